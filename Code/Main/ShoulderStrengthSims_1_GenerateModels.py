@@ -25,27 +25,38 @@ Not all model muscles strength are altered, with the following changed:
     - PECM1, PECM2 and PECM3 together
     - LAT
     - CORB
+
+The baseline model is parsed once and each variant is created by changing the
+max isometric force of the muscles in the group (see modelHelper). The model
+files are written out across a pool of threads. The same variant specifications
+can be passed straight to the batch simulations to create the models in memory.
+
+The variants are also stored compactly in an overlay file (strengthVariants.json
+in the model directory), which only holds the changed muscle properties of each
+variant. Setting writeModelFiles to False only writes the overlay file, with the
+full models created from it when they are needed.
     
 """
 
 # %% Import packages
 
-import opensim as osim
 import os
+import sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import modelHelper
 
 # %% Create models
 
 #Set main directory
-mainPath = os.getcwd()
+mainPath = os.path.dirname(os.path.abspath(__file__))
 
 #Create path to baseline model
 
 #Add path to model directory
-modelPath = mainPath+'\..\..\ModelFiles'
-#Add geometry to visualiser
-osim.ModelVisualizer.addDirToGeometrySearchPaths(modelPath+'\Geometry')
+modelPath = os.path.join(mainPath,'..','..','ModelFiles')
 #Set the baseline model filename
-baseModelFileName = modelPath+'\BaselineModel.osim'
+baseModelFileName = os.path.join(modelPath,'BaselineModel.osim')
 
 #Set scale factors to weaken muscles by
 scaleFactors = [0.8,0.9,1.1,1.2]
@@ -65,39 +76,23 @@ muscToAlter = [['TRP1','TRP2'],
     ['LAT'],
     ['CORB']]
 
-#Loop through muscle groups and adjust by the scale factors listed
+#Number of threads to write the model files with
+nThreads = 4
 
-#Loop through muscle groups
-for mm in range(0,len(muscToAlter)):
-    
-    #Create a string label for the current muscle group
-    s = '_'
-    modelLabel = s.join(muscToAlter[mm])
-    
-    #Loop through scale factors
-    for ss in range(0,len(scaleFactors)):
-        
-        #Create a version of the baseline model to edit
-        osimModel = osim.Model(baseModelFileName)
-        
-        #Loop through muscles within the list
-        for gg in range(0,len(muscToAlter[mm])):
-            
-            #Get string for current muscle
-            currMusc = muscToAlter[mm][gg]
-            
-            #Get the current muscles strength
-            currMuscStrength = osimModel.getMuscles().get(currMusc).get_max_isometric_force()
-            
-            #Scale to its new force generating capacity
-            newMuscStrength = currMuscStrength * scaleFactors[ss]
-            
-            #Set the new strength in the model
-            osimModel.getMuscles().get(currMusc).set_max_isometric_force(newMuscStrength)
-            
-        #Save new model to the output directory
-        osimModel.setName(modelLabel+'_strength'+str(int(scaleFactors[ss]*100)))
-        osimModel.finalizeConnections()
-        osimModel.printToXML(modelPath+'\\'+modelLabel+'_strength'+str(int(scaleFactors[ss]*100))+'.osim')
+#Write out the full model files for each variant as well as the overlay file
+writeModelFiles = True
+
+#Create the variant specifications for each muscle group and scale factor
+#from the baseline model strengths
+variantSpecs = modelHelper.getVariantSpecs(baseModelFileName,muscToAlter,scaleFactors)
+
+#Save the variant overlay file to the output directory
+modelHelper.writeVariantOverlay(variantSpecs,os.path.join(modelPath,'strengthVariants.json'))
+print(str(len(variantSpecs))+' variants written to '+os.path.join(modelPath,'strengthVariants.json'))
+
+#Save the new models to the output directory
+if writeModelFiles:
+    modelFiles = modelHelper.writeVariantModels(variantSpecs,modelPath,nThreads)
+    print(str(len(modelFiles))+' variant models written to '+modelPath)
         
 # %% ----- End of ShoulderStrengthSims_1_GenerateModels.py ----- %% #
\ No newline at end of file
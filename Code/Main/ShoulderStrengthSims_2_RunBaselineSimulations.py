@@ -27,17 +27,48 @@ Movement task options that can be simulated are currently:
 
 import opensim as osim
 import os
+import sys
+import time
 import pandas as pd
 
-os.chdir('..\\Supplementary')
+#Add the supplementary code directory to the path, rather than importing the
+#helper functions from the working directory
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
 import osimHelper
-
-os.chdir('..\\Main')
+import cacheHelper
+import profileHelper
+import tuneHelper
 
 # %% Folder set up
 
+#Set whether to solve with staged mesh refinement. The task is first solved on
+#a coarse mesh, with each solution interpolated onto the next finer mesh as the
+#guess. This stops once the objective and coordinates don't change between
+#meshes. If False, a single solve is run at the task mesh interval, which
+#reproduces the original baseline results. The refinement meshes stop at the
+#task mesh interval, but the coarser guess can still lead the solver to a
+#slightly different solution.
+useMeshRefinement = False
+
+#Set whether to use the solution cache. Problems that match a cached solution
+#exactly (model, bounds, goals, solver settings and guess) aren't re-solved.
+useSolutionCache = True
+
+#Watchdog rules for stopping the solve if it stalls or diverges (None solves
+#without the watchdog, see watchdogHelper for the rules)
+watchdogSettings = None
+
+#Set whether to use the solver settings tuned for this machine, if it has been
+#tuned (see ShoulderStrengthSims_Autotune.py)
+useTunedSettings = True
+
+#Set whether to profile the phases of the run (e.g. model processing, study set
+#up and solve). The Chrome trace and timing table of the run are written to a
+#Profiles folder in the task results directory.
+profileRun = False
+
 #Set main directory
-mainPath = os.getcwd()
+mainPath = os.path.dirname(os.path.abspath(__file__))
 
 #Set task name to be simulated
 print('Select task to simulate:')
@@ -48,6 +79,7 @@ if taskNo == 1:
     print('Concentric upward reach 105 task selected.')
     taskName = 'ConcentricUpwardReach105'
     meshInterval = 50 #100 mesh interval providing weird nan's in created guess
+    meshRefinement = [25,50] #meshes for staged refinement, ending at the task mesh interval
 else:
     raise ValueError('No tasks match the input number')
     
@@ -60,15 +92,35 @@ if not os.path.isdir(taskName): #check if directory already exists
 #Set task results directory
 taskPath = resultsPath+'\\'+taskName
 
+#Turn on profiling
+if profileRun:
+    profilePath = taskPath+'\\Profiles\\BaselineSim_'+time.strftime('%Y%m%d_%H%M%S')
+    profileHelper.enableProfiling(profilePath)
+
+#Set solution cache directory, with the model landmarks and processed models
+#cached within it. Checkpoints of the solves are also kept here, so that an
+#interrupted solve resumes from its latest checkpoint when the script is re-run.
+if useSolutionCache:
+    cachePath = resultsPath+'\\SolutionCache'
+    landmarkCachePath = cachePath+'\\Landmarks'
+    modelCachePath = cachePath+'\\ProcessedModels'
+    checkpointPath = cachePath+'\\Checkpoints'
+else:
+    cachePath = None
+    landmarkCachePath = None
+    modelCachePath = None
+    checkpointPath = None
+
 #Load task bounds
 
 #Navigate to supporting data directory
 os.chdir('..\\SupportingData')
 
 #Load in dataframes
-taskBoundsElv = pd.read_csv('shoulder_elv_bounds.csv', index_col = 'Task')
-taskBoundsRot = pd.read_csv('shoulder_rot_bounds.csv', index_col = 'Task')
-taskBoundsAng = pd.read_csv('elv_angle_bounds.csv', index_col = 'Task')
+with profileHelper.profileSpan('loadTaskBounds','io'):
+    taskBoundsElv = pd.read_csv('shoulder_elv_bounds.csv', index_col = 'Task')
+    taskBoundsRot = pd.read_csv('shoulder_rot_bounds.csv', index_col = 'Task')
+    taskBoundsAng = pd.read_csv('elv_angle_bounds.csv', index_col = 'Task')
 
 # %% Model set up
 
@@ -79,169 +131,100 @@ os.chdir(modelPath)
 #Add geometry directory
 osim.ModelVisualizer.addDirToGeometrySearchPaths(modelPath+'\\Geometry')
 
-#Load the baseline model
-osimModel = osim.Model(modelPath+'\\BaselineModel.osim')
-
-#Lock the thorax joints of the model to make this a shoulder only movement
-osimModel.updCoordinateSet().get('thorax_tilt').set_locked(True)
-osimModel.updCoordinateSet().get('thorax_list').set_locked(True)
-osimModel.updCoordinateSet().get('thorax_rotation').set_locked(True)
-osimModel.updCoordinateSet().get('thorax_tx').set_locked(True)
-osimModel.updCoordinateSet().get('thorax_ty').set_locked(True)
-osimModel.updCoordinateSet().get('thorax_tz').set_locked(True)
-
-#Add a 1kg mass for the reaching tasks
-if 'Reach' in taskName:
-    #Get hand mass and calculate added 1kg value
-    newHandMass = osimModel.getBodySet().get('hand_r').getMass() + 1
-    #Set new hand mass
-    osimModel.getBodySet().get('hand_r').setMass(newHandMass)
-
-#Add relevant torque actuators to each degree of freedom
-#Loop through and add coordinate actuators
-#Don't add anything for the thorax
-for cc in range(0,osimModel.updCoordinateSet().getSize()):    
-    #Get current coordinate name
-    coordName = osimModel.updCoordinateSet().get(cc).getName()
-    #Conditional statements for adding actuators
-    if coordName == 'elbow_flexion':
-        #Add an idealised torque actuator
-        osimHelper.addCoordinateActuator(osimModel,coordName,75.0,
-                                         [float('inf'),float('-inf')],'_torque')
-    elif coordName == 'pro_sup':
-        #Add an idealised torque actuator
-        osimHelper.addCoordinateActuator(osimModel,coordName,30.0,
-                                         [float('inf'),float('-inf')],'_torque')
-    elif coordName == 'elv_angle':
-        #Add a reserve torque actuator
-        osimHelper.addCoordinateActuator(osimModel,coordName,1.0,
-                                         [float('inf'),float('-inf')],'_reserve')
-    elif coordName == 'shoulder_elv' or coordName == 'shoulder_rot':
-        #Add a reserve torque actuator
-        osimHelper.addCoordinateActuator(osimModel,coordName,1.0,
-                                         [1.0,-1.0],'_reserve')
-
-#Finalise model
-osimModel.finalizeFromProperties()
-
-#Something weird going on later if I try and call the model processor directly
-#from the model object here (says the model has no subcomponents?). A workaround
-#is to process print out the model and call it to the processor via its filename,
-#and then get a variable to call the processed model.
-
-#Print out the edited model
-osimModel.printToXML('simModel.osim')
-
-#Set up a model processor to configure model
-modelProcessor = osim.ModelProcessor('simModel.osim')
-
-#Convert model muscles to DeGrooteFregly type
-modelProcessor.append(osim.ModOpReplaceMusclesWithDeGrooteFregly2016())
-
-#Append settings for muscle models
-#Set to ignore tendon compliance
-modelProcessor.append(osim.ModOpIgnoreTendonCompliance())
-#Set to ignore conservative passive fiber forces
-modelProcessor.append(osim.ModOpIgnorePassiveFiberForcesDGF())
-#Set the fiber damping low to limit non-conservative passive forces
-#This may also serve to limit the negative muscle forces that can happen
-modelProcessor.append(osim.ModOpFiberDampingDGF(1e-02))
-
-####### this parameter could be a factor in the different results coming up
-####### along with te active force width (if that didn't change). default is 0.1
-####### so this shift may be quite large (the original 1e-05 that is)?
-
-#Scale active force width of muscles
-modelProcessor.append(osim.ModOpScaleActiveFiberForceCurveWidthDGF(1.5))
-
-##### don't think active force width was altered either in original simulations...
-
-#Process and get a variable to call the model
-simModel = modelProcessor.process()
-
-#Clean up the printed out model file from the directory
-os.remove('simModel.osim')
+#Load and configure the baseline model for the simulations
+#See osimHelper.createSimModel for the thorax locking, added hand mass, torque
+#actuators and muscle model settings
+simModel = osimHelper.createSimModel(modelPath+'\\BaselineModel.osim',taskName,
+                                     modelCachePath = modelCachePath)
 
 # %% Simulation set up
 
-#Create the Moco study
-study = osim.MocoStudy()
-
-#Initialise the problem
-problem = study.updProblem()
-
-#Set the model processor in the problem
-problem.setModel(simModel)
-
 #Navigate to guess directory
 os.chdir('..\\GuessFiles')
 
 #Set guess path
 guessPath = os.getcwd()
 
-#Set time bounds on the problem
-##### NOTE: first iteration with end time bounds seemed to try and solve to the
-##### the final end time bound (i.e. 1.0) rather than as fast as possible. Test
-##### and see whether removing these fixes it.
-# Set to a percentage of the final guess time to end
-timeLB = 0.9*osim.Storage(taskName+'_StartingGuess.sto').getLastTime()
-timeUB = 1.1*osim.Storage(taskName+'_StartingGuess.sto').getLastTime()
-problem.setTimeBounds(osim.MocoInitialBounds(0.0),
-                      osim.MocoFinalBounds(timeLB,timeUB))
-# problem.setTimeBounds(0,[])
-
-#Define marker end point goals
-osimHelper.addMarkerEndPoints(taskName,problem,simModel)
-
-#Define kinematic task bounds
-osimHelper.addTaskBounds(taskName,problem,simModel,taskBoundsElv,taskBoundsRot,taskBoundsAng)
-
-#Add a control cost to the problem
-problem.addGoal(osim.MocoControlGoal('effort',1))
-
-#Add a final time goal to the problem
-problem.addGoal(osim.MocoFinalTimeGoal('time',1))
-
-#Configure the solver
-solver = study.initCasADiSolver()
-solver.set_num_mesh_intervals(meshInterval)
-solver.set_verbosity(2)
-solver.set_optim_solver('ipopt')
-solver.set_optim_convergence_tolerance(1e-4)
-solver.set_optim_constraint_tolerance(1e-4)
-
-#Set the guess to an existing solution for this task from existing work
-#Note that this will be slightly off given the previous study included forces
+#Set guess file
+#Note that the guess is set to an existing solution for this task from existing
+#work. This will be slightly off given the previous study included forces
 #that approximated ligaments and joint capsule passive resistance, but should 
-#still work as an OK start.
-
-#Set guess in solver
-#Note an accesory function is used here as some solution files seem to generate
-#NaN's in the last row of the slack variables, which generates a Casadi error
-#when attempting to use as a guess.
-osimHelper.fixGuessFile(guessPath+'\\'+taskName+'_StartingGuess.sto',solver)
-
-### nan's getting created in guess!!! happening in original created guess though
-### has something to do with mesh interval I think
+#still work as an OK start. An accesory function is used to set the guess as
+#some solution files seem to generate NaN's in the last row of the slack 
+#variables, which generates a Casadi error when attempting to use as a guess.
+#The guess is interpolated onto the solver mesh, so it doesn't need to match
+#the mesh interval used.
+guessFile = guessPath+'\\'+taskName+'_StartingGuess.sto'
 
 # %% Solve!
 
 #Navigate to task results directory
 os.chdir(taskPath)
 
-#Set study name
-study.setName('BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes')
+#Get the tuned solver settings and IPOPT options. The process and thread split
+#doesn't apply to the single solve here.
+solverSettings = None
+ipoptOptions = None
+if useTunedSettings:
+    nProcesses, nThreads, solverSettings, ipoptOptions = tuneHelper.getTunedRunSettings(1)
 
-#Print setup file to directory
-study.printToXML('BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes.omoco')
+#The Moco study is created with the problem bounds, goals and solver settings.
+#Time bounds are set to a percentage of the final guess time to end.
+##### NOTE: first iteration with end time bounds seemed to try and solve to the
+##### the final end time bound (i.e. 1.0) rather than as fast as possible. Test
+##### and see whether removing these fixes it.
 
-#Run optimisation
-baselineSolution = study.solve()
+if useMeshRefinement:
+    
+    #Run the optimisation over the refinement meshes
+    baselineSolution, solutionFile, refinementSummary = \
+        osimHelper.runMeshRefinement(taskName,simModel,guessFile,meshRefinement,
+                                     taskBoundsElv,taskBoundsRot,taskBoundsAng,
+                                     taskPath,'BaselineSim_'+taskName,
+                                     cachePath = cachePath,
+                                     landmarkCachePath = landmarkCachePath,
+                                     watchdogSettings = watchdogSettings,
+                                     checkpointPath = checkpointPath,
+                                     solverSettings = solverSettings,
+                                     ipoptOptions = ipoptOptions)
+    
+    #Print the refinement summary
+    print(refinementSummary.to_string())
+    
+else:
+    
+    #Create the study
+    study = osimHelper.createMocoStudy(taskName,simModel,guessFile,meshInterval,
+                                       taskBoundsElv,taskBoundsRot,taskBoundsAng,
+                                       landmarkCachePath = landmarkCachePath,
+                                       solverSettings = solverSettings)
+    
+    #Set study name
+    study.setName('BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes')
+    
+    #Print setup file to directory
+    with profileHelper.profileSpan('printStudy','io'):
+        study.printToXML('BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes.omoco')
+    
+    #Run optimisation, or get the solution from the cache
+    baselineSolution, solveInfo = cacheHelper.solveStudy(study,
+                                                         'BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes_solution.sto',
+                                                         cachePath,guessFile,taskName,
+                                                         'Baseline',meshInterval,
+                                                         watchdogSettings = watchdogSettings,
+                                                         checkpointPath = checkpointPath,
+                                                         ipoptOptions = ipoptOptions)
 
 
 # if os.getenv('OPENSIM_USE_VISUALIZER') != '0':
 #     study.visualize(baselineSolution)
 
+#Write the trace and timing table of the run
+if profileRun:
+    timingTable = profileHelper.getTimingTable(profileHelper.mergeTraces(profilePath))
+    timingTable.to_csv(profilePath+'\\timingTable.csv', index = False)
+    print(timingTable.to_string())
+
 # %% Re-run with JRF goals...
 
 # %% ----- End of ShoulderStrengthSims_2_RunBaselineSimulations.py ----- %% #
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code runs the movement simulations with the altered muscle strength models
+generated in ShoulderStrengthSims_1_GenerateModels.py. The variant models are
+spread across a pool of processes, with each process limited to a set number of
+threads so that the machine isn't oversubscribed. The baseline simulation
+solution for the task (from ShoulderStrengthSims_2_RunBaselineSimulations.py)
+is used as the guess where it is available.
+
+By default the variants are solved as continuation chains along each muscle
+groups strength axis (i.e. 100 -> 90 -> 80 and 100 -> 110 -> 120), with each
+solve seeded from the nearest converged solution in a solution library stored
+in the task results directory. This requires the baseline solution at the same
+number of nodes. Setting useContinuation to False solves every variant
+independently from the same guess.
+
+A summary of each variants status and timing is written to the task results
+directory as the batch progresses.
+
+Movement task options that can be simulated are currently:
+    - 'ConcentricUpwardReach105'
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+import time
+
+#Number of threads each worker can use. This is set before the helper functions
+#are imported, as the thread pools of numpy and pandas are started when they are
+#imported and are inherited by the worker processes (see threadHelper).
+threadsPerWorker = 1
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+threadHelper.setThreadLimits(threadsPerWorker)
+import batchHelper
+import modelHelper
+import profileHelper
+import resultsHelper
+
+# %% Batch settings
+
+#Number of worker processes (None uses the number of CPUs divided by the
+#threads per worker)
+nProcesses = None
+
+#Number of solves (or chains with continuation) before a worker process is replaced
+solvesPerWorker = 1
+
+#Solve the variants as continuation chains from the baseline solution
+useContinuation = True
+
+#Meshes for staged refinement of independent solves (None uses a single solve
+#at the task mesh interval). Not used with continuation, where the neighbouring
+#solutions already provide a guess at the final mesh.
+meshRefinement = None
+
+#Use the solution cache so that unchanged problems aren't re-solved
+useSolutionCache = True
+
+#Watchdog rules for stopping solves that stall or diverge (None solves without
+#the watchdog, see watchdogHelper for the rules). Stopped solves are retried
+#from the baseline solution and then at the retry mesh interval.
+watchdogSettings = {'maxWallTime': 3600, 'maxIterations': 3000}
+retryMeshInterval = 25
+
+#Variant model sources, relative to the model directory. These can be .osim
+#files, variant overlay files (see ShoulderStrengthSims_1_GenerateModels.py)
+#or wildcard patterns. Variants from an overlay file are created in memory.
+variantSources = ['*_strength*.osim']
+
+#Profile the phases of the run (e.g. model processing, study set up and solve)
+#in the worker processes. The Chrome trace and timing table of the run are
+#written to a Profiles folder in the task results directory.
+profileRun = False
+
+#Add the solutions in the task results directory to the results store once the
+#batch is finished (see resultsHelper), so the variants can be compared without
+#re-reading each solution file
+updateResultsStore = True
+
+# %% Run batch
+
+if __name__ == '__main__':
+
+    #Set the thread limits before opensim is imported, so that they are in
+    #place for the worker processes
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+    import osimHelper
+
+    #Set main directory
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+
+    #Set task name to be simulated
+    print('Select task to simulate:')
+    print('[1] Concetric Upward Reach 105')
+    taskNo = input('Enter number selection: ')
+    taskNo = int(taskNo)
+    if taskNo == 1:
+        print('Concentric upward reach 105 task selected.')
+        taskName = 'ConcentricUpwardReach105'
+        meshInterval = 50 #100 mesh interval providing weird nan's in created guess
+    else:
+        raise ValueError('No tasks match the input number')
+
+    #Set the directories
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+    dataPath = os.path.join(mainPath,'..','..','SupportingData')
+    guessPath = os.path.join(mainPath,'..','..','GuessFiles')
+    taskPath = os.path.join(mainPath,'..','..','SimulationResults',taskName)
+    if useSolutionCache:
+        cachePath = os.path.join(mainPath,'..','..','SimulationResults','SolutionCache')
+    else:
+        cachePath = None
+
+    #Turn on profiling before the worker processes are started
+    if profileRun:
+        profilePath = os.path.join(taskPath,'Profiles','StrengthSims_'+time.strftime('%Y%m%d_%H%M%S'))
+        profileHelper.enableProfiling(profilePath)
+
+    #Load task bounds
+    with profileHelper.profileSpan('loadTaskBounds','io'):
+        taskBounds = osimHelper.loadTaskBounds(dataPath)
+
+    #Set the baseline solution for the task at the same number of nodes
+    baselineSolution = os.path.join(taskPath,'BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes_solution.sto')
+
+    #Get the list of variant models
+    modelFiles = modelHelper.getVariantSources([os.path.join(modelPath,source) for source in variantSources])
+    print(str(len(modelFiles))+' variant models found.')
+
+    #Run the batch
+    if useContinuation:
+
+        #Check for the baseline solution to start the chains from
+        if not os.path.isfile(baselineSolution):
+            raise ValueError('Baseline solution '+baselineSolution+' is needed for continuation')
+
+        #Run the continuation chains
+        batchSummary = batchHelper.runContinuationSimulations(modelFiles,taskName,baselineSolution,
+                                                              meshInterval,taskBounds,taskPath,
+                                                              nProcesses = nProcesses,
+                                                              threadsPerWorker = threadsPerWorker,
+                                                              chainsPerWorker = solvesPerWorker,
+                                                              cachePath = cachePath,
+                                                              watchdogSettings = watchdogSettings,
+                                                              retryMeshInterval = retryMeshInterval)
+
+    else:
+
+        #Use the baseline solution as the guess if it exists, otherwise use the
+        #starting guess for the task
+        guessFile = baselineSolution
+        if not os.path.isfile(guessFile):
+            guessFile = os.path.join(guessPath,taskName+'_StartingGuess.sto')
+        print('Using guess file: '+guessFile)
+
+        #Run the independent solves
+        batchSummary = batchHelper.runBatchSimulations(modelFiles,taskName,guessFile,meshInterval,
+                                                       taskBounds,taskPath,
+                                                       nProcesses = nProcesses,
+                                                       threadsPerWorker = threadsPerWorker,
+                                                       solvesPerWorker = solvesPerWorker,
+                                                       meshRefinement = meshRefinement,
+                                                       cachePath = cachePath,
+                                                       watchdogSettings = watchdogSettings,
+                                                       fallbackGuessFile = os.path.join(guessPath,taskName+'_StartingGuess.sto'),
+                                                       retryMeshInterval = retryMeshInterval)
+
+    #Print the summary
+    print(batchSummary[['variant','status','numIterations','wallTime']].to_string())
+
+    #Add the new solutions to the results store
+    if updateResultsStore:
+        resultsHelper.ingestSolutions(os.path.join(taskPath,'ResultsStore'),
+                                      resultsHelper.findSolutionFiles(taskPath),taskName)
+
+    #Write the trace and timing table of the run
+    if profileRun:
+        timingTable = profileHelper.getTimingTable(profileHelper.mergeTraces(profilePath))
+        timingTable.to_csv(os.path.join(profilePath,'timingTable.csv'), index = False)
+        print(timingTable.to_string())
+        print('Trace written to '+os.path.join(profilePath,'pipelineTrace.json'))
+
+# %% ----- End of ShoulderStrengthSims_3_RunStrengthSimulations.py ----- %% #
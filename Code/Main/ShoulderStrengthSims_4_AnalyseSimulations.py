@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code analyses the baseline and strength variant solutions from
+ShoulderStrengthSims_2_RunBaselineSimulations.py and
+ShoulderStrengthSims_3_RunStrengthSimulations.py, to get the glenohumeral joint
+reaction forces, muscle forces and fibre states at every time node (see
+analysisHelper). The solutions are spread across a pool of processes, and the
+outputs are added to an analysis store in the task results directory. Solutions
+that have already been analysed are skipped, so this can be re-run as new
+solutions are added.
+
+Movement task options that can be analysed are currently:
+    - 'ConcentricUpwardReach105'
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+
+#Number of threads each worker can use. This is set before the helper functions
+#are imported, as the thread pools of numpy and pandas are started when they are
+#imported and are inherited by the worker processes (see threadHelper).
+threadsPerWorker = 1
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+threadHelper.setThreadLimits(threadsPerWorker)
+import numpy as np
+import analysisHelper
+import batchHelper
+import modelHelper
+import resultsHelper
+
+# %% Analysis settings
+
+#Number of worker processes (None uses the number of CPUs divided by the
+#threads per worker)
+nProcesses = None
+
+#Variant model sources, relative to the model directory (see
+#ShoulderStrengthSims_3_RunStrengthSimulations.py)
+variantSources = ['*_strength*.osim']
+
+# %% Run analysis
+
+if __name__ == '__main__':
+
+    #Set the thread limits before opensim is imported, so that they are in
+    #place for the worker processes
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+
+    #Set main directory
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+
+    #Set task name to be analysed
+    print('Select task to analyse:')
+    print('[1] Concetric Upward Reach 105')
+    taskNo = input('Enter number selection: ')
+    taskNo = int(taskNo)
+    if taskNo == 1:
+        print('Concentric upward reach 105 task selected.')
+        taskName = 'ConcentricUpwardReach105'
+    else:
+        raise ValueError('No tasks match the input number')
+
+    #Set the directories
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+    taskPath = os.path.join(mainPath,'..','..','SimulationResults',taskName)
+    modelCachePath = os.path.join(mainPath,'..','..','SimulationResults','SolutionCache','ProcessedModels')
+    storePath = os.path.join(taskPath,'AnalysisStore')
+
+    #Match the solutions to their variant models
+    modelFiles = modelHelper.getVariantSources([os.path.join(modelPath,source) for source in variantSources])
+    modelSources = analysisHelper.getVariantModelSources(modelFiles,os.path.join(modelPath,'BaselineModel.osim'))
+
+    #Analyse the solutions
+    resultsIndex, errorList = analysisHelper.runBatchAnalysis(resultsHelper.findSolutionFiles(taskPath),
+                                                              modelSources,taskName,storePath,
+                                                              nProcesses = nProcesses,
+                                                              threadsPerWorker = threadsPerWorker,
+                                                              modelCachePath = modelCachePath)
+
+    #Print the peak resultant glenohumeral joint reaction force of each solution
+    reactionColumns = ['/jointset/'+analysisHelper.reactionJoints[0]+'|reaction_on_child'+suffix
+                       for suffix in ['_fx','_fy','_fz']]
+    reactionData = resultsHelper.getResultsColumns(storePath,reactionColumns,resultsIndex)
+    peakReactions = resultsIndex[['solutionId','muscleGroup','scaleFactor','nodes']].copy()
+    peakReactions['peakReaction'] = [np.nanmax(np.linalg.norm(reactionData[solutionId], axis = 1))
+                                     for solutionId in peakReactions['solutionId']]
+    print(peakReactions.sort_values(['muscleGroup','scaleFactor']).to_string(index = False))
+
+# %% ----- End of ShoulderStrengthSims_4_AnalyseSimulations.py ----- %% #
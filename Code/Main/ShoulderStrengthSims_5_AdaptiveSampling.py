@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code samples combinations of muscle group strengths adaptively, as an
+alternative to the dense sweep of ShoulderStrengthSims_1_GenerateModels.py and
+ShoulderStrengthSims_3_RunStrengthSimulations.py. Gaussian process surrogates
+of the outcome metrics are fitted against the scale factors of every muscle
+group, and batches of variants are chosen where the surrogates are most
+uncertain until they reach the target accuracy (see surrogateHelper). Only the
+chosen variants are created (in memory) and solved.
+
+The sampling state and solutions are written to an AdaptiveSampling folder in
+the task results directory. Re-running the script carries on from the saved
+state, e.g. with a higher maximum number of solves. The predicted effect of
+each muscle group on each metric is written to surrogateEffects.csv.
+
+Movement task options that can be simulated are currently:
+    - 'ConcentricUpwardReach105'
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+
+#Number of threads each worker can use. This is set before the helper functions
+#are imported, as the thread pools of numpy and pandas are started when they are
+#imported and are inherited by the worker processes (see threadHelper).
+threadsPerWorker = 1
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+threadHelper.setThreadLimits(threadsPerWorker)
+import batchHelper
+import surrogateHelper
+
+# %% Sampling settings
+
+#Number of worker processes (None uses the number of CPUs divided by the
+#threads per worker)
+nProcesses = None
+
+#Muscle groups to vary the strength of
+muscToAlter = [['TRP1','TRP2'],
+    ['TRP3','TRP4'],
+    ['SRA1','SRA2','SRA3'],
+    ['DELT1'],
+    ['DELT2'],
+    ['DELT3'],
+    ['SUPSP'],
+    ['INFSP','TMIN'],
+    ['SUBSC'],
+    ['TMAJ'],
+    ['PECM1','PECM2','PECM3'],
+    ['LAT'],
+    ['CORB']]
+
+#Bounds of the scale factors of each group
+factorBounds = (0.8, 1.2)
+
+#Outcome metrics to fit the surrogates to (see surrogateHelper.surrogateMetrics)
+metricSpecs = {'objective': {'header': 'objective'},
+               'peakDELT2Activation': {'column': '/forceset/DELT2/activation', 'statistic': 'max'},
+               'peakSUPSPActivation': {'column': '/forceset/SUPSP/activation', 'statistic': 'max'}}
+
+#Target standardised accuracy of the surrogates and maximum number of solves
+targetAccuracy = 0.05
+maxSolves = 60
+
+#Use the solution cache so that unchanged problems aren't re-solved
+useSolutionCache = True
+
+#Watchdog rules for stopping solves that stall or diverge (see watchdogHelper)
+watchdogSettings = {'maxWallTime': 3600, 'maxIterations': 3000}
+retryMeshInterval = 25
+
+# %% Run sampling
+
+if __name__ == '__main__':
+
+    #Set the thread limits before opensim is imported, so that they are in
+    #place for the worker processes
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+    import osimHelper
+
+    #Set main directory
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+
+    #Set task name to be simulated
+    print('Select task to simulate:')
+    print('[1] Concetric Upward Reach 105')
+    taskNo = input('Enter number selection: ')
+    taskNo = int(taskNo)
+    if taskNo == 1:
+        print('Concentric upward reach 105 task selected.')
+        taskName = 'ConcentricUpwardReach105'
+        meshInterval = 50
+    else:
+        raise ValueError('No tasks match the input number')
+
+    #Set the directories
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+    dataPath = os.path.join(mainPath,'..','..','SupportingData')
+    guessPath = os.path.join(mainPath,'..','..','GuessFiles')
+    taskPath = os.path.join(mainPath,'..','..','SimulationResults',taskName)
+    samplingPath = os.path.join(taskPath,'AdaptiveSampling')
+    if useSolutionCache:
+        cachePath = os.path.join(mainPath,'..','..','SimulationResults','SolutionCache')
+    else:
+        cachePath = None
+
+    #Load task bounds
+    taskBounds = osimHelper.loadTaskBounds(dataPath)
+
+    #Use the baseline solution as the guess if it exists, otherwise use the
+    #starting guess for the task
+    guessFile = os.path.join(taskPath,'BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes_solution.sto')
+    if not os.path.isfile(guessFile):
+        guessFile = os.path.join(guessPath,taskName+'_StartingGuess.sto')
+    print('Using guess file: '+guessFile)
+
+    #Run the sampling
+    samplingState = surrogateHelper.runAdaptiveSampling(os.path.join(samplingPath,'samplingState.json'),
+                                                        os.path.join(modelPath,'BaselineModel.osim'),
+                                                        muscToAlter,taskName,guessFile,meshInterval,
+                                                        taskBounds,samplingPath,
+                                                        boundsOfFactors = factorBounds,
+                                                        metricSpecs = metricSpecs,
+                                                        maxSolves = maxSolves,
+                                                        targetAccuracy = targetAccuracy,
+                                                        batchSettings = {'nProcesses': nProcesses,
+                                                                         'threadsPerWorker': threadsPerWorker,
+                                                                         'cachePath': cachePath,
+                                                                         'watchdogSettings': watchdogSettings,
+                                                                         'fallbackGuessFile': os.path.join(guessPath,taskName+'_StartingGuess.sto'),
+                                                                         'retryMeshInterval': retryMeshInterval})
+
+    #Write and print the predicted effect of each group
+    surrogateEffects = surrogateHelper.getSurrogateEffects(samplingState)
+    surrogateEffects.to_csv(os.path.join(samplingPath,'surrogateEffects.csv'), index = False)
+    effectRange = surrogateEffects.groupby(['metric','muscleGroup'])['mean'].agg(lambda values: values.max() - values.min())
+    print(effectRange.unstack('metric').to_string())
+
+# %% ----- End of ShoulderStrengthSims_5_AdaptiveSampling.py ----- %% #
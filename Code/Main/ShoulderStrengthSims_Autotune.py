@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code tunes the solver configuration for the machine it is run on (see
+tuneHelper). Short probes of the baseline task problem are solved with
+different CasADi parallel evaluation settings, finite difference schemes, IPOPT
+linear solvers and splits of the CPUs between worker processes and threads. The
+fastest configuration is saved against the host fingerprint and used by the
+simulation scripts on later runs. Run this once on each type of node.
+
+Usage:
+    python ShoulderStrengthSims_Autotune.py [options]
+
+Options:
+    --show              print the saved configuration for this host and exit
+    --mesh N            number of mesh intervals for the probes
+    --tune-file PATH    path to the tune .json file (default uses
+                        tuneHelper.defaultTuneFile)
+
+"""
+
+# %% Import packages
+
+import argparse
+import json
+import os
+import sys
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import tuneHelper
+
+# %% Run autotune
+
+if __name__ == '__main__':
+
+    #Set the paths
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+    taskName = 'ConcentricUpwardReach105'
+    modelFile = os.path.join(mainPath,'..','..','ModelFiles','BaselineModel.osim')
+    guessFile = os.path.join(mainPath,'..','..','GuessFiles',taskName+'_StartingGuess.sto')
+    dataPath = os.path.join(mainPath,'..','..','SupportingData')
+
+    #Read the command line arguments
+    parser = argparse.ArgumentParser(description = 'Tune the solver configuration for this machine')
+    parser.add_argument('--show', action = 'store_true',
+                        help = 'print the saved configuration for this host and exit')
+    parser.add_argument('--mesh', type = int, default = 50,
+                        help = 'number of mesh intervals for the probes')
+    parser.add_argument('--tune-file', default = None,
+                        help = 'path to the tune .json file')
+    args = parser.parse_args()
+
+    #Print the saved configuration
+    fingerprint, hostInfo = tuneHelper.getHostFingerprint()
+    print('Host fingerprint '+fingerprint+': '+json.dumps(hostInfo))
+    if args.show:
+        tunedConfig = tuneHelper.loadTunedConfig(args.tune_file)
+        if tunedConfig is None:
+            print('This host has not been tuned')
+        else:
+            print(json.dumps({key: tunedConfig[key] for key in tunedConfig
+                              if key not in ['hostInfo','probes']}, indent = 1))
+        sys.exit()
+
+    #Run the probes and save the fastest configuration
+    tunedConfig = tuneHelper.autotuneSolver(taskName,modelFile,guessFile,dataPath,
+                                            meshInterval = args.mesh,
+                                            tuneFile = args.tune_file)
+    print('Fastest configuration: '+str(tunedConfig['nProcesses'])+' processes x '+
+          str(tunedConfig['threadsPerWorker'])+' threads, solver settings '+
+          json.dumps(tunedConfig['solverSettings'])+', IPOPT options '+
+          json.dumps(tunedConfig['ipoptOptions'])+' ('+
+          str(round(tunedConfig['throughput'],2))+' iterations/s)')
+
+# %% ----- End of ShoulderStrengthSims_Autotune.py ----- %% #
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code runs the solver benchmark suite (see benchmarkHelper) and compares the
+results against a stored baseline, so that changes to the solver settings or
+upgrades to the solver can be checked for regressions in solve time, iterations,
+objective or memory. The results of each run are saved in the Benchmarks
+directory, and the baseline is only replaced when asked.
+
+Usage:
+    python ShoulderStrengthSims_Benchmark.py [options]
+
+Options:
+    --cases NAME [NAME ...]     only run the named benchmark cases
+    --synthetic-only            only run the synthetic reference problems
+    --update-baseline           save the results as the new baseline
+    --output PATH               directory to save the benchmark results to
+
+"""
+
+# %% Import packages
+
+import argparse
+import os
+import sys
+import time
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import benchmarkHelper
+
+# %% Run benchmarks
+
+if __name__ == '__main__':
+
+    #Set the paths
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+    modelFile = os.path.join(mainPath,'..','..','ModelFiles','BaselineModel.osim')
+    guessFile = os.path.join(mainPath,'..','..','GuessFiles','ConcentricUpwardReach105_StartingGuess.sto')
+    dataPath = os.path.join(mainPath,'..','..','SupportingData')
+
+    #Read the command line arguments
+    parser = argparse.ArgumentParser(description = 'Run the solver benchmark suite and check for regressions')
+    parser.add_argument('--cases', nargs = '+', default = None,
+                        help = 'only run the named benchmark cases')
+    parser.add_argument('--synthetic-only', action = 'store_true',
+                        help = 'only run the synthetic reference problems')
+    parser.add_argument('--update-baseline', action = 'store_true',
+                        help = 'save the results as the new baseline')
+    parser.add_argument('--output', default = os.path.join(mainPath,'..','..','Benchmarks'),
+                        help = 'directory to save the benchmark results to')
+    args = parser.parse_args()
+
+    #Select the cases
+    cases = benchmarkHelper.benchmarkCases
+    if args.cases is not None:
+        cases = [case for case in cases if case['name'] in args.cases]
+    if args.synthetic_only:
+        cases = [case for case in cases if case['problem'] in ['SlidingMass','DoublePendulum']]
+    if len(cases) == 0:
+        raise ValueError('No benchmark cases selected')
+
+    #Run the benchmarks
+    resultsFile = os.path.join(args.output,'benchmarkResults_'+time.strftime('%Y%m%d_%H%M%S')+'.json')
+    benchmarkResults = benchmarkHelper.runBenchmarks(cases,resultsFile,modelFile,guessFile,dataPath)
+    print(benchmarkResults[['case','status','wallTime','numIterations','objective','peakMemoryMB']].to_string())
+    print('Results saved to '+resultsFile)
+
+    #Compare against the baseline
+    baselineFile = os.path.join(args.output,'benchmarkBaseline.json')
+    if os.path.isfile(baselineFile):
+        comparison = benchmarkHelper.compareBenchmarks(benchmarkResults,
+                                                       benchmarkHelper.loadBenchmarkResults(baselineFile))
+        print(comparison.to_string())
+        if comparison['regression'].any():
+            print('Regressions found in: '+', '.join(comparison['case'][comparison['regression']]))
+        else:
+            print('No regressions found against the baseline.')
+    else:
+        print('No baseline found at '+baselineFile)
+
+    #Update the baseline
+    if args.update_baseline:
+        with open(resultsFile,'r') as resultsJson, open(baselineFile,'w') as baselineJson:
+            baselineJson.write(resultsJson.read())
+        print('Baseline updated.')
+
+    #Exit with an error if there were regressions, so this can be used in checks
+    if os.path.isfile(baselineFile) and not args.update_baseline and comparison['regression'].any():
+        sys.exit(1)
+
+# %% ----- End of ShoulderStrengthSims_Benchmark.py ----- %% #
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code checks the variant models before a sweep, without creating any
+Opensim models (see modelHelper.readModelInventory). The muscle properties and
+coordinate ranges of each model are streamed from the model files across a pool
+of processes, and each model is compared against the baseline model. The
+inventories and differences are written to .csv files, and any variant that
+changes more than the max isometric force of its muscle group at its scale
+factor is printed.
+
+Usage:
+    python ShoulderStrengthSims_InspectModels.py [options]
+
+Options:
+    --models SOURCE [SOURCE ...]    model files, overlay files or wildcard
+                                    patterns to inspect (default is every .osim
+                                    file in the model directory)
+    --baseline PATH                 path to the baseline model file
+    --processes N                   number of worker processes
+    --output PATH                   directory to write the .csv files to
+
+"""
+
+# %% Import packages
+
+import argparse
+import os
+import sys
+import numpy as np
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import batchHelper
+import modelHelper
+
+# %% Run inspection
+
+if __name__ == '__main__':
+
+    #Set the paths
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+
+    #Read the command line arguments
+    parser = argparse.ArgumentParser(description = 'Inspect the variant models against the baseline model')
+    parser.add_argument('--models', nargs = '+', default = [os.path.join(modelPath,'*.osim')],
+                        help = 'model files, overlay files or wildcard patterns to inspect')
+    parser.add_argument('--baseline', default = os.path.join(modelPath,'BaselineModel.osim'),
+                        help = 'path to the baseline model file')
+    parser.add_argument('--processes', type = int, default = None,
+                        help = 'number of worker processes')
+    parser.add_argument('--output', default = os.path.join(modelPath,'Inventory'),
+                        help = 'directory to write the .csv files to')
+    args = parser.parse_args()
+
+    #Get the model sources, with the baseline model first
+    modelSources = [source for source in modelHelper.getVariantSources(args.models)
+                    if isinstance(source, dict) or os.path.abspath(source) != os.path.abspath(args.baseline)]
+    modelSources = [args.baseline] + modelSources
+    baselineModel = os.path.splitext(os.path.basename(args.baseline))[0]
+
+    #Read the inventories and compare against the baseline
+    muscleTable, coordinateTable = modelHelper.getModelInventories(modelSources,args.processes)
+    diffTable = modelHelper.diffModelInventories(muscleTable,coordinateTable,baselineModel)
+
+    #Write the tables
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    muscleTable.to_csv(os.path.join(args.output,'muscleInventory.csv'), index = False)
+    coordinateTable.to_csv(os.path.join(args.output,'coordinateInventory.csv'), index = False)
+    diffTable.to_csv(os.path.join(args.output,'modelDiffs.csv'), index = False)
+    print(str(len(modelSources))+' models inspected, '+str(diffTable['model'].nunique())+
+          ' differ from '+baselineModel)
+
+    #Check each strength variant only scales the max isometric force of its group
+    nUnexpected = 0
+    for modelName, modelDiffs in diffTable.groupby('model'):
+        muscleGroup, scaleFactor = batchHelper.getVariantInfo(modelName)
+        if muscleGroup in ['Baseline','Combined']:
+            continue
+        isExpected = (modelDiffs['property'] == 'max_isometric_force') & \
+            modelDiffs['component'].isin(muscleGroup.split('_')) & \
+            np.isclose(modelDiffs['ratio'], scaleFactor)
+        if not isExpected.all() or len(modelDiffs) != len(muscleGroup.split('_')):
+            nUnexpected += 1
+            print('Unexpected differences in '+modelName+':')
+            print(modelDiffs.to_string(index = False))
+    print(str(nUnexpected)+' variants with unexpected differences')
+
+# %% ----- End of ShoulderStrengthSims_InspectModels.py ----- %% #
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code runs the simulations described in a job manifest without any user
+input, so that sweeps can be left to run unattended (e.g. overnight or on a
+cluster node). The jobs are added to a persistent job queue in the output
+directory, which records the state of each job. Running the same manifest again
+after an interruption carries on with the remaining jobs, and completed jobs are
+never re-solved. Once the jobs are finished, the solutions are added to a
+results store in the output directory (see resultsHelper). See queueHelper for
+the manifest format, and the Manifests directory for examples.
+
+The same manifest can be run on several nodes at once to share the jobs, as
+long as the output directory is on a filesystem shared by the nodes (or several
+times on one machine, e.g. to try out a run before moving it to a cluster).
+Each run takes the next pending job whenever one of its workers is free, and
+the jobs of a run that stops (e.g. a node going down) are reclaimed by the
+other runs once its heartbeat has expired (see queueHelper.reclaimJobs).
+
+Usage:
+    python ShoulderStrengthSims_RunManifest.py manifest.json [options]
+
+Options:
+    --status            print the state of the jobs in the queue and exit
+    --retry-failed      run failed jobs again if they have attempts left
+    --processes N       number of worker processes (overrides the manifest)
+    --threads N         number of threads per worker (overrides the manifest)
+    --profile           profile the phases of the jobs, writing a Chrome trace
+                        and timing table to a Profiles folder in the output
+                        directory
+
+"""
+
+# %% Import packages
+
+import argparse
+import json
+import os
+import sys
+import time
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes. The other helper functions are
+#imported once the thread limits of the manifest have been set, as the thread
+#pools of numpy and pandas are started when they are imported and are inherited
+#by the worker processes (see threadHelper).
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+
+# %% Run manifest
+
+if __name__ == '__main__':
+
+    #Read the command line arguments
+    parser = argparse.ArgumentParser(description = 'Run the simulations in a job manifest through a resumable job queue')
+    parser.add_argument('manifest', help = 'path to the manifest .json file')
+    parser.add_argument('--status', action = 'store_true',
+                        help = 'print the state of the jobs in the queue and exit')
+    parser.add_argument('--retry-failed', action = 'store_true',
+                        help = 'run failed jobs again if they have attempts left')
+    parser.add_argument('--processes', type = int, default = None,
+                        help = 'number of worker processes')
+    parser.add_argument('--threads', type = int, default = None,
+                        help = 'number of threads per worker')
+    parser.add_argument('--profile', action = 'store_true',
+                        help = 'profile the phases of the jobs')
+    args = parser.parse_args()
+
+    #Set the thread limits from the manifest before numpy and pandas are
+    #imported, so that they are in place for the worker processes
+    if args.threads is None:
+        with open(args.manifest,'r') as jsonFile:
+            args.threads = json.load(jsonFile).get('threadsPerWorker', 1)
+    threadHelper.setThreadLimits(args.threads)
+    import batchHelper
+    import profileHelper
+    import queueHelper
+    import resultsHelper
+
+    #Load the manifest and set the Moco thread limits before opensim is
+    #imported
+    manifest = queueHelper.loadManifest(args.manifest)
+    if args.processes is not None:
+        manifest['nProcesses'] = args.processes
+    manifest['threadsPerWorker'] = args.threads
+    batchHelper.limitWorkerThreads(manifest['threadsPerWorker'])
+
+    #Print the queue status
+    if args.status:
+        queueSummary = queueHelper.getQueueSummary(manifest['queueFile'])
+        if len(queueSummary) == 0:
+            print('No jobs in queue '+manifest['queueFile'])
+        else:
+            print(queueSummary[['jobId','state','attempts','nodeId']].to_string())
+            print(queueSummary['state'].value_counts().to_string())
+        sys.exit()
+
+    #Add the manifest jobs to the queue, leaving the running jobs to be
+    #reclaimed if their runners have stopped, as other nodes may be working
+    #on the queue
+    queueSummary = queueHelper.initQueue(manifest['queueFile'],queueHelper.getManifestJobs(manifest),
+                                         retryFailed = args.retry_failed, resetRunning = False,
+                                         maxAttempts = manifest['maxAttempts'])
+    print(str(len(queueSummary))+' jobs in queue '+manifest['queueFile']+' ('+
+          ', '.join([str(count)+' '+state for state, count in queueSummary['state'].value_counts().items()])+')')
+
+    #Turn on profiling before the worker processes are started
+    if args.profile:
+        profilePath = os.path.join(manifest['outputPath'],'Profiles',
+                                   'Manifest_'+time.strftime('%Y%m%d_%H%M%S'))
+        profileHelper.enableProfiling(profilePath)
+
+    #Run the pending jobs
+    queueSummary = batchHelper.runJobQueue(manifest['queueFile'],
+                                           nProcesses = manifest['nProcesses'],
+                                           threadsPerWorker = manifest['threadsPerWorker'],
+                                           solvesPerWorker = manifest['solvesPerWorker'],
+                                           summaryFile = os.path.join(manifest['outputPath'],
+                                                                      'batchSummary_'+manifest['taskName']+'.csv'))
+
+    #Print the summary
+    print(queueSummary[['jobId','state','attempts']].to_string())
+
+    #Add the new solutions to the results store of the output directory
+    resultsHelper.ingestSolutions(os.path.join(manifest['outputPath'],'ResultsStore'),
+                                  resultsHelper.findSolutionFiles(manifest['outputPath']),
+                                  manifest['taskName'])
+
+    #Write the trace and timing table of the run
+    if args.profile:
+        timingTable = profileHelper.getTimingTable(profileHelper.mergeTraces(profilePath))
+        timingTable.to_csv(os.path.join(profilePath,'timingTable.csv'), index = False)
+        print(timingTable.to_string())
+        print('Trace written to '+os.path.join(profilePath,'pipelineTrace.json'))
+
+# %% ----- End of ShoulderStrengthSims_RunManifest.py ----- %% #
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code runs the strength variant sweep as a single streaming pipeline (see
+pipelineHelper), in place of running ShoulderStrengthSims_1_GenerateModels.py,
+ShoulderStrengthSims_3_RunStrengthSimulations.py and
+ShoulderStrengthSims_4_AnalyseSimulations.py one after the other. Each variant
+is solved as soon as its model has been generated, and each solution analysed
+as soon as it has been solved, so the machine is kept busy across the whole
+sweep. The variants are solved independently from the baseline solution (or the
+starting guess), as continuation chains need the solves of a group in order.
+
+The worker count of each stage can be set to balance the stages. The share of
+time the workers of each stage were busy is printed at the end, where a stage
+close to fully busy is holding back the others.
+
+Movement task options that can be simulated are currently:
+    - 'ConcentricUpwardReach105'
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+
+#Number of threads each solve worker can use. This is set before the helper
+#functions are imported, as the thread pools of numpy and pandas are started
+#when they are imported and are inherited by the worker processes (see
+#threadHelper).
+threadsPerWorker = 1
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+threadHelper.setThreadLimits(threadsPerWorker)
+import pandas as pd
+import batchHelper
+import modelHelper
+import pipelineHelper
+
+# %% Pipeline settings
+
+#Set scale factors to weaken muscles by
+scaleFactors = [0.8,0.9,1.1,1.2]
+
+#Create a list of muscle(s) to alter
+muscToAlter = [['TRP1','TRP2'],
+    ['TRP3','TRP4'],
+    ['SRA1','SRA2','SRA3'],
+    ['DELT1'],
+    ['DELT2'],
+    ['DELT3'],
+    ['SUPSP'],
+    ['INFSP','TMIN'],
+    ['SUBSC'],
+    ['TMAJ'],
+    ['PECM1','PECM2','PECM3'],
+    ['LAT'],
+    ['CORB']]
+
+#Number of workers in each stage (the solve stage defaults to the number of CPUs
+#divided by the threads per worker)
+stageWorkers = {'generate': 1, 'solve': None, 'analyse': 2}
+
+#Write the variant model files to the model directory as they are generated
+#(False creates the models in memory)
+writeModelFiles = True
+
+#Use the solution cache so that unchanged problems aren't re-solved
+useSolutionCache = True
+
+#Watchdog rules for stopping solves that stall or diverge (see watchdogHelper)
+watchdogSettings = {'maxWallTime': 3600, 'maxIterations': 3000}
+retryMeshInterval = 25
+
+# %% Run pipeline
+
+if __name__ == '__main__':
+
+    #Set the thread limits before opensim is imported, so that they are in
+    #place for the worker processes
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+    import osimHelper
+
+    #Set main directory
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+
+    #Set task name to be simulated
+    print('Select task to simulate:')
+    print('[1] Concetric Upward Reach 105')
+    taskNo = input('Enter number selection: ')
+    taskNo = int(taskNo)
+    if taskNo == 1:
+        print('Concentric upward reach 105 task selected.')
+        taskName = 'ConcentricUpwardReach105'
+        meshInterval = 50
+    else:
+        raise ValueError('No tasks match the input number')
+
+    #Set the directories
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+    dataPath = os.path.join(mainPath,'..','..','SupportingData')
+    guessPath = os.path.join(mainPath,'..','..','GuessFiles')
+    taskPath = os.path.join(mainPath,'..','..','SimulationResults',taskName)
+    if useSolutionCache:
+        cachePath = os.path.join(mainPath,'..','..','SimulationResults','SolutionCache')
+        modelCachePath = os.path.join(cachePath,'ProcessedModels')
+    else:
+        cachePath = None
+        modelCachePath = None
+
+    #Load task bounds
+    taskBounds = osimHelper.loadTaskBounds(dataPath)
+
+    #Use the baseline solution as the guess if it exists, otherwise use the
+    #starting guess for the task
+    guessFile = os.path.join(taskPath,'BaselineSim_'+taskName+'_'+str(meshInterval*2+1)+'nodes_solution.sto')
+    if not os.path.isfile(guessFile):
+        guessFile = os.path.join(guessPath,taskName+'_StartingGuess.sto')
+    print('Using guess file: '+guessFile)
+
+    #Create the variant specifications
+    variantSpecs = modelHelper.getVariantSpecs(os.path.join(modelPath,'BaselineModel.osim'),
+                                               muscToAlter,scaleFactors)
+
+    #Run the pipeline
+    batchSummary, stageStats, errorList = \
+        pipelineHelper.runPipeline(variantSpecs,taskName,guessFile,meshInterval,taskBounds,taskPath,
+                                   storePath = os.path.join(taskPath,'AnalysisStore'),
+                                   modelPath = modelPath if writeModelFiles else None,
+                                   stageWorkers = {stageName: stageWorkers[stageName] for stageName in stageWorkers
+                                                   if stageWorkers[stageName] is not None},
+                                   threadsPerWorker = threadsPerWorker,
+                                   cachePath = cachePath, modelCachePath = modelCachePath,
+                                   watchdogSettings = watchdogSettings,
+                                   fallbackGuessFile = os.path.join(guessPath,taskName+'_StartingGuess.sto'),
+                                   retryMeshInterval = retryMeshInterval)
+
+    #Print the summary and the utilisation of each stage
+    print(batchSummary[['variant','status','numIterations','wallTime']].to_string())
+    print(pd.DataFrame(stageStats).T.to_string())
+
+# %% ----- End of ShoulderStrengthSims_RunPipeline.py ----- %% #
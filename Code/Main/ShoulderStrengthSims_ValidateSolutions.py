@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+This code checks that the baseline and strength variant solutions are
+dynamically consistent, by replaying the solved controls of each solution in a
+forward simulation of its processed model from the solved initial state (see
+validationHelper). The errors between the integrated and solved states, the
+marker end point errors at the end of the forward simulation and the cost of
+each integration are written to validationSummary_<taskName>.csv in the task
+results directory. The forward simulations are spread across a pool of
+processes, and the results are cached so that this can be re-run as new
+solutions are added without integrating the earlier solutions again.
+
+Movement task options that can be validated are currently:
+    - 'ConcentricUpwardReach105'
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+
+#Number of threads each worker can use. This is set before the helper functions
+#are imported, as the thread pools of numpy and pandas are started when they are
+#imported and are inherited by the worker processes (see threadHelper).
+threadsPerWorker = 1
+
+#Add the supplementary code directory to the path so that the helper functions
+#can also be found by the worker processes
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import threadHelper
+threadHelper.setThreadLimits(threadsPerWorker)
+import analysisHelper
+import batchHelper
+import modelHelper
+import resultsHelper
+import validationHelper
+
+# %% Validation settings
+
+#Number of worker processes (None uses the number of CPUs divided by the
+#threads per worker)
+nProcesses = None
+
+#Variant model sources, relative to the model directory (see
+#ShoulderStrengthSims_3_RunStrengthSimulations.py)
+variantSources = ['*_strength*.osim']
+
+#Use the validation cache so that unchanged solutions aren't integrated again
+useValidationCache = True
+
+# %% Run validation
+
+if __name__ == '__main__':
+
+    #Set the thread limits before opensim is imported, so that they are in
+    #place for the worker processes
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+
+    #Set main directory
+    mainPath = os.path.dirname(os.path.abspath(__file__))
+
+    #Set task name to be validated
+    print('Select task to validate:')
+    print('[1] Concetric Upward Reach 105')
+    taskNo = input('Enter number selection: ')
+    taskNo = int(taskNo)
+    if taskNo == 1:
+        print('Concentric upward reach 105 task selected.')
+        taskName = 'ConcentricUpwardReach105'
+    else:
+        raise ValueError('No tasks match the input number')
+
+    #Set the directories
+    modelPath = os.path.join(mainPath,'..','..','ModelFiles')
+    taskPath = os.path.join(mainPath,'..','..','SimulationResults',taskName)
+    modelCachePath = os.path.join(mainPath,'..','..','SimulationResults','SolutionCache','ProcessedModels')
+    if useValidationCache:
+        cachePath = os.path.join(mainPath,'..','..','SimulationResults','ValidationCache')
+    else:
+        cachePath = None
+
+    #Match the solutions to their variant models
+    modelFiles = modelHelper.getVariantSources([os.path.join(modelPath,source) for source in variantSources])
+    modelSources = analysisHelper.getVariantModelSources(modelFiles,os.path.join(modelPath,'BaselineModel.osim'))
+
+    #Validate the solutions
+    validationTable, errorList = validationHelper.runBatchValidation(resultsHelper.findSolutionFiles(taskPath),
+                                                                     modelSources,taskName,
+                                                                     cachePath = cachePath,
+                                                                     nProcesses = nProcesses,
+                                                                     threadsPerWorker = threadsPerWorker,
+                                                                     modelCachePath = modelCachePath,
+                                                                     summaryFile = os.path.join(taskPath,'validationSummary_'+taskName+'.csv'))
+
+    #Print the errors and integration cost of each solution, and the solutions
+    #that aren't consistent
+    if len(validationTable) > 0:
+        print(validationTable[['variant','nodes','valueMaxError','forwardMarkerMaxError',
+                               'solvedMarkerMaxError','integrationTime','integrationSteps',
+                               'isConsistent']].to_string(index = False))
+        print(str((~validationTable['isConsistent']).sum())+' of '+str(len(validationTable))+
+              ' solutions are not consistent with a forward simulation')
+
+# %% ----- End of ShoulderStrengthSims_ValidateSolutions.py ----- %% #
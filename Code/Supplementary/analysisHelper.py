@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for analysing the simulation solutions of
+a sweep after they have been solved, to get the joint reaction forces, muscle
+forces and fibre states at every time node. Each solution is analysed with the
+processed model of its variant, which is realised once and then evaluated at
+each of the solution states (see opensim.analyze), rather than running the
+per-file analyses. The solutions are spread across a pool of processes and the
+outputs are written as arrays to a results store (see resultsHelper). Functions
+defined here include:
+
+    getAnalysisPaths        gets the output paths to analyse for the muscle
+                            outputs and joint reactions
+
+    getVariantModelSources  maps variant names to their model sources
+
+    runSolutionAnalysis     analyses a single solution with the model of its
+                            variant (used by the worker processes)
+
+    runBatchAnalysis        spreads the analysis of a list of solutions across
+                            a pool of worker processes and adds the outputs to
+                            an analysis store
+
+The outputs are stored with their output path as the column label, e.g.
+/forceset/DELT2|tendon_force for a muscle output, and the six components of a
+joint reaction with a suffix, e.g. /jointset/shoulder2|reaction_on_child_fx.
+Joint reactions are the moment and force on the child body from the joint,
+expressed in the ground frame.
+
+Note that opensim is only imported within the worker function, so that the
+thread limits are in the worker environment before it is loaded (see
+threadHelper for the limits of numpy and pandas).
+
+"""
+
+# %% Import packages
+
+import multiprocessing as mp
+import os
+import time
+import traceback
+import numpy as np
+import batchHelper
+import profileHelper
+import resultsHelper
+
+# %% Settings
+
+#Muscle outputs to analyse
+muscleOutputs = ['tendon_force','active_fiber_force','passive_fiber_force',
+                 'fiber_length','normalized_fiber_length','normalized_fiber_velocity']
+
+#Joints to analyse the reactions of. The glenohumeral joint is the last of the
+#shoulder joints, which has the humerus as its child.
+reactionJoints = ['shoulder2']
+
+#Suffixes for the moment and force components of the joint reactions
+reactionSuffixes = ['_mx','_my','_mz','_fx','_fy','_fz']
+
+# %% getAnalysisPaths
+
+def getAnalysisPaths(analysisOutputs = None, analysisJoints = None):
+
+    # Gets the output paths to analyse, as regular expressions of the muscle
+    # outputs and joint reaction outputs
+    #
+    # Input:    analysisOutputs - list of muscle output names (default uses
+    #                             muscleOutputs)
+    #           analysisJoints - list of joint names for the reactions (default
+    #                            uses reactionJoints)
+    #
+    # Output:   scalarPaths - list of output paths of the muscle outputs
+    #           reactionPaths - list of output paths of the joint reactions
+
+    #Set the defaults
+    if analysisOutputs is None:
+        analysisOutputs = muscleOutputs
+    if analysisJoints is None:
+        analysisJoints = reactionJoints
+
+    #Create the output paths
+    scalarPaths = ['/forceset/.*\\|'+outputName for outputName in analysisOutputs]
+    reactionPaths = ['/jointset/'+jointName+'\\|reaction_on_child' for jointName in analysisJoints]
+
+    return scalarPaths, reactionPaths
+
+# %% getVariantModelSources
+
+def getVariantModelSources(modelFiles = None, baselineModelFile = None):
+
+    # Maps variant names to their model sources, as they are named in the
+    # solution files (see resultsHelper.getSolutionInfo)
+    #
+    # Input:    modelFiles - list of strings of paths to variant model files, or
+    #                        variant specification dictionaries (see
+    #                        modelHelper.getVariantSources)
+    #           baselineModelFile - optional string of path to the baseline
+    #                               model file for the baseline solutions
+    #
+    # Output:   modelSources - dictionary of variant name to model source, with
+    #                          the baseline model under 'Baseline'
+
+    #Check for appropriate inputs
+    if modelFiles is None:
+        raise ValueError('A list of model files is needed in getVariantModelSources')
+
+    #Map the variant names
+    modelSources = {}
+    for modelFile in modelFiles:
+        if isinstance(modelFile, dict):
+            modelSources[modelFile['name']] = modelFile
+        else:
+            modelSources[os.path.splitext(os.path.basename(modelFile))[0]] = modelFile
+    if baselineModelFile is not None:
+        modelSources['Baseline'] = baselineModelFile
+
+    return modelSources
+
+# %% runSolutionAnalysis
+
+def runSolutionAnalysis(analysisSettings = None):
+
+    # Worker function for analysing a single solution with the processed model
+    # of its variant. Any errors are caught and returned so that a failed
+    # solution doesn't bring down the rest of the batch.
+    #
+    # Input:    analysisSettings - dictionary containing:
+    #               solutionFile - string of path to the solution file
+    #               modelFile - string of path to the variant model file, or a
+    #                           variant specification dictionary
+    #               taskName - string of relevant task name options
+    #               modelCachePath - optional string of path to the processed
+    #                                model cache (see osimHelper.createSimModel)
+    #               scalarPaths - list of muscle output paths
+    #               reactionPaths - list of joint reaction output paths
+    #
+    # Output:   analysisResult - dictionary of the solution file, the output
+    #                            labels and data (with a row per time node),
+    #                            the analysis time and any error message
+
+    #Check for appropriate inputs
+    if analysisSettings is None:
+        raise ValueError('Analysis settings are needed in runSolutionAnalysis')
+
+    #Start the timer for the analysis
+    startTime = time.time()
+    analysisResult = {'solutionFile': analysisSettings['solutionFile'], 'labels': None,
+                      'data': None, 'errorMessage': None}
+
+    try:
+
+        #Import opensim and the helper functions within the worker, after the
+        #thread limits have been set in the environment
+        import opensim as osim
+        import modelHelper
+        import osimHelper
+
+        #Create the processed model of the variant, as it was solved
+        if isinstance(analysisSettings['modelFile'], dict):
+            osimModel = modelHelper.createVariantModel(analysisSettings['modelFile'])
+        else:
+            osimModel = analysisSettings['modelFile']
+        simModel = osimHelper.createSimModel(osimModel,analysisSettings['taskName'],
+                                             modelCachePath = analysisSettings.get('modelCachePath'))
+
+        #Load the solution states and controls
+        trajectory = osim.MocoTrajectory(analysisSettings['solutionFile'])
+        statesTable = trajectory.exportToStatesTable()
+        controlsTable = trajectory.exportToControlsTable()
+
+        #Analyse the muscle outputs and joint reactions at each time node
+        with profileHelper.profileSpan('analyzeOutputs','analysis'):
+            scalarTable = osim.analyze(simModel,statesTable,controlsTable,
+                                       analysisSettings['scalarPaths'])
+            reactionTable = osim.analyzeSpatialVec(simModel,statesTable,controlsTable,
+                                                   analysisSettings['reactionPaths'])
+            reactionTable = reactionTable.flatten(reactionSuffixes)
+
+        #Collect the outputs as arrays
+        labels = ['time'] + list(scalarTable.getColumnLabels()) + list(reactionTable.getColumnLabels())
+        data = np.column_stack([np.array(scalarTable.getIndependentColumn()),
+                                scalarTable.getMatrix().to_numpy(),
+                                reactionTable.getMatrix().to_numpy()])
+        analysisResult.update({'labels': labels, 'data': data})
+
+    except Exception as err:
+
+        #Record the error for the solution
+        analysisResult['errorMessage'] = repr(err)+'\n'+traceback.format_exc()
+
+    #Set the overall time for the analysis
+    analysisResult['wallTime'] = time.time() - startTime
+
+    #Record the analysis in the profile and write out the spans of the worker
+    profileHelper.addSpan('runSolutionAnalysis','job',startTime,analysisResult['wallTime'],
+                          {'solutionFile': os.path.basename(analysisSettings['solutionFile'])})
+    profileHelper.flushTrace()
+
+    return analysisResult
+
+# %% runBatchAnalysis
+
+def runBatchAnalysis(solutionFiles = None, modelSources = None, taskName = None,
+                     storePath = None, nProcesses = None, threadsPerWorker = 1,
+                     modelCachePath = None, analysisOutputs = None, analysisJoints = None,
+                     writeEvery = 16):
+
+    # Spreads the analysis of a list of solutions across a pool of worker
+    # processes. Solutions already analysed are skipped unless the solution
+    # file has changed. The outputs are added to the analysis store as they
+    # finish, in groups so that an interrupted batch keeps most of its work.
+    #
+    # Input:    solutionFiles - list of strings of paths to solution files
+    #           modelSources - dictionary of variant name to model source (see
+    #                          getVariantModelSources)
+    #           taskName - string of relevant task name options
+    #           storePath - string of path to the analysis store directory
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs divided by the threads per worker)
+    #           threadsPerWorker - number of threads each worker can use
+    #           modelCachePath - optional string of path to the processed model
+    #                            cache (see osimHelper.createSimModel)
+    #           analysisOutputs - list of muscle output names (default uses
+    #                             muscleOutputs)
+    #           analysisJoints - list of joint names for the reactions (default
+    #                            uses reactionJoints)
+    #           writeEvery - number of analysed solutions to add to the store
+    #                        at a time
+    #
+    # Output:   resultsIndex - pandas dataframe of the analysis store index
+    #           errorList - list of (solution file, error message) tuples of
+    #                       the solutions that couldn't be analysed
+
+    #Check for appropriate inputs
+    if solutionFiles is None or modelSources is None or taskName is None or storePath is None:
+        raise ValueError('Solution files, model sources, task name and store path are needed in runBatchAnalysis')
+
+    #Get the output paths
+    scalarPaths, reactionPaths = getAnalysisPaths(analysisOutputs,analysisJoints)
+
+    #Create the settings for each new solution, matching it to its model
+    jobList = []
+    errorList = []
+    solutionRows = {}
+    for solutionFile in resultsHelper.getNewSolutions(storePath,solutionFiles):
+        solutionRow = resultsHelper.getSolutionRow(solutionFile,taskName)
+        if solutionRow['muscleGroup'] == 'Baseline':
+            modelFile = modelSources.get('Baseline')
+        else:
+            modelFile = modelSources.get(solutionRow['variant'])
+        if modelFile is None:
+            errorList.append((solutionFile,'No model found for variant '+solutionRow['variant']))
+            continue
+        solutionRows[os.path.abspath(solutionFile)] = solutionRow
+        jobList.append({'solutionFile': os.path.abspath(solutionFile), 'modelFile': modelFile,
+                        'taskName': taskName, 'modelCachePath': modelCachePath,
+                        'scalarPaths': scalarPaths, 'reactionPaths': reactionPaths})
+    print(str(len(jobList))+' solutions to analyse')
+
+    #Run the analyses across the pool
+    if len(jobList) > 0:
+
+        #Set the number of processes if not specified
+        if nProcesses is None:
+            nProcesses = max(1, mp.cpu_count() // threadsPerWorker)
+        nProcesses = max(1, min(nProcesses, len(jobList)))
+
+        #Set the thread limits in the current environment
+        batchHelper.limitWorkerThreads(threadsPerWorker)
+
+        #Analyse the solutions, adding the outputs to the store in groups
+        finishedRows = []
+        finishedData = []
+        batchStart = time.time()
+        with mp.Pool(processes = nProcesses, initializer = batchHelper.limitWorkerThreads,
+                     initargs = (threadsPerWorker,)) as pool:
+            for nFinished, analysisResult in enumerate(pool.imap_unordered(runSolutionAnalysis, jobList,
+                                                                           chunksize = 1), 1):
+                if analysisResult['errorMessage'] is not None:
+                    errorList.append((analysisResult['solutionFile'],analysisResult['errorMessage']))
+                else:
+                    finishedRows.append(solutionRows[analysisResult['solutionFile']])
+                    finishedData.append((analysisResult['labels'],analysisResult['data']))
+                print('Analysed '+os.path.basename(analysisResult['solutionFile'])+' in '+
+                      str(round(analysisResult['wallTime'],1))+' s ['+str(nFinished)+'/'+
+                      str(len(jobList))+' after '+str(round(time.time()-batchStart,1))+' s]')
+                if len(finishedRows) >= writeEvery:
+                    resultsHelper.addStoreSolutions(storePath,finishedRows,finishedData)
+                    finishedRows = []
+                    finishedData = []
+
+        #Add the remaining outputs
+        if len(finishedRows) > 0:
+            resultsHelper.addStoreSolutions(storePath,finishedRows,finishedData)
+
+    #Print any errors
+    for solutionFile, errorMessage in errorList:
+        print('Could not analyse '+solutionFile+': '+errorMessage.splitlines()[0])
+
+    return resultsHelper.loadResultsIndex(storePath), errorList
+
+# %%
@@ -0,0 +1,1060 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for running the strength variant simulations
+in batches across a pool of processes. Functions defined here include:
+
+    getVariantInfo          splits a variant model name into its muscle group
+                            label and strength scale factor
+
+    limitWorkerThreads      caps the number of threads the numerical libraries
+                            used by each worker process can start
+
+    runVariantSimulation    configures, solves and writes the solution for a
+                            single variant model (used by the worker processes)
+
+    runBatchSimulations     spreads a list of variant models across a pool of
+                            worker processes and writes a status summary
+
+    writeBatchSummary       writes the list of variant summaries to a .csv file
+
+    getLibrarySolutions     lists the converged solutions in a solution library
+                            by muscle group, scale factor and number of nodes
+
+    addLibrarySolution      copies a converged solution into a solution library
+
+    findNearestSolution     finds the library solution closest in strength to
+                            a variant for use as a guess
+
+    getContinuationChains   orders the variant models into chains moving away
+                            from the baseline strength for each muscle group
+
+    runContinuationChain    solves a chain of variants in order, seeding each
+                            solve from the nearest converged solution
+
+    runContinuationSimulations  spreads the continuation chains across a pool
+                                of worker processes and writes a status summary
+
+    runQueuedJob            claims, solves and finishes a single job from a job
+                            queue (used by the worker processes)
+
+    runJobQueue             spreads the pending jobs of a job queue across a
+                            pool of worker processes, alongside any runners on
+                            other nodes sharing the queue
+
+Note that opensim is only imported within the worker function, so that the
+thread limits are in the worker environment before it is loaded. The limits of
+numpy and pandas, which are imported with this file, need to be set by the
+entry scripts before this file is imported (see threadHelper).
+
+"""
+
+# %% Import packages
+
+import glob
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import time
+import traceback
+import pandas as pd
+import profileHelper
+import threadHelper
+import tuneHelper
+
+# %% Settings
+
+#Columns to include in the batch summary file
+summaryColumns = ['variant','muscleGroup','scaleFactor','meshInterval','status',
+                  'success','numIterations','objective','solverDuration',
+                  'wallTime','cacheHit','attempts','abortReason','workerPid',
+                  'guessFile','solutionFile','errorMessage']
+
+#Task templates built in the current worker process, keyed by the task, time
+#reference file, mesh interval, threads and solver settings (see
+#osimHelper.createTaskTemplate)
+taskTemplates = {}
+
+# %% getVariantInfo
+
+def getVariantInfo(variantName = None):
+
+    # Convenience function for splitting a variant name into its muscle group
+    # label and scale factor (e.g. 'DELT1_strength80' becomes 'DELT1' and 0.8).
+    # The baseline model returns a 'Baseline' label with a scale factor of 1,
+    # and variants that combine several muscle groups (see
+    # modelHelper.getCombinedVariantSpecs) a 'Combined' label with a nan scale
+    # factor.
+    #
+    # Input:    variantName - string of variant name, path to variant model file
+    #                         or variant specification dictionary
+    #
+    # Output:   muscleGroup - string of muscle group label
+    #           scaleFactor - float of strength scale factor
+
+    #Check for appropriate inputs
+    if variantName is None:
+        raise ValueError('A variant name is needed in getVariantInfo')
+
+    #Get the name from a variant specification (see modelHelper.getVariantSpecs)
+    if isinstance(variantName, dict):
+        return variantName['muscleGroup'], variantName['scaleFactor']
+
+    #Remove any path and file extension
+    variantName = os.path.splitext(os.path.basename(variantName))[0]
+
+    #Split the name at the strength label
+    if '_strength' in variantName:
+        muscleGroup, scaleStr = variantName.rsplit('_strength',1)
+        scaleFactor = int(scaleStr) / 100
+    elif variantName.startswith('Combined_'):
+        muscleGroup = 'Combined'
+        scaleFactor = float('nan')
+    else:
+        muscleGroup = 'Baseline'
+        scaleFactor = 1.0
+
+    return muscleGroup, scaleFactor
+
+# %% limitWorkerThreads
+
+def limitWorkerThreads(nThreads = 1):
+
+    # Sets the thread limits of the numerical libraries and the Moco parallel
+    # evaluations in the current process. This is used as the worker
+    # initialiser so that each process in the pool doesn't start a thread per
+    # core and oversubscribe the machine. The limits of libraries that are
+    # already loaded are only changed if threadpoolctl is available (see
+    # threadHelper).
+    #
+    # Input:    nThreads - number of threads each worker can use
+
+    #Set the thread limits of the numerical libraries
+    threadHelper.setThreadLimits(nThreads)
+
+    #Set the Moco parallel evaluations, where 1 would use every hardware thread
+    import osimHelper
+    os.environ['OPENSIM_MOCO_PARALLEL'] = str(osimHelper.getMocoParallel(nThreads))
+
+# %% runVariantSimulation
+
+def runVariantSimulation(jobSettings = None):
+
+    # Worker function for solving the task with a single variant model. Any
+    # errors are caught and returned in the summary so that a failed variant
+    # doesn't bring down the rest of the batch.
+    #
+    # Input:    jobSettings - dictionary containing:
+    #               modelFile - string of path to variant model file, or a
+    #                           variant specification dictionary (see
+    #                           modelHelper.getVariantSpecs) to create the
+    #                           model in memory
+    #               taskName - string of relevant task name options
+    #               guessFile - string of path to guess file
+    #               meshInterval - number of mesh intervals for the solver
+    #               taskBounds - list of the elevation, rotation and angle task
+    #                            bound dataframes (see osimHelper.loadTaskBounds)
+    #               outputPath - string of path to write solution to
+    #               nThreads - number of threads for the solver to use
+    #               timeReferenceFile - optional string of path to the file used
+    #                                   to set the time bounds
+    #               meshRefinement - optional list of mesh intervals to solve
+    #                                over with staged refinement (see
+    #                                osimHelper.runMeshRefinement), replacing
+    #                                the single solve at the mesh interval
+    #               solverSettings - optional dictionary of solver settings
+    #                                that replace the defaults (see
+    #                                osimHelper.defaultSolverSettings)
+    #               cachePath - optional string of path to the solution cache
+    #                           directory (see cacheHelper.solveStudy). The model
+    #                           landmarks and processed models are also cached,
+    #                           and the solves checkpointed, in Landmarks,
+    #                           ProcessedModels and Checkpoints folders within
+    #                           this directory.
+    #               watchdog - optional dictionary of watchdog rules to solve
+    #                          with (see watchdogHelper.watchdogDefaults). The
+    #                          wall time limit applies to the whole job.
+    #               fallbackGuessFile - optional string of path to a guess file
+    #                                   to retry with if the watchdog stops the
+    #                                   solve
+    #               retryMeshInterval - optional (coarser) number of mesh
+    #                                   intervals to retry at if the watchdog
+    #                                   stops the solve
+    #               ipoptOptions - optional dictionary of IPOPT options to solve
+    #                              with (see cacheHelper.solveStudy)
+    #
+    # Output:   summary - dictionary of the variant status and timing
+
+    #Check for appropriate inputs
+    if jobSettings is None:
+        raise ValueError('Job settings are needed in runVariantSimulation')
+
+    #Start the timer for the job
+    startTime = time.time()
+
+    #Set the variant details in the summary
+    if isinstance(jobSettings['modelFile'], dict):
+        variantName = jobSettings['modelFile']['name']
+    else:
+        variantName = os.path.splitext(os.path.basename(jobSettings['modelFile']))[0]
+    muscleGroup, scaleFactor = getVariantInfo(variantName)
+    summary = dict.fromkeys(summaryColumns)
+    summary.update({'variant': variantName, 'muscleGroup': muscleGroup,
+                    'scaleFactor': scaleFactor, 'workerPid': os.getpid(),
+                    'guessFile': jobSettings['guessFile']})
+
+    try:
+
+        #Import opensim and the helper functions within the worker, after the
+        #thread limits have been set in the environment
+        import cacheHelper
+        import modelHelper
+        import osimHelper
+        import watchdogHelper
+
+        #Create the processed model for the variant, creating the variant in
+        #memory if it is given as a specification
+        if isinstance(jobSettings['modelFile'], dict):
+            with profileHelper.profileSpan('createVariantModel','model'):
+                osimModel = modelHelper.createVariantModel(jobSettings['modelFile'])
+        else:
+            osimModel = jobSettings['modelFile']
+
+        #Set the landmark and processed model caches and the solve checkpoints
+        #within the solution cache
+        if jobSettings.get('cachePath') is not None:
+            landmarkCachePath = os.path.join(jobSettings['cachePath'],'Landmarks')
+            modelCachePath = os.path.join(jobSettings['cachePath'],'ProcessedModels')
+            checkpointPath = os.path.join(jobSettings['cachePath'],'Checkpoints')
+        else:
+            landmarkCachePath = None
+            modelCachePath = None
+            checkpointPath = None
+        simModel = osimHelper.createSimModel(osimModel,jobSettings['taskName'],
+                                             modelCachePath = modelCachePath)
+
+        #Get the task template, building it with the first model solved by
+        #the worker. The time bounds are kept relative to the reference file,
+        #or the guess file if there isn't one.
+        timeReferenceFile = jobSettings.get('timeReferenceFile')
+        if timeReferenceFile is None:
+            timeReferenceFile = jobSettings['guessFile']
+        if jobSettings.get('meshRefinement') is not None:
+            templateMeshInterval = jobSettings['meshRefinement'][0]
+        else:
+            templateMeshInterval = jobSettings['meshInterval']
+        templateKey = (jobSettings['taskName'],os.path.abspath(timeReferenceFile),
+                       templateMeshInterval,jobSettings['nThreads'],
+                       json.dumps(jobSettings.get('solverSettings'), sort_keys = True))
+        if templateKey not in taskTemplates:
+            taskTemplates[templateKey] = \
+                osimHelper.createTaskTemplate(jobSettings['taskName'],simModel,
+                                              timeReferenceFile,*jobSettings['taskBounds'],
+                                              meshInterval = templateMeshInterval,
+                                              nThreads = jobSettings['nThreads'],
+                                              landmarkCachePath = landmarkCachePath,
+                                              solverSettings = jobSettings.get('solverSettings'))
+        taskTemplate = taskTemplates[templateKey]
+
+        #Set the watchdog rules, with the wall time limit covering the whole job
+        watchdogSettings = None
+        if jobSettings.get('watchdog') is not None:
+            watchdogSettings = dict(watchdogHelper.watchdogDefaults)
+            watchdogSettings.update(jobSettings['watchdog'])
+
+        #Set the details of a job that runs out of time before its first solve
+        solutionFile = None
+        solveInfo = {'meshInterval': jobSettings['meshInterval'], 'status': 'Aborted',
+                     'success': False, 'numIterations': 0, 'objective': None,
+                     'solverDuration': 0.0, 'cacheHit': False,
+                     'abortReason': 'wall time limit reached before the solve started'}
+
+        if jobSettings.get('meshRefinement') is not None:
+
+            #Limit the refinement to the time left for the job
+            refinementWatchdogSettings = watchdogSettings
+            if watchdogSettings is not None and watchdogSettings['maxWallTime'] is not None:
+                refinementWatchdogSettings = dict(watchdogSettings,
+                                                  maxWallTime = watchdogSettings['maxWallTime'] - (time.time() - startTime))
+
+            #Solve over the refinement meshes
+            solution, solutionFile, refinementSummary = \
+                osimHelper.runMeshRefinement(jobSettings['taskName'],simModel,
+                                             jobSettings['guessFile'],jobSettings['meshRefinement'],
+                                             *jobSettings['taskBounds'],
+                                             outputPath = jobSettings['outputPath'],
+                                             studyName = variantName+'_'+jobSettings['taskName'],
+                                             cachePath = jobSettings.get('cachePath'),
+                                             taskTemplate = taskTemplate,
+                                             watchdogSettings = refinementWatchdogSettings,
+                                             checkpointPath = checkpointPath,
+                                             ipoptOptions = jobSettings.get('ipoptOptions'))
+
+            #Get the details of the final mesh solved
+            solveInfo = refinementSummary.iloc[-1].to_dict()
+
+        else:
+
+            #Set the solve attempts. A solve stopped by the watchdog is retried
+            #with the fallback guess and then at the coarser retry mesh.
+            attemptList = [(jobSettings['guessFile'],jobSettings['meshInterval'])]
+            if jobSettings.get('watchdog') is not None:
+                if jobSettings.get('fallbackGuessFile') is not None \
+                    and jobSettings['fallbackGuessFile'] != jobSettings['guessFile']:
+                    attemptList.append((jobSettings['fallbackGuessFile'],jobSettings['meshInterval']))
+                if jobSettings.get('retryMeshInterval') is not None:
+                    attemptList.append((jobSettings['guessFile'],jobSettings['retryMeshInterval']))
+
+            for guessFile, meshInterval in attemptList:
+
+                #Limit the watched solve to the time left for the job
+                attemptWatchdogSettings = watchdogSettings
+                if watchdogSettings is not None and watchdogSettings['maxWallTime'] is not None:
+                    attemptWatchdogSettings = dict(watchdogSettings,
+                                                   maxWallTime = watchdogSettings['maxWallTime'] - (time.time() - startTime))
+                    if attemptWatchdogSettings['maxWallTime'] <= 0:
+                        break
+
+                #Set the study name from the variant and number of nodes
+                studyName = variantName+'_'+jobSettings['taskName']+'_'+str(meshInterval*2+1)+'nodes'
+
+                #Set up the study
+                study = osimHelper.createTemplateStudy(taskTemplate,simModel,guessFile,studyName,
+                                                       {'num_mesh_intervals': meshInterval})
+
+                #Print setup file to the output directory
+                with profileHelper.profileSpan('printStudy','io'):
+                    study.printToXML(os.path.join(jobSettings['outputPath'],studyName+'.omoco'))
+
+                #Run optimisation, or get the solution from the cache
+                solutionFile = os.path.join(jobSettings['outputPath'],studyName+'_solution.sto')
+                solution, solveInfo = cacheHelper.solveStudy(study,solutionFile,
+                                                             jobSettings.get('cachePath'),
+                                                             guessFile,jobSettings['taskName'],
+                                                             variantName,meshInterval,
+                                                             watchdogSettings = attemptWatchdogSettings,
+                                                             checkpointPath = checkpointPath,
+                                                             ipoptOptions = jobSettings.get('ipoptOptions'))
+                solveInfo['meshInterval'] = meshInterval
+                summary['guessFile'] = guessFile
+                summary['attempts'] = attemptList.index((guessFile,meshInterval)) + 1
+
+                #Stop unless the watchdog stopped the solve
+                if solveInfo['abortReason'] is None:
+                    break
+
+        #Collect the solution details
+        for key in ['meshInterval','status','success','numIterations','objective',
+                    'solverDuration','cacheHit','abortReason']:
+            summary[key] = solveInfo[key]
+        summary['solutionFile'] = solutionFile
+
+    except Exception as err:
+
+        #Record the error for the variant
+        summary.update({'status': 'Error', 'success': False,
+                        'errorMessage': repr(err)+'\n'+traceback.format_exc()})
+
+    #Set the overall time for the job
+    summary['wallTime'] = time.time() - startTime
+
+    #Record the job in the profile and write out the spans of the worker
+    profileHelper.addSpan('runVariantSimulation','job',startTime,summary['wallTime'],
+                          {'variant': variantName, 'status': str(summary['status'])})
+    profileHelper.flushTrace()
+
+    return summary
+
+# %% runBatchSimulations
+
+def runBatchSimulations(modelFiles = None, taskName = None, guessFile = None,
+                        meshInterval = 50, taskBounds = None, outputPath = None,
+                        nProcesses = None, threadsPerWorker = 1, solvesPerWorker = 1,
+                        summaryFile = None, meshRefinement = None, cachePath = None,
+                        watchdogSettings = None, fallbackGuessFile = None,
+                        retryMeshInterval = None, autoTune = True):
+
+    # Spreads the variant model simulations across a pool of worker processes.
+    # Each worker is limited to the specified number of threads, and workers
+    # are replaced after the specified number of solves to limit the memory
+    # growth across repeated solves. The summary file is rewritten as each
+    # variant completes so that progress can be checked during the batch.
+    #
+    # Input:    modelFiles - list of strings of paths to variant model files, or
+    #                        variant specification dictionaries to create the
+    #                        models in memory (see modelHelper.getVariantSpecs)
+    #           taskName - string of relevant task name options
+    #           guessFile - string of path to guess file
+    #           meshInterval - number of mesh intervals for the solver
+    #           taskBounds - list of the elevation, rotation and angle task
+    #                        bound dataframes (see osimHelper.loadTaskBounds)
+    #           outputPath - string of path to write solutions to
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs divided by the threads per worker)
+    #           threadsPerWorker - number of threads each worker can use
+    #           solvesPerWorker - number of solves before a worker is replaced
+    #                             (None keeps workers for the whole batch)
+    #           summaryFile - string of path for the summary .csv file (default
+    #                         is batchSummary_<taskName>.csv in the output path)
+    #           meshRefinement - optional list of mesh intervals to solve each
+    #                            variant over with staged refinement
+    #           cachePath - optional string of path to the solution cache directory
+    #           watchdogSettings - optional dictionary of watchdog rules to solve
+    #                              with (see watchdogHelper.watchdogDefaults)
+    #           fallbackGuessFile - optional string of path to a guess file to
+    #                               retry with if the watchdog stops a solve
+    #           retryMeshInterval - optional (coarser) number of mesh intervals
+    #                               to retry at if the watchdog stops a solve
+    #           autoTune - whether to apply the tuned solver configuration for
+    #                      the host if there is one (see tuneHelper)
+    #
+    # Output:   batchSummary - pandas dataframe of each variants status and timing
+
+    #Check for appropriate inputs
+    if modelFiles is None or taskName is None or guessFile is None \
+        or taskBounds is None or outputPath is None:
+        raise ValueError('Model files, task name, guess file, task bounds and output path are needed in runBatchSimulations')
+
+    #Apply the tuned solver configuration for the host
+    solverSettings = None
+    ipoptOptions = None
+    if autoTune:
+        nProcesses, threadsPerWorker, solverSettings, ipoptOptions = \
+            tuneHelper.getTunedRunSettings(nProcesses,threadsPerWorker)
+
+    #Set the number of processes if not specified
+    if nProcesses is None:
+        nProcesses = max(1, mp.cpu_count() // threadsPerWorker)
+    #Don't start more processes than there are variants
+    nProcesses = max(1, min(nProcesses, len(modelFiles)))
+
+    #Set the summary file if not specified
+    if summaryFile is None:
+        summaryFile = os.path.join(outputPath,'batchSummary_'+taskName+'.csv')
+
+    #Create the output directory if needed
+    if not os.path.isdir(outputPath):
+        os.makedirs(outputPath)
+
+    #Create the settings for each job
+    jobList = [{'modelFile': modelFile, 'taskName': taskName,
+                'guessFile': guessFile, 'meshInterval': meshInterval,
+                'taskBounds': list(taskBounds), 'outputPath': outputPath,
+                'nThreads': threadsPerWorker, 'meshRefinement': meshRefinement,
+                'cachePath': cachePath, 'watchdog': watchdogSettings,
+                'fallbackGuessFile': fallbackGuessFile,
+                'retryMeshInterval': retryMeshInterval, 'solverSettings': solverSettings,
+                'ipoptOptions': ipoptOptions} for modelFile in modelFiles]
+
+    #Also set the thread limits in the current environment, so that they are
+    #inherited by the workers before opensim is loaded
+    limitWorkerThreads(threadsPerWorker)
+
+    #Run the jobs across the pool, collecting summaries as they finish
+    summaryList = []
+    batchStart = time.time()
+    with mp.Pool(processes = nProcesses, initializer = limitWorkerThreads,
+                 initargs = (threadsPerWorker,), maxtasksperchild = solvesPerWorker) as pool:
+        for summary in pool.imap_unordered(runVariantSimulation, jobList, chunksize = 1):
+            #Append the summary and rewrite the file
+            summaryList.append(summary)
+            writeBatchSummary(summaryList,summaryFile)
+            #Print progress
+            print('Finished '+summary['variant']+' ('+str(summary['status'])+') in '+
+                  str(round(summary['wallTime'],1))+' s ['+str(len(summaryList))+'/'+
+                  str(len(jobList))+' after '+str(round(time.time()-batchStart,1))+' s]')
+
+    #Sort the final summary by variant and write out
+    batchSummary = writeBatchSummary(summaryList,summaryFile,sortRows = True)
+
+    return batchSummary
+
+# %% writeBatchSummary
+
+def writeBatchSummary(summaryList = None, summaryFile = None, sortRows = False):
+
+    # Convenience function for writing the list of variant summaries to file
+    #
+    # Input:    summaryList - list of summary dictionaries from the worker function
+    #           summaryFile - string of path for the summary .csv file
+    #           sortRows - sort the summary by muscle group and scale factor
+    #
+    # Output:   batchSummary - pandas dataframe of the summaries
+
+    #Check for appropriate inputs
+    if summaryList is None or summaryFile is None:
+        raise ValueError('A summary list and file are needed in writeBatchSummary')
+
+    #Convert to dataframe
+    batchSummary = pd.DataFrame(summaryList, columns = summaryColumns)
+
+    #Sort if requested
+    if sortRows:
+        batchSummary = batchSummary.sort_values(['muscleGroup','scaleFactor']).reset_index(drop = True)
+
+    #Write to file, replacing the file in a single step as several runners of
+    #a shared job queue can write the same summary
+    batchSummary.to_csv(summaryFile+'.'+str(os.getpid())+'.tmp', index = False)
+    os.replace(summaryFile+'.'+str(os.getpid())+'.tmp', summaryFile)
+
+    return batchSummary
+
+# %% getLibrarySolutions
+
+def getLibrarySolutions(libraryPath = None):
+
+    # Lists the converged solutions stored in a solution library. Library files
+    # are named <muscleGroup>_strength<XX>_<N>nodes.sto, with the baseline
+    # solution stored under the 'Baseline' muscle group at a strength of 100.
+    #
+    # Input:    libraryPath - string of path to the solution library directory
+    #
+    # Output:   librarySolutions - pandas dataframe with muscleGroup, scaleFactor,
+    #                              nodes and solutionFile columns
+
+    #Check for appropriate inputs
+    if libraryPath is None:
+        raise ValueError('A library path is needed in getLibrarySolutions')
+
+    #Loop through the library files and get their details from the filename
+    libraryList = []
+    for solutionFile in sorted(glob.glob(os.path.join(libraryPath,'*_strength*_*nodes.sto'))):
+        variantName, nodeStr = os.path.splitext(os.path.basename(solutionFile))[0].rsplit('_',1)
+        muscleGroup, scaleFactor = getVariantInfo(variantName)
+        libraryList.append({'muscleGroup': muscleGroup, 'scaleFactor': scaleFactor,
+                            'nodes': int(nodeStr.replace('nodes','')),
+                            'solutionFile': solutionFile})
+
+    return pd.DataFrame(libraryList, columns = ['muscleGroup','scaleFactor','nodes','solutionFile'])
+
+# %% addLibrarySolution
+
+def addLibrarySolution(libraryPath = None, solutionFile = None, muscleGroup = None,
+                       scaleFactor = None, meshInterval = None):
+
+    # Copies a converged solution into the solution library. The file is copied
+    # to a temporary name and then renamed, so that other processes reading
+    # the library never see a partially written file.
+    #
+    # Input:    libraryPath - string of path to the solution library directory
+    #           solutionFile - string of path to the converged solution
+    #           muscleGroup - string of muscle group label
+    #           scaleFactor - float of strength scale factor
+    #           meshInterval - number of mesh intervals used in the solution
+    #
+    # Output:   libraryFile - string of path to the library copy of the solution
+
+    #Check for appropriate inputs
+    if libraryPath is None or solutionFile is None or muscleGroup is None \
+        or scaleFactor is None or meshInterval is None:
+        raise ValueError('All five input arguments are needed in addLibrarySolution')
+
+    #Create the library directory if needed
+    if not os.path.isdir(libraryPath):
+        os.makedirs(libraryPath)
+
+    #Set the library filename
+    libraryFile = os.path.join(libraryPath,muscleGroup+'_strength'+str(int(round(scaleFactor*100)))+
+                               '_'+str(meshInterval*2+1)+'nodes.sto')
+
+    #Copy to a temporary file and rename into place
+    tempFile = libraryFile+'.'+str(os.getpid())+'.tmp'
+    shutil.copyfile(solutionFile,tempFile)
+    os.replace(tempFile,libraryFile)
+
+    return libraryFile
+
+# %% findNearestSolution
+
+def findNearestSolution(libraryPath = None, muscleGroup = None, scaleFactor = None,
+                        meshInterval = None):
+
+    # Finds the converged library solution closest in strength to a variant.
+    # Solutions from the same muscle group and the baseline are considered,
+    # with the same muscle group preferred when the strengths are equally close.
+    #
+    # Input:    libraryPath - string of path to the solution library directory
+    #           muscleGroup - string of muscle group label
+    #           scaleFactor - float of strength scale factor
+    #           meshInterval - number of mesh intervals the solution needs to match
+    #
+    # Output:   solutionFile - string of path to the nearest solution (None if
+    #                          there are no matching solutions in the library)
+
+    #Check for appropriate inputs
+    if libraryPath is None or muscleGroup is None or scaleFactor is None or meshInterval is None:
+        raise ValueError('All four input arguments are needed in findNearestSolution')
+
+    #Get the library solutions for the muscle group and baseline at the mesh size
+    librarySolutions = getLibrarySolutions(libraryPath)
+    librarySolutions = librarySolutions.loc[(librarySolutions['nodes'] == meshInterval*2+1) &
+                                            librarySolutions['muscleGroup'].isin([muscleGroup,'Baseline'])]
+
+    #Return nothing if there are no solutions
+    if len(librarySolutions) == 0:
+        return None
+
+    #Rank by distance in strength, then by muscle group
+    librarySolutions = librarySolutions.assign(
+        distance = (librarySolutions['scaleFactor'] - scaleFactor).abs().round(6),
+        otherGroup = librarySolutions['muscleGroup'] != muscleGroup)
+    librarySolutions = librarySolutions.sort_values(['distance','otherGroup'])
+
+    return librarySolutions['solutionFile'].iloc[0]
+
+# %% getContinuationChains
+
+def getContinuationChains(modelFiles = None):
+
+    # Orders the variant models into continuation chains for each muscle group.
+    # Each group has a chain of decreasing strengths below the baseline (e.g.
+    # 90 then 80) and increasing strengths above the baseline (e.g. 110 then 120)
+    # so that each solve is seeded from its already solved neighbour.
+    #
+    # Input:    modelFiles - list of strings of paths to variant model files, or
+    #                        variant specification dictionaries
+    #
+    # Output:   chainList - list of lists of model files in solve order
+
+    #Check for appropriate inputs
+    if modelFiles is None:
+        raise ValueError('A list of model files is needed in getContinuationChains')
+
+    #Group the model files by muscle group
+    groupFiles = {}
+    for modelFile in modelFiles:
+        muscleGroup, scaleFactor = getVariantInfo(modelFile)
+        groupFiles.setdefault(muscleGroup,[]).append((scaleFactor,modelFile))
+
+    #Create the chains in each direction away from the baseline
+    chainList = []
+    for muscleGroup in sorted(groupFiles.keys()):
+        weakerChain = [modelFile for scaleFactor, modelFile in
+                       sorted(groupFiles[muscleGroup], key = lambda x: x[0], reverse = True)
+                       if scaleFactor < 1]
+        strongerChain = [modelFile for scaleFactor, modelFile in
+                         sorted(groupFiles[muscleGroup], key = lambda x: x[0])
+                         if scaleFactor > 1]
+        for chain in [weakerChain,strongerChain]:
+            if len(chain) > 0:
+                chainList.append(chain)
+
+    return chainList
+
+# %% runContinuationChain
+
+def runContinuationChain(chainSettings = None):
+
+    # Worker function for solving a chain of variant models in order. Each
+    # variant is seeded from the nearest converged solution in the library, and
+    # converged solutions are added to the library for the next variant.
+    #
+    # Input:    chainSettings - dictionary of job settings (see runVariantSimulation)
+    #                           with the model file replaced by:
+    #               modelFiles - list of strings of paths to model files in solve order
+    #               libraryPath - string of path to the solution library directory
+    #               fallbackGuessFile - string of path to guess file to use if
+    #                                   there are no library solutions, or if
+    #                                   the watchdog stops a solve
+    #
+    # Output:   summaryList - list of summary dictionaries for each variant
+
+    #Check for appropriate inputs
+    if chainSettings is None:
+        raise ValueError('Chain settings are needed in runContinuationChain')
+
+    #Loop through the chain
+    summaryList = []
+    for modelFile in chainSettings['modelFiles']:
+
+        #Get the variant details
+        muscleGroup, scaleFactor = getVariantInfo(modelFile)
+
+        #Find the nearest converged solution to use as the guess
+        guessFile = findNearestSolution(chainSettings['libraryPath'],muscleGroup,
+                                        scaleFactor,chainSettings['meshInterval'])
+        if guessFile is None:
+            guessFile = chainSettings['fallbackGuessFile']
+
+        #Set the job settings for the variant
+        jobSettings = {key: chainSettings[key] for key in chainSettings
+                       if key not in ['modelFiles','libraryPath']}
+        jobSettings.update({'modelFile': modelFile, 'guessFile': guessFile})
+
+        #Solve the variant
+        summary = runVariantSimulation(jobSettings)
+        summaryList.append(summary)
+
+        #Add converged solutions to the library, at the mesh they were solved
+        #on (which is the retry mesh if the watchdog stopped the first solve)
+        if summary['success']:
+            addLibrarySolution(chainSettings['libraryPath'],summary['solutionFile'],
+                               muscleGroup,scaleFactor,int(summary['meshInterval']))
+
+    return summaryList
+
+# %% runContinuationSimulations
+
+def runContinuationSimulations(modelFiles = None, taskName = None, baselineSolution = None,
+                               meshInterval = 50, taskBounds = None, outputPath = None,
+                               libraryPath = None, nProcesses = None, threadsPerWorker = 1,
+                               chainsPerWorker = 1, summaryFile = None, cachePath = None,
+                               watchdogSettings = None, retryMeshInterval = None,
+                               autoTune = True):
+
+    # Solves the variant models as continuation chains along each muscle groups
+    # strength axis, with the chains spread across a pool of worker processes.
+    # The baseline solution seeds the library, and is also used to set the time
+    # bounds for every variant so that they don't drift along the chain.
+    #
+    # Input:    modelFiles - list of strings of paths to variant model files, or
+    #                        variant specification dictionaries
+    #           taskName - string of relevant task name options
+    #           baselineSolution - string of path to the converged baseline solution
+    #           meshInterval - number of mesh intervals for the solver
+    #           taskBounds - list of the elevation, rotation and angle task
+    #                        bound dataframes (see osimHelper.loadTaskBounds)
+    #           outputPath - string of path to write solutions to
+    #           libraryPath - string of path to the solution library directory
+    #                         (default is SolutionLibrary in the output path)
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs divided by the threads per worker)
+    #           threadsPerWorker - number of threads each worker can use
+    #           chainsPerWorker - number of chains before a worker is replaced
+    #           summaryFile - string of path for the summary .csv file (default
+    #                         is continuationSummary_<taskName>.csv in the output path)
+    #           cachePath - optional string of path to the solution cache directory
+    #           watchdogSettings - optional dictionary of watchdog rules to solve
+    #                              with (see watchdogHelper.watchdogDefaults).
+    #                              Stopped solves are retried from the baseline
+    #                              solution.
+    #           retryMeshInterval - optional (coarser) number of mesh intervals
+    #                               to retry at if the watchdog stops a solve
+    #           autoTune - whether to apply the tuned solver configuration for
+    #                      the host if there is one (see tuneHelper)
+    #
+    # Output:   batchSummary - pandas dataframe of each variants status and timing
+
+    #Check for appropriate inputs
+    if modelFiles is None or taskName is None or baselineSolution is None \
+        or taskBounds is None or outputPath is None:
+        raise ValueError('Model files, task name, baseline solution, task bounds and output path are needed in runContinuationSimulations')
+
+    #Set the default paths
+    if libraryPath is None:
+        libraryPath = os.path.join(outputPath,'SolutionLibrary')
+    if summaryFile is None:
+        summaryFile = os.path.join(outputPath,'continuationSummary_'+taskName+'.csv')
+
+    #Create the output directory if needed
+    if not os.path.isdir(outputPath):
+        os.makedirs(outputPath)
+
+    #Add the baseline solution to the library
+    addLibrarySolution(libraryPath,baselineSolution,'Baseline',1.0,meshInterval)
+
+    #Apply the tuned solver configuration for the host
+    solverSettings = None
+    ipoptOptions = None
+    if autoTune:
+        nProcesses, threadsPerWorker, solverSettings, ipoptOptions = \
+            tuneHelper.getTunedRunSettings(nProcesses,threadsPerWorker)
+
+    #Create the chains and their settings
+    chainList = getContinuationChains(modelFiles)
+    chainJobs = [{'modelFiles': chain, 'taskName': taskName, 'meshInterval': meshInterval,
+                  'taskBounds': list(taskBounds), 'outputPath': outputPath,
+                  'nThreads': threadsPerWorker, 'libraryPath': libraryPath,
+                  'fallbackGuessFile': baselineSolution,
+                  'timeReferenceFile': baselineSolution, 'cachePath': cachePath,
+                  'watchdog': watchdogSettings, 'retryMeshInterval': retryMeshInterval,
+                  'solverSettings': solverSettings, 'ipoptOptions': ipoptOptions}
+                 for chain in chainList]
+
+    #Set the number of processes if not specified
+    if nProcesses is None:
+        nProcesses = max(1, mp.cpu_count() // threadsPerWorker)
+    #Don't start more processes than there are chains
+    nProcesses = max(1, min(nProcesses, len(chainJobs)))
+
+    #Set the thread limits in the current environment
+    limitWorkerThreads(threadsPerWorker)
+
+    #Run the chains across the pool, collecting summaries as they finish
+    summaryList = []
+    batchStart = time.time()
+    with mp.Pool(processes = nProcesses, initializer = limitWorkerThreads,
+                 initargs = (threadsPerWorker,), maxtasksperchild = chainsPerWorker) as pool:
+        for chainSummary in pool.imap_unordered(runContinuationChain, chainJobs, chunksize = 1):
+            #Append the summaries and rewrite the file
+            summaryList.extend(chainSummary)
+            writeBatchSummary(summaryList,summaryFile)
+            #Print progress
+            print('Finished chain '+' -> '.join([summary['variant']+' ('+str(summary['status'])+')'
+                                                  for summary in chainSummary])+
+                  ' ['+str(len(summaryList))+'/'+str(len(modelFiles))+' after '+
+                  str(round(time.time()-batchStart,1))+' s]')
+
+    #Sort the final summary by variant and write out
+    batchSummary = writeBatchSummary(summaryList,summaryFile,sortRows = True)
+
+    return batchSummary
+
+# %% runQueuedJob
+
+def runQueuedJob(queueJob = None):
+
+    # Worker function for running a single job from a job queue (see
+    # queueHelper). The job is claimed before it is solved, so a job that has
+    # already been taken or finished is skipped.
+    #
+    # Input:    queueJob - dictionary containing:
+    #               queueFile - string of path to the queue .json file
+    #               jobId - optional string of the job to run (default runs
+    #                       the next pending job)
+    #               nodeId - optional string of the runner the worker belongs
+    #                        to (see queueHelper.getNodeId)
+    #               taskId - optional ID of the runner task, recorded with
+    #                        the claim (see runJobQueue)
+    #               solverSettings - optional dictionary of tuned solver
+    #                                settings, which the job settings override
+    #               ipoptOptions - optional dictionary of tuned IPOPT options,
+    #                              which the job settings override
+    #               jobFunction - optional function that runs the job settings
+    #                             and returns the job summary, in place of
+    #                             solving the variant (see runJobQueue)
+    #
+    # Output:   summary - dictionary of the variant status and timing (None if
+    #                     the job wasn't pending)
+
+    #Check for appropriate inputs
+    if queueJob is None:
+        raise ValueError('A queue file and job ID are needed in runQueuedJob')
+
+    #Import the queue functions within the worker
+    import queueHelper
+
+    #Claim the job
+    job = queueHelper.claimJob(queueJob['queueFile'],queueJob.get('jobId'),queueJob.get('nodeId'),
+                               queueJob.get('taskId'))
+    if job is None:
+        return None
+
+    #Run the job with the given function and record the result in the queue
+    if queueJob.get('jobFunction') is not None:
+        summary = queueJob['jobFunction'](dict(job['settings']))
+        queueHelper.finishJob(queueJob['queueFile'],job['jobId'],summary,job['claimId'])
+        return summary
+
+    #Load the task bounds for the job settings
+    import osimHelper
+    jobSettings = dict(job['settings'])
+    jobSettings['taskBounds'] = list(osimHelper.loadTaskBounds(jobSettings.pop('dataPath')))
+
+    #Merge any tuned settings under the job settings
+    for settingsKey in ['solverSettings','ipoptOptions']:
+        if queueJob.get(settingsKey) is not None:
+            mergedSettings = dict(queueJob[settingsKey])
+            mergedSettings.update(jobSettings.get(settingsKey) or {})
+            jobSettings[settingsKey] = mergedSettings
+
+    #Solve the variant and record the result in the queue, unless the job was
+    #reclaimed while it was being solved
+    summary = runVariantSimulation(jobSettings)
+    queueHelper.finishJob(queueJob['queueFile'],job['jobId'],summary,job['claimId'])
+
+    return summary
+
+# %% runJobQueue
+
+def runJobQueue(queueFile = None, nProcesses = None, threadsPerWorker = 1,
+                solvesPerWorker = 1, summaryFile = None, autoTune = True,
+                pollInterval = None, jobFunction = None):
+
+    # Spreads the pending jobs of a job queue across a pool of worker processes.
+    # The queue is updated as each job is claimed and finished, so the run can
+    # be interrupted and started again without losing completed jobs.
+    #
+    # Each worker claims the next pending job when it is free, so the same queue
+    # can be run on several nodes at once from a shared filesystem (or by
+    # several runners on one machine). The runner writes a heartbeat while it
+    # is working and reclaims the jobs of runners that have stopped (see
+    # queueHelper.reclaimJobs). Free workers wait for the jobs running on other
+    # runners, so that reclaimed jobs are picked up, and the runner finishes
+    # once no jobs are pending or running.
+    #
+    # Input:    queueFile - string of path to the queue .json file (see
+    #                       queueHelper.initQueue)
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs divided by the threads per worker)
+    #           threadsPerWorker - number of threads each worker can use
+    #           solvesPerWorker - number of solves before a worker is replaced
+    #                             (None keeps workers for the whole run)
+    #           summaryFile - optional string of path for a summary .csv file
+    #                         of all finished jobs in the queue
+    #           autoTune - whether to apply the tuned solver configuration for
+    #                      the host if there is one (see tuneHelper)
+    #           pollInterval - seconds between checks of the queue while
+    #                          waiting on other runners (default uses the
+    #                          queueHelper heartbeat interval)
+    #           jobFunction - optional module level function that runs the
+    #                         settings of a job in a worker and returns its
+    #                         summary, with at least the 'variant', 'status',
+    #                         'success' and 'wallTime' (default solves the
+    #                         variant with runVariantSimulation, e.g. a stub
+    #                         function can be used to test the queue)
+    #
+    # Output:   queueSummary - pandas dataframe of the jobs in the queue
+
+    #Check for appropriate inputs
+    if queueFile is None:
+        raise ValueError('A queue file is needed in runJobQueue')
+
+    #Apply the tuned solver configuration for the host
+    solverSettings = None
+    ipoptOptions = None
+    if autoTune:
+        nProcesses, threadsPerWorker, solverSettings, ipoptOptions = \
+            tuneHelper.getTunedRunSettings(nProcesses,threadsPerWorker)
+
+    #Set the thread limits in the current environment before the queue
+    #functions (and opensim) are imported
+    limitWorkerThreads(threadsPerWorker)
+    import queueHelper
+
+    #Set the defaults
+    if pollInterval is None:
+        pollInterval = queueHelper.heartbeatInterval
+
+    #Function to count the jobs in each state, and get the jobs claimed by the
+    #tasks of a runner
+    def getStateCounts(nodeId = None):
+        jobList = queueHelper.loadQueue(queueFile)['jobs']
+        stateCounts = {jobState: sum([job['state'] == jobState for job in jobList])
+                       for jobState in queueHelper.jobStates}
+        taskJobs = {job['taskId']: job for job in jobList
+                    if job.get('nodeId') == nodeId and job.get('taskId') is not None}
+        return stateCounts, taskJobs
+
+    #Check for jobs to run
+    stateCounts, taskJobs = getStateCounts()
+    print(str(stateCounts['pending'])+' pending and '+str(stateCounts['running'])+
+          ' running jobs in '+queueFile)
+
+    #Run the jobs across the pool
+    if stateCounts['pending'] + stateCounts['running'] > 0:
+
+        #Set the number of processes if not specified
+        if nProcesses is None:
+            nProcesses = max(1, mp.cpu_count() // threadsPerWorker)
+        nProcesses = max(1, min(nProcesses, stateCounts['pending'] + stateCounts['running']))
+
+        #Start the heartbeat of the runner
+        nodeId = queueHelper.getNodeId()
+        stopHeartbeat = queueHelper.startHeartbeat(queueFile, nodeId, {'nProcesses': nProcesses},
+                                                   interval = pollInterval)
+        queueJob = {'queueFile': queueFile, 'nodeId': nodeId,
+                    'solverSettings': solverSettings, 'ipoptOptions': ipoptOptions,
+                    'jobFunction': jobFunction}
+
+        nFinished = 0
+        runStart = time.time()
+        resultQueue = queue.Queue()
+        try:
+            with mp.Pool(processes = nProcesses, initializer = limitWorkerThreads,
+                         initargs = (threadsPerWorker,), maxtasksperchild = solvesPerWorker) as pool:
+
+                #Function to start workers on the next pending jobs. Each task
+                #is kept by its ID with its start time until its result is in,
+                #and the job it claims is recorded against its ID in the queue.
+                runningTasks = {}
+                taskClaims = {}
+                taskIds = itertools.count()
+                def startTasks(nStart):
+                    for iTask in range(nStart):
+                        taskId = next(taskIds)
+                        runningTasks[taskId] = time.time()
+                        pool.apply_async(runQueuedJob, (dict(queueJob, taskId = taskId),),
+                                         callback = lambda result, taskId = taskId: resultQueue.put((taskId, result)),
+                                         error_callback = lambda result, taskId = taskId: resultQueue.put((taskId, result)))
+
+                #Give each worker a job
+                startTasks(nProcesses)
+                while True:
+
+                    #Wait for a worker to finish, checking the queue regularly
+                    try:
+                        taskId, summary = resultQueue.get(timeout = pollInterval)
+                    except queue.Empty:
+                        pass
+                    else:
+                        runningTasks.pop(taskId, None)
+                        taskClaims.pop(taskId, None)
+                        if isinstance(summary, dict):
+                            nFinished += 1
+                            print('Finished '+summary['variant']+' ('+str(summary['status'])+') in '+
+                                  str(round(summary['wallTime'],1))+' s ['+str(nFinished)+' by '+nodeId+
+                                  ' after '+str(round(time.time()-runStart,1))+' s]')
+                        elif summary is not None:
+                            print('Queue worker failed: '+repr(summary))
+
+                    #Drop the tasks of workers that have stopped (e.g. a crash in
+                    #the solver), whose results will never come in. A task is
+                    #lost once the worker that claimed its job has stopped while
+                    #the job is still running under its claim, and the job is
+                    #then reclaimed by the heartbeat (see queueHelper.reclaimJobs).
+                    #The claims are kept as they are seen, as a reclaimed job
+                    #can be claimed again by another runner. A task whose worker
+                    #stopped after finishing its job is given a poll interval
+                    #for its result to come in, and a task that hasn't been
+                    #seen with a claim is only dropped after the heartbeat
+                    #timeout.
+                    stateCounts, taskJobs = getStateCounts(nodeId)
+                    for taskId in list(runningTasks.keys()):
+                        taskJob = taskJobs.get(taskId)
+                        if taskJob is not None and taskJob['claimId'] is not None \
+                            and taskId not in taskClaims:
+                            taskClaims[taskId] = {'claimId': taskJob['claimId'],
+                                                  'workerPid': taskJob['workerPid'],
+                                                  'stoppedTime': None}
+                        if taskId in taskClaims:
+                            taskClaim = taskClaims[taskId]
+                            if taskClaim['stoppedTime'] is None \
+                                and not queueHelper.isProcessRunning(taskClaim['workerPid']):
+                                taskClaim['stoppedTime'] = time.time()
+                            isClaimRunning = taskJob is not None and taskJob['state'] == 'running' \
+                                and taskJob['claimId'] == taskClaim['claimId']
+                            isLost = taskClaim['stoppedTime'] is not None and \
+                                (isClaimRunning or time.time() - taskClaim['stoppedTime'] > pollInterval)
+                        else:
+                            isLost = time.time() - runningTasks[taskId] > queueHelper.heartbeatTimeout
+                        if isLost:
+                            runningTasks.pop(taskId)
+                            taskClaims.pop(taskId, None)
+                            print('Queue worker stopped without a result, freeing its place in the pool')
+
+                    #Give the free workers any pending jobs, and stop once there
+                    #are no tasks left here and no jobs left on any runner
+                    startTasks(min(nProcesses - len(runningTasks), stateCounts['pending']))
+                    if len(runningTasks) == 0 and stateCounts['pending'] + stateCounts['running'] == 0:
+                        break
+
+        finally:
+            stopHeartbeat.set()
+            queueHelper.removeHeartbeat(queueFile, nodeId)
+
+    #Write the summary of all finished jobs in the queue
+    if summaryFile is not None:
+        writeBatchSummary([job['summary'] for job in queueHelper.loadQueue(queueFile)['jobs']
+                           if job['summary'] is not None],summaryFile,sortRows = True)
+
+    return queueHelper.getQueueSummary(queueFile)
+
+# %%
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for benchmarking the solver settings on a
+set of reference problems, so that the effect of changing settings or upgrading
+the solver can be measured. The reference problems are the task problems at
+reduced mesh sizes and different tolerances, and two cheap synthetic problems
+(a sliding mass moving between two positions, and a double pendulum swing up).
+Each case is solved in a fresh process so that its peak memory can be measured.
+Functions defined here include:
+
+    createSlidingMassStudy  creates the sliding mass reference problem
+
+    createPendulumStudy     creates the double pendulum reference problem
+
+    createBenchmarkStudy    creates the Moco study for a benchmark case
+
+    getPeakMemory           gets the peak memory use of the current process
+
+    runBenchmarkCase        solves a single benchmark case and records its cost
+                            (used by the worker processes)
+
+    runBenchmarks           solves a list of benchmark cases and writes the
+                            results file
+
+    loadBenchmarkResults    loads a benchmark results file
+
+    compareBenchmarks       compares benchmark results against a baseline and
+                            flags any regressions
+
+The results are written as a .json file with the host details and a record for
+each case of the solve status, solve and wall time, iterations, objective and
+its breakdown into the goal terms, and peak memory.
+
+"""
+
+# %% Import packages
+
+import json
+import multiprocessing as mp
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+import traceback
+import pandas as pd
+
+# %% Settings
+
+#Benchmark cases. Task cases are solved with the task problem at the mesh
+#interval, synthetic cases with the named reference problem. The solver
+#settings replace the defaults (see osimHelper.defaultSolverSettings).
+benchmarkCases = [{'name': 'SlidingMass_25', 'problem': 'SlidingMass', 'meshInterval': 25},
+                  {'name': 'DoublePendulum_50', 'problem': 'DoublePendulum', 'meshInterval': 50},
+                  {'name': 'ConcentricUpwardReach105_10_tol1e-2', 'problem': 'ConcentricUpwardReach105',
+                   'meshInterval': 10, 'solverSettings': {'optim_convergence_tolerance': 1e-2,
+                                                          'optim_constraint_tolerance': 1e-2}},
+                  {'name': 'ConcentricUpwardReach105_25_tol1e-2', 'problem': 'ConcentricUpwardReach105',
+                   'meshInterval': 25, 'solverSettings': {'optim_convergence_tolerance': 1e-2,
+                                                          'optim_constraint_tolerance': 1e-2}},
+                  {'name': 'ConcentricUpwardReach105_25_tol1e-4', 'problem': 'ConcentricUpwardReach105',
+                   'meshInterval': 25},
+                  {'name': 'ConcentricUpwardReach105_50_tol1e-4', 'problem': 'ConcentricUpwardReach105',
+                   'meshInterval': 50}]
+
+#Relative increases over the baseline that are flagged as regressions
+regressionTolerances = {'wallTime': 0.2,
+                        'solverDuration': 0.2,
+                        'numIterations': 0.1,
+                        'peakMemoryMB': 0.2,
+                        'objective': 1e-3}
+
+# %% createSlidingMassStudy
+
+def createSlidingMassStudy(meshInterval = 25):
+
+    # Creates the sliding mass reference problem, where a 2kg mass on a slider
+    # is moved 1m from rest to rest in minimum time
+    #
+    # Input:    meshInterval - number of mesh intervals for the solver
+    #
+    # Output:   study - MocoStudy object ready to solve
+
+    #Import opensim
+    import opensim as osim
+
+    #Create the model
+    model = osim.Model()
+    model.setName('SlidingMass')
+    body = osim.Body('body', 2.0, osim.Vec3(0), osim.Inertia(0))
+    model.addComponent(body)
+    joint = osim.SliderJoint('slider', model.getGround(), body)
+    joint.updCoordinate().setName('position')
+    model.addComponent(joint)
+
+    #Add the actuator from the joint coordinate, as the coordinate isn't in
+    #the coordinate set of the model until the connections are finalised
+    actu = osim.CoordinateActuator()
+    actu.setName('position_actuator')
+    actu.setCoordinate(joint.updCoordinate())
+    actu.setOptimalForce(1.0)
+    actu.setMaxControl(10.0)
+    actu.setMinControl(-10.0)
+    model.addComponent(actu)
+    model.finalizeConnections()
+
+    #Create the study
+    study = osim.MocoStudy()
+    study.setName('SlidingMass')
+    problem = study.updProblem()
+    problem.setModel(model)
+    problem.setTimeBounds(osim.MocoInitialBounds(0.0), osim.MocoFinalBounds(0.0, 5.0))
+    problem.setStateInfo('/slider/position/value', [-5.0, 5.0], 0.0, 1.0)
+    problem.setStateInfo('/slider/position/speed', [-50.0, 50.0], 0.0, 0.0)
+    problem.addGoal(osim.MocoFinalTimeGoal('time', 1))
+
+    #Configure the solver
+    solver = study.initCasADiSolver()
+    solver.set_num_mesh_intervals(meshInterval)
+
+    return study
+
+# %% createPendulumStudy
+
+def createPendulumStudy(meshInterval = 50):
+
+    # Creates the double pendulum reference problem, where a double pendulum
+    # with torque actuators at each joint swings up from hanging to upright,
+    # from rest to rest, with minimal effort and time
+    #
+    # Input:    meshInterval - number of mesh intervals for the solver
+    #
+    # Output:   study - MocoStudy object ready to solve
+
+    #Import opensim and the helper functions
+    import math
+    import opensim as osim
+    import osimHelper
+
+    #Create the model, adding torque actuators if the model has none
+    model = osim.ModelFactory.createDoublePendulum()
+    model.setName('DoublePendulum')
+    if model.getActuators().getSize() == 0:
+        for cc in range(model.getCoordinateSet().getSize()):
+            osimHelper.addCoordinateActuator(model,model.getCoordinateSet().get(cc).getName(),
+                                             50.0,[1.0,-1.0],'_torque')
+    model.finalizeConnections()
+
+    #Create the study
+    study = osim.MocoStudy()
+    study.setName('DoublePendulum')
+    problem = study.updProblem()
+    problem.setModel(model)
+    problem.setTimeBounds(osim.MocoInitialBounds(0.0), osim.MocoFinalBounds(0.5, 5.0))
+
+    #Swing the first joint up and keep the second joint straight
+    for cc in range(model.getCoordinateSet().getSize()):
+        coord = model.getCoordinateSet().get(cc)
+        statePath = '/jointset/'+coord.getJoint().getName()+'/'+coord.getName()
+        problem.setStateInfo(statePath+'/value', [-10.0, 10.0], 0.0, math.pi if cc == 0 else 0.0)
+        problem.setStateInfo(statePath+'/speed', [-50.0, 50.0], 0.0, 0.0)
+
+    #Add the goals
+    problem.addGoal(osim.MocoControlGoal('effort', 1))
+    problem.addGoal(osim.MocoFinalTimeGoal('time', 1))
+
+    #Configure the solver
+    solver = study.initCasADiSolver()
+    solver.set_num_mesh_intervals(meshInterval)
+
+    return study
+
+# %% createBenchmarkStudy
+
+def createBenchmarkStudy(caseSettings = None):
+
+    # Creates the Moco study for a benchmark case
+    #
+    # Input:    caseSettings - dictionary of the benchmark case (see
+    #                          benchmarkCases) with the paths used for the task
+    #                          problems (modelFile, guessFile and dataPath)
+    #
+    # Output:   study - MocoStudy object ready to solve
+    #           guessFile - string of path to the guess file used (None for the
+    #                       synthetic problems)
+
+    #Check for appropriate inputs
+    if caseSettings is None:
+        raise ValueError('Case settings are needed in createBenchmarkStudy')
+
+    #Import opensim and the helper functions
+    import opensim as osim
+    import osimHelper
+
+    #Create the synthetic problems
+    if caseSettings['problem'] in ['SlidingMass','DoublePendulum']:
+        if caseSettings['problem'] == 'SlidingMass':
+            study = createSlidingMassStudy(caseSettings['meshInterval'])
+        else:
+            study = createPendulumStudy(caseSettings['meshInterval'])
+        solver = osim.MocoCasADiSolver.safeDownCast(study.updSolver())
+        for settingName in caseSettings.get('solverSettings') or {}:
+            getattr(solver,'set_'+settingName)(caseSettings['solverSettings'][settingName])
+        return study, None
+
+    #Create the task problem from the template
+    simModel = osimHelper.createSimModel(caseSettings['modelFile'],caseSettings['problem'])
+    taskTemplate = osimHelper.createTaskTemplate(caseSettings['problem'],simModel,
+                                                 caseSettings['guessFile'],
+                                                 *osimHelper.loadTaskBounds(caseSettings['dataPath']),
+                                                 meshInterval = caseSettings['meshInterval'],
+                                                 solverSettings = caseSettings.get('solverSettings'))
+    study = osimHelper.createTemplateStudy(taskTemplate,simModel,caseSettings['guessFile'],
+                                           caseSettings['name'])
+
+    return study, caseSettings['guessFile']
+
+# %% getPeakMemory
+
+def getPeakMemory():
+
+    # Gets the peak memory use of the current process. This uses the resource
+    # module, which isn't available on Windows.
+    #
+    # Output:   peakMemoryMB - peak resident memory in MB (None if unavailable)
+
+    #Import the resource module where available
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    #Get the peak resident memory, which is in bytes on macOS and kB elsewhere
+    peakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peakMemory / 1024**2
+    return peakMemory / 1024
+
+# %% runBenchmarkCase
+
+def runBenchmarkCase(caseSettings = None):
+
+    # Worker function for solving a benchmark case and recording its cost. The
+    # case is solved in a temporary directory without the solution cache.
+    #
+    # Input:    caseSettings - dictionary of the benchmark case with the paths
+    #                          used for the task problems (see createBenchmarkStudy)
+    #
+    # Output:   result - dictionary of the case status and cost
+
+    #Check for appropriate inputs
+    if caseSettings is None:
+        raise ValueError('Case settings are needed in runBenchmarkCase')
+
+    #Start the timer for the case
+    startTime = time.time()
+    result = {'case': caseSettings['name'], 'problem': caseSettings['problem'],
+              'meshInterval': caseSettings['meshInterval'],
+              'solverSettings': caseSettings.get('solverSettings')}
+
+    try:
+
+        #Import the helper functions
+        import cacheHelper
+
+        #Create and solve the study
+        setupStart = time.time()
+        study, guessFile = createBenchmarkStudy(caseSettings)
+        result['setupTime'] = time.time() - setupStart
+        solutionFile = os.path.join(tempfile.mkdtemp(),caseSettings['name']+'_solution.sto')
+        solution, solveInfo = cacheHelper.solveStudy(study,solutionFile)
+        for key in ['status','success','numIterations','objective','solverDuration']:
+            result[key] = solveInfo[key]
+
+        #Get the objective breakdown where the solution provides it
+        try:
+            result['objectiveTerms'] = {termName: solution.getObjectiveTerm(termName)
+                                        for termName in list(solution.getObjectiveTermNames())}
+        except AttributeError:
+            result['objectiveTerms'] = None
+
+        #Clean up the solution
+        os.remove(solutionFile)
+        os.rmdir(os.path.dirname(solutionFile))
+
+    except Exception as err:
+
+        #Record the error for the case
+        result.update({'status': 'Error', 'success': False,
+                       'errorMessage': repr(err)+'\n'+traceback.format_exc()})
+
+    #Set the wall time and peak memory for the case
+    result['wallTime'] = time.time() - startTime
+    result['peakMemoryMB'] = getPeakMemory()
+
+    return result
+
+# %% runBenchmarks
+
+def runBenchmarks(cases = None, resultsFile = None, modelFile = None, guessFile = None,
+                  dataPath = None):
+
+    # Solves a list of benchmark cases one after the other, each in a fresh
+    # process, and writes the results file
+    #
+    # Input:    cases - list of benchmark case dictionaries (default uses
+    #                   benchmarkCases)
+    #           resultsFile - string of path to write the results .json file to
+    #           modelFile - string of path to the model file for the task cases
+    #           guessFile - string of path to the guess file for the task cases
+    #           dataPath - string of path to supporting data directory for the
+    #                      task cases
+    #
+    # Output:   benchmarkResults - pandas dataframe of the results of each case
+
+    #Check for appropriate inputs
+    if resultsFile is None:
+        raise ValueError('A results file is needed in runBenchmarks')
+
+    #Set the default cases
+    if cases is None:
+        cases = benchmarkCases
+
+    #Check the task case paths
+    if any([case['problem'] not in ['SlidingMass','DoublePendulum'] for case in cases]) \
+        and (modelFile is None or guessFile is None or dataPath is None):
+        raise ValueError('A model file, guess file and data path are needed for the task cases in runBenchmarks')
+
+    #Add the paths to the case settings
+    caseList = [dict(case, modelFile = modelFile, guessFile = guessFile, dataPath = dataPath)
+                for case in cases]
+
+    #Solve each case in a fresh process
+    resultList = []
+    with mp.Pool(processes = 1, maxtasksperchild = 1) as pool:
+        for result in pool.imap(runBenchmarkCase, caseList, chunksize = 1):
+            resultList.append(result)
+            print('Finished '+result['case']+' ('+str(result['status'])+') in '+
+                  str(round(result['wallTime'],1))+' s')
+
+    #Write the results with the host details
+    benchmarkRun = {'hostName': socket.gethostname(),
+                    'platform': platform.platform(),
+                    'processor': platform.processor(),
+                    'cpuCount': mp.cpu_count(),
+                    'created': time.time(),
+                    'results': resultList}
+    if not os.path.isdir(os.path.dirname(os.path.abspath(resultsFile))):
+        os.makedirs(os.path.dirname(os.path.abspath(resultsFile)))
+    with open(resultsFile,'w') as jsonFile:
+        json.dump(benchmarkRun, jsonFile, indent = 1,
+                  default = lambda value: value.item() if hasattr(value,'item') else str(value))
+
+    return loadBenchmarkResults(resultsFile)
+
+# %% loadBenchmarkResults
+
+def loadBenchmarkResults(resultsFile = None):
+
+    # Loads a benchmark results file
+    #
+    # Input:    resultsFile - string of path to the results .json file
+    #
+    # Output:   benchmarkResults - pandas dataframe of the results of each case
+
+    #Check for appropriate inputs
+    if resultsFile is None:
+        raise ValueError('A results file is needed in loadBenchmarkResults')
+
+    #Load the results
+    with open(resultsFile,'r') as jsonFile:
+        benchmarkRun = json.load(jsonFile)
+
+    return pd.DataFrame(benchmarkRun['results'])
+
+# %% compareBenchmarks
+
+def compareBenchmarks(benchmarkResults = None, baselineResults = None, tolerances = None):
+
+    # Compares benchmark results against a baseline. A case is flagged as a
+    # regression if it no longer converges, or if its cost increases by more
+    # than the relative tolerance (or its objective changes by more than the
+    # tolerance in either direction).
+    #
+    # Input:    benchmarkResults - pandas dataframe of the benchmark results
+    #           baselineResults - pandas dataframe of the baseline results
+    #           tolerances - dictionary of relative tolerances (default uses
+    #                        regressionTolerances)
+    #
+    # Output:   comparison - pandas dataframe of the relative change in each
+    #                        measure for the cases in both, with a regression
+    #                        flag and the measures that regressed
+
+    #Check for appropriate inputs
+    if benchmarkResults is None or baselineResults is None:
+        raise ValueError('Benchmark and baseline results are needed in compareBenchmarks')
+
+    #Set the default tolerances
+    if tolerances is None:
+        tolerances = regressionTolerances
+
+    #Match the cases
+    merged = benchmarkResults.merge(baselineResults, on = 'case', suffixes = ('','_baseline'))
+
+    #Calculate the relative changes and flag the regressions
+    comparison = merged[['case','success','success_baseline']].copy()
+    regressed = [[] for ind in range(len(merged))]
+    for measure in tolerances:
+        current = pd.to_numeric(merged[measure], errors = 'coerce')
+        baseline = pd.to_numeric(merged[measure+'_baseline'], errors = 'coerce')
+        change = (current - baseline) / baseline.abs()
+        comparison[measure+'Change'] = change
+        if measure == 'objective':
+            isRegression = change.abs() > tolerances[measure]
+        else:
+            isRegression = change > tolerances[measure]
+        for ind in range(len(merged)):
+            if isRegression.iloc[ind]:
+                regressed[ind].append(measure)
+    for ind in range(len(merged)):
+        if merged['success_baseline'].iloc[ind] and not merged['success'].iloc[ind]:
+            regressed[ind].insert(0,'success')
+    comparison['regression'] = [len(measures) > 0 for measures in regressed]
+    comparison['regressedMeasures'] = [', '.join(measures) for measures in regressed]
+
+    return comparison
+
+# %%
@@ -0,0 +1,643 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for caching simulation solutions against
+the problem that produced them, so that re-running an unchanged problem doesn't
+need another solve. The problem is identified by a hash of the printed Moco
+study (which includes the processed model, state bounds, goals and solver
+settings) along with the guess file. Functions defined here include:
+
+    lockFile                context manager that holds an exclusive lock file
+                            while the cache index is edited
+
+    getProblemHash          creates the hash identifying a Moco study and guess
+
+    loadCacheIndex          loads the cache index as a dataframe
+
+    getCachedSolution       finds a cached solution for a problem hash
+
+    addCachedSolution       adds a solution to the cache and evicts the least
+                            recently used solutions over the size limit
+
+    queryCache              lists the cached solutions by task and variant
+
+    solveStudy              solves a Moco study, using the cache if provided,
+                            and writes the solution to file
+
+    getLatestCheckpoint     finds the latest readable intermediate trajectory
+                            in a checkpoint directory
+
+    getModelHash            creates the hash identifying a processed model from
+                            its source model and the changes made to it
+
+    getCachedModel          loads a cached processed model for a model hash
+
+    addCachedModel          adds a processed model to the cache
+
+Processed models (see osimHelper.createSimModel) are cached in their own
+directory as model files named by their hash. The files are written to a
+temporary name and renamed into place, so any number of processes can read the
+cache while others add to it without needing a lock.
+
+Long solves can also be checkpointed (see solveStudy). The solver writes its
+intermediate trajectories at a set iteration interval to a checkpoint directory
+named by the problem hash, within a sub-directory for each solve (named by its
+host, process and start time) so that solves of the same problem running at
+the same time don't share or remove each others files. If the solve is
+interrupted (e.g. the job is pre-empted or stopped by the watchdog), solving
+the same problem again resumes from the latest checkpoint of any of its solves
+by using it as the guess. The checkpoints of a solve are only removed once it
+has converged, along with those of earlier solves of the problem that have
+since stopped.
+
+Note that opensim is only imported within the functions that use it, so that
+the cache index and file lock can be used without loading it.
+
+"""
+
+# %% Import packages
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+import pandas as pd
+import guessHelper
+import profileHelper
+import stoHelper
+import watchdogHelper
+
+# %% Settings
+
+#Columns in the cache index
+cacheColumns = ['problemHash','taskName','variant','meshInterval','status',
+                'success','numIterations','objective','solverDuration',
+                'sizeBytes','created','lastAccessed','cacheFile']
+
+#Filename of the cache index within the cache directory
+cacheIndexName = 'cacheIndex.csv'
+
+#Filename prefix of the processed models in the model cache directory
+modelCachePrefix = 'processedModel_'
+
+#Seconds since the last checkpoint after which the checkpoints of another
+#solve of a converged problem are assumed to be from a solve that has stopped
+checkpointStaleTime = 3600
+
+# %% lockFile
+
+@contextlib.contextmanager
+def lockFile(lockFileName = None, timeout = 600, staleTime = 3600):
+
+    # Context manager for holding an exclusive lock while a shared file is
+    # edited. The lock is a file created atomically, so it works across the
+    # processes of a pool and across machines sharing a filesystem. Lock files
+    # older than the stale time are assumed to be left over from a crashed
+    # process and removed. A stale lock is first renamed to a name unique to
+    # the waiting process, and only removed if it is the same lock file that
+    # was found to be stale, so that two waiters can't both break the lock and
+    # remove a new lock taken by one of them.
+    #
+    # Input:    lockFileName - string of path to the lock file
+    #           timeout - seconds to wait for the lock before raising an error
+    #           staleTime - seconds after which an existing lock is removed
+
+    #Check for appropriate inputs
+    if lockFileName is None:
+        raise ValueError('A lock file name is needed in lockFile')
+
+    #Try to create the lock file until it is acquired or timed out
+    startTime = time.time()
+    while True:
+        try:
+            lockHandle = os.open(lockFileName, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(lockHandle, str(os.getpid()).encode())
+            os.close(lockHandle)
+            break
+        except FileExistsError:
+            #Remove the lock if it is stale
+            try:
+                lockStat = os.stat(lockFileName)
+                if time.time() - lockStat.st_mtime > staleTime:
+                    staleFileName = lockFileName+'.'+socket.gethostname()+'_'+str(os.getpid())+'.stale'
+                    os.rename(lockFileName, staleFileName)
+                    staleStat = os.stat(staleFileName)
+                    if (staleStat.st_ino, staleStat.st_mtime_ns) == (lockStat.st_ino, lockStat.st_mtime_ns):
+                        os.remove(staleFileName)
+                    else:
+                        #Put back a new lock that was taken in the meantime
+                        try:
+                            os.link(staleFileName, lockFileName)
+                        except FileExistsError:
+                            pass
+                        os.remove(staleFileName)
+                    continue
+            except FileNotFoundError:
+                continue
+            #Raise an error if timed out
+            if time.time() - startTime > timeout:
+                raise TimeoutError('Could not acquire lock '+lockFileName)
+            time.sleep(0.05)
+
+    #Hold the lock and remove it when finished
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lockFileName)
+        except FileNotFoundError:
+            pass
+
+# %% getProblemHash
+
+def getProblemHash(study = None, guessFile = None):
+
+    # Creates the hash identifying a Moco study. The study is printed to XML,
+    # which includes the processed model, the state bounds from the task bound
+    # tables, the goals and their weights and the solver settings. The study
+    # name is removed so the same problem under a different name still matches.
+    # The guess is set in the solver as an object rather than in the XML, so
+    # the guess file contents are included separately.
+    #
+    # Input:    study - MocoStudy object to hash
+    #           guessFile - optional string of path to the guess file used
+    #
+    # Output:   problemHash - string of SHA-256 hex digest
+
+    #Check for appropriate inputs
+    if study is None:
+        raise ValueError('A Moco study is needed in getProblemHash')
+
+    #Print the study to a temporary file and read it back in
+    tempFileHandle, tempFileName = tempfile.mkstemp(suffix = '.omoco')
+    os.close(tempFileHandle)
+    study.printToXML(tempFileName)
+    with open(tempFileName,'rb') as studyFile:
+        studyXML = studyFile.read()
+    os.remove(tempFileName)
+
+    #Remove the study name
+    studyXML = re.sub(rb'<MocoStudy name="[^"]*">', b'<MocoStudy>', studyXML, count = 1)
+
+    #Create the hash from the study and guess file
+    problemHash = hashlib.sha256(studyXML)
+    if guessFile is not None:
+        with open(guessFile,'rb') as guess:
+            problemHash.update(guess.read())
+
+    return problemHash.hexdigest()
+
+# %% loadCacheIndex
+
+def loadCacheIndex(cachePath = None):
+
+    # Loads the cache index from the cache directory
+    #
+    # Input:    cachePath - string of path to the cache directory
+    #
+    # Output:   cacheIndex - pandas dataframe of the cached solutions
+
+    #Check for appropriate inputs
+    if cachePath is None:
+        raise ValueError('A cache path is needed in loadCacheIndex')
+
+    #Load the index if it exists
+    indexFile = os.path.join(cachePath,cacheIndexName)
+    if os.path.isfile(indexFile):
+        return pd.read_csv(indexFile, dtype = {'problemHash': str, 'variant': str})
+    else:
+        return pd.DataFrame(columns = cacheColumns)
+
+# %% getCachedSolution
+
+def getCachedSolution(cachePath = None, problemHash = None):
+
+    # Finds the cached solution for a problem hash and updates the last
+    # accessed time used for eviction
+    #
+    # Input:    cachePath - string of path to the cache directory
+    #           problemHash - string of problem hash (see getProblemHash)
+    #
+    # Output:   cacheEntry - dictionary of the cache index entry for the
+    #                        solution (None if not in the cache)
+
+    #Check for appropriate inputs
+    if cachePath is None or problemHash is None:
+        raise ValueError('A cache path and problem hash are needed in getCachedSolution')
+
+    #Return nothing if there is no cache
+    if not os.path.isdir(cachePath):
+        return None
+
+    #Look up the hash in the index
+    with lockFile(os.path.join(cachePath,cacheIndexName+'.lock')):
+        cacheIndex = loadCacheIndex(cachePath)
+        isMatch = cacheIndex['problemHash'] == problemHash
+        if not isMatch.any():
+            return None
+        #Check the cached file is still there
+        cacheEntry = cacheIndex.loc[isMatch].iloc[0].to_dict()
+        if not os.path.isfile(os.path.join(cachePath,cacheEntry['cacheFile'])):
+            return None
+        #Update the access time
+        cacheIndex.loc[isMatch,'lastAccessed'] = time.time()
+        cacheIndex.to_csv(os.path.join(cachePath,cacheIndexName), index = False)
+
+    #Set the full path to the cached file
+    cacheEntry['cacheFile'] = os.path.join(cachePath,cacheEntry['cacheFile'])
+
+    return cacheEntry
+
+# %% addCachedSolution
+
+def addCachedSolution(cachePath = None, problemHash = None, solutionFile = None,
+                      solveInfo = None, taskName = None, variant = None,
+                      meshInterval = None, maxCacheSize = 5e9):
+
+    # Adds a solution file to the cache. If the cache is then over the size
+    # limit, the least recently accessed solutions are removed until it fits.
+    #
+    # Input:    cachePath - string of path to the cache directory
+    #           problemHash - string of problem hash (see getProblemHash)
+    #           solutionFile - string of path to the solution file to cache
+    #           solveInfo - dictionary of the solution status details (see solveStudy)
+    #           taskName - string of task name for querying the cache
+    #           variant - string of variant name for querying the cache
+    #           meshInterval - number of mesh intervals for querying the cache
+    #           maxCacheSize - maximum total size of cached solutions in bytes
+
+    #Check for appropriate inputs
+    if cachePath is None or problemHash is None or solutionFile is None or solveInfo is None:
+        raise ValueError('A cache path, problem hash, solution file and solve info are needed in addCachedSolution')
+
+    #Create the cache directory if needed
+    if not os.path.isdir(cachePath):
+        os.makedirs(cachePath)
+
+    #Copy the solution into the cache under its hash
+    cacheFile = problemHash+'.sto'
+    tempFile = os.path.join(cachePath,cacheFile+'.'+str(os.getpid())+'.tmp')
+    shutil.copyfile(solutionFile,tempFile)
+    os.replace(tempFile,os.path.join(cachePath,cacheFile))
+
+    #Update the index
+    with lockFile(os.path.join(cachePath,cacheIndexName+'.lock')):
+
+        #Load the index and replace any existing entry for the hash
+        cacheIndex = loadCacheIndex(cachePath)
+        cacheIndex = cacheIndex.loc[cacheIndex['problemHash'] != problemHash]
+
+        #Add the new entry
+        currTime = time.time()
+        cacheEntry = {'problemHash': problemHash, 'taskName': taskName,
+                      'variant': variant, 'meshInterval': meshInterval,
+                      'sizeBytes': os.path.getsize(os.path.join(cachePath,cacheFile)),
+                      'created': currTime, 'lastAccessed': currTime,
+                      'cacheFile': cacheFile}
+        for key in ['status','success','numIterations','objective','solverDuration']:
+            cacheEntry[key] = solveInfo.get(key)
+        cacheIndex = pd.concat([cacheIndex,pd.DataFrame([cacheEntry], columns = cacheColumns)],
+                               ignore_index = True)
+
+        #Evict the least recently accessed solutions while over the size limit
+        cacheIndex = cacheIndex.sort_values('lastAccessed', ascending = False).reset_index(drop = True)
+        keepEntry = cacheIndex['sizeBytes'].cumsum() <= maxCacheSize
+        #Always keep the newest entry
+        keepEntry.iloc[0] = True
+        for evictFile in cacheIndex.loc[~keepEntry,'cacheFile']:
+            try:
+                os.remove(os.path.join(cachePath,evictFile))
+            except FileNotFoundError:
+                pass
+        cacheIndex = cacheIndex.loc[keepEntry]
+
+        #Write the index
+        cacheIndex.to_csv(os.path.join(cachePath,cacheIndexName), index = False)
+
+# %% queryCache
+
+def queryCache(cachePath = None, taskName = None, variant = None):
+
+    # Lists the cached solutions, optionally filtered by task and variant
+    #
+    # Input:    cachePath - string of path to the cache directory
+    #           taskName - optional string of task name to filter by
+    #           variant - optional string of variant name to filter by
+    #
+    # Output:   cacheIndex - pandas dataframe of the matching cached solutions
+
+    #Check for appropriate inputs
+    if cachePath is None:
+        raise ValueError('A cache path is needed in queryCache')
+
+    #Load the index
+    cacheIndex = loadCacheIndex(cachePath)
+
+    #Filter the index
+    if taskName is not None:
+        cacheIndex = cacheIndex.loc[cacheIndex['taskName'] == taskName]
+    if variant is not None:
+        cacheIndex = cacheIndex.loc[cacheIndex['variant'] == variant]
+
+    return cacheIndex.reset_index(drop = True)
+
+# %% solveStudy
+
+@profileHelper.profileFunction
+def solveStudy(study = None, solutionFile = None, cachePath = None, guessFile = None,
+               taskName = None, variant = None, meshInterval = None, maxCacheSize = 5e9,
+               watchdogSettings = None, checkpointPath = None, checkpointInterval = 50,
+               ipoptOptions = None):
+
+    # Solves a Moco study and writes the solution to file. If a cache path is
+    # provided the study is first looked up in the cache, and on a hit the
+    # cached solution is copied to the solution file instead of solving.
+    # Converged solutions are added to the cache. If watchdog settings are
+    # provided, the study is solved in a separate process that is stopped if
+    # the solve stalls or diverges (see watchdogHelper.solveWatched). If a
+    # checkpoint path is provided, intermediate trajectories are written during
+    # the solve and an interrupted solve of the same problem is resumed from
+    # the latest of these. IPOPT options that aren't available as solver
+    # properties (e.g. the linear solver) are written to an ipopt.opt file in
+    # the working directory of the solve, where IPOPT reads them from.
+    #
+    # Input:    study - MocoStudy object to solve
+    #           solutionFile - string of path to write the solution to
+    #           cachePath - optional string of path to the cache directory
+    #           guessFile - optional string of path to the guess file used (this
+    #                       is included in the problem hash)
+    #           taskName - optional string of task name for the cache index
+    #           variant - optional string of variant name for the cache index
+    #           meshInterval - optional number of mesh intervals for the cache index
+    #           maxCacheSize - maximum total size of cached solutions in bytes
+    #           watchdogSettings - optional dictionary of watchdog rules (see
+    #                              watchdogHelper.watchdogDefaults)
+    #           checkpointPath - optional string of path to the checkpoint directory
+    #           checkpointInterval - number of iterations between checkpoints
+    #           ipoptOptions - optional dictionary of IPOPT options to solve
+    #                          with (e.g. {'linear_solver': 'ma27'})
+    #
+    # Output:   solution - MocoSolution, or MocoTrajectory for a cache hit or
+    #                      watched solve (None if the watchdog stopped the solve)
+    #           solveInfo - dictionary of the solution status, success, number
+    #                       of iterations, objective, solver duration, whether
+    #                       it came from the cache and the reason the watchdog
+    #                       stopped the solve
+
+    #Check for appropriate inputs
+    if study is None or solutionFile is None:
+        raise ValueError('A Moco study and solution file are needed in solveStudy')
+
+    #Import opensim
+    import opensim as osim
+
+    #Get the problem hash before any checkpoint settings are added to the study
+    if cachePath is not None or checkpointPath is not None:
+        with profileHelper.profileSpan('getProblemHash','cache'):
+            problemHash = getProblemHash(study,guessFile)
+
+    #Check the cache for the problem
+    if cachePath is not None:
+        cacheEntry = getCachedSolution(cachePath,problemHash)
+        if cacheEntry is not None:
+            #Copy the cached solution to the solution file
+            shutil.copyfile(cacheEntry['cacheFile'],solutionFile)
+            #Return the cached solution and details
+            solveInfo = {key: cacheEntry[key] for key in
+                         ['status','success','numIterations','objective','solverDuration']}
+            solveInfo['success'] = bool(solveInfo['success'])
+            solveInfo['cacheHit'] = True
+            solveInfo['abortReason'] = None
+            return osim.MocoTrajectory(solutionFile), solveInfo
+
+    #Set up the checkpoints for the problem, in a directory for this solve
+    problemCheckpointPath = None
+    solveCheckpointPath = None
+    if checkpointPath is not None:
+        problemCheckpointPath = os.path.join(checkpointPath,problemHash)
+        solveCheckpointPath = os.path.join(problemCheckpointPath,socket.gethostname()+'_'+
+                                           str(os.getpid())+'_'+str(int(time.time()*1000)))
+        os.makedirs(solveCheckpointPath, exist_ok = True)
+        solver = osim.MocoCasADiSolver.safeDownCast(study.updSolver())
+        #Resume from the latest checkpoint of an interrupted solve
+        checkpointFile = getLatestCheckpoint(problemCheckpointPath)
+        if checkpointFile is not None:
+            print('Resuming from checkpoint '+checkpointFile)
+            checkpointGuess, report = guessHelper.createGuessTrajectory(checkpointFile,solver)
+            solver.setGuess(checkpointGuess)
+        #Write the intermediate trajectories
+        solver.set_output_interval(checkpointInterval)
+
+    #Set the working directory of the solve, writing the IPOPT options file
+    #there (in a temporary directory if there are no checkpoints)
+    workingPath = solveCheckpointPath
+    if ipoptOptions:
+        if workingPath is None:
+            workingPath = tempfile.mkdtemp()
+        with open(os.path.join(workingPath,'ipopt.opt'),'w') as optFile:
+            for optionName in ipoptOptions:
+                optFile.write(optionName+' '+str(ipoptOptions[optionName])+'\n')
+
+    if watchdogSettings is not None:
+
+        #Run optimisation in a watched process, which writes any checkpoints
+        #to its working directory
+        with profileHelper.profileSpan('solve','solve',{'watched': True}):
+            solution, solveInfo = watchdogHelper.solveWatched(study,solutionFile,watchdogSettings,
+                                                              workingPath = workingPath)
+        solveInfo['cacheHit'] = False
+
+    else:
+
+        #Run optimisation, from within the working directory so the
+        #intermediate trajectories are written there
+        currentPath = os.getcwd()
+        if workingPath is not None:
+            os.chdir(workingPath)
+        try:
+            with profileHelper.profileSpan('solve','solve',{'watched': False}):
+                solution = study.solve()
+        finally:
+            os.chdir(currentPath)
+
+        #Unseal the solution so that failed solutions can still be written out
+        solution.unseal()
+        with profileHelper.profileSpan('writeSolution','io'):
+            solution.write(solutionFile)
+
+        #Collect the solution details
+        solveInfo = {'status': solution.getStatus(),
+                     'success': solution.success(),
+                     'numIterations': solution.getNumIterations(),
+                     'objective': solution.getObjective(),
+                     'solverDuration': solution.getSolverDuration(),
+                     'cacheHit': False,
+                     'abortReason': None}
+
+    #Remove the temporary working directory, or the checkpoints once the solve
+    #has converged. The checkpoints of other solves of the problem are only
+    #removed once they have stopped writing them, and the checkpoints of an
+    #unconverged solve are kept to resume from.
+    if workingPath is not None and solveCheckpointPath is None:
+        shutil.rmtree(workingPath, ignore_errors = True)
+    elif solveCheckpointPath is not None and solveInfo['success']:
+        shutil.rmtree(solveCheckpointPath, ignore_errors = True)
+        for dirName in os.listdir(problemCheckpointPath):
+            otherPath = os.path.join(problemCheckpointPath,dirName)
+            fileTimes = [os.path.getmtime(os.path.join(otherPath,fileName)) for fileName in os.listdir(otherPath)]
+            if time.time() - max(fileTimes + [os.path.getmtime(otherPath)]) > checkpointStaleTime:
+                shutil.rmtree(otherPath, ignore_errors = True)
+        try:
+            os.rmdir(problemCheckpointPath)
+        except OSError:
+            pass
+
+    #Add converged solutions to the cache
+    if cachePath is not None and solveInfo['success']:
+        addCachedSolution(cachePath,problemHash,solutionFile,solveInfo,
+                          taskName,variant,meshInterval,maxCacheSize)
+
+    return solution, solveInfo
+
+# %% getLatestCheckpoint
+
+def getLatestCheckpoint(problemCheckpointPath = None):
+
+    # Finds the latest intermediate trajectory in a checkpoint directory,
+    # across the directories of each solve of the problem. The trajectories are
+    # checked from newest to oldest, skipping any that can't be read (e.g. one
+    # left partially written by an interrupted solve).
+    #
+    # Input:    problemCheckpointPath - string of path to the checkpoint
+    #                                   directory of a problem
+    #
+    # Output:   checkpointFile - string of path to the latest checkpoint (None
+    #                            if there are no readable checkpoints)
+
+    #Check for appropriate inputs
+    if problemCheckpointPath is None:
+        raise ValueError('A checkpoint path is needed in getLatestCheckpoint')
+
+    #Return nothing if there are no checkpoints
+    if not os.path.isdir(problemCheckpointPath):
+        return None
+
+    #Check the trajectories from newest to oldest
+    checkpointFiles = [os.path.join(dirPath,fileName)
+                       for dirPath, dirNames, fileNames in os.walk(problemCheckpointPath)
+                       for fileName in fileNames if fileName.endswith('.sto')]
+    for checkpointFile in sorted(checkpointFiles, key = os.path.getmtime, reverse = True):
+        try:
+            header, labels, data = stoHelper.readSto(checkpointFile, useSidecar = False)
+        except Exception:
+            continue
+        if data.shape[0] > 1 and 'time' in labels:
+            return checkpointFile
+
+    return None
+
+# %% getModelHash
+
+def getModelHash(sourceModel = None, modelSpec = None):
+
+    # Creates the hash identifying a processed model. The hash covers the
+    # source model file, the model changes and the ordered list of model
+    # operators with their arguments, and the opensim version that applies them.
+    #
+    # Input:    sourceModel - string of path to the source .osim model file, or
+    #                         an Opensim model object (which is printed out)
+    #           modelSpec - dictionary of the model changes and operators (see
+    #                       osimHelper.getTaskModelSpec)
+    #
+    # Output:   modelHash - string of SHA-256 hex digest
+
+    #Check for appropriate inputs
+    if sourceModel is None or modelSpec is None:
+        raise ValueError('A source model and model specification are needed in getModelHash')
+
+    #Import opensim
+    import opensim as osim
+
+    #Read the source model, printing out model objects to a temporary file
+    if isinstance(sourceModel, str):
+        with open(sourceModel,'rb') as modelFile:
+            sourceXML = modelFile.read()
+    else:
+        tempFileHandle, tempFileName = tempfile.mkstemp(suffix = '.osim')
+        os.close(tempFileHandle)
+        try:
+            sourceModel.printToXML(tempFileName)
+            with open(tempFileName,'rb') as modelFile:
+                sourceXML = modelFile.read()
+        finally:
+            os.remove(tempFileName)
+
+    #Create the hash from the source model, model changes and opensim version
+    modelHash = hashlib.sha256(sourceXML)
+    modelHash.update(json.dumps(modelSpec, sort_keys = True).encode())
+    modelHash.update(osim.GetVersionAndDate().encode())
+
+    return modelHash.hexdigest()
+
+# %% getCachedModel
+
+def getCachedModel(modelCachePath = None, modelHash = None):
+
+    # Loads the cached processed model for a model hash
+    #
+    # Input:    modelCachePath - string of path to the model cache directory
+    #           modelHash - string of model hash (see getModelHash)
+    #
+    # Output:   simModel - processed Opensim model object (None if not in the cache)
+
+    #Check for appropriate inputs
+    if modelCachePath is None or modelHash is None:
+        raise ValueError('A model cache path and model hash are needed in getCachedModel')
+
+    #Import opensim
+    import opensim as osim
+
+    #Return nothing if the model isn't cached
+    cacheFile = os.path.join(modelCachePath,modelCachePrefix+modelHash+'.osim')
+    if not os.path.isfile(cacheFile):
+        return None
+
+    #Load the model
+    simModel = osim.Model(cacheFile)
+    simModel.finalizeConnections()
+
+    return simModel
+
+# %% addCachedModel
+
+def addCachedModel(modelCachePath = None, modelHash = None, simModel = None):
+
+    # Adds a processed model to the cache
+    #
+    # Input:    modelCachePath - string of path to the model cache directory
+    #           modelHash - string of model hash (see getModelHash)
+    #           simModel - processed Opensim model object to cache
+
+    #Check for appropriate inputs
+    if modelCachePath is None or modelHash is None or simModel is None:
+        raise ValueError('A model cache path, model hash and model are needed in addCachedModel')
+
+    #Create the cache directory if needed
+    os.makedirs(modelCachePath, exist_ok = True)
+
+    #Print the model to a temporary file and rename it into place
+    cacheFile = os.path.join(modelCachePath,modelCachePrefix+modelHash+'.osim')
+    tempFile = cacheFile+'.'+str(os.getpid())+'.tmp'
+    simModel.printToXML(tempFile)
+    os.replace(tempFile,cacheFile)
+
+# %%
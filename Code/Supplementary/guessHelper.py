@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for assembling simulation guesses from
+existing solutions. The source columns are mapped to the target variable names
+with a set of renaming rules, non-finite values are filled by interpolation
+and the data are resampled onto the target time points, all as whole array
+operations. Functions defined here include:
+
+    renameColumns           applies the renaming rules to a list of labels
+
+    scrubNonFinite          fills NaN and infinite values by interpolating
+                            over time within each column
+
+    resampleData            linearly resamples all columns onto new time points
+
+    assembleGuess           maps, scrubs and resamples source data onto a
+                            target variable layout
+
+    getMissingLabels        lists the defaulted variables of a guess that are
+                            genuinely missing from the source data
+
+    createGuessTrajectory   creates a MocoTrajectory guess on the mesh of a
+                            Moco solver from an existing solution file
+
+Renaming rules are a list of (pattern, replacement) pairs that are applied in
+order to each source label with re.sub. A replacement of None drops any label
+matching the pattern. The default rules:
+    - drop the slack variables (gamma_*), which the solver sets to zero and can
+      contain NaN's in the last row of existing solutions
+    - move actuators that were components in the existing solutions into the
+      forceset, as the reserve and torque actuators are in the forceset in
+      this study (e.g. /elv_angle_reserve to /forceset/elv_angle_reserve)
+
+"""
+
+# %% Import packages
+
+import os
+import re
+import tempfile
+import numpy as np
+import stoHelper
+
+# %% Settings
+
+#Default renaming rules for mapping existing solutions onto the current problem
+defaultRenameRules = [(r'^gamma_', None),
+                      (r'^/(?!forceset/|jointset/)', '/forceset/')]
+
+#Patterns of the problem variables that are expected to be left at their
+#default values in a guess, i.e. the slack variables that are dropped from the
+#existing solutions and the multipliers, which the solver starts from zero
+expectedDefaultPatterns = [r'^gamma_', r'^lambda_']
+
+# %% renameColumns
+
+def renameColumns(labels = None, renameRules = None):
+
+    # Applies the renaming rules to a list of labels
+    #
+    # Input:    labels - list of source column labels
+    #           renameRules - list of (pattern, replacement) pairs (default
+    #                         uses defaultRenameRules)
+    #
+    # Output:   newLabels - list of renamed labels, with None for dropped labels
+
+    #Check for appropriate inputs
+    if labels is None:
+        raise ValueError('A list of labels is needed in renameColumns')
+
+    #Set the default rules
+    if renameRules is None:
+        renameRules = defaultRenameRules
+
+    #Compile the rules
+    compiledRules = [(re.compile(pattern), replacement) for pattern, replacement in renameRules]
+
+    #Apply the rules to each label
+    newLabels = []
+    for label in labels:
+        for pattern, replacement in compiledRules:
+            if label is None:
+                break
+            if replacement is None:
+                if pattern.search(label):
+                    label = None
+            else:
+                label = pattern.sub(replacement, label)
+        newLabels.append(label)
+
+    return newLabels
+
+# %% scrubNonFinite
+
+def scrubNonFinite(time = None, data = None):
+
+    # Fills NaN and infinite values in each column by linearly interpolating
+    # between the finite values over time. Columns with no finite values are
+    # set to zero.
+    #
+    # Input:    time - 1D numpy array of time points
+    #           data - 2D numpy array with a row per time point
+    #
+    # Output:   data - 2D numpy array with the non-finite values filled
+    #           scrubbedColumns - list of column indices that were filled
+
+    #Check for appropriate inputs
+    if time is None or data is None:
+        raise ValueError('Time and data are needed in scrubNonFinite')
+
+    #Find the columns with non-finite values
+    isFinite = np.isfinite(data)
+    scrubbedColumns = list(np.where(~isFinite.all(axis = 0))[0])
+
+    #Return without copying if there is nothing to fill
+    if len(scrubbedColumns) == 0:
+        return data, scrubbedColumns
+
+    #Fill each of the columns
+    data = np.array(data, dtype = np.float64)
+    for col in scrubbedColumns:
+        if isFinite[:,col].any():
+            data[:,col] = np.interp(time, time[isFinite[:,col]], data[isFinite[:,col],col])
+        else:
+            data[:,col] = 0.0
+
+    return data, scrubbedColumns
+
+# %% resampleData
+
+def resampleData(time = None, data = None, newTime = None):
+
+    # Linearly resamples all columns of the data onto new time points in a
+    # single step. New time points outside the original time are held at the
+    # first or last values.
+    #
+    # Input:    time - 1D numpy array of increasing time points
+    #           data - 2D numpy array with a row per time point
+    #           newTime - 1D numpy array of time points to resample to
+    #
+    # Output:   newData - 2D numpy array with a row per new time point
+
+    #Check for appropriate inputs
+    if time is None or data is None or newTime is None:
+        raise ValueError('All three input arguments are needed in resampleData')
+
+    #Get the interval each new time point falls in and its position within it
+    time = np.asarray(time, dtype = np.float64)
+    newTime = np.clip(np.asarray(newTime, dtype = np.float64), time[0], time[-1])
+    upperInd = np.clip(np.searchsorted(time, newTime, side = 'right'), 1, len(time) - 1)
+    lowerInd = upperInd - 1
+    interval = time[upperInd] - time[lowerInd]
+    weight = np.divide(newTime - time[lowerInd], interval,
+                       out = np.zeros_like(newTime), where = interval > 0)
+
+    #Interpolate all columns together
+    return data[lowerInd,:] * (1 - weight)[:,None] + data[upperInd,:] * weight[:,None]
+
+# %% assembleGuess
+
+def assembleGuess(sourceLabels = None, sourceData = None, targetLabels = None,
+                  targetData = None, renameRules = None):
+
+    # Maps source data onto a target variable layout. Source columns are
+    # renamed to the target names, non-finite values are filled and the data
+    # are resampled onto the target time points, with the target time scaled
+    # to span the same period as the source. Target variables without a
+    # source column keep their values in the target data.
+    #
+    # Input:    sourceLabels - list of source column labels (including time)
+    #           sourceData - 2D numpy array of source data
+    #           targetLabels - list of target column labels (including time)
+    #           targetData - 2D numpy array of target data, used for its number
+    #                        of time points and the default variable values
+    #           renameRules - list of (pattern, replacement) pairs (default
+    #                         uses defaultRenameRules)
+    #
+    # Output:   guessData - 2D numpy array in the target layout
+    #           report - dictionary containing lists of the mapped, defaulted
+    #                    (target variables left at their default), unused
+    #                    (source columns without a target) and scrubbed
+    #                    (source columns with non-finite values) labels
+
+    #Check for appropriate inputs
+    if sourceLabels is None or sourceData is None or targetLabels is None or targetData is None:
+        raise ValueError('Source and target labels and data are needed in assembleGuess')
+
+    #Get the time columns
+    sourceTime = np.asarray(sourceData[:,sourceLabels.index('time')], dtype = np.float64)
+    targetTime = np.asarray(targetData[:,targetLabels.index('time')], dtype = np.float64)
+
+    #Map the source columns to the target columns
+    newLabels = renameColumns(sourceLabels, renameRules)
+    targetIndex = {label: ind for ind, label in enumerate(targetLabels)}
+    sourceCols = []
+    targetCols = []
+    unused = []
+    for ind, label in enumerate(newLabels):
+        if sourceLabels[ind] == 'time':
+            continue
+        if label in targetIndex:
+            sourceCols.append(ind)
+            targetCols.append(targetIndex[label])
+        else:
+            unused.append(sourceLabels[ind])
+
+    #Fill any non-finite values in the mapped columns
+    mappedData, scrubbedCols = scrubNonFinite(sourceTime, np.asarray(sourceData[:,sourceCols], dtype = np.float64))
+
+    #Scale the target time to span the source period
+    newTime = sourceTime[0] + (targetTime - targetTime[0]) / (targetTime[-1] - targetTime[0]) \
+        * (sourceTime[-1] - sourceTime[0])
+
+    #Resample and place the mapped columns in the target layout
+    guessData = np.array(targetData, dtype = np.float64)
+    guessData[:,targetLabels.index('time')] = newTime
+    guessData[:,targetCols] = resampleData(sourceTime, mappedData, newTime)
+
+    #Create the report
+    mappedTargets = set(targetCols)
+    report = {'mapped': [targetLabels[col] for col in targetCols],
+              'defaulted': [label for ind, label in enumerate(targetLabels)
+                            if label != 'time' and ind not in mappedTargets],
+              'unused': unused,
+              'scrubbed': [sourceLabels[sourceCols[col]] for col in scrubbedCols]}
+
+    return guessData, report
+
+# %% getMissingLabels
+
+def getMissingLabels(defaultedLabels = None):
+
+    # Lists the defaulted variables of a guess (see assembleGuess) that are
+    # genuinely missing from the source data, leaving out the slack variables
+    # and multipliers that are expected to be left at their defaults
+    #
+    # Input:    defaultedLabels - list of the defaulted target labels
+    #
+    # Output:   missingLabels - list of the defaulted labels that don't match
+    #                           the expectedDefaultPatterns
+
+    #Check for appropriate inputs
+    if defaultedLabels is None:
+        raise ValueError('A list of defaulted labels is needed in getMissingLabels')
+
+    compiledPatterns = [re.compile(pattern) for pattern in expectedDefaultPatterns]
+
+    return [label for label in defaultedLabels
+            if not any([pattern.search(label) for pattern in compiledPatterns])]
+
+# %% createGuessTrajectory
+
+def createGuessTrajectory(guessFile = None, mocoSolver = None, renameRules = None):
+
+    # Creates a guess on the mesh of a Moco solver from an existing solution
+    # file, which can be at a different number of mesh intervals. A guess is
+    # created by the solver to get the variables and mesh (which sets the
+    # slacks to zero), and the existing solution is mapped onto it with
+    # assembleGuess. The guess is passed back to opensim through a temporary
+    # .sto file.
+    #
+    # Input:    guessFile - string of path to the existing solution file
+    #           mocoSolver - Moco solver to create the guess for
+    #           renameRules - list of (pattern, replacement) pairs (default
+    #                         uses defaultRenameRules)
+    #
+    # Output:   guessTraj - MocoTrajectory on the solvers mesh
+    #           report - dictionary of mapped, defaulted, unused and scrubbed
+    #                    labels (see assembleGuess)
+
+    #Check for appropriate inputs
+    if guessFile is None or mocoSolver is None:
+        raise ValueError('A guess file and linked Moco Solver are needed in createGuessTrajectory')
+
+    #Import opensim
+    import opensim as osim
+
+    #Read the existing solution
+    sourceHeader, sourceLabels, sourceData = stoHelper.readSto(guessFile)
+
+    #Create the guess from the solver and read its layout
+    tempFileHandle, tempFileName = tempfile.mkstemp(suffix = '.sto')
+    os.close(tempFileHandle)
+    try:
+        mocoSolver.createGuess().write(tempFileName)
+        targetHeader, targetLabels, targetData = stoHelper.readSto(tempFileName, useSidecar = False)
+
+        #Map the existing solution onto the guess
+        guessData, report = assembleGuess(sourceLabels,sourceData,targetLabels,
+                                          targetData,renameRules)
+
+        #Write the guess and load as a trajectory
+        stoHelper.writeSto(tempFileName,targetHeader,targetLabels,guessData)
+        guessTraj = osim.MocoTrajectory(tempFileName)
+    finally:
+        os.remove(tempFileName)
+
+    return guessTraj, report
+
+# %%
@@ -0,0 +1,703 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for generating the strength variant models.
+The baseline model is only parsed once, and each variant is derived from it by
+changing the max_isometric_force of the targeted muscles. Variants are
+described by a small specification dictionary, which can be written out as a
+full model file or turned into an Opensim model in memory for the solvers.
+Functions defined here include:
+
+    parseBaseModel          parses the baseline model .osim file and finds the
+                            muscle elements in the force set
+
+    getVariantSpecs         creates the variant specifications for each muscle
+                            group and scale factor
+
+    getCombinedVariantSpecs creates the variant specifications for combinations
+                            of scale factors across several muscle groups
+
+    createVariantXML        creates the full .osim file contents for a variant
+
+    writeVariantModels      writes the variant model files in parallel
+
+    writeVariantOverlay     writes the variant specifications to an overlay file
+
+    readVariantOverlay      reads the variant specifications from an overlay file
+
+    getVariantSources       expands a list of model and overlay files into the
+                            model files and variant specifications they contain
+
+    loadBaseModel           loads the baseline Opensim model once per process
+
+    createVariantModel      creates a variant Opensim model in memory from the
+                            baseline model
+
+    loadVariantModel        loads a variant Opensim model from a model file,
+                            overlay file or variant specification
+
+    readModelInventory      streams a model file for the muscle properties and
+                            coordinate ranges, without creating the model
+
+    getModelInventories     collects the muscle and coordinate tables of a list
+                            of model sources across a pool of processes
+
+    diffModelInventories    lists the muscle and coordinate properties of each
+                            model that differ from the baseline model
+
+Variant specifications are dictionaries containing:
+    name - string of variant name (e.g. 'DELT1_strength80')
+    muscleGroup - string of muscle group label (e.g. 'DELT1')
+    scaleFactor - float of strength scale factor (e.g. 0.8)
+    baseModelFile - string of path to the baseline model
+    overrides - dictionary of muscle name to a dictionary of property name
+                to new value (e.g. {'DELT1': {'max_isometric_force': 445.44}})
+
+Variants that scale several muscle groups at once have a 'Combined' muscle group
+label and a nan scale factor, with the scale factor of each group in:
+    groupFactors - dictionary of muscle group label to scale factor
+
+Variants can also be stored compactly as an overlay file, which holds the
+baseline model path and the overrides for each variant in JSON format. The
+full model is only created from the overlay when it is needed.
+
+"""
+
+# %% Import packages
+
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import xml.etree.ElementTree as ET
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+
+# %% Settings
+
+#Baseline models already loaded in the current process (see loadBaseModel)
+baseModels = {}
+
+#Muscle properties read into the model inventories
+inventoryProperties = ['max_isometric_force','optimal_fiber_length',
+                       'tendon_slack_length','pennation_angle_at_optimal']
+
+#Coordinate properties read into the model inventories
+coordinateProperties = ['rangeMin','rangeMax','defaultValue','locked']
+
+# %% parseBaseModel
+
+def parseBaseModel(baseModelFileName = None):
+
+    # Parses the baseline model file and finds the muscle elements within the
+    # force set (i.e. those with a max_isometric_force property)
+    #
+    # Input:    baseModelFileName - string of path to baseline model file
+    #
+    # Output:   baseTree - ElementTree of the baseline model
+    #           muscleElements - dictionary of muscle name to muscle element
+
+    #Check for appropriate inputs
+    if baseModelFileName is None:
+        raise ValueError('A baseline model file is needed in parseBaseModel')
+
+    #Parse the model file
+    baseTree = ET.parse(baseModelFileName)
+
+    #Find the muscles in the force set
+    muscleElements = {}
+    for forceElement in baseTree.getroot().find('Model').find('ForceSet').find('objects'):
+        if forceElement.find('max_isometric_force') is not None:
+            muscleElements[forceElement.get('name')] = forceElement
+
+    return baseTree, muscleElements
+
+# %% getVariantSpecs
+
+def getVariantSpecs(baseModelFileName = None, muscToAlter = None, scaleFactors = None):
+
+    # Creates the variant specifications for each muscle group and scale factor.
+    # The new max isometric forces are calculated from the baseline model.
+    #
+    # Input:    baseModelFileName - string of path to baseline model file
+    #           muscToAlter - list of lists of muscle names in each group
+    #           scaleFactors - list of scale factors to apply to each group
+    #
+    # Output:   variantSpecs - list of variant specification dictionaries
+
+    #Check for appropriate inputs
+    if baseModelFileName is None or muscToAlter is None or scaleFactors is None:
+        raise ValueError('All three input arguments are needed in getVariantSpecs')
+
+    #Get the baseline muscle strengths
+    baseTree, muscleElements = parseBaseModel(baseModelFileName)
+
+    #Loop through muscle groups and scale factors
+    variantSpecs = []
+    for muscleGroup in muscToAlter:
+
+        #Create a string label for the current muscle group
+        modelLabel = '_'.join(muscleGroup)
+
+        for scaleFactor in scaleFactors:
+
+            #Scale each muscle to its new force generating capacity
+            overrides = {}
+            for currMusc in muscleGroup:
+                if currMusc not in muscleElements:
+                    raise ValueError('Muscle '+currMusc+' not found in '+baseModelFileName)
+                overrides[currMusc] = {'max_isometric_force':
+                                       float(muscleElements[currMusc].find('max_isometric_force').text) * scaleFactor}
+
+            #Create the specification
+            variantSpecs.append({'name': modelLabel+'_strength'+str(int(round(scaleFactor*100))),
+                                 'muscleGroup': modelLabel,
+                                 'scaleFactor': scaleFactor,
+                                 'baseModelFile': baseModelFileName,
+                                 'overrides': overrides})
+
+    return variantSpecs
+
+# %% getCombinedVariantSpecs
+
+def getCombinedVariantSpecs(baseModelFileName = None, muscToAlter = None, groupFactors = None):
+
+    # Creates the variant specifications for combinations of scale factors
+    # across several muscle groups. Each variant is named from a hash of its
+    # scale factors (e.g. 'Combined_3f9a1c2e'), as the names would otherwise be
+    # too long to use as file names.
+    #
+    # Input:    baseModelFileName - string of path to baseline model file
+    #           muscToAlter - list of lists of muscle names in each group
+    #           groupFactors - list of dictionaries of muscle group label to
+    #                          scale factor, with a dictionary for each variant.
+    #                          Groups that aren't included keep their baseline
+    #                          strength.
+    #
+    # Output:   variantSpecs - list of variant specification dictionaries
+
+    #Check for appropriate inputs
+    if baseModelFileName is None or muscToAlter is None or groupFactors is None:
+        raise ValueError('All three input arguments are needed in getCombinedVariantSpecs')
+
+    #Get the baseline muscle strengths
+    baseTree, muscleElements = parseBaseModel(baseModelFileName)
+
+    #Get the muscles in each group by their label
+    groupMuscles = {'_'.join(muscleGroup): muscleGroup for muscleGroup in muscToAlter}
+
+    #Loop through the variants
+    variantSpecs = []
+    for variantFactors in groupFactors:
+
+        #Scale each muscle in the groups to its new force generating capacity
+        overrides = {}
+        for modelLabel in variantFactors:
+            if modelLabel not in groupMuscles:
+                raise ValueError('Muscle group '+modelLabel+' not found in the groups to alter')
+            for currMusc in groupMuscles[modelLabel]:
+                if currMusc not in muscleElements:
+                    raise ValueError('Muscle '+currMusc+' not found in '+baseModelFileName)
+                overrides[currMusc] = {'max_isometric_force':
+                                       float(muscleElements[currMusc].find('max_isometric_force').text) * variantFactors[modelLabel]}
+
+        #Name the variant from its scale factors
+        factorStr = json.dumps({modelLabel: round(float(variantFactors[modelLabel]),6)
+                                for modelLabel in variantFactors}, sort_keys = True)
+        variantName = 'Combined_'+hashlib.sha1(factorStr.encode('utf-8')).hexdigest()[:8]
+
+        #Create the specification
+        variantSpecs.append({'name': variantName,
+                             'muscleGroup': 'Combined',
+                             'scaleFactor': float('nan'),
+                             'groupFactors': {modelLabel: float(variantFactors[modelLabel])
+                                              for modelLabel in variantFactors},
+                             'baseModelFile': baseModelFileName,
+                             'overrides': overrides})
+
+    return variantSpecs
+
+# %% createVariantXML
+
+def createVariantXML(baseTree = None, muscleElements = None, variantSpec = None):
+
+    # Creates the full .osim file contents for a variant from the parsed
+    # baseline model. The muscle properties and model name are set in the
+    # baseline tree, written out and then restored, so the tree can be reused
+    # for the next variant without copying it.
+    #
+    # Input:    baseTree - ElementTree of the baseline model (see parseBaseModel)
+    #           muscleElements - dictionary of muscle name to muscle element
+    #           variantSpec - variant specification dictionary
+    #
+    # Output:   variantXML - bytes of the variant .osim file contents
+
+    #Check for appropriate inputs
+    if baseTree is None or muscleElements is None or variantSpec is None:
+        raise ValueError('All three input arguments are needed in createVariantXML')
+
+    #Get the model element
+    modelElement = baseTree.getroot().find('Model')
+    baseName = modelElement.get('name')
+
+    #Set the new muscle properties, keeping the baseline values
+    baseValues = []
+    for currMusc in variantSpec['overrides']:
+        for propName in variantSpec['overrides'][currMusc]:
+            propElement = muscleElements[currMusc].find(propName)
+            if propElement is None:
+                raise ValueError('Property '+propName+' not found for muscle '+currMusc)
+            baseValues.append((propElement,propElement.text))
+            propElement.text = repr(float(variantSpec['overrides'][currMusc][propName]))
+
+    #Set the model name and write out
+    try:
+        modelElement.set('name',variantSpec['name'])
+        variantXML = ET.tostring(baseTree.getroot(), encoding = 'UTF-8')
+    finally:
+        #Restore the baseline values
+        modelElement.set('name',baseName)
+        for propElement, baseValue in baseValues:
+            propElement.text = baseValue
+
+    return variantXML
+
+# %% writeVariantModels
+
+def writeVariantModels(variantSpecs = None, outputPath = None, nThreads = 4):
+
+    # Writes the variant model files from their specifications. The baseline
+    # model is parsed once for each baseline file used by the variants, and the
+    # files are written across a pool of threads.
+    #
+    # Input:    variantSpecs - list of variant specification dictionaries
+    #           outputPath - string of path to write the model files to
+    #           nThreads - number of threads to write files with
+    #
+    # Output:   modelFiles - list of strings of paths to the written model files
+
+    #Check for appropriate inputs
+    if variantSpecs is None or outputPath is None:
+        raise ValueError('Variant specifications and an output path are needed in writeVariantModels')
+
+    #Parse each of the baseline models once
+    parsedModels = {}
+    for variantSpec in variantSpecs:
+        if variantSpec['baseModelFile'] not in parsedModels:
+            parsedModels[variantSpec['baseModelFile']] = parseBaseModel(variantSpec['baseModelFile'])
+
+    #Function to write out a single file
+    def writeFile(fileDetails):
+        modelFile, variantXML = fileDetails
+        with open(modelFile,'wb') as osimFile:
+            osimFile.write(variantXML)
+        return modelFile
+
+    #Create the file contents, writing them across the threads as they are made
+    fileList = ((os.path.join(outputPath,variantSpec['name']+'.osim'),
+                 createVariantXML(*parsedModels[variantSpec['baseModelFile']],variantSpec))
+                for variantSpec in variantSpecs)
+    with ThreadPool(max(1, nThreads)) as pool:
+        modelFiles = list(pool.imap(writeFile, fileList))
+
+    return modelFiles
+
+# %% writeVariantOverlay
+
+def writeVariantOverlay(variantSpecs = None, overlayFile = None):
+
+    # Writes the variant specifications to an overlay file. Only the baseline
+    # model path and the changed properties are stored, with the baseline path
+    # relative to the overlay file so the two can be moved together.
+    #
+    # Input:    variantSpecs - list of variant specification dictionaries, which
+    #                          all need to share the same baseline model
+    #           overlayFile - string of path to the overlay .json file
+
+    #Check for appropriate inputs
+    if variantSpecs is None or overlayFile is None:
+        raise ValueError('Variant specifications and an overlay file are needed in writeVariantOverlay')
+
+    #Check the variants share a baseline model
+    baseModelFiles = set([os.path.abspath(variantSpec['baseModelFile']) for variantSpec in variantSpecs])
+    if len(baseModelFiles) != 1:
+        raise ValueError('All variants in an overlay file need the same baseline model')
+
+    #Create the overlay contents
+    overlay = {'baseModelFile': os.path.relpath(baseModelFiles.pop(),
+                                                os.path.dirname(os.path.abspath(overlayFile))),
+               'variants': {}}
+    for variantSpec in variantSpecs:
+        overlay['variants'][variantSpec['name']] = {'muscleGroup': variantSpec['muscleGroup'],
+                                                    'scaleFactor': variantSpec['scaleFactor'],
+                                                    'overrides': variantSpec['overrides']}
+        if 'groupFactors' in variantSpec:
+            overlay['variants'][variantSpec['name']]['groupFactors'] = variantSpec['groupFactors']
+
+    #Write to file
+    with open(overlayFile,'w') as jsonFile:
+        json.dump(overlay, jsonFile, indent = 1)
+
+# %% readVariantOverlay
+
+def readVariantOverlay(overlayFile = None):
+
+    # Reads the variant specifications from an overlay file
+    #
+    # Input:    overlayFile - string of path to the overlay .json file
+    #
+    # Output:   variantSpecs - list of variant specification dictionaries
+
+    #Check for appropriate inputs
+    if overlayFile is None:
+        raise ValueError('An overlay file is needed in readVariantOverlay')
+
+    #Load the file
+    with open(overlayFile,'r') as jsonFile:
+        overlay = json.load(jsonFile)
+
+    #Set the baseline model path relative to the overlay file
+    baseModelFileName = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(overlayFile)),
+                                                      overlay['baseModelFile']))
+
+    #Create the specifications
+    variantSpecs = []
+    for variantName in overlay['variants']:
+        variantSpec = {'name': variantName, 'baseModelFile': baseModelFileName}
+        variantSpec.update(overlay['variants'][variantName])
+        variantSpecs.append(variantSpec)
+
+    return variantSpecs
+
+# %% getVariantSources
+
+def getVariantSources(sourceList = None):
+
+    # Expands a list of model sources into the entries used by the batch
+    # simulations. Existing .osim files are kept as they are, overlay .json
+    # files are expanded into their variant specifications, and wildcard
+    # patterns are expanded to the matching files.
+    #
+    # Input:    sourceList - list of strings of .osim files, overlay .json files
+    #                        or wildcard patterns (e.g. 'ModelFiles/*_strength*.osim')
+    #
+    # Output:   variantList - list of model file strings and variant
+    #                         specification dictionaries
+
+    #Check for appropriate inputs
+    if sourceList is None:
+        raise ValueError('A list of model sources is needed in getVariantSources')
+
+    #Loop through the sources
+    variantList = []
+    for source in sourceList:
+        for sourceFile in sorted(glob.glob(source)):
+            if sourceFile.endswith('.json'):
+                variantList.extend(readVariantOverlay(sourceFile))
+            else:
+                variantList.append(sourceFile)
+
+    return variantList
+
+# %% loadBaseModel
+
+def loadBaseModel(baseModelFileName = None):
+
+    # Loads a baseline Opensim model, keeping it for later calls in the same
+    # process so that the file is only read once per worker
+    #
+    # Input:    baseModelFileName - string of path to baseline model file
+    #
+    # Output:   baseModel - Opensim model object of the baseline model
+
+    #Check for appropriate inputs
+    if baseModelFileName is None:
+        raise ValueError('A baseline model file is needed in loadBaseModel')
+
+    #Import opensim here so that generating the model files doesn't need it
+    import opensim as osim
+
+    #Load the model if it hasn't been already
+    if baseModelFileName not in baseModels:
+        baseModels[baseModelFileName] = osim.Model(baseModelFileName)
+
+    return baseModels[baseModelFileName]
+
+# %% createVariantModel
+
+def createVariantModel(variantSpec = None):
+
+    # Creates a variant Opensim model in memory by copying the baseline model
+    # and setting the new muscle properties, without writing the model to file
+    #
+    # Input:    variantSpec - variant specification dictionary
+    #
+    # Output:   osimModel - Opensim model object of the variant
+
+    #Check for appropriate inputs
+    if variantSpec is None:
+        raise ValueError('A variant specification is needed in createVariantModel')
+
+    #Import opensim
+    import opensim as osim
+
+    #Create a copy of the baseline model to edit
+    osimModel = osim.Model(loadBaseModel(variantSpec['baseModelFile']))
+
+    #Set the new properties of each muscle
+    for currMusc in variantSpec['overrides']:
+        muscle = osimModel.getMuscles().get(currMusc)
+        for propName in variantSpec['overrides'][currMusc]:
+            osim.PropertyHelper.setValueDouble(float(variantSpec['overrides'][currMusc][propName]),
+                                               muscle.updPropertyByName(propName))
+
+    #Set the model name
+    osimModel.setName(variantSpec['name'])
+    osimModel.finalizeConnections()
+
+    return osimModel
+
+# %% loadVariantModel
+
+def loadVariantModel(variantSource = None, variantName = None):
+
+    # Loads a variant Opensim model from any of the variant formats. Existing
+    # .osim files are loaded directly, while overlay files and specifications
+    # are created in memory from the baseline model.
+    #
+    # Input:    variantSource - string of path to .osim file or overlay .json
+    #                           file, or a variant specification dictionary
+    #           variantName - string of variant name (needed for overlay files)
+    #
+    # Output:   osimModel - Opensim model object of the variant
+
+    #Check for appropriate inputs
+    if variantSource is None:
+        raise ValueError('A variant source is needed in loadVariantModel')
+
+    #Create from a variant specification
+    if isinstance(variantSource, dict):
+        return createVariantModel(variantSource)
+
+    #Create from the overlay file
+    if variantSource.endswith('.json'):
+        if variantName is None:
+            raise ValueError('A variant name is needed to load from an overlay file')
+        variantSpecs = [variantSpec for variantSpec in readVariantOverlay(variantSource)
+                        if variantSpec['name'] == variantName]
+        if len(variantSpecs) == 0:
+            raise ValueError('Variant '+variantName+' not found in '+variantSource)
+        return createVariantModel(variantSpecs[0])
+
+    #Load the model file
+    import opensim as osim
+    return osim.Model(variantSource)
+
+# %% readModelInventory
+
+def readModelInventory(modelFileName = None, muscleProperties = None):
+
+    # Streams a model file for the properties of its muscles and the ranges of
+    # its coordinates. The file is read with iterparse and each component is
+    # cleared once it has been read, so memory stays bounded and no Opensim
+    # model is created.
+    #
+    # Input:    modelFileName - string of path to .osim model file
+    #           muscleProperties - list of muscle property names to read
+    #                              (default uses inventoryProperties)
+    #
+    # Output:   muscleTable - pandas dataframe with a row per muscle of its type
+    #                         and properties
+    #           coordinateTable - pandas dataframe with a row per coordinate of
+    #                             its joint, range, default value and lock
+
+    #Check for appropriate inputs
+    if modelFileName is None:
+        raise ValueError('A model file is needed in readModelInventory')
+
+    #Set the defaults
+    if muscleProperties is None:
+        muscleProperties = inventoryProperties
+
+    #Stream through the file, keeping the tags of the open elements
+    muscleRows = []
+    coordinateRows = []
+    tagStack = []
+    jointName = None
+    for event, element in ET.iterparse(modelFileName, events = ('start','end')):
+
+        #Track the open elements and the current joint
+        if event == 'start':
+            if len(tagStack) >= 2 and tagStack[-1] == 'objects' and tagStack[-2] == 'JointSet':
+                jointName = element.get('name')
+            tagStack.append(element.tag)
+            continue
+        tagStack.pop()
+
+        #Read the coordinates
+        if element.tag == 'Coordinate':
+            rangeValues = (element.findtext('range') or 'nan nan').split()
+            coordinateRows.append({'coordinate': element.get('name'), 'joint': jointName,
+                                   'rangeMin': float(rangeValues[0]),
+                                   'rangeMax': float(rangeValues[1]),
+                                   'defaultValue': float(element.findtext('default_value') or 'nan'),
+                                   'locked': (element.findtext('locked') or 'false').strip() == 'true'})
+            element.clear()
+
+        #Read the muscles in the force set, and clear every component of the
+        #model sets once it has been read
+        elif len(tagStack) >= 1 and tagStack[-1] == 'objects':
+            if len(tagStack) >= 2 and tagStack[-2] == 'ForceSet' \
+                and element.find('max_isometric_force') is not None:
+                muscleRow = {'muscle': element.get('name'), 'muscleType': element.tag}
+                for propName in muscleProperties:
+                    muscleRow[propName] = float(element.findtext(propName) or 'nan')
+                muscleRows.append(muscleRow)
+            element.clear()
+
+    return (pd.DataFrame(muscleRows, columns = ['muscle','muscleType']+muscleProperties),
+            pd.DataFrame(coordinateRows, columns = ['coordinate','joint']+coordinateProperties))
+
+# %% getModelInventories
+
+def getModelInventories(modelSources = None, nProcesses = None, muscleProperties = None):
+
+    # Collects the muscle and coordinate tables of a list of model sources. The
+    # model files are streamed across a pool of processes. Variant
+    # specifications are taken from the inventory of their baseline model with
+    # the overrides applied, so their models don't need to be written out.
+    #
+    # Input:    modelSources - list of strings of paths to model files, or
+    #                          variant specification dictionaries (see
+    #                          getVariantSources)
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs)
+    #           muscleProperties - list of muscle property names to read
+    #                              (default uses inventoryProperties)
+    #
+    # Output:   muscleTable - pandas dataframe with a row per model and muscle
+    #           coordinateTable - pandas dataframe with a row per model and
+    #                             coordinate
+
+    #Check for appropriate inputs
+    if modelSources is None:
+        raise ValueError('A list of model sources is needed in getModelInventories')
+
+    #Set the defaults
+    if muscleProperties is None:
+        muscleProperties = inventoryProperties
+    if nProcesses is None:
+        nProcesses = mp.cpu_count()
+
+    #Get the model files to read, including the baseline models of any variants
+    modelFiles = [source for source in modelSources if not isinstance(source, dict)]
+    for source in modelSources:
+        if isinstance(source, dict) and source['baseModelFile'] not in modelFiles:
+            modelFiles.append(source['baseModelFile'])
+
+    #Read the model files across the pool
+    nProcesses = max(1, min(nProcesses, len(modelFiles)))
+    readArgs = [(modelFile,muscleProperties) for modelFile in modelFiles]
+    if nProcesses > 1:
+        with mp.Pool(processes = nProcesses) as pool:
+            inventoryList = pool.starmap(readModelInventory, readArgs,
+                                         chunksize = max(1, len(readArgs) // (4*nProcesses)))
+    else:
+        inventoryList = [readModelInventory(*fileArgs) for fileArgs in readArgs]
+    fileInventories = dict(zip(modelFiles, inventoryList))
+
+    #Collect the tables of each source, labelled by the model name
+    muscleTables = []
+    coordinateTables = []
+    for source in modelSources:
+        if isinstance(source, dict):
+            muscleTable, coordinateTable = fileInventories[source['baseModelFile']]
+            muscleTable = muscleTable.copy()
+            for currMusc in source['overrides']:
+                for propName in source['overrides'][currMusc]:
+                    if propName in muscleTable.columns:
+                        muscleTable.loc[muscleTable['muscle'] == currMusc, propName] = \
+                            float(source['overrides'][currMusc][propName])
+            modelName = source['name']
+        else:
+            muscleTable, coordinateTable = fileInventories[source]
+            modelName = os.path.splitext(os.path.basename(source))[0]
+        muscleTables.append(muscleTable.assign(model = modelName))
+        coordinateTables.append(coordinateTable.assign(model = modelName))
+
+    #Combine the tables with the model first
+    muscleTable = pd.concat(muscleTables, ignore_index = True)
+    coordinateTable = pd.concat(coordinateTables, ignore_index = True)
+
+    return (muscleTable[['model']+list(muscleTable.columns[:-1])],
+            coordinateTable[['model']+list(coordinateTable.columns[:-1])])
+
+# %% diffModelInventories
+
+def diffModelInventories(muscleTable = None, coordinateTable = None, baselineModel = 'BaselineModel',
+                         relTolerance = 1e-9):
+
+    # Lists the muscle and coordinate properties of each model that differ from
+    # the baseline model, including muscles and coordinates that have been
+    # added or removed (which have a nan value)
+    #
+    # Input:    muscleTable - pandas dataframe of the muscle inventories (see
+    #                         getModelInventories)
+    #           coordinateTable - pandas dataframe of the coordinate inventories
+    #           baselineModel - string of the model name of the baseline model
+    #           relTolerance - relative tolerance for values to be the same
+    #
+    # Output:   diffTable - pandas dataframe with a row per differing property of
+    #                       each model, with the baseline value, model value and
+    #                       their ratio
+
+    #Check for appropriate inputs
+    if muscleTable is None or coordinateTable is None:
+        raise ValueError('Muscle and coordinate tables are needed in diffModelInventories')
+    if baselineModel not in set(muscleTable['model']):
+        raise ValueError('Baseline model '+baselineModel+' not found in the inventories')
+
+    #Stack the numeric properties of the components into one column
+    longTables = []
+    for componentType, table, nameColumn in [('muscle',muscleTable,'muscle'),
+                                             ('coordinate',coordinateTable,'coordinate')]:
+        valueColumns = [column for column in table.columns if column in inventoryProperties+coordinateProperties]
+        longTable = table.melt(id_vars = ['model',nameColumn], value_vars = valueColumns,
+                               var_name = 'property', value_name = 'value')
+        longTables.append(longTable.rename(columns = {nameColumn: 'component'}).assign(componentType = componentType))
+    longTable = pd.concat(longTables, ignore_index = True)
+    longTable['value'] = longTable['value'].astype(float)
+
+    #Line up each property across the models
+    valueTable = longTable.set_index(['componentType','component','property','model'])['value'].unstack('model')
+    baseValues = valueTable[baselineModel].to_numpy()
+
+    #Find the values that differ from the baseline
+    diffList = []
+    for modelName in valueTable.columns:
+        if modelName == baselineModel:
+            continue
+        modelValues = valueTable[modelName].to_numpy()
+        isDiff = ~np.isclose(modelValues, baseValues, rtol = relTolerance, atol = 0, equal_nan = True)
+        if np.any(isDiff):
+            modelDiffs = valueTable.index[isDiff].to_frame(index = False)
+            modelDiffs.insert(0, 'model', modelName)
+            modelDiffs['baseValue'] = baseValues[isDiff]
+            modelDiffs['value'] = modelValues[isDiff]
+            diffList.append(modelDiffs)
+    diffColumns = ['model','componentType','component','property','baseValue','value']
+    if len(diffList) == 0:
+        diffTable = pd.DataFrame(columns = diffColumns)
+    else:
+        diffTable = pd.concat(diffList, ignore_index = True)[diffColumns]
+    diffTable['ratio'] = diffTable['value'].astype(float) / diffTable['baseValue'].astype(float)
+
+    return diffTable
+
+# %%
@@ -13,16 +13,124 @@ Functions defined here include:
     addCoordinateActuator   adds a coordinate actuator to the specified coordinate
                             with the specified parameters
     
+    getGeometryHash         creates a hash of the model bodies, joints and markers
+    
+    getModelLandmarks       gets the joint centre and marker positions used for
+                            the marker end points, reusing them across models
+                            with the same geometry
+    
+    calcEndPointTargets     calculates the marker end point targets for the tasks
+                            from the model landmarks
+    
+    getMarkerEndPointGoals  gets the marker end point goal specifications
+                            relevant to the specified task name
+    
+    addGoals                adds goals to a Moco Problem from their specifications
+    
     addMarkerEndPoints      adds marker end point goals relevant to the specified
                             task name to a Moco Problem
+    
+    getTaskStateBounds      gets the kinematic state bounds relevant to the
+                            specified task name
+    
+    applyStateBounds        sets state bounds in a Moco Problem
+    
+    addTaskBounds           adds the kinematic state bounds relevant to the 
+                            specified task name to a Moco Problem
+    
+    fixGuessFile            fills a solver generated guess with the data from
+                            an existing solution file
+    
+    interpolateFinite       linearly interpolates data while ignoring any
+                            non-finite values
+    
+    loadTaskBounds          loads the task bound dataframes from the supporting
+                            data directory
+    
+    getMocoParallel         converts a number of threads to the Moco parallel
+                            setting
+
+    getTaskModelSpec        gets the locked coordinates, added mass and
+                            actuators for the models of a task
+    
+    createSimModel          configures and processes a model file for the
+                            movement simulations
+    
+    createTaskTemplate      builds the bounds, goals and solver settings of a
+                            task once for reuse across model variants
+    
+    createTemplateStudy     sets up a Moco study from a task template with a
+                            processed simulation model
+    
+    createMocoStudy         sets up the Moco study and solver for a task with
+                            a processed simulation model
+    
+    runMeshRefinement       solves a task over increasingly fine meshes, using
+                            each solution as the guess for the next mesh
+
+Note that opensim is only imported within the functions that use it, so that
+the functions that don't (e.g. loadTaskBounds and calcEndPointTargets) can be
+used without loading it.
 
 """
 
 # %% Import packages
 
-import opensim as osim
+import hashlib
+import json
 import math
+import os
+import tempfile
+import time
+import numpy as np
 import pandas as pd
+import cacheHelper
+import guessHelper
+import profileHelper
+import stoHelper
+
+# %% Settings
+
+#Marker end point task settings. The end point of each task is at a point the
+#reach distance (as a multiple of forearm length) in front of the shoulder and
+#raised to the reach angle (degrees) above the level of the shoulder (note
+#there is no prescribed distance in the Vidt paper).
+endPointTasks = {'ConcentricUpwardReach105': {'reachDistance': 2.0, 'reachAngle': 15.0}}
+
+#Landmarks already calculated in the current process (see getModelLandmarks)
+modelLandmarks = {}
+
+#Model settings for the simulations. The thorax coordinates are locked to make
+#the tasks shoulder only movements, and torque or reserve actuators are added to
+#the arm coordinates as (optimal force, [max control, min control], name suffix).
+lockedCoordinates = ['thorax_tilt','thorax_list','thorax_rotation',
+                     'thorax_tx','thorax_ty','thorax_tz']
+coordinateActuators = {'elbow_flexion': (75.0,[float('inf'),float('-inf')],'_torque'),
+                       'pro_sup': (30.0,[float('inf'),float('-inf')],'_torque'),
+                       'elv_angle': (1.0,[float('inf'),float('-inf')],'_reserve'),
+                       'shoulder_elv': (1.0,[1.0,-1.0],'_reserve'),
+                       'shoulder_rot': (1.0,[1.0,-1.0],'_reserve')}
+
+#Model operators applied by the model processor, as the name of the opensim
+#operator class and its arguments in the order they are applied. The muscles are
+#converted to the DeGrooteFregly type, tendon compliance and conservative
+#passive fiber forces are ignored, the fiber damping is set low to limit
+#non-conservative passive forces (this may also serve to limit the negative
+#muscle forces that can happen) and the active force width of the muscles is
+#scaled.
+modelOperators = [('ModOpReplaceMusclesWithDeGrooteFregly2016',[]),
+                  ('ModOpIgnoreTendonCompliance',[]),
+                  ('ModOpIgnorePassiveFiberForcesDGF',[]),
+                  ('ModOpFiberDampingDGF',[1e-02]),
+                  ('ModOpScaleActiveFiberForceCurveWidthDGF',[1.5])]
+
+#Default CasADi solver settings, each set with the matching set_ method of the
+#solver in the order listed
+defaultSolverSettings = {'num_mesh_intervals': 50,
+                         'verbosity': 2,
+                         'optim_solver': 'ipopt',
+                         'optim_convergence_tolerance': 1e-4,
+                         'optim_constraint_tolerance': 1e-4}
 
 # %% addCoordinateActuator
 
@@ -45,6 +153,9 @@ def addCoordinateActuator(modelObject = None, coordinate = None, optForce = 1.0,
     if coordinate is None:
         raise ValueError('A coordinate string must be specified')
         
+    #Import opensim
+    import opensim as osim
+    
     #Create actuator
     actu = osim.CoordinateActuator()
     
@@ -64,129 +175,297 @@ def addCoordinateActuator(modelObject = None, coordinate = None, optForce = 1.0,
     #Add actuator to models forceset
     modelObject.updForceSet().append(actu)
 
-# %% addMarkerEndPoints
+# %% getGeometryHash
 
-def addMarkerEndPoints(taskName = None, mocoProblem = None, modelObject = None):
-        
-    # Convenience function for adding a coordinate actuator to model
+def getGeometryHash(modelObject = None):
+    
+    # Creates a hash of the model geometry, from the body, joint (including
+    # coordinate defaults) and marker sets. The force set isn't included, so
+    # the strength variants of a model share the same hash. The sets are
+    # printed out to be hashed, so the hash is kept on the model object and
+    # only calculated once per model (e.g. not again for each study or mesh
+    # set up with the same processed model).
     #
-    # Input:    taskName - string of relevant task name options
-    #           mocoProblem - MocoProblem object to add goals to
-    #           modelObject - Opensim model object to add actuator to
+    # Input:    modelObject - Opensim model object
+    #
+    # Output:   geometryHash - string of SHA-256 hex digest
     
     #Check for appropriate inputs
-    if taskName is None or mocoProblem is None or modelObject is None:
-        raise ValueError('All three input arguments are needed for addMarkerEndPoints function')
+    if modelObject is None:
+        raise ValueError('A model object is needed in getGeometryHash')
     
-    if taskName == 'ConcentricUpwardReach105':
-        
-        #Get the desired end point of the movement. This will be at a point 15
-        #degrees above the shoulder at a distance of 200% of forearm length.
-        #(note there is no prescribed distance in the Vidt paper)
-
-        #Get the position of the shoulder joint centre. Note that the 1 corresponds
-        #to the humphant_offset frame. This command also transforms it to the
-        #ground frame.
-        modelObject_state = modelObject.initSystem()
-        SJC_ground = modelObject.getJointSet().get('shoulder0').get_frames(1).getPositionInGround(modelObject_state)
-
-        #Calculate the distance of the forearm (i.e. between the elbow and wrist
-        #joint centre).
-
-        #Get the position of the joint centres. Joint 1 corresponds to ulna offset
-        #frame for elbow and joint 0 the radius offset for the radius hand joint
-        EJC_ground = modelObject.getJointSet().get('elbow').get_frames(1).getPositionInGround(modelObject_state)
-        WJC_ground = modelObject.getJointSet().get('radius_hand_r').get_frames(0).getPositionInGround(modelObject_state)
+    #Use the hash already calculated for the model
+    if getattr(modelObject, 'geometryHash', None) is not None:
+        return modelObject.geometryHash
+    
+    #Print each of the sets to a temporary directory and hash the contents
+    geometryHash = hashlib.sha256()
+    with tempfile.TemporaryDirectory() as tempPath:
+        for modelSet in [modelObject.getBodySet(), modelObject.getJointSet(), modelObject.getMarkerSet()]:
+            setFileName = os.path.join(tempPath,'set.xml')
+            modelSet.printToXML(setFileName)
+            with open(setFileName,'rb') as setFile:
+                geometryHash.update(setFile.read())
+    geometryHash = geometryHash.hexdigest()
+    
+    #Keep the hash on the model object
+    try:
+        modelObject.geometryHash = geometryHash
+    except AttributeError:
+        pass
+    
+    return geometryHash
 
-        #Calculate the distance between the joint centres
-        elbow = [EJC_ground.get(0),EJC_ground.get(1),EJC_ground.get(2)]
-        wrist = [WJC_ground.get(0),WJC_ground.get(1),WJC_ground.get(2)]
-        FA_length = (((wrist[0]-elbow[0])**2) + ((wrist[1]-elbow[1])**2) + ((wrist[2]-elbow[2])**2))**0.5
+# %% getModelLandmarks
 
-        #Calculate the position 200% forearm length in front of the shoulder. In
-        #front is represented by positive X
-        inFrontPoint = [SJC_ground.get(0)+(FA_length*2),SJC_ground.get(1),SJC_ground.get(2)]
+def getModelLandmarks(modelObject = None, landmarkCachePath = None):
+    
+    # Gets the positions of the joint centres and markers in the default pose
+    # that are used to set the marker end point goals. The landmarks are kept
+    # against the geometry hash of the model, so they are only calculated
+    # (which needs the model system to be initialised) once per geometry in a
+    # process, and once overall if a cache directory is provided.
+    #
+    # Input:    modelObject - Opensim model object
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the landmarks in across runs
+    #
+    # Output:   landmarks - dictionary of landmark name to numpy array of its
+    #                       position in the ground frame
+    
+    #Check for appropriate inputs
+    if modelObject is None:
+        raise ValueError('A model object is needed in getModelLandmarks')
+    
+    #Check for the landmarks in the current process
+    geometryHash = getGeometryHash(modelObject)
+    if geometryHash in modelLandmarks:
+        return modelLandmarks[geometryHash]
+    
+    #Check for the landmarks in the cache directory
+    if landmarkCachePath is not None:
+        cacheFileName = os.path.join(landmarkCachePath,'landmarks_'+geometryHash+'.json')
+        if os.path.isfile(cacheFileName):
+            with open(cacheFileName,'r') as cacheFile:
+                landmarks = {name: np.array(pos) for name, pos in json.load(cacheFile).items()}
+            modelLandmarks[geometryHash] = landmarks
+            return landmarks
+    
+    #Initialise the model to get the default pose
+    with profileHelper.profileSpan('initSystem','model'):
+        modelObject_state = modelObject.initSystem()
+    
+    #Get the position of the joint centres in the ground frame. For the shoulder
+    #the 1 corresponds to the humphant_offset frame, for the elbow the 1
+    #corresponds to the ulna offset frame and for the wrist the 0 corresponds
+    #to the radius offset frame.
+    landmarks = {}
+    landmarks['SJC'] = modelObject.getJointSet().get('shoulder0').get_frames(1).getPositionInGround(modelObject_state)
+    landmarks['EJC'] = modelObject.getJointSet().get('elbow').get_frames(1).getPositionInGround(modelObject_state)
+    landmarks['WJC'] = modelObject.getJointSet().get('radius_hand_r').get_frames(0).getPositionInGround(modelObject_state)
+    
+    #Get the position of the wrist and hand markers
+    for markerName in ['RS','US','wri_out']:
+        landmarks[markerName] = modelObject.getMarkerSet().get(markerName).getLocationInGround(modelObject_state)
+    
+    #Convert to arrays
+    landmarks = {name: np.array([pos.get(0),pos.get(1),pos.get(2)]) for name, pos in landmarks.items()}
+    
+    #Store the landmarks
+    modelLandmarks[geometryHash] = landmarks
+    if landmarkCachePath is not None:
+        if not os.path.isdir(landmarkCachePath):
+            os.makedirs(landmarkCachePath)
+        tempFileName = cacheFileName+'.'+str(os.getpid())+'.tmp'
+        with open(tempFileName,'w') as cacheFile:
+            json.dump({name: pos.tolist() for name, pos in landmarks.items()}, cacheFile)
+        os.replace(tempFileName,cacheFileName)
+    
+    return landmarks
 
-        #Calculate how far above this point is needed to generate a 15 degree angle
-        #above the level of the shoulder joint. Calculate this using a 2D triangle
-        #encompassing the X and Y axis
+# %% calcEndPointTargets
 
-        #Calculate horizontal distance from shoulder to in front point
-        Xdist = (FA_length*2) - SJC_ground.get(0)
-        #Set angle to calculate height with
-        theta = math.radians(15)
-        #Calculate height of triangle
-        Ydist = math.tan(theta) * Xdist
+def calcEndPointTargets(landmarks = None, taskNames = None):
+    
+    # Calculates the marker end point targets for the tasks from the model
+    # landmarks, with all tasks calculated together
+    #
+    # Input:    landmarks - dictionary of landmark positions (see getModelLandmarks)
+    #           taskNames - optional list of task names (default is all tasks
+    #                       in endPointTasks)
+    #
+    # Output:   endPointTargets - dictionary of task name to a dictionary of
+    #                             marker name to numpy array of its end point
+    
+    #Check for appropriate inputs
+    if landmarks is None:
+        raise ValueError('Model landmarks are needed in calcEndPointTargets')
+    
+    #Set the tasks
+    if taskNames is None:
+        taskNames = list(endPointTasks.keys())
+    
+    #Get the task settings as arrays
+    reachDistance = np.array([endPointTasks[taskName]['reachDistance'] for taskName in taskNames])
+    reachAngle = np.radians([endPointTasks[taskName]['reachAngle'] for taskName in taskNames])
+    
+    #Calculate the distance of the forearm (i.e. between the elbow and wrist
+    #joint centre).
+    FA_length = np.linalg.norm(landmarks['WJC'] - landmarks['EJC'])
+    
+    #Calculate the position in front of the shoulder. In front is represented 
+    #by positive X
+    inFrontPoint = np.tile(landmarks['SJC'], (len(taskNames),1))
+    inFrontPoint[:,0] += FA_length * reachDistance
+    
+    #Calculate how far above this point is needed to generate the reach angle
+    #above the level of the shoulder joint. Calculate this using a 2D triangle
+    #encompassing the X and Y axis
+    Xdist = (FA_length * reachDistance) - landmarks['SJC'][0]
+    Ydist = np.tan(reachAngle) * Xdist
+    
+    #Prescribe upward reach point
+    upwardReachPoint = inFrontPoint.copy()
+    upwardReachPoint[:,1] += Ydist
+    
+    #Identify the distance between the two wrist markers, and the distance from
+    #the wrist joint centre to the wri_out marker
+    wristWidth = np.linalg.norm(landmarks['RS'] - landmarks['US'])
+    wristHeight = np.linalg.norm(landmarks['wri_out'] - landmarks['WJC'])
+    
+    #Add and subtract half of the wrist distance from the reach point along the
+    #Z-axis to get the end points for the wrist markers. It is positive Z in the
+    #ground frame for the ulna marker and negative Z for the radius marker. Add
+    #the wrist height along the Y-axis to get the end point for the wri_out marker.
+    US_endLoc = upwardReachPoint + np.array([0, 0, wristWidth/2])
+    RS_endLoc = upwardReachPoint - np.array([0, 0, wristWidth/2])
+    W_endLoc = upwardReachPoint + np.array([0, wristHeight, 0])
+    
+    #Collect the targets for each task
+    endPointTargets = {}
+    for ii, taskName in enumerate(taskNames):
+        endPointTargets[taskName] = {'RS': RS_endLoc[ii], 'US': US_endLoc[ii], 'wri_out': W_endLoc[ii]}
+    
+    return endPointTargets
 
-        #Prescribe upward reach point
-        upwardReachPoint = [inFrontPoint[0],inFrontPoint[1]+Ydist,inFrontPoint[2]]
+# %% getMarkerEndPointGoals
 
+def getMarkerEndPointGoals(taskName = None, modelObject = None, landmarkCachePath = None):
+    
+    # Convenience function for getting the marker end point goals relevant to
+    # the specified task name. The goals are returned as specifications so
+    # they can be reused across problems (see addGoals).
+    #
+    # Input:    taskName - string of relevant task name options
+    #           modelObject - Opensim model object to get the end points from
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the model landmarks in across runs
+    #
+    # Output:   goalSpecs - list of goal specification dictionaries
+    
+    #Check for appropriate inputs
+    if taskName is None or modelObject is None:
+        raise ValueError('A task name and model are needed for getMarkerEndPointGoals function')
+    
+    goalSpecs = []
+    
+    if taskName in endPointTasks:
+        
+        #Get the end point targets from the model landmarks. The landmarks
+        #don't change with muscle strength, so are reused across variants.
+        endPointTargets = calcEndPointTargets(getModelLandmarks(modelObject,landmarkCachePath))[taskName]
+        
         #Create a marker end point cost for the reach position. Need to use the
         #markers on both sides of the wrist and the top of the hand to ensure that
         #the hand is placed level and palmar side down at the end - as such, need
         #to create markers end points for each of these.
-
-        #Identify the distance between the two wrist markers
-        RS = modelObject.getMarkerSet().get('RS').getLocationInGround(modelObject_state)
-        US = modelObject.getMarkerSet().get('US').getLocationInGround(modelObject_state)
-        RS = [RS.get(0),RS.get(1),RS.get(2)]
-        US = [US.get(0),US.get(1),US.get(2)]
-        wristWidth = (((RS[0]-US[0])**2) + ((RS[1]-US[1])**2) + ((RS[2]-US[2])**2))**0.5
-
-        #Add and subtract half of the wrist distance from the original marker end
-        #point along the Z-axis to get the proposed end points for the markers. It
-        #is positive Z in the ground frame for the ulna marker and negative Z for
-        #the radius marker
-        US_endLoc = osim.Vec3(upwardReachPoint[0],upwardReachPoint[1],upwardReachPoint[2]+(wristWidth/2))
-        RS_endLoc = osim.Vec3(upwardReachPoint[0],upwardReachPoint[1],upwardReachPoint[2]-(wristWidth/2))
-
-        #Measure the distance from the wrist joint centre to the wri_out marker for
-        #prescribing where the hand needs to go.
-        wri_out = modelObject.getMarkerSet().get('wri_out').getLocationInGround(modelObject_state)
-        wri_out = [wri_out.get(0),wri_out.get(1),wri_out.get(2)]
-        wrist = [WJC_ground.get(0),WJC_ground.get(1),WJC_ground.get(2)]
-        wristHeight = (((wri_out[0]-wrist[0])**2) + ((wri_out[1]-wrist[1])**2) + ((wri_out[2]-wrist[2])**2))**0.5
-
-        #Add the wirst height amount along the y-axis from the proposed reach point
-        #to get the point where the wri_out marker needs to go
-        W_endLoc = osim.Vec3(upwardReachPoint[0],upwardReachPoint[1]+wristHeight,upwardReachPoint[2])
-
+        
         #Add the end point costs equally weighted to contribute 50# to the problem
-        endPointCost1 = osim.MocoMarkerFinalGoal('RS_endPoint',5)
-        endPointCost1.setPointName('/markerset/RS')
-        endPointCost1.setReferenceLocation(RS_endLoc)
-        endPointCost2 = osim.MocoMarkerFinalGoal('US_endPoint',5)
-        endPointCost2.setPointName('/markerset/US')
-        endPointCost2.setReferenceLocation(US_endLoc)
-        endPointCost3 = osim.MocoMarkerFinalGoal('W_endPoint',5)
-        endPointCost3.setPointName('/markerset/wri_out')
-        endPointCost3.setReferenceLocation(W_endLoc)
-
-        #Add the end point cost along with an effort cost.
-        mocoProblem.addGoal(endPointCost1)
-        mocoProblem.addGoal(endPointCost2)
-        mocoProblem.addGoal(endPointCost3)
+        for goalName, markerName in [('RS_endPoint','RS'),
+                                     ('US_endPoint','US'),
+                                     ('W_endPoint','wri_out')]:
+            goalSpecs.append({'type': 'MocoMarkerFinalGoal',
+                              'name': goalName, 'weight': 5,
+                              'pointName': '/markerset/'+markerName,
+                              'referenceLocation': [float(x) for x in endPointTargets[markerName]]})
         
     # elif taskName is 'OtherTasks...'
+    
+    return goalSpecs
+
+# %% addGoals
+
+def addGoals(mocoProblem = None, goalSpecs = None):
+    
+    # Convenience function for adding goals to a problem from their
+    # specifications. Each specification is a dictionary with the goal type
+    # (the name of the opensim goal class), name and weight, and optionally
+    # the point name and reference location for marker goals.
+    #
+    # Input:    mocoProblem - MocoProblem object to add goals to
+    #           goalSpecs - list of goal specification dictionaries
+    
+    #Check for appropriate inputs
+    if mocoProblem is None or goalSpecs is None:
+        raise ValueError('A problem and goal specifications are needed for addGoals function')
+    
+    #Import opensim
+    import opensim as osim
+    
+    #Create and add each goal
+    for goalSpec in goalSpecs:
+        goal = getattr(osim,goalSpec['type'])(goalSpec['name'],goalSpec['weight'])
+        if 'pointName' in goalSpec:
+            goal.setPointName(goalSpec['pointName'])
+        if 'referenceLocation' in goalSpec:
+            goal.setReferenceLocation(osim.Vec3(*goalSpec['referenceLocation']))
+        mocoProblem.addGoal(goal)
+
+# %% addMarkerEndPoints
+
+def addMarkerEndPoints(taskName = None, mocoProblem = None, modelObject = None,
+                       landmarkCachePath = None):
         
-# %% addTaskBounds
+    # Convenience function for adding marker end point goals to a problem
+    #
+    # Input:    taskName - string of relevant task name options
+    #           mocoProblem - MocoProblem object to add goals to
+    #           modelObject - Opensim model object to get the end points from
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the model landmarks in across runs
+    
+    #Check for appropriate inputs
+    if taskName is None or mocoProblem is None or modelObject is None:
+        raise ValueError('All three input arguments are needed for addMarkerEndPoints function')
+    
+    #Add the end point goals for the task
+    addGoals(mocoProblem,getMarkerEndPointGoals(taskName,modelObject,landmarkCachePath))
+        
+# %% getTaskStateBounds
 
-def addTaskBounds(taskName = None, mocoProblem = None, modelObject = None, 
-                  taskBoundsElv = None, taskBoundsRot = None, taskBoundsAng = None):
+def getTaskStateBounds(taskName = None, modelObject = None, taskBoundsElv = None,
+                       taskBoundsRot = None, taskBoundsAng = None):
         
-    # Convenience function for adding a coordinate actuator to model
+    # Convenience function for getting the kinematic state bounds relevant to
+    # the specified task name. The bounds are returned as lists of
+    # (name, bounds, initial bounds, final bounds) so they can be reused
+    # across problems (see applyStateBounds).
     #
     # Input:    taskName - string of relevant task name options
-    #           mocoProblem - MocoProblem object to add bounds to
-    #           modelObject - Opensim model object to add actuator to
+    #           modelObject - Opensim model object to get the coordinates from
     #           taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
     #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
     #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    #
+    # Output:   stateBounds - dictionary of the bounds for individual states
+    #                         ('states') and for state name patterns ('patterns')
     
     #Check for appropriate inputs
-    if taskName is None or mocoProblem is None or modelObject is None \
+    if taskName is None or modelObject is None \
         or taskBoundsElv is None or taskBoundsRot is None or taskBoundsAng is None:
-        raise ValueError('All six input arguments are needed for addTaskBounds function')
+        raise ValueError('All five input arguments are needed for getTaskStateBounds function')
+    
+    stateBounds = {'states': [], 'patterns': []}
         
     #Set the relevant task bounds
     
@@ -194,45 +473,22 @@ def addTaskBounds(taskName = None, mocoProblem = None, modelObject = None,
         
         #Set task name from dataframe
         dfTaskName = 'UpwardReach105'
-            
-        #Shoulder elevation
-                
-        #Set state name
-        stateName = '/jointset/'+modelObject.getCoordinateSet().get('shoulder_elv').getJoint().getName()+'/'+modelObject.getCoordinateSet().get('shoulder_elv').getName()+'/value'
-        #Set overall task bounds
-        taskBounds = [math.radians(taskBoundsElv.loc[[dfTaskName],'Min'][0]),
-                      math.radians(taskBoundsElv.loc[[dfTaskName],'Max'][0])]
-        #Set bounds for end point
-        endBounds = [math.radians(taskBoundsElv.loc[[dfTaskName],'ConcentricLowerBound'][0]),
-                     math.radians(taskBoundsElv.loc[[dfTaskName],'ConcentricUpperBound'][0])]
-        #Set bounds in problem        
-        mocoProblem.setStateInfo(stateName,taskBounds,math.radians(0),endBounds)
         
-        #Shoulder rotation
+        #Shoulder elevation, shoulder rotation and elevation angle
+        for coordName, taskBoundsCoord in [('shoulder_elv',taskBoundsElv),
+                                           ('shoulder_rot',taskBoundsRot),
+                                           ('elv_angle',taskBoundsAng)]:
                 
-        #Set state name
-        stateName = '/jointset/'+modelObject.getCoordinateSet().get('shoulder_rot').getJoint().getName()+'/'+modelObject.getCoordinateSet().get('shoulder_rot').getName()+'/value'
-        #Set overall task bounds
-        taskBounds = [math.radians(taskBoundsRot.loc[[dfTaskName],'Min'][0]),
-                      math.radians(taskBoundsRot.loc[[dfTaskName],'Max'][0])]
-        #Set bounds for end point
-        endBounds = [math.radians(taskBoundsRot.loc[[dfTaskName],'ConcentricLowerBound'][0]),
-                     math.radians(taskBoundsRot.loc[[dfTaskName],'ConcentricUpperBound'][0])]
-        #Set bounds in problem        
-        mocoProblem.setStateInfo(stateName,taskBounds,math.radians(0),endBounds)
-        
-        #Elevation angle
-                
-        #Set state name
-        stateName = '/jointset/'+modelObject.getCoordinateSet().get('elv_angle').getJoint().getName()+'/'+modelObject.getCoordinateSet().get('elv_angle').getName()+'/value'
-        #Set overall task bounds
-        taskBounds = [math.radians(taskBoundsAng.loc[[dfTaskName],'Min'][0]),
-                      math.radians(taskBoundsAng.loc[[dfTaskName],'Max'][0])]
-        #Set bounds for end point
-        endBounds = [math.radians(taskBoundsAng.loc[[dfTaskName],'ConcentricLowerBound'][0]),
-                     math.radians(taskBoundsAng.loc[[dfTaskName],'ConcentricUpperBound'][0])]
-        #Set bounds in problem        
-        mocoProblem.setStateInfo(stateName,taskBounds,math.radians(0),endBounds)
+            #Set state name
+            stateName = '/jointset/'+modelObject.getCoordinateSet().get(coordName).getJoint().getName()+'/'+modelObject.getCoordinateSet().get(coordName).getName()+'/value'
+            #Set overall task bounds
+            taskBounds = [math.radians(taskBoundsCoord.loc[[dfTaskName],'Min'][0]),
+                          math.radians(taskBoundsCoord.loc[[dfTaskName],'Max'][0])]
+            #Set bounds for end point
+            endBounds = [math.radians(taskBoundsCoord.loc[[dfTaskName],'ConcentricLowerBound'][0]),
+                         math.radians(taskBoundsCoord.loc[[dfTaskName],'ConcentricUpperBound'][0])]
+            #Set bounds for problem
+            stateBounds['states'].append((stateName,taskBounds,math.radians(0),endBounds))
         
         #Elbow flexion
         
@@ -249,8 +505,8 @@ def addTaskBounds(taskName = None, mocoProblem = None, modelObject = None,
             mx = modelObject.getCoordinateSet().get('elbow_flexion').getRangeMax()
         #Set overall task bounds
         taskBounds = [mn,mx]
-        #Set bounds in problem        
-        mocoProblem.setStateInfo(stateName,taskBounds,math.radians(0),[])
+        #Set bounds for problem
+        stateBounds['states'].append((stateName,taskBounds,math.radians(0),[]))
         
         #Forearm
         
@@ -268,78 +524,650 @@ def addTaskBounds(taskName = None, mocoProblem = None, modelObject = None,
         mx = modelObject.getCoordinateSet().get('elbow_flexion').getRangeMax()
         #Set overall task bounds
         taskBounds = [mn,mx]
-        #Set bounds in problem        
-        mocoProblem.setStateInfo(stateName,taskBounds,math.radians(0),[])
+        #Set bounds for problem
+        stateBounds['states'].append((stateName,taskBounds,math.radians(0),[]))
             
     # elif taskName is 'OtherTasks...'
     
     #Set velocity bounds for all model coordinates to start and end at rest
-    mocoProblem.setStateInfoPattern('/jointset/.*/speed',[-50.0,50.0],0.0,0.0)
+    stateBounds['patterns'].append(('/jointset/.*/speed',[-50.0,50.0],0.0,0.0))
     
     #Set muscle activation bounds for activation to start at min value
-    mocoProblem.setStateInfoPattern('/forceset/.*/activation',[0.01,1.0],0.01,[])
+    stateBounds['patterns'].append(('/forceset/.*/activation',[0.01,1.0],0.01,[]))
+    
+    return stateBounds
+
+# %% applyStateBounds
+
+def applyStateBounds(mocoProblem = None, stateBounds = None):
+    
+    # Convenience function for setting state bounds in a problem
+    #
+    # Input:    mocoProblem - MocoProblem object to add bounds to
+    #           stateBounds - dictionary of state and pattern bounds (see
+    #                         getTaskStateBounds)
+    
+    #Check for appropriate inputs
+    if mocoProblem is None or stateBounds is None:
+        raise ValueError('A problem and state bounds are needed for applyStateBounds function')
+    
+    #Set the bounds in the problem
+    for stateName, bounds, initialBounds, finalBounds in stateBounds['states']:
+        mocoProblem.setStateInfo(stateName,bounds,initialBounds,finalBounds)
+    for statePattern, bounds, initialBounds, finalBounds in stateBounds['patterns']:
+        mocoProblem.setStateInfoPattern(statePattern,bounds,initialBounds,finalBounds)
+
+# %% addTaskBounds
+
+def addTaskBounds(taskName = None, mocoProblem = None, modelObject = None, 
+                  taskBoundsElv = None, taskBoundsRot = None, taskBoundsAng = None):
+        
+    # Convenience function for adding the kinematic task bounds to a problem
+    #
+    # Input:    taskName - string of relevant task name options
+    #           mocoProblem - MocoProblem object to add bounds to
+    #           modelObject - Opensim model object to get the coordinates from
+    #           taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
+    #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
+    #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    
+    #Check for appropriate inputs
+    if taskName is None or mocoProblem is None or modelObject is None \
+        or taskBoundsElv is None or taskBoundsRot is None or taskBoundsAng is None:
+        raise ValueError('All six input arguments are needed for addTaskBounds function')
+    
+    #Set the bounds for the task
+    applyStateBounds(mocoProblem,getTaskStateBounds(taskName,modelObject,taskBoundsElv,
+                                                    taskBoundsRot,taskBoundsAng))
 
 # %% fixGuessFile
 
-def fixGuessFile(guessFile = None, mocoSolver = None):
+@profileHelper.profileFunction
+def fixGuessFile(guessFile = None, mocoSolver = None, renameRules = None):
         
     # Convenience function for fixing a guess file that contains NaN's in it 
     # Some solution files seem to generate nan's in the last row
     # of the slack variables which generates a Casadi error when
-    # attempting to use as a guess. To resolve this, a random
-    # guess can be created (which seems to set the slacks to
-    # zero), and be filled with the relevant data states,
-    # controls, multipliers) from the existing solution.
+    # attempting to use as a guess. To resolve this, a guess is created
+    # on the solvers mesh with the relevant data (states, controls and
+    # multipliers) mapped and interpolated from the existing solution (see
+    # guessHelper.createGuessTrajectory).
     #
     # Input:    guessFile - string to path of guess file
-    # 
-    # Note: this function will only work if the guess file matches the inputs
-    # to the solver exactly. If they don't match things won't work well...
-    
-    ##### TODO: this currently works for baseline sims, but may need some options if re-using in other processes...
+    #           mocoSolver - Moco solver to set the guess in
+    #           renameRules - optional list of (pattern, replacement) pairs for
+    #                         mapping the guess file columns to the problem
+    #                         variables (default uses guessHelper.defaultRenameRules)
+    #
+    # Output:   report - dictionary of the mapped, defaulted, unused and 
+    #                    scrubbed variables (see guessHelper.assembleGuess)
     
     #Check for appropriate inputs
     if guessFile is None or mocoSolver is None:
         raise ValueError('A guess file and linked Moco Solver are needed in fixGuessFile')
-        
-    #Grab the file as a Moco tracjectory
-    mocoTraj = osim.MocoTrajectory(guessFile)
-
-    #Create random guess using the current solver
-    randTraj = mocoSolver.createGuess()
-    
-    #Resample the randomly created guess if it doesn't match the guess file
-    if randTraj.getNumTimes() != mocoTraj.getNumTimes():
-        randTraj.resampleWithNumTimes(mocoTraj.getNumTimes())
-    
-    #Set time for random guess to original trajectory
-    randTraj.setTime(mocoTraj.getTime())
-
-    #Refresh states in random guess from the moco trajectory
-    randTraj.setStatesTrajectory(mocoTraj.exportToStatesTable())
-
-    #Refresh controls from moco trajectory
-    controlNames = list(mocoTraj.getControlNames())
-    #Reserve and torque actuators in this study are in the forceset, but were
-    #components in the existing solution. Therefore, the control name has the 
-    #forceset string in the current guess. This needs to be accounted for in
-    #creating the new guess
-    #Loop through and set the controls in the guess
-    for cc in range(0,len(controlNames)-1):
-        if '/forceset' not in controlNames[cc]:
-            randTraj.setControl('/forceset'+controlNames[cc],mocoTraj.getControlMat(controlNames[cc]))
-        else:
-            randTraj.setControl(controlNames[cc],mocoTraj.getControlMat(controlNames[cc]))
-
-    #Refresh multipliers from moco trajectory
-    multiplierNames = list(mocoTraj.getMultiplierNames())
-    for cc in range(0,len(multiplierNames)-1):
-        randTraj.setMultiplier(multiplierNames[cc],mocoTraj.getMultiplierMat(multiplierNames[cc]))
+    
+    #Create the guess on the solvers mesh
+    guessTraj, report = guessHelper.createGuessTrajectory(guessFile,mocoSolver,renameRules)
+    
+    #Print any variables that weren't in the guess file, other than the slack
+    #variables and multipliers that are expected to be left at their defaults
+    missingLabels = guessHelper.getMissingLabels(report['defaulted'])
+    if len(missingLabels) > 0:
+        print(str(len(missingLabels))+' variables left at default values in guess: '+
+              ', '.join(missingLabels))
         
     #Set the guess in the input solver
-    mocoSolver.setGuess(randTraj)
+    mocoSolver.setGuess(guessTraj)
+    
+    return report
+    
+# %% interpolateFinite
+
+def interpolateFinite(sourceTime = None, sourceData = None, newTime = None):
+    
+    # Convenience function for linearly interpolating data onto new time points
+    # while leaving out any NaN or infinite values in the source data
+    #
+    # Input:    sourceTime - array of source time points
+    #           sourceData - array of source data values
+    #           newTime - array of time points to interpolate to
+    #
+    # Output:   newData - array of interpolated data values
+    
+    #Check for appropriate inputs
+    if sourceTime is None or sourceData is None or newTime is None:
+        raise ValueError('All three input arguments are needed in interpolateFinite')
+    
+    #Flatten the inputs
+    sourceTime = np.asarray(sourceTime, dtype = float).flatten()
+    sourceData = np.asarray(sourceData, dtype = float).flatten()
+    
+    #Identify the finite values
+    isFinite = np.isfinite(sourceData)
+    
+    #Return zeros if there are no finite values to interpolate
+    if not isFinite.any():
+        return np.zeros(len(newTime))
+    
+    return np.interp(newTime,sourceTime[isFinite],sourceData[isFinite])
+    
+# %% loadTaskBounds
+
+def loadTaskBounds(dataPath = None):
+    
+    # Convenience function for loading the task bound dataframes from the
+    # supporting data directory
+    #
+    # Input:    dataPath - string of path to supporting data directory
+    #
+    # Output:   taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
+    #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
+    #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    
+    #Check for appropriate inputs
+    if dataPath is None:
+        raise ValueError('A path to the supporting data directory is needed in loadTaskBounds')
+    
+    #Load in dataframes
+    taskBoundsElv = pd.read_csv(os.path.join(dataPath,'shoulder_elv_bounds.csv'), index_col = 'Task')
+    taskBoundsRot = pd.read_csv(os.path.join(dataPath,'shoulder_rot_bounds.csv'), index_col = 'Task')
+    taskBoundsAng = pd.read_csv(os.path.join(dataPath,'elv_angle_bounds.csv'), index_col = 'Task')
+    
+    return taskBoundsElv, taskBoundsRot, taskBoundsAng
+
+# %% getMocoParallel
+
+def getMocoParallel(nThreads = 1):
+    
+    # Converts a number of threads to the value of the Moco parallel setting
+    # (the parallel solver setting and the OPENSIM_MOCO_PARALLEL environment
+    # variable). Moco takes 0 as serial, 1 as all of the hardware threads and
+    # larger values as that number of threads, so a single thread is set as 0.
+    #
+    # Input:    nThreads - number of threads for the CasADi parallel evaluations
+    #
+    # Output:   mocoParallel - integer value of the Moco parallel setting
+    
+    return 0 if nThreads <= 1 else int(nThreads)
+
+# %% getTaskModelSpec
+
+def getTaskModelSpec(taskName = None):
+    
+    # Convenience function for getting the changes made to the models for a
+    # task, which are the same for all of the model variants
+    #
+    # Input:    taskName - string of relevant task name options
+    #
+    # Output:   modelSpec - dictionary of the coordinates to lock, mass (kg) to
+    #                       add to bodies, actuators to add to coordinates and
+    #                       the model operators to process the model with
+    
+    #Check for appropriate inputs
+    if taskName is None:
+        raise ValueError('A task name is needed in getTaskModelSpec')
+    
+    modelSpec = {'lockedCoordinates': list(lockedCoordinates),
+                 'addedMass': {},
+                 'actuators': dict(coordinateActuators),
+                 'operators': list(modelOperators)}
+    
+    #Add a 1kg mass to the hand for the reaching tasks
+    if 'Reach' in taskName:
+        modelSpec['addedMass']['hand_r'] = 1.0
+    
+    return modelSpec
+
+# %% createSimModel
+
+@profileHelper.profileFunction
+def createSimModel(modelFileName = None, taskName = None, modelSpec = None,
+                   modelCachePath = None):
+    
+    # Convenience function for configuring a model for the movement simulations.
+    # The thorax is locked, hand mass added for reaching tasks, torque and
+    # reserve actuators are added and the muscles are converted to the
+    # DeGrooteFregly type through a model processor. If a model cache is used,
+    # the processed model is loaded from the cache when the same source model
+    # and model changes have already been processed.
+    #
+    # Input:    modelFileName - string of path to .osim model file, or an
+    #                           Opensim model object already in memory (e.g.
+    #                           from modelHelper.createVariantModel), which is
+    #                           copied rather than edited
+    #           taskName - string of relevant task name options
+    #           modelSpec - optional dictionary of the model changes (default
+    #                       uses getTaskModelSpec for the task)
+    #           modelCachePath - optional string of path to a directory to
+    #                            store the processed models in across runs
+    #
+    # Output:   simModel - processed Opensim model object
+    
+    #Check for appropriate inputs
+    if modelFileName is None or taskName is None:
+        raise ValueError('A model file and task name are needed in createSimModel')
+    
+    #Import opensim
+    import opensim as osim
+    
+    #Get the model changes for the task
+    if modelSpec is None:
+        modelSpec = getTaskModelSpec(taskName)
+    
+    #Load the processed model from the cache if it is there
+    if modelCachePath is not None:
+        with profileHelper.profileSpan('getCachedModel','cache'):
+            modelHash = cacheHelper.getModelHash(modelFileName,modelSpec)
+            simModel = cacheHelper.getCachedModel(modelCachePath,modelHash)
+        if simModel is not None:
+            return simModel
+    
+    #Load the model, or copy the model object
+    with profileHelper.profileSpan('loadModel','model'):
+        osimModel = osim.Model(modelFileName)
+    
+    #Lock the thorax joints of the model to make this a shoulder only movement
+    for coordName in modelSpec['lockedCoordinates']:
+        osimModel.updCoordinateSet().get(coordName).set_locked(True)
+    
+    #Add mass to the bodies (e.g. 1kg to the hand for the reaching tasks)
+    for bodyName in modelSpec['addedMass']:
+        newMass = osimModel.getBodySet().get(bodyName).getMass() + modelSpec['addedMass'][bodyName]
+        osimModel.getBodySet().get(bodyName).setMass(newMass)
+    
+    #Add relevant torque actuators to each degree of freedom
+    #Loop through and add coordinate actuators in the coordinate set order
+    #Don't add anything for the thorax
+    for cc in range(0,osimModel.updCoordinateSet().getSize()):    
+        #Get current coordinate name
+        coordName = osimModel.updCoordinateSet().get(cc).getName()
+        #Add an idealised torque or reserve actuator
+        if coordName in modelSpec['actuators']:
+            optForce, controlLevel, appendStr = modelSpec['actuators'][coordName]
+            addCoordinateActuator(osimModel,coordName,optForce,controlLevel,appendStr)
+    
+    #Finalise model
+    osimModel.finalizeFromProperties()
+    
+    #The model processor doesn't work when called directly from the model object
+    #(says the model has no subcomponents), so the model is printed out and
+    #passed to the processor via its filename. A unique temporary file is used
+    #so that parallel processes don't overwrite each others model.
+    tempFileHandle, tempFileName = tempfile.mkstemp(suffix = '.osim')
+    os.close(tempFileHandle)
+    with profileHelper.profileSpan('printModel','io'):
+        osimModel.printToXML(tempFileName)
+    
+    #Set up a model processor to configure model
+    modelProcessor = osim.ModelProcessor(tempFileName)
+    
+    #Append the model operators (see modelOperators), which convert the muscles
+    #to the DeGrooteFregly type and set the muscle model settings
+    for operatorName, operatorArgs in modelSpec['operators']:
+        modelProcessor.append(getattr(osim,operatorName)(*operatorArgs))
+    
+    #Process and get a variable to call the model
+    with profileHelper.profileSpan('processModel','model'):
+        simModel = modelProcessor.process()
+    
+    #Clean up the printed out model file
+    os.remove(tempFileName)
+    
+    #Add the processed model to the cache
+    if modelCachePath is not None:
+        with profileHelper.profileSpan('addCachedModel','cache'):
+            cacheHelper.addCachedModel(modelCachePath,modelHash,simModel)
+    
+    return simModel
+
+# %% createTaskTemplate
+
+@profileHelper.profileFunction
+def createTaskTemplate(taskName = None, simModel = None, timeReferenceFile = None,
+                       taskBoundsElv = None, taskBoundsRot = None, taskBoundsAng = None,
+                       meshInterval = 50, nThreads = None, landmarkCachePath = None,
+                       solverSettings = None):
+    
+    # Convenience function for building the parts of a task problem that don't
+    # depend on muscle strength once, so that studies for each of the model
+    # variants can be set up by only swapping in the processed model (see
+    # createTemplateStudy). The template only holds plain python values, so it
+    # can be passed between processes or stored.
+    #
+    # Input:    taskName - string of relevant task name options
+    #           simModel - processed Opensim model object to get the coordinates
+    #                      and landmarks from (see createSimModel)
+    #           timeReferenceFile - string of path to the file used to set the
+    #                               time bounds (e.g. the guess file)
+    #           taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
+    #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
+    #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    #           meshInterval - number of mesh intervals for the solver
+    #           nThreads - optional number of threads for CasADi to use in 
+    #                      parallel evaluations (default uses CasADi settings)
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the model landmarks in across runs
+    #           solverSettings - optional dictionary of solver settings that
+    #                            replace the defaults (see defaultSolverSettings)
+    #
+    # Output:   taskTemplate - dictionary of the task name, model geometry hash,
+    #                          model changes, time bounds, state bounds, goals
+    #                          and solver settings
+    
+    #Check for appropriate inputs
+    if taskName is None or simModel is None or timeReferenceFile is None \
+        or taskBoundsElv is None or taskBoundsRot is None or taskBoundsAng is None:
+        raise ValueError('Task name, model, time reference file and task bounds are needed in createTaskTemplate')
+    
+    #Set time bounds to a percentage of the final reference time
+    finalTime = stoHelper.getLastTime(timeReferenceFile)
+    
+    #Set the goals as the marker end points, a control cost and a final time goal
+    goalSpecs = getMarkerEndPointGoals(taskName,simModel,landmarkCachePath)
+    goalSpecs.append({'type': 'MocoControlGoal', 'name': 'effort', 'weight': 1})
+    goalSpecs.append({'type': 'MocoFinalTimeGoal', 'name': 'time', 'weight': 1})
+    
+    #Set the solver settings, limiting the CasADi parallel evaluations if requested
+    templateSettings = dict(defaultSolverSettings)
+    templateSettings['num_mesh_intervals'] = meshInterval
+    if nThreads is not None:
+        templateSettings['parallel'] = getMocoParallel(nThreads)
+    if solverSettings is not None:
+        templateSettings.update(solverSettings)
+    
+    #Create the template
+    taskTemplate = {'taskName': taskName,
+                    'geometryHash': getGeometryHash(simModel),
+                    'modelSpec': getTaskModelSpec(taskName),
+                    'timeBounds': [0.9*finalTime,1.1*finalTime],
+                    'stateBounds': getTaskStateBounds(taskName,simModel,taskBoundsElv,
+                                                      taskBoundsRot,taskBoundsAng),
+                    'goals': goalSpecs,
+                    'solverSettings': templateSettings}
+    
+    return taskTemplate
+
+# %% createTemplateStudy
+
+@profileHelper.profileFunction
+def createTemplateStudy(taskTemplate = None, simModel = None, guessFile = None,
+                        studyName = None, solverSettings = None):
+    
+    # Convenience function for setting up a ready to solve Moco study from a
+    # task template with a processed simulation model. The model needs the
+    # same geometry as the model the template was created from, which is the
+    # case for all of the strength variants.
+    #
+    # Input:    taskTemplate - dictionary of task settings (see createTaskTemplate)
+    #           simModel - processed Opensim model object (see createSimModel)
+    #           guessFile - string of path to guess file
+    #           studyName - optional string to name the study
+    #           solverSettings - optional dictionary of solver settings that
+    #                            replace those in the template (e.g. a different
+    #                            number of mesh intervals)
+    #
+    # Output:   study - MocoStudy object ready to solve
+    
+    #Check for appropriate inputs
+    if taskTemplate is None or simModel is None or guessFile is None:
+        raise ValueError('A task template, model and guess file are needed in createTemplateStudy')
+    
+    #Check the model matches the template
+    if getGeometryHash(simModel) != taskTemplate['geometryHash']:
+        raise ValueError('Model geometry does not match the task template in createTemplateStudy')
+    
+    #Import opensim
+    import opensim as osim
+    
+    #Create the Moco study
+    study = osim.MocoStudy()
+    
+    #Set study name
+    if studyName is not None:
+        study.setName(studyName)
+    
+    #Initialise the problem
+    problem = study.updProblem()
+    
+    #Set the model in the problem
+    problem.setModel(simModel)
+    
+    #Set time bounds on the problem
+    problem.setTimeBounds(osim.MocoInitialBounds(0.0),
+                          osim.MocoFinalBounds(*taskTemplate['timeBounds']))
+    
+    #Add the goals
+    addGoals(problem,taskTemplate['goals'])
+    
+    #Set the kinematic task bounds
+    applyStateBounds(problem,taskTemplate['stateBounds'])
+    
+    #Configure the solver
+    solver = study.initCasADiSolver()
+    settings = dict(taskTemplate['solverSettings'])
+    if solverSettings is not None:
+        settings.update(solverSettings)
+    for settingName in settings:
+        getattr(solver,'set_'+settingName)(settings[settingName])
+    
+    #Set the guess in the solver
+    fixGuessFile(guessFile,solver)
+    
+    return study
+
+# %% createMocoStudy
+
+def createMocoStudy(taskName = None, simModel = None, guessFile = None,
+                    meshInterval = 50, taskBoundsElv = None, taskBoundsRot = None,
+                    taskBoundsAng = None, studyName = None, nThreads = None,
+                    timeReferenceFile = None, landmarkCachePath = None,
+                    solverSettings = None):
+    
+    # Convenience function for setting up the Moco study for a movement task
+    # with the processed simulation model. Time bounds are set relative to the
+    # final time of the guess file, the task goals and bounds are added and the
+    # CasADi solver is configured with the guess. When setting up studies for
+    # many models, create the task template once and use createTemplateStudy.
+    #
+    # Input:    taskName - string of relevant task name options
+    #           simModel - processed Opensim model object (see createSimModel)
+    #           guessFile - string of path to guess file
+    #           meshInterval - number of mesh intervals for the solver
+    #           taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
+    #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
+    #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    #           studyName - optional string to name the study
+    #           nThreads - optional number of threads for CasADi to use in 
+    #                      parallel evaluations (default uses CasADi settings)
+    #           timeReferenceFile - optional string of path to the file used to
+    #                               set the time bounds (default is the guess file)
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the model landmarks in across runs
+    #           solverSettings - optional dictionary of solver settings that
+    #                            replace the defaults (see defaultSolverSettings)
+    #
+    # Output:   study - MocoStudy object ready to solve
     
+    #Check for appropriate inputs
+    if taskName is None or simModel is None or guessFile is None \
+        or taskBoundsElv is None or taskBoundsRot is None or taskBoundsAng is None:
+        raise ValueError('Task name, model, guess file and task bounds are needed in createMocoStudy')
     
+    #Keep the time bounds relative to the guess file by default. A separate
+    #reference file can be used so that the bounds don't drift when solutions
+    #are chained together as guesses.
+    if timeReferenceFile is None:
+        timeReferenceFile = guessFile
+    
+    #Build the task template for the model and set up the study from it
+    taskTemplate = createTaskTemplate(taskName,simModel,timeReferenceFile,
+                                      taskBoundsElv,taskBoundsRot,taskBoundsAng,
+                                      meshInterval,nThreads,landmarkCachePath,
+                                      solverSettings)
+    
+    return createTemplateStudy(taskTemplate,simModel,guessFile,studyName)
+
+# %% runMeshRefinement
+
+def runMeshRefinement(taskName = None, simModel = None, guessFile = None,
+                      meshIntervals = [25,50,100], taskBoundsElv = None,
+                      taskBoundsRot = None, taskBoundsAng = None, outputPath = None,
+                      studyName = None, objectiveTolerance = 1e-2,
+                      stateTolerance = math.radians(1), nThreads = None,
+                      timeReferenceFile = None, cachePath = None,
+                      landmarkCachePath = None, taskTemplate = None,
+                      watchdogSettings = None, checkpointPath = None,
+                      solverSettings = None, ipoptOptions = None):
+    
+    # Convenience function for solving a task over a series of increasingly
+    # fine meshes. The first (coarse) mesh is solved from the guess file, and
+    # each solution is interpolated onto the next mesh as its guess (see
+    # fixGuessFile). The refinement stops once the relative change
+    # in objective and the change in coordinate values between meshes are both
+    # below the tolerances, or once the final mesh is solved.
+    #
+    # Input:    taskName - string of relevant task name options
+    #           simModel - processed Opensim model object (see createSimModel)
+    #           guessFile - string of path to guess file for the first mesh
+    #           meshIntervals - list of mesh intervals to solve in order
+    #           taskBoundsElv - pandas dataframe containing shoulder elevation angle task bounds
+    #           taskBoundsRot - pandas dataframe containing shoulder rotation task bounds
+    #           taskBoundsAng - pandas dataframe containing elevation angle task bounds
+    #           outputPath - string of path to write the solutions of each mesh to
+    #           studyName - string to name the study, with the number of nodes
+    #                       appended for each mesh
+    #           objectiveTolerance - relative change in objective to stop at
+    #           stateTolerance - maximum change in coordinate values (rad) to stop at
+    #           nThreads - optional number of threads for CasADi parallel evaluations
+    #           timeReferenceFile - optional string of path to the file used to
+    #                               set the time bounds (default is the guess file)
+    #           cachePath - optional string of path to the solution cache
+    #                       directory (see cacheHelper.solveStudy)
+    #           landmarkCachePath - optional string of path to a directory to
+    #                               store the model landmarks in across runs
+    #           taskTemplate - optional task template (see createTaskTemplate)
+    #                          to set up the studies from, replacing the task
+    #                          bounds, time reference and thread settings
+    #           watchdogSettings - optional dictionary of watchdog rules to
+    #                              solve each mesh with (see cacheHelper.solveStudy).
+    #                              The wall time limit applies to all of the
+    #                              meshes together.
+    #           checkpointPath - optional string of path to the checkpoint
+    #                            directory for resuming interrupted solves
+    #           solverSettings - optional dictionary of solver settings that
+    #                            replace the defaults (see defaultSolverSettings),
+    #                            if the task template isn't given
+    #           ipoptOptions - optional dictionary of IPOPT options to solve
+    #                          each mesh with (see cacheHelper.solveStudy)
+    #
+    # Output:   solution - MocoSolution (or cached MocoTrajectory) from the
+    #                      final mesh solved
+    #           solutionFile - string of path to the final solution file
+    #           refinementSummary - pandas dataframe of the objective, change
+    #                               and solve time at each mesh
+    
+    #Check for appropriate inputs
+    if taskName is None or simModel is None or guessFile is None or outputPath is None \
+        or studyName is None:
+        raise ValueError('Task name, model, guess file, output path and study name are needed in runMeshRefinement')
+    if taskTemplate is None and \
+        (taskBoundsElv is None or taskBoundsRot is None or taskBoundsAng is None):
+        raise ValueError('Task bounds or a task template are needed in runMeshRefinement')
+    
+    #Build the task template once for all of the meshes, keeping the time
+    #bounds set from the original guess
+    if taskTemplate is None:
+        if timeReferenceFile is None:
+            timeReferenceFile = guessFile
+        taskTemplate = createTaskTemplate(taskName,simModel,timeReferenceFile,
+                                          taskBoundsElv,taskBoundsRot,taskBoundsAng,
+                                          meshIntervals[0],nThreads,landmarkCachePath,
+                                          solverSettings)
+    
+    #Loop through the meshes
+    startTime = time.time()
+    summaryList = []
+    prevSolution = None
+    for meshInterval in meshIntervals:
+        
+        #Set the study name for the current mesh
+        meshStudyName = studyName+'_'+str(meshInterval*2+1)+'nodes'
+        
+        #Limit the watched solve to the time left for the refinement, stopping
+        #if there is no time left to solve the mesh
+        meshWatchdogSettings = watchdogSettings
+        if watchdogSettings is not None and watchdogSettings.get('maxWallTime') is not None:
+            meshWatchdogSettings = dict(watchdogSettings,
+                                        maxWallTime = watchdogSettings['maxWallTime'] - (time.time() - startTime))
+            if meshWatchdogSettings['maxWallTime'] <= 0:
+                solution = None
+                solutionFile = None
+                summaryList.append({'meshInterval': meshInterval, 'objectiveChange': np.nan,
+                                    'stateChange': np.nan, 'solutionFile': None,
+                                    'status': 'Aborted', 'success': False, 'numIterations': 0,
+                                    'objective': np.nan, 'solverDuration': 0.0, 'cacheHit': False,
+                                    'abortReason': 'wall time limit reached before the solve started'})
+                break
+        
+        #Set up the study with the previous solution as the guess
+        study = createTemplateStudy(taskTemplate,simModel,guessFile,meshStudyName,
+                                    {'num_mesh_intervals': meshInterval})
+        
+        #Print setup file to the output directory
+        with profileHelper.profileSpan('printStudy','io'):
+            study.printToXML(os.path.join(outputPath,meshStudyName+'.omoco'))
+        
+        #Solve and write out the solution
+        solutionFile = os.path.join(outputPath,meshStudyName+'_solution.sto')
+        solution, solveInfo = cacheHelper.solveStudy(study,solutionFile,cachePath,guessFile,
+                                                     taskName,studyName,meshInterval,
+                                                     watchdogSettings = meshWatchdogSettings,
+                                                     checkpointPath = checkpointPath,
+                                                     ipoptOptions = ipoptOptions)
+        
+        #Calculate the changes from the previous mesh
+        objectiveChange = np.nan
+        stateChange = np.nan
+        if prevSolution is not None and solution is not None:
+            #Relative change in objective
+            objectiveChange = abs(solveInfo['objective'] - prevObjective) \
+                / max(abs(prevObjective), 1e-12)
+            #Maximum change in coordinate values with the previous solution
+            #interpolated onto the current time points
+            currTime = np.array(solution.getTimeMat()).flatten()
+            prevTime = np.array(prevSolution.getTimeMat()).flatten()
+            stateChange = 0.0
+            for stateName in list(solution.getStateNames()):
+                if stateName.endswith('/value'):
+                    prevState = interpolateFinite(prevTime / prevTime[-1],
+                                                  prevSolution.getStateMat(stateName),
+                                                  currTime / currTime[-1])
+                    currState = np.array(solution.getStateMat(stateName)).flatten()
+                    stateChange = max(stateChange, np.nanmax(np.abs(currState - prevState)))
+        
+        #Record the mesh summary
+        meshSummary = {'meshInterval': meshInterval,
+                       'objectiveChange': objectiveChange,
+                       'stateChange': stateChange,
+                       'solutionFile': solutionFile}
+        meshSummary.update(solveInfo)
+        summaryList.append(meshSummary)
+        
+        #Stop if the solution didn't converge
+        if not solveInfo['success']:
+            break
+        
+        #Stop if the changes are within the tolerances
+        if objectiveChange < objectiveTolerance and stateChange < stateTolerance:
+            break
+        
+        #Use the current solution as the guess for the next mesh
+        guessFile = solutionFile
+        prevSolution = solution
+        prevObjective = solveInfo['objective']
+    
+    return solution, solutionFile, pd.DataFrame(summaryList)
+
 # %%
     #...add function here...
     
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for running a sweep as a streaming pipeline,
+rather than generating every model, then solving every variant, then analysing
+every solution. The stages run at the same time and are joined by bounded
+queues, so a variant enters the solver as soon as its model exists and a
+solution is analysed as soon as it lands. Functions defined here include:
+
+    runStageWorker          takes items from a stage queue, processes them and
+                            puts the outputs on the next queue (used by the
+                            stage threads)
+
+    runPipeline             runs the generation, solve, analysis and store
+                            stages of a sweep as a pipeline
+
+The stages of the pipeline are:
+    generate - writes the variant model file (or passes the variant
+               specification through to create the model in memory)
+    solve - builds and solves the problem of the variant in a pool of worker
+            processes (see batchHelper.runVariantSimulation)
+    analyse - analyses the converged solutions in a second pool of worker
+              processes (see analysisHelper.runSolutionAnalysis)
+    store - adds the analysis outputs to the analysis store in groups (see
+            resultsHelper.addStoreSolutions)
+
+Each stage has its own number of workers, and is fed by a queue with a maximum
+size. A stage that can't keep up fills its queue, which blocks the stage before
+it (e.g. a slow analysis stage holds the solvers back rather than building up
+solutions in memory). The problem build stays in the solve stage, as the
+Opensim objects it creates can't be passed between processes. A solve or
+analysis that doesn't return within its timeout (e.g. because its worker
+process crashed) is recorded as failed, so that its stage carries on with the
+next item.
+
+"""
+
+# %% Import packages
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+import analysisHelper
+import batchHelper
+import modelHelper
+import resultsHelper
+import tuneHelper
+import watchdogHelper
+
+# %% Settings
+
+#Item put on a stage queue to stop its workers
+stopItem = None
+
+#Seconds to wait for the result of a solve or analysis from its pool before the
+#item is recorded as failed. Solves with a watchdog wall time limit wait for
+#the limit and the margin instead.
+taskTimeouts = {'solve': 6*3600, 'analyse': 1800}
+taskTimeoutMargin = 600
+
+# %% runStageWorker
+
+def runStageWorker(stageName = None, stageFunc = None, inQueue = None, outQueue = None,
+                   stageStats = None, errorList = None, stateLock = None):
+
+    # Takes items from a stage queue until the stop item, processes each with
+    # the stage function and puts the outputs on the next queue. Putting on a
+    # full queue blocks until the next stage catches up. Errors are recorded
+    # rather than stopping the worker.
+    #
+    # Input:    stageName - string of stage name
+    #           stageFunc - function of an item that returns a list of outputs
+    #           inQueue - queue to take items from
+    #           outQueue - queue to put the outputs on (None for the last stage)
+    #           stageStats - dictionary of stage name to the number of items and
+    #                        busy time of the stage
+    #           errorList - list to add (stage name, error message) tuples to
+    #           stateLock - lock guarding the stage stats and error list, which
+    #                       are shared between the stage threads
+
+    #Check for appropriate inputs
+    if stageName is None or stageFunc is None or inQueue is None or stateLock is None:
+        raise ValueError('A stage name, function, queue and lock are needed in runStageWorker')
+
+    while True:
+
+        #Get the next item
+        item = inQueue.get()
+        if item is stopItem:
+            break
+
+        #Process the item
+        startTime = time.time()
+        try:
+            outputList = stageFunc(item)
+        except Exception as err:
+            with stateLock:
+                errorList.append((stageName,repr(err)+'\n'+traceback.format_exc()))
+            outputList = []
+        with stateLock:
+            stageStats[stageName]['items'] += 1
+            stageStats[stageName]['busyTime'] += time.time() - startTime
+
+        #Pass the outputs on
+        if outQueue is not None:
+            for output in outputList:
+                outQueue.put(output)
+
+# %% runPipeline
+
+def runPipeline(modelSources = None, taskName = None, guessFile = None, meshInterval = 50,
+                taskBounds = None, outputPath = None, storePath = None, modelPath = None,
+                stageWorkers = None, queueSizes = None, threadsPerWorker = 1,
+                solvesPerWorker = 1, summaryFile = None, cachePath = None,
+                modelCachePath = None, watchdogSettings = None, fallbackGuessFile = None,
+                retryMeshInterval = None, writeEvery = 16, autoTune = True):
+
+    # Runs the generation, solve, analysis and store stages of a sweep as a
+    # pipeline. Each stage has a set of worker threads taking items from its
+    # queue. The solve and analyse threads each hand their items to a pool of
+    # worker processes, so each stage has as many processes as threads. The
+    # summary file is rewritten as each variant is solved, as in
+    # batchHelper.runBatchSimulations.
+    #
+    # Input:    modelSources - list of strings of paths to variant model files,
+    #                          or variant specification dictionaries (see
+    #                          modelHelper.getVariantSpecs)
+    #           taskName - string of relevant task name options
+    #           guessFile - string of path to guess file
+    #           meshInterval - number of mesh intervals for the solver
+    #           taskBounds - list of the elevation, rotation and angle task
+    #                        bound dataframes (see osimHelper.loadTaskBounds)
+    #           outputPath - string of path to write solutions to
+    #           storePath - optional string of path to the analysis store
+    #                       directory (None skips the analysis stages)
+    #           modelPath - optional string of path to write the variant model
+    #                       files to (None creates the models in memory)
+    #           stageWorkers - optional dictionary of stage name to number of
+    #                          workers. The solve stage defaults to the number
+    #                          of CPUs divided by the threads per worker, and
+    #                          the other stages to one.
+    #           queueSizes - optional dictionary of stage name to the maximum
+    #                        number of items waiting for the stage (default is
+    #                        twice the number of workers of the stage)
+    #           threadsPerWorker - number of threads each solve worker can use
+    #           solvesPerWorker - number of solves before a solve worker is
+    #                             replaced (None keeps workers for the whole sweep)
+    #           summaryFile - string of path for the summary .csv file (default
+    #                         is batchSummary_<taskName>.csv in the output path)
+    #           cachePath - optional string of path to the solution cache directory
+    #           modelCachePath - optional string of path to the processed model
+    #                            cache for the analysis (see osimHelper.createSimModel)
+    #           watchdogSettings - optional dictionary of watchdog rules to solve
+    #                              with (see watchdogHelper.watchdogDefaults)
+    #           fallbackGuessFile - optional string of path to a guess file to
+    #                               retry with if the watchdog stops a solve
+    #           retryMeshInterval - optional (coarser) number of mesh intervals
+    #                               to retry at if the watchdog stops a solve
+    #           writeEvery - number of analysed solutions to add to the store
+    #                        at a time
+    #           autoTune - whether to apply the tuned solver configuration for
+    #                      the host if there is one (see tuneHelper)
+    #
+    # The solves and analyses are given up on after the taskTimeouts, with the
+    # solves waiting for the watchdog wall time limit and taskTimeoutMargin if
+    # there is one.
+    #
+    # Output:   batchSummary - pandas dataframe of each variants status and timing
+    #           stageStats - dictionary of stage name to the number of items,
+    #                        busy time and utilisation of its workers
+    #           errorList - list of (stage name, error message) tuples
+
+    #Check for appropriate inputs
+    if modelSources is None or taskName is None or guessFile is None \
+        or taskBounds is None or outputPath is None:
+        raise ValueError('Model sources, task name, guess file, task bounds and output path are needed in runPipeline')
+
+    #Set the number of workers and queue size of each stage
+    stageNames = ['generate','solve']
+    if storePath is not None:
+        stageNames += ['analyse','store']
+    if stageWorkers is None:
+        stageWorkers = {}
+    if queueSizes is None:
+        queueSizes = {}
+
+    #Apply the tuned solver configuration for the host
+    solverSettings = None
+    ipoptOptions = None
+    nSolveWorkers = stageWorkers.get('solve')
+    if autoTune:
+        nSolveWorkers, threadsPerWorker, solverSettings, ipoptOptions = \
+            tuneHelper.getTunedRunSettings(nSolveWorkers,threadsPerWorker)
+    if nSolveWorkers is None:
+        nSolveWorkers = max(1, mp.cpu_count() // threadsPerWorker)
+    stageWorkers = {stageName: stageWorkers.get(stageName, 1) for stageName in stageNames}
+    stageWorkers['solve'] = max(1, min(nSolveWorkers, len(modelSources)))
+    #The store is written by a single worker
+    if 'store' in stageWorkers:
+        stageWorkers['store'] = 1
+
+    #Set the summary file if not specified
+    if summaryFile is None:
+        summaryFile = os.path.join(outputPath,'batchSummary_'+taskName+'.csv')
+
+    #Set how long to wait for each solve, which is limited by the watchdog
+    solveTimeout = taskTimeouts['solve']
+    if watchdogSettings is not None:
+        maxWallTime = dict(watchdogHelper.watchdogDefaults, **watchdogSettings)['maxWallTime']
+        if maxWallTime is not None:
+            solveTimeout = maxWallTime + taskTimeoutMargin
+
+    #Create the output directories if needed
+    for dirPath in [outputPath, modelPath]:
+        if dirPath is not None and not os.path.isdir(dirPath):
+            os.makedirs(dirPath)
+
+    #Create the queue feeding each stage. The generate queue holds all of the
+    #sources, as they are only small.
+    stageQueues = {stageName: queue.Queue(maxsize = queueSizes.get(stageName, 2*stageWorkers[stageName]))
+                   for stageName in stageNames[1:]}
+    stageQueues['generate'] = queue.Queue()
+    for source in modelSources:
+        stageQueues['generate'].put(source)
+
+    #Stage state shared between the worker threads
+    stageStats = {stageName: {'items': 0, 'busyTime': 0.0} for stageName in stageNames}
+    errorList = []
+    summaryList = []
+    stateLock = threading.Lock()
+    parsedModels = {}
+
+    #Generate stage: write the variant model file and create the solve job
+    def generateVariant(modelSource):
+        if isinstance(modelSource, dict) and modelPath is not None:
+            with stateLock:
+                if modelSource['baseModelFile'] not in parsedModels:
+                    parsedModels[modelSource['baseModelFile']] = modelHelper.parseBaseModel(modelSource['baseModelFile'])
+                variantXML = modelHelper.createVariantXML(*parsedModels[modelSource['baseModelFile']],modelSource)
+            modelFile = os.path.join(modelPath,modelSource['name']+'.osim')
+            with open(modelFile+'.tmp','wb') as osimFile:
+                osimFile.write(variantXML)
+            os.replace(modelFile+'.tmp',modelFile)
+            modelSource = modelFile
+        return [{'modelFile': modelSource, 'taskName': taskName,
+                 'guessFile': guessFile, 'meshInterval': meshInterval,
+                 'taskBounds': list(taskBounds), 'outputPath': outputPath,
+                 'nThreads': threadsPerWorker, 'meshRefinement': None,
+                 'cachePath': cachePath, 'watchdog': watchdogSettings,
+                 'fallbackGuessFile': fallbackGuessFile,
+                 'retryMeshInterval': retryMeshInterval, 'solverSettings': solverSettings,
+                 'ipoptOptions': ipoptOptions}]
+
+    #Solve stage: solve the variant in the solve pool and pass converged
+    #solutions on to the analysis. A solve without a result by the timeout is
+    #recorded as failed.
+    def solveVariant(jobSettings):
+        try:
+            summary = solvePool.apply_async(batchHelper.runVariantSimulation,(jobSettings,)).get(solveTimeout)
+        except mp.TimeoutError:
+            if isinstance(jobSettings['modelFile'], dict):
+                variantName = jobSettings['modelFile']['name']
+            else:
+                variantName = os.path.splitext(os.path.basename(jobSettings['modelFile']))[0]
+            muscleGroup, scaleFactor = batchHelper.getVariantInfo(variantName)
+            summary = dict.fromkeys(batchHelper.summaryColumns)
+            summary.update({'variant': variantName, 'muscleGroup': muscleGroup,
+                            'scaleFactor': scaleFactor, 'meshInterval': meshInterval,
+                            'status': 'Error', 'success': False, 'wallTime': solveTimeout,
+                            'guessFile': guessFile,
+                            'errorMessage': 'No result from the solve worker after '+str(solveTimeout)+' s'})
+        with stateLock:
+            summaryList.append(summary)
+            batchHelper.writeBatchSummary(summaryList,summaryFile)
+            print('Solved '+summary['variant']+' ('+str(summary['status'])+') in '+
+                  str(round(summary['wallTime'],1))+' s ['+str(len(summaryList))+'/'+
+                  str(len(modelSources))+' after '+str(round(time.time()-pipelineStart,1))+' s]')
+        if storePath is None or not summary['success']:
+            return []
+        return [{'solutionFile': os.path.abspath(summary['solutionFile']),
+                 'modelFile': jobSettings['modelFile'], 'taskName': taskName,
+                 'modelCachePath': modelCachePath, 'scalarPaths': scalarPaths,
+                 'reactionPaths': reactionPaths}]
+
+    #Analyse stage: analyse the solution in the analysis pool, recording an
+    #analysis without a result by the timeout as failed
+    def analyseSolution(analysisSettings):
+        try:
+            analysisResult = analysisPool.apply_async(analysisHelper.runSolutionAnalysis,
+                                                      (analysisSettings,)).get(taskTimeouts['analyse'])
+        except mp.TimeoutError:
+            analysisResult = {'solutionFile': analysisSettings['solutionFile'],
+                              'errorMessage': 'No result from the analysis worker after '+
+                              str(taskTimeouts['analyse'])+' s'}
+        if analysisResult['errorMessage'] is not None:
+            with stateLock:
+                errorList.append(('analyse',analysisResult['solutionFile']+': '+analysisResult['errorMessage']))
+            return []
+        return [analysisResult]
+
+    #Store stage: add the analysis outputs to the store in groups
+    storeRows = []
+    storeData = []
+    def storeAnalysis(analysisResult):
+        storeRows.append(resultsHelper.getSolutionRow(analysisResult['solutionFile'],taskName))
+        storeData.append((analysisResult['labels'],analysisResult['data']))
+        if len(storeRows) >= writeEvery:
+            resultsHelper.addStoreSolutions(storePath,storeRows,storeData)
+            del storeRows[:], storeData[:]
+        return []
+
+    stageFuncs = {'generate': generateVariant, 'solve': solveVariant,
+                  'analyse': analyseSolution, 'store': storeAnalysis}
+
+    #Set the thread limits in the current environment, so that they are
+    #inherited by the workers before opensim is loaded
+    batchHelper.limitWorkerThreads(threadsPerWorker)
+    scalarPaths, reactionPaths = analysisHelper.getAnalysisPaths()
+
+    #Start the worker process pools
+    solvePool = mp.Pool(processes = stageWorkers['solve'], initializer = batchHelper.limitWorkerThreads,
+                        initargs = (threadsPerWorker,), maxtasksperchild = solvesPerWorker)
+    analysisPool = None
+    if storePath is not None:
+        analysisPool = mp.Pool(processes = stageWorkers['analyse'], initializer = batchHelper.limitWorkerThreads,
+                               initargs = (1,))
+
+    try:
+
+        #Start the worker threads of each stage
+        pipelineStart = time.time()
+        stageThreads = {}
+        for stageInd, stageName in enumerate(stageNames):
+            outQueue = stageQueues[stageNames[stageInd+1]] if stageInd+1 < len(stageNames) else None
+            stageThreads[stageName] = [threading.Thread(target = runStageWorker,
+                                                        args = (stageName,stageFuncs[stageName],
+                                                                stageQueues[stageName],outQueue,
+                                                                stageStats,errorList,stateLock),
+                                                        daemon = True)
+                                       for workerNo in range(stageWorkers[stageName])]
+            for stageThread in stageThreads[stageName]:
+                stageThread.start()
+
+        #Stop each stage in turn once the stage before it has finished
+        for stageName in stageNames:
+            for workerNo in range(stageWorkers[stageName]):
+                stageQueues[stageName].put(stopItem)
+            for stageThread in stageThreads[stageName]:
+                stageThread.join()
+
+        #Add the remaining outputs to the store
+        if len(storeRows) > 0:
+            resultsHelper.addStoreSolutions(storePath,storeRows,storeData)
+
+    finally:
+
+        #Close the pools
+        for pool in [solvePool, analysisPool]:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    #Set the utilisation of the workers of each stage
+    pipelineTime = time.time() - pipelineStart
+    for stageName in stageNames:
+        stageStats[stageName]['workers'] = stageWorkers[stageName]
+        stageStats[stageName]['utilisation'] = stageStats[stageName]['busyTime'] / \
+            (stageWorkers[stageName] * pipelineTime)
+
+    #Print any errors
+    for stageName, errorMessage in errorList:
+        print('Error in '+stageName+' stage: '+errorMessage.splitlines()[0])
+
+    #Sort the final summary by variant and write out
+    batchSummary = batchHelper.writeBatchSummary(summaryList,summaryFile,sortRows = True)
+
+    return batchSummary, stageStats, errorList
+
+# %%
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for profiling the phases of the simulation
+pipeline (e.g. model loading, model processing, landmark calculation, guess
+repair, printing the study and the solve itself). Phases are marked with spans,
+which are recorded in each process and written to a trace directory. The traces
+can be merged into a Chrome trace (which opens in chrome://tracing or Perfetto)
+and summarised as a timing table of each phase. Functions defined here include:
+
+    enableProfiling         turns on profiling in the current process and any
+                            worker processes started from it
+
+    profileSpan             marks a phase of the pipeline within a with block
+
+    recordSpan              records a span as a Chrome trace event (used by
+                            profileSpan and profileFunction)
+
+    profileFunction         decorator that marks a whole function as a phase
+
+    addSpan                 records a span that has already finished (e.g. a
+                            whole worker job)
+
+    flushTrace              writes the spans recorded in the current process to
+                            the trace directory
+
+    loadTraceEvents         loads and combines the trace files of one or more
+                            trace directories
+
+    mergeTraces             writes the trace files of a trace directory into a
+                            single Chrome trace file
+
+    getTimingTable          summarises the total and self time of each phase
+
+Profiling is off unless enableProfiling has been called, or the trace directory
+environment variable is set. When off, a span is a single check of a module
+variable so the instrumentation can be left in place.
+
+"""
+
+# %% Import packages
+
+import atexit
+import contextlib
+import functools
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+import pandas as pd
+
+# %% Settings
+
+#Environment variable holding the trace directory, which is inherited by worker
+#processes so that their spans are recorded too
+traceEnvVar = 'SHOULDERSIMS_TRACE_PATH'
+
+#Trace directory for the current process (None when profiling is off)
+tracePath = os.environ.get(traceEnvVar)
+
+#Spans recorded in the current process that haven't been written out
+traceEvents = []
+
+#Span used when profiling is off
+nullSpan = contextlib.nullcontext()
+
+# %% enableProfiling
+
+def enableProfiling(traceDir = None):
+
+    # Turns on profiling in the current process, and in any worker processes
+    # started from it afterwards
+    #
+    # Input:    traceDir - string of path to the directory to write traces to
+
+    #Check for appropriate inputs
+    if traceDir is None:
+        raise ValueError('A trace directory is needed in enableProfiling')
+
+    global tracePath
+
+    #Create the trace directory
+    if not os.path.isdir(traceDir):
+        os.makedirs(traceDir)
+
+    #Set the trace directory here and in the environment for the workers
+    tracePath = os.path.abspath(traceDir)
+    os.environ[traceEnvVar] = tracePath
+
+# %% profileSpan
+
+def profileSpan(spanName = None, category = 'pipeline', spanArgs = None):
+
+    # Marks a phase of the pipeline within a with block, e.g.
+    #     with profileHelper.profileSpan('printStudy', 'io'):
+    #         study.printToXML(studyFile)
+    #
+    # Input:    spanName - string of the phase name
+    #           category - string of the phase category
+    #           spanArgs - optional dictionary of details to record with the span
+    #
+    # Output:   span - context manager that records the phase
+
+    #Do nothing when profiling is off
+    if tracePath is None:
+        return nullSpan
+
+    return recordSpan(spanName,category,spanArgs)
+
+@contextlib.contextmanager
+def recordSpan(spanName, category, spanArgs):
+
+    # Context manager that records a span as a Chrome trace complete event.
+    # The start is taken from the wall clock so that spans from different
+    # processes line up, and the duration from the performance counter.
+    #
+    # Input:    spanName - string of the phase name
+    #           category - string of the phase category
+    #           spanArgs - dictionary of details to record with the span
+
+    startTime = time.time()
+    startCounter = time.perf_counter()
+    try:
+        yield
+    finally:
+        traceEvents.append({'name': spanName, 'cat': category, 'ph': 'X',
+                            'ts': startTime * 1e6,
+                            'dur': (time.perf_counter() - startCounter) * 1e6,
+                            'pid': os.getpid(), 'tid': threading.get_ident(),
+                            'args': spanArgs or {}})
+
+# %% profileFunction
+
+def profileFunction(func):
+
+    # Decorator that marks a whole function as a phase named after the function
+    #
+    # Input:    func - function to profile
+    #
+    # Output:   profiledFunc - function that records a span for each call
+
+    @functools.wraps(func)
+    def profiledFunc(*args, **kwargs):
+        if tracePath is None:
+            return func(*args, **kwargs)
+        with recordSpan(func.__name__,func.__module__,None):
+            return func(*args, **kwargs)
+
+    return profiledFunc
+
+# %% addSpan
+
+def addSpan(spanName = None, category = 'pipeline', startTime = None, duration = None,
+            spanArgs = None):
+
+    # Records a span that has already finished, from its start time and duration
+    #
+    # Input:    spanName - string of the phase name
+    #           category - string of the phase category
+    #           startTime - wall clock time the phase started at (s)
+    #           duration - duration of the phase (s)
+    #           spanArgs - optional dictionary of details to record with the span
+
+    #Do nothing when profiling is off
+    if tracePath is None:
+        return
+
+    #Check for appropriate inputs
+    if spanName is None or startTime is None or duration is None:
+        raise ValueError('A span name, start time and duration are needed in addSpan')
+
+    traceEvents.append({'name': spanName, 'cat': category, 'ph': 'X',
+                        'ts': startTime * 1e6, 'dur': duration * 1e6,
+                        'pid': os.getpid(), 'tid': threading.get_ident(),
+                        'args': spanArgs or {}})
+
+# %% flushTrace
+
+def flushTrace():
+
+    # Writes the spans recorded in the current process to a new file in the
+    # trace directory. This is called at the end of each worker job and when
+    # the main process exits.
+
+    #Do nothing when profiling is off or there is nothing to write
+    if tracePath is None or len(traceEvents) == 0:
+        return
+
+    #Name the process in the trace
+    processEvent = {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                    'args': {'name': mp.current_process().name+' ('+str(os.getpid())+')'}}
+
+    #Write the spans to a unique file
+    traceFile = os.path.join(tracePath,'trace_'+str(os.getpid())+'_'+
+                             str(int(time.time()*1e6))+'.json')
+    with open(traceFile+'.tmp','w') as jsonFile:
+        json.dump([processEvent]+traceEvents, jsonFile)
+    os.replace(traceFile+'.tmp',traceFile)
+
+    #Clear the written spans
+    del traceEvents[:]
+
+#Write out any remaining spans of the main process
+atexit.register(flushTrace)
+
+# %% loadTraceEvents
+
+def loadTraceEvents(traceDirs = None):
+
+    # Loads and combines the trace files of one or more trace directories, e.g.
+    # to aggregate the phases across the runs of a sweep
+    #
+    # Input:    traceDirs - string of path to a trace directory, or a list of paths
+    #
+    # Output:   events - list of Chrome trace events
+
+    #Check for appropriate inputs
+    if traceDirs is None:
+        raise ValueError('A trace directory is needed in loadTraceEvents')
+    if isinstance(traceDirs, str):
+        traceDirs = [traceDirs]
+
+    #Load the events from each trace file
+    events = []
+    for traceDir in traceDirs:
+        for fileName in sorted(os.listdir(traceDir)):
+            if fileName.startswith('trace_') and fileName.endswith('.json'):
+                with open(os.path.join(traceDir,fileName),'r') as jsonFile:
+                    events.extend(json.load(jsonFile))
+
+    return events
+
+# %% mergeTraces
+
+def mergeTraces(traceDir = None, traceFile = None):
+
+    # Writes the trace files of a trace directory into a single Chrome trace
+    # file, which can be opened in chrome://tracing or ui.perfetto.dev
+    #
+    # Input:    traceDir - string of path to the trace directory (default is the
+    #                      current trace directory)
+    #           traceFile - string of path to write the trace to (default is
+    #                       pipelineTrace.json in the trace directory)
+    #
+    # Output:   events - list of Chrome trace events
+
+    #Set the defaults
+    if traceDir is None:
+        traceDir = tracePath
+    if traceDir is None:
+        raise ValueError('A trace directory is needed in mergeTraces')
+    if traceFile is None:
+        traceFile = os.path.join(traceDir,'pipelineTrace.json')
+
+    #Write the spans of the current process first
+    if traceDir == tracePath:
+        flushTrace()
+
+    #Combine and write the events
+    events = loadTraceEvents(traceDir)
+    with open(traceFile,'w') as jsonFile:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, jsonFile)
+
+    return events
+
+# %% getTimingTable
+
+def getTimingTable(events = None):
+
+    # Summarises the phases in a list of trace events. The self time of a phase
+    # excludes the time of any phases nested within it, so the phases with the
+    # most self time are the ones to optimise.
+    #
+    # Input:    events - list of Chrome trace events (see loadTraceEvents)
+    #
+    # Output:   timingTable - pandas dataframe of the count, total time, self
+    #                         time, mean time, maximum time (s) and share of the
+    #                         total self time of each phase
+
+    #Check for appropriate inputs
+    if events is None:
+        raise ValueError('Trace events are needed in getTimingTable')
+
+    #Get the spans
+    spans = pd.DataFrame([event for event in events if event.get('ph') == 'X'])
+    if len(spans) == 0:
+        return pd.DataFrame(columns = ['phase','category','count','totalTime','selfTime',
+                                       'meanTime','maxTime','selfShare'])
+
+    #Calculate the self time of each span from the spans nested within it
+    spans['self'] = spans['dur']
+    for threadKey, threadSpans in spans.groupby(['pid','tid']):
+        openSpans = []
+        for ind in threadSpans.sort_values(['ts','dur'], ascending = [True,False]).index:
+            #Close the spans that ended before this one started
+            while len(openSpans) > 0 and \
+                spans.at[openSpans[-1],'ts'] + spans.at[openSpans[-1],'dur'] <= spans.at[ind,'ts']:
+                openSpans.pop()
+            #Remove this span from the self time of the span it is nested in
+            if len(openSpans) > 0:
+                spans.at[openSpans[-1],'self'] -= spans.at[ind,'dur']
+            openSpans.append(ind)
+
+    #Summarise each phase in seconds
+    timingTable = spans.groupby(['name','cat']).agg(count = ('dur','size'),
+                                                    totalTime = ('dur','sum'),
+                                                    selfTime = ('self','sum'),
+                                                    meanTime = ('dur','mean'),
+                                                    maxTime = ('dur','max')).reset_index()
+    timingTable = timingTable.rename(columns = {'name': 'phase', 'cat': 'category'})
+    for column in ['totalTime','selfTime','meanTime','maxTime']:
+        timingTable[column] = timingTable[column] / 1e6
+    timingTable['selfShare'] = timingTable['selfTime'] / timingTable['selfTime'].sum()
+
+    return timingTable.sort_values('selfTime', ascending = False).reset_index(drop = True)
+
+# %%
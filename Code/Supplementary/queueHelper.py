@@ -0,0 +1,679 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for running simulations from a job manifest
+through a persistent job queue. The queue is stored as a .json file next to the
+results and records the state of every job, so an interrupted sweep can be
+restarted with the same manifest and carries on from where it stopped without
+re-solving completed jobs. Functions defined here include:
+
+    loadManifest            loads a job manifest and resolves its paths
+
+    getManifestJobs         creates the list of jobs described by a manifest
+
+    loadQueue               loads the job queue from file
+
+    writeQueue              writes the job queue to file
+
+    initQueue               adds the jobs of a manifest to the job queue
+
+    claimJob                marks a pending job in the queue as running
+
+    finishJob               marks a running job in the queue as done or failed
+
+    getNodeId               gets the identifier of the current runner process
+
+    writeHeartbeat          writes the heartbeat file of a runner
+
+    removeHeartbeat         removes the heartbeat file of a runner
+
+    startHeartbeat          starts a thread that writes the heartbeat of a runner
+                            and reclaims the jobs of dead runners
+
+    isProcessRunning        checks if a process on the current host is still
+                            running
+
+    reclaimJobs             sets the running jobs of dead runners back to pending
+
+    getQueueSummary         creates a summary table of the jobs in the queue
+
+A manifest is a .json file, with paths relative to the manifest file, e.g.:
+
+    {"taskName": "ConcentricUpwardReach105",
+     "models": ["../ModelFiles/strengthVariants.json"],
+     "meshIntervals": [50],
+     "guessFile": "../GuessFiles/ConcentricUpwardReach105_StartingGuess.sto",
+     "dataPath": "../SupportingData",
+     "outputPath": "../SimulationResults/ConcentricUpwardReach105",
+     "cachePath": "../SimulationResults/SolutionCache",
+     "solverSettings": {"optim_max_iterations": 3000},
+     "watchdog": {"maxWallTime": 1800, "stallIterations": 200},
+     "retryMeshInterval": 25,
+     "nProcesses": 4, "threadsPerWorker": 1}
+
+The models can be .osim files, variant overlay files or wildcard patterns (see
+modelHelper.getVariantSources). A job is created for each model and mesh
+interval, or for each model if a list of meshRefinement intervals is given.
+If watchdog rules are given (see watchdogHelper), solves stopped by the watchdog
+are retried with the fallbackGuessFile and then at the retryMeshInterval.
+
+Each job in the queue holds its settings, its state ('pending', 'running',
+'done' or 'failed'), the number of attempts, the process and host that ran it
+and its summary once finished. All edits to the queue are made while holding
+the queue lock file, and the queue file is replaced in a single step, so the
+queue can be shared by the processes of a pool. The lock file functions (see
+cacheHelper.lockFile) are only imported when the queue is edited, so that a
+manifest can be loaded and the thread limits set before opensim is imported.
+
+The queue can also be shared by runners on several nodes, as long as the queue
+and output directories are on a filesystem that all of the nodes share. Each
+runner (see batchHelper.runJobQueue) is identified by its host and process ID,
+and regularly rewrites a heartbeat file in a directory next to the queue file.
+The runner, and the task of the runner, is recorded against each job it claims. Running jobs are reclaimed
+(set back to pending) when the heartbeat of their runner is older than the
+heartbeat timeout, or straight away when their runner or worker process on the
+same host has stopped. A job that keeps losing its runner is marked as failed
+after the maximum number of claims. Each claim has its own ID, so a worker that
+finishes a job after it was reclaimed doesn't overwrite the new claim.
+
+"""
+
+# %% Import packages
+
+import json
+import os
+import socket
+import threading
+import time
+import pandas as pd
+import modelHelper
+
+# %% Settings
+
+#Default values for the optional manifest entries
+manifestDefaults = {'meshIntervals': [50],
+                    'meshRefinement': None,
+                    'timeReferenceFile': None,
+                    'cachePath': None,
+                    'solverSettings': None,
+                    'watchdog': None,
+                    'fallbackGuessFile': None,
+                    'retryMeshInterval': None,
+                    'queueFile': None,
+                    'maxAttempts': 1,
+                    'nProcesses': None,
+                    'threadsPerWorker': 1,
+                    'solvesPerWorker': 1}
+
+#Manifest entries that are paths, resolved relative to the manifest file
+manifestPathKeys = ['guessFile','dataPath','outputPath','timeReferenceFile',
+                    'cachePath','queueFile','fallbackGuessFile']
+
+#Job states
+jobStates = ['pending','running','done','failed']
+
+#Seconds the queue lock can be held before it is assumed to be left over from a
+#stopped process. Queue edits only take a fraction of a second.
+queueLockStale = 120
+
+#Seconds between the heartbeats of a runner, and since the last heartbeat after
+#which a runner is assumed to have stopped
+heartbeatInterval = 30
+heartbeatTimeout = 180
+
+#Windows process access right, error code and exit code used to check if a
+#process is running (PROCESS_QUERY_LIMITED_INFORMATION, ERROR_ACCESS_DENIED and
+#STILL_ACTIVE)
+processQueryAccess = 0x1000
+accessDeniedError = 5
+stillActiveCode = 259
+
+#Maximum number of times a job can be claimed before it is marked as failed
+#when its runners keep stopping (e.g. a job that crashes its node)
+maxClaims = 3
+
+# %% loadManifest
+
+def loadManifest(manifestFile = None):
+
+    # Loads a job manifest, filling the optional entries with their defaults,
+    # resolving the paths relative to the manifest file and expanding the
+    # model sources
+    #
+    # Input:    manifestFile - string of path to the manifest .json file
+    #
+    # Output:   manifest - dictionary of manifest settings, with the expanded
+    #                      list of model files and specifications in 'modelFiles'
+
+    #Check for appropriate inputs
+    if manifestFile is None:
+        raise ValueError('A manifest file is needed in loadManifest')
+
+    #Load the manifest
+    with open(manifestFile,'r') as jsonFile:
+        manifestSettings = json.load(jsonFile)
+
+    #Check the required entries
+    missingKeys = [key for key in ['taskName','models','guessFile','dataPath','outputPath']
+                   if key not in manifestSettings]
+    if len(missingKeys) > 0:
+        raise ValueError('Manifest '+manifestFile+' is missing: '+', '.join(missingKeys))
+
+    #Fill the defaults
+    manifest = dict(manifestDefaults)
+    manifest.update(manifestSettings)
+
+    #Resolve the paths relative to the manifest file
+    manifestPath = os.path.dirname(os.path.abspath(manifestFile))
+    for key in manifestPathKeys:
+        if manifest[key] is not None:
+            manifest[key] = os.path.normpath(os.path.join(manifestPath,manifest[key]))
+
+    #Set the queue file in the output directory by default
+    if manifest['queueFile'] is None:
+        manifest['queueFile'] = os.path.join(manifest['outputPath'],'jobQueue_'+manifest['taskName']+'.json')
+
+    #Expand the model sources
+    manifest['modelFiles'] = modelHelper.getVariantSources([os.path.join(manifestPath,source)
+                                                            for source in manifest['models']])
+    if len(manifest['modelFiles']) == 0:
+        raise ValueError('No models found for the sources in manifest '+manifestFile)
+
+    return manifest
+
+# %% getManifestJobs
+
+def getManifestJobs(manifest = None):
+
+    # Creates the list of jobs described by a manifest. The job settings match
+    # those of batchHelper.runVariantSimulation, with the supporting data path
+    # in place of the task bound dataframes so that the jobs can be stored.
+    #
+    # Input:    manifest - dictionary of manifest settings (see loadManifest)
+    #
+    # Output:   jobList - list of job dictionaries with the job ID and settings
+
+    #Check for appropriate inputs
+    if manifest is None:
+        raise ValueError('A manifest is needed in getManifestJobs')
+
+    #Set the mesh intervals to create jobs for. Mesh refinement runs all of
+    #the meshes in a single job.
+    if manifest['meshRefinement'] is not None:
+        meshIntervals = [manifest['meshRefinement'][-1]]
+    else:
+        meshIntervals = manifest['meshIntervals']
+
+    #Create a job for each model and mesh interval
+    jobList = []
+    for modelFile in manifest['modelFiles']:
+        if isinstance(modelFile, dict):
+            variantName = modelFile['name']
+        else:
+            variantName = os.path.splitext(os.path.basename(modelFile))[0]
+        for meshInterval in meshIntervals:
+            jobSettings = {'modelFile': modelFile, 'taskName': manifest['taskName'],
+                           'guessFile': manifest['guessFile'], 'meshInterval': meshInterval,
+                           'dataPath': manifest['dataPath'], 'outputPath': manifest['outputPath'],
+                           'nThreads': manifest['threadsPerWorker'],
+                           'timeReferenceFile': manifest['timeReferenceFile'],
+                           'meshRefinement': manifest['meshRefinement'],
+                           'solverSettings': manifest['solverSettings'],
+                           'cachePath': manifest['cachePath'],
+                           'watchdog': manifest['watchdog'],
+                           'fallbackGuessFile': manifest['fallbackGuessFile'],
+                           'retryMeshInterval': manifest['retryMeshInterval']}
+            jobList.append({'jobId': variantName+'_'+manifest['taskName']+'_'+str(meshInterval*2+1)+'nodes',
+                            'settings': jobSettings})
+
+    return jobList
+
+# %% loadQueue
+
+def loadQueue(queueFile = None):
+
+    # Loads the job queue from file
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #
+    # Output:   queue - dictionary of the queue with the list of 'jobs' (empty
+    #                   if the queue file doesn't exist yet)
+
+    #Check for appropriate inputs
+    if queueFile is None:
+        raise ValueError('A queue file is needed in loadQueue')
+
+    #Load the queue if it exists
+    if not os.path.isfile(queueFile):
+        return {'jobs': []}
+    with open(queueFile,'r') as jsonFile:
+        return json.load(jsonFile)
+
+# %% writeQueue
+
+def writeQueue(queueFile = None, queue = None):
+
+    # Writes the job queue to a temporary file and renames it into place, so
+    # that the queue file is never left partially written. Should only be
+    # called while holding the queue lock.
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           queue - dictionary of the queue
+
+    #Check for appropriate inputs
+    if queueFile is None or queue is None:
+        raise ValueError('A queue file and queue are needed in writeQueue')
+
+    #Write the queue, converting any numpy values in the summaries
+    tempFile = queueFile+'.'+str(os.getpid())+'.tmp'
+    with open(tempFile,'w') as jsonFile:
+        json.dump(queue, jsonFile, indent = 1,
+                  default = lambda value: value.item() if hasattr(value,'item') else str(value))
+    os.replace(tempFile,queueFile)
+
+# %% initQueue
+
+def initQueue(queueFile = None, jobList = None, retryFailed = False,
+              resetRunning = True, maxAttempts = 1):
+
+    # Adds a list of jobs to the job queue. Jobs already in the queue keep their
+    # state, so completed jobs are never re-solved, and the settings of pending
+    # jobs are updated. Jobs left running by an interrupted sweep are set back
+    # to pending, as are failed jobs if requested and they have attempts left.
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           jobList - list of job dictionaries (see getManifestJobs)
+    #           retryFailed - set failed jobs back to pending
+    #           resetRunning - set running jobs back to pending (assumes no
+    #                          other process is working on the queue, see
+    #                          reclaimJobs for queues shared between runners)
+    #           maxAttempts - maximum number of attempts at a failed job
+    #
+    # Output:   queueSummary - pandas dataframe of the jobs in the queue
+
+    #Check for appropriate inputs
+    if queueFile is None or jobList is None:
+        raise ValueError('A queue file and job list are needed in initQueue')
+
+    #Create the queue directory if needed
+    if not os.path.isdir(os.path.dirname(os.path.abspath(queueFile))):
+        os.makedirs(os.path.dirname(os.path.abspath(queueFile)))
+
+    #Import the lock file function
+    import cacheHelper
+
+    with cacheHelper.lockFile(queueFile+'.lock', staleTime = queueLockStale):
+
+        #Load the queue
+        queue = loadQueue(queueFile)
+        queueJobs = {job['jobId']: job for job in queue['jobs']}
+
+        #Add or update the jobs
+        for newJob in jobList:
+            if newJob['jobId'] not in queueJobs:
+                job = {'jobId': newJob['jobId'], 'state': 'pending', 'attempts': 0,
+                       'workerPid': None, 'hostName': None, 'nodeId': None, 'taskId': None,
+                       'claimId': None,
+                       'started': None, 'finished': None, 'settings': newJob['settings'],
+                       'summary': None}
+                queue['jobs'].append(job)
+                queueJobs[job['jobId']] = job
+            elif queueJobs[newJob['jobId']]['state'] == 'pending':
+                queueJobs[newJob['jobId']]['settings'] = newJob['settings']
+
+        #Reset the running and failed jobs
+        for job in queue['jobs']:
+            if job['state'] == 'running' and resetRunning:
+                job['state'] = 'pending'
+            elif job['state'] == 'failed' and retryFailed and job['attempts'] < maxAttempts:
+                job['state'] = 'pending'
+
+        #Write the queue
+        writeQueue(queueFile,queue)
+
+    return getQueueSummary(queueFile)
+
+# %% claimJob
+
+def claimJob(queueFile = None, jobId = None, nodeId = None, taskId = None):
+
+    # Marks a pending job in the queue as running by the current process
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           jobId - optional string of the job to claim (default claims
+    #                   the first pending job)
+    #           nodeId - optional string of the runner the process belongs to
+    #                    (default is the current process, see getNodeId)
+    #           taskId - optional ID of the runner task the job is claimed for,
+    #                    so the runner can match its tasks to their jobs
+    #
+    # Output:   job - dictionary of the claimed job (None if the job isn't
+    #                 pending or there are no pending jobs)
+
+    #Check for appropriate inputs
+    if queueFile is None:
+        raise ValueError('A queue file is needed in claimJob')
+
+    #Import the lock file function
+    import cacheHelper
+
+    with cacheHelper.lockFile(queueFile+'.lock', staleTime = queueLockStale):
+
+        #Find the job
+        queue = loadQueue(queueFile)
+        for job in queue['jobs']:
+            if job['state'] == 'pending' and (jobId is None or job['jobId'] == jobId):
+                break
+        else:
+            return None
+
+        #Mark the job as running
+        job.update({'state': 'running', 'attempts': job['attempts'] + 1,
+                    'workerPid': os.getpid(), 'hostName': socket.gethostname(),
+                    'nodeId': nodeId if nodeId is not None else getNodeId(),
+                    'taskId': taskId,
+                    'claimId': getNodeId()+'_'+str(int(time.time()*1e6)),
+                    'started': time.time(), 'finished': None})
+        writeQueue(queueFile,queue)
+
+    return job
+
+# %% finishJob
+
+def finishJob(queueFile = None, jobId = None, summary = None, claimId = None):
+
+    # Marks a running job in the queue as done if it was successful, or failed
+    # otherwise, and stores its summary
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           jobId - string of the job to finish
+    #           summary - dictionary of the job status and timing (see
+    #                     batchHelper.runVariantSimulation)
+    #           claimId - optional string of the claim the job was run under,
+    #                     so the job isn't finished if it has since been
+    #                     reclaimed and claimed again
+    #
+    # Output:   isFinished - whether the job was finished
+
+    #Check for appropriate inputs
+    if queueFile is None or jobId is None or summary is None:
+        raise ValueError('A queue file, job ID and summary are needed in finishJob')
+
+    #Import the lock file function
+    import cacheHelper
+
+    with cacheHelper.lockFile(queueFile+'.lock', staleTime = queueLockStale):
+
+        #Update the job
+        queue = loadQueue(queueFile)
+        for job in queue['jobs']:
+            if job['jobId'] == jobId:
+                break
+        else:
+            raise ValueError('Job '+jobId+' not found in queue '+queueFile)
+
+        #Leave a job that has been claimed again by another worker
+        if claimId is not None and job.get('claimId') != claimId:
+            return False
+
+        job.update({'state': 'done' if summary['success'] else 'failed',
+                    'finished': time.time(), 'summary': summary})
+        writeQueue(queueFile,queue)
+
+    return True
+
+# %% getQueueSummary
+
+def getQueueSummary(queueFile = None):
+
+    # Creates a summary table of the jobs in the queue
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #
+    # Output:   queueSummary - pandas dataframe with a row per job of its state,
+    #                          attempts and summary details
+
+    #Check for appropriate inputs
+    if queueFile is None:
+        raise ValueError('A queue file is needed in getQueueSummary')
+
+    #Create a row for each job
+    rowList = []
+    for job in loadQueue(queueFile)['jobs']:
+        row = {key: job.get(key) for key in ['jobId','state','attempts','hostName','nodeId',
+                                             'started','finished']}
+        if job['summary'] is not None:
+            row.update({key: job['summary'][key] for key in job['summary']
+                        if key not in ['errorMessage']})
+        rowList.append(row)
+
+    return pd.DataFrame(rowList)
+
+# %% getNodeId
+
+def getNodeId():
+
+    # Gets the identifier of the current runner process, from its host name and
+    # process ID
+    #
+    # Output:   nodeId - string of the runner identifier
+
+    return socket.gethostname()+'_'+str(os.getpid())
+
+# %% writeHeartbeat
+
+def writeHeartbeat(queueFile = None, nodeId = None, nodeInfo = None):
+
+    # Writes the heartbeat file of a runner to the heartbeat directory of the
+    # queue. The file is replaced in a single step, which also updates its
+    # modified time on the shared filesystem.
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           nodeId - string of the runner identifier (see getNodeId)
+    #           nodeInfo - optional dictionary of runner details to include
+    #
+    # Output:   heartbeatTime - modified time of the heartbeat file, which is
+    #                           used as the current time on the shared
+    #                           filesystem so that node clocks don't need to match
+
+    #Check for appropriate inputs
+    if queueFile is None or nodeId is None:
+        raise ValueError('A queue file and node ID are needed in writeHeartbeat')
+
+    #Create the heartbeat directory if needed
+    heartbeatPath = os.path.splitext(queueFile)[0]+'_heartbeats'
+    if not os.path.isdir(heartbeatPath):
+        os.makedirs(heartbeatPath, exist_ok = True)
+
+    #Write the heartbeat
+    heartbeat = {'nodeId': nodeId, 'hostName': socket.gethostname(), 'pid': os.getpid(),
+                 'updated': time.time()}
+    heartbeat.update(nodeInfo or {})
+    heartbeatFile = os.path.join(heartbeatPath,nodeId+'.json')
+    with open(heartbeatFile+'.tmp','w') as jsonFile:
+        json.dump(heartbeat, jsonFile)
+    os.replace(heartbeatFile+'.tmp',heartbeatFile)
+
+    return os.path.getmtime(heartbeatFile)
+
+# %% removeHeartbeat
+
+def removeHeartbeat(queueFile = None, nodeId = None):
+
+    # Removes the heartbeat file of a runner once it has stopped taking jobs
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           nodeId - string of the runner identifier (see getNodeId)
+
+    #Check for appropriate inputs
+    if queueFile is None or nodeId is None:
+        raise ValueError('A queue file and node ID are needed in removeHeartbeat')
+
+    try:
+        os.remove(os.path.join(os.path.splitext(queueFile)[0]+'_heartbeats',nodeId+'.json'))
+    except FileNotFoundError:
+        pass
+
+# %% startHeartbeat
+
+def startHeartbeat(queueFile = None, nodeId = None, nodeInfo = None, interval = None,
+                   timeout = None):
+
+    # Starts a thread that writes the heartbeat of a runner and reclaims the
+    # jobs of dead runners at each heartbeat. The thread is in the runner
+    # process rather than the workers, as a worker can't run other threads
+    # while it is in the solver.
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           nodeId - string of the runner identifier (see getNodeId)
+    #           nodeInfo - optional dictionary of runner details to include
+    #           interval - seconds between heartbeats (default uses
+    #                      heartbeatInterval)
+    #           timeout - seconds since the last heartbeat after which a runner
+    #                     is assumed to have stopped (default uses heartbeatTimeout)
+    #
+    # Output:   stopEvent - threading event to set to stop the heartbeat
+
+    #Check for appropriate inputs
+    if queueFile is None or nodeId is None:
+        raise ValueError('A queue file and node ID are needed in startHeartbeat')
+
+    #Set the defaults
+    if interval is None:
+        interval = heartbeatInterval
+
+    #Write the heartbeat and reclaim jobs until stopped
+    stopEvent = threading.Event()
+    def runHeartbeat():
+        while True:
+            try:
+                heartbeatTime = writeHeartbeat(queueFile,nodeId,nodeInfo)
+                reclaimedJobs = reclaimJobs(queueFile,heartbeatTime,timeout)
+                if len(reclaimedJobs) > 0:
+                    print('Reclaimed jobs from stopped runners: '+', '.join(reclaimedJobs))
+            except Exception as err:
+                print('Heartbeat of '+nodeId+' failed: '+repr(err))
+            if stopEvent.wait(interval):
+                break
+
+    #Write the first heartbeat before any jobs are claimed
+    writeHeartbeat(queueFile,nodeId,nodeInfo)
+    threading.Thread(target = runHeartbeat, daemon = True).start()
+
+    return stopEvent
+
+# %% isProcessRunning
+
+def isProcessRunning(pid = None):
+
+    # Checks if a process on the current host is still running. On Windows the
+    # process is opened and its exit code checked, as os.kill with signal 0
+    # sends a Ctrl+C event to the console rather than checking the process.
+    #
+    # Input:    pid - integer of the process ID
+    #
+    # Output:   isRunning - whether the process is running (also True if the
+    #                       process exists but can't be checked)
+
+    #Check for appropriate inputs
+    if pid is None:
+        raise ValueError('A process ID is needed in isProcessRunning')
+
+    #Open the process and check it hasn't exited on Windows
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error = True)
+        processHandle = kernel32.OpenProcess(processQueryAccess, False, int(pid))
+        if not processHandle:
+            return ctypes.get_last_error() == accessDeniedError
+        try:
+            exitCode = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(processHandle, ctypes.byref(exitCode)):
+                return True
+            return exitCode.value == stillActiveCode
+        finally:
+            kernel32.CloseHandle(processHandle)
+
+    #Send the null signal elsewhere, which only checks the process exists
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return True
+
+# %% reclaimJobs
+
+def reclaimJobs(queueFile = None, currentTime = None, timeout = None):
+
+    # Sets the running jobs of dead runners back to pending, or to failed once
+    # they have been claimed the maximum number of times. A runner is dead if
+    # its heartbeat file is missing or older than the timeout, or if it is on
+    # the current host and its process, or the worker process running the job,
+    # has stopped.
+    #
+    # Input:    queueFile - string of path to the queue .json file
+    #           currentTime - optional current time on the shared filesystem
+    #                         (see writeHeartbeat, default is the local time)
+    #           timeout - seconds since the last heartbeat after which a runner
+    #                     is assumed to have stopped (default uses heartbeatTimeout)
+    #
+    # Output:   reclaimedJobs - list of the job IDs that were reclaimed
+
+    #Check for appropriate inputs
+    if queueFile is None:
+        raise ValueError('A queue file is needed in reclaimJobs')
+
+    #Set the defaults
+    if currentTime is None:
+        currentTime = time.time()
+    if timeout is None:
+        timeout = heartbeatTimeout
+
+    #Import the lock file function
+    import cacheHelper
+
+    #Only take the lock if there are running jobs
+    if not any([job['state'] == 'running' for job in loadQueue(queueFile)['jobs']]):
+        return []
+
+    heartbeatPath = os.path.splitext(queueFile)[0]+'_heartbeats'
+    reclaimedJobs = []
+    with cacheHelper.lockFile(queueFile+'.lock', staleTime = queueLockStale):
+
+        #Check the runner of each running job
+        queue = loadQueue(queueFile)
+        for job in queue['jobs']:
+            if job['state'] != 'running':
+                continue
+            nodeId = job.get('nodeId')
+            heartbeatFile = os.path.join(heartbeatPath,str(nodeId)+'.json')
+            try:
+                isDead = nodeId is None or currentTime - os.path.getmtime(heartbeatFile) > timeout
+            except FileNotFoundError:
+                isDead = True
+            if not isDead and job['hostName'] == socket.gethostname():
+                isDead = not isProcessRunning(int(nodeId.rsplit('_',1)[1])) or not isProcessRunning(job['workerPid'])
+            if not isDead:
+                continue
+
+            #Set the job back to pending, or failed if it has run out of claims
+            if job['attempts'] >= maxClaims:
+                job.update({'state': 'failed', 'finished': time.time(), 'claimId': None})
+            else:
+                job.update({'state': 'pending', 'claimId': None})
+            job['reclaims'] = job.get('reclaims', 0) + 1
+            reclaimedJobs.append(job['jobId'])
+
+        #Write the queue
+        if len(reclaimedJobs) > 0:
+            writeQueue(queueFile,queue)
+
+    return reclaimedJobs
+
+# %%
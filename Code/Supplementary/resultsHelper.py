@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for collecting the simulation solutions of
+a sweep into a columnar results store, so that the variants can be compared
+without re-reading each .sto file. Functions defined here include:
+
+    getSolutionInfo         gets the variant, muscle group, scale factor and
+                            number of nodes of a solution from its file name
+
+    findSolutionFiles       lists the solution files in a results directory
+
+    loadResultsIndex        loads the index of the solutions in a results store
+
+    writeStoreChunk         writes the data of a list of solutions to a new chunk
+
+    writeResultsIndex       writes the results index and removes unused chunks
+
+    getSolutionRow          gets the index row of a solution file
+
+    getNewSolutions         lists the solution files that are new or changed
+                            since they were added to a results store
+
+    addStoreSolutions       adds the data of a list of solutions to a results
+                            store as a new chunk
+
+    ingestSolutions         adds new or changed solution files to a results store
+
+    compactStore            rewrites a results store into a single chunk
+
+    loadStoreChunk          loads a chunk of a results store as a memory map
+
+    filterResults           selects solutions from the results index by variant,
+                            muscle group, scale factor and mesh
+
+    matchColumns            lists the data columns in a results store that
+                            match a pattern
+
+    getResultsColumns       gets the data of selected columns for each solution
+
+    queryResults            calculates a statistic of a column for each solution
+
+The store is a directory with an index of the solutions (resultsIndex.csv) and
+the data in chunks. The index has a row per solution with its variant details,
+the header of the solution file (status, objective terms, solver duration etc.)
+and the rows it takes up in its chunk. Each chunk (chunk_<n>.npy) is a 2D numpy
+array of the states, controls, multipliers etc. of the solutions added together,
+stored column by column so that a single column is read from a memory map in
+one contiguous block, with the column labels in chunk_<n>.json. New solutions
+are added as a new chunk, and solutions that have changed replace their
+previous rows.
+
+"""
+
+# %% Import packages
+
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import batchHelper
+import stoHelper
+
+# %% Settings
+
+#Name of the results index file in a store
+resultsIndexName = 'resultsIndex.csv'
+
+#Index columns, which come before the solution file header values
+indexColumns = ['solutionId','taskName','variant','muscleGroup','scaleFactor',
+                'nodes','meshInterval','solutionFile','stoSize','stoModified',
+                'chunk','rowStart','rowCount']
+
+#Chunks loaded in the current process, keyed by the chunk file
+storeChunks = {}
+
+#Statistics that can be calculated from a column of a solution
+statisticFunctions = {'max': np.nanmax, 'min': np.nanmin, 'mean': np.nanmean,
+                      'absmax': lambda values: np.nanmax(np.abs(values)),
+                      'initial': lambda values: values[0],
+                      'final': lambda values: values[-1]}
+
+# %% getSolutionInfo
+
+def getSolutionInfo(solutionFile = None, taskName = None):
+
+    # Gets the details of a solution from its file name, which is of the form
+    # <variant>_<taskName>_<nodes>nodes_solution.sto (see batchHelper)
+    #
+    # Input:    solutionFile - string of path to the solution file
+    #           taskName - optional string of task name to remove from the
+    #                      variant name
+    #
+    # Output:   solutionInfo - dictionary of the solution ID, task name,
+    #                          variant, muscle group, scale factor, number of
+    #                          nodes and mesh interval
+
+    #Check for appropriate inputs
+    if solutionFile is None:
+        raise ValueError('A solution file is needed in getSolutionInfo')
+
+    #Get the solution ID from the file name
+    solutionId = os.path.basename(solutionFile)
+    if solutionId.endswith('_solution.sto'):
+        solutionId = solutionId[:-len('_solution.sto')]
+    else:
+        solutionId = os.path.splitext(solutionId)[0]
+
+    #Split off the number of nodes
+    variantName = solutionId
+    nodes = None
+    nodeMatch = re.match(r'^(.*)_(\d+)nodes$', variantName)
+    if nodeMatch is not None:
+        variantName, nodes = nodeMatch.group(1), int(nodeMatch.group(2))
+
+    #Split off the task name
+    if taskName is not None and variantName.endswith('_'+taskName):
+        variantName = variantName[:-len('_'+taskName)]
+
+    #Get the muscle group and scale factor
+    muscleGroup, scaleFactor = batchHelper.getVariantInfo(variantName)
+
+    return {'solutionId': solutionId, 'taskName': taskName, 'variant': variantName,
+            'muscleGroup': muscleGroup, 'scaleFactor': scaleFactor, 'nodes': nodes,
+            'meshInterval': None if nodes is None else (nodes - 1) // 2}
+
+# %% findSolutionFiles
+
+def findSolutionFiles(resultsPath = None):
+
+    # Lists the solution files in a results directory. Sub-directories (e.g.
+    # the solution library and cache) aren't searched, so each solution is
+    # only listed once.
+    #
+    # Input:    resultsPath - string of path to the results directory
+    #
+    # Output:   solutionFiles - sorted list of strings of paths to solution files
+
+    #Check for appropriate inputs
+    if resultsPath is None:
+        raise ValueError('A results path is needed in findSolutionFiles')
+
+    return sorted([os.path.join(resultsPath,fileName) for fileName in os.listdir(resultsPath)
+                   if fileName.endswith('_solution.sto')])
+
+# %% loadResultsIndex
+
+def loadResultsIndex(storePath = None):
+
+    # Loads the index of the solutions in a results store
+    #
+    # Input:    storePath - string of path to the results store directory
+    #
+    # Output:   resultsIndex - pandas dataframe with a row per solution (empty
+    #                          if the store doesn't exist yet)
+
+    #Check for appropriate inputs
+    if storePath is None:
+        raise ValueError('A store path is needed in loadResultsIndex')
+
+    #Return an empty index if there is no store
+    indexFile = os.path.join(storePath,resultsIndexName)
+    if not os.path.isfile(indexFile):
+        return pd.DataFrame(columns = indexColumns)
+
+    return pd.read_csv(indexFile, dtype = {'solutionId': str, 'variant': str,
+                                           'muscleGroup': str, 'chunk': str})
+
+# %% writeStoreChunk
+
+def writeStoreChunk(storePath = None, solutionList = None):
+
+    # Writes the data of a list of solutions to a new chunk in a results store.
+    # The labels of the chunk are all of the labels of the solutions, with any
+    # columns a solution doesn't have filled with NaN.
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           solutionList - list of (labels, data) tuples of each solution
+    #
+    # Output:   chunkName - string of the chunk name
+    #           rowStarts - list of the first row of each solution in the chunk
+
+    #Check for appropriate inputs
+    if storePath is None or solutionList is None:
+        raise ValueError('A store path and solution list are needed in writeStoreChunk')
+
+    #Get the next chunk number, after any unused chunk data that couldn't be
+    #removed yet
+    chunkNumbers = [int(re.match(r'^chunk_(\d+)\.(npy|json)$', fileName).group(1))
+                    for fileName in os.listdir(storePath)
+                    if re.match(r'^chunk_\d+\.(npy|json)$', fileName)]
+    chunkName = 'chunk_'+str(max(chunkNumbers + [0]) + 1).zfill(5)
+
+    #Combine the labels of the solutions in order of first appearance
+    chunkLabels = []
+    for labels, data in solutionList:
+        chunkLabels.extend([label for label in labels if label not in chunkLabels])
+    labelIndex = {label: ind for ind, label in enumerate(chunkLabels)}
+
+    #Fill the chunk, storing it column by column
+    rowCounts = [data.shape[0] for labels, data in solutionList]
+    rowStarts = list(np.cumsum([0] + rowCounts[:-1]))
+    chunkData = np.full((sum(rowCounts), len(chunkLabels)), np.nan, order = 'F')
+    for (labels, data), rowStart in zip(solutionList, rowStarts):
+        chunkData[rowStart:rowStart+data.shape[0], [labelIndex[label] for label in labels]] = data
+
+    #Write the data before the labels, as the labels mark the chunk as complete
+    tempFile = os.path.join(storePath,chunkName+'.tmp.npy')
+    np.save(tempFile, chunkData)
+    os.replace(tempFile,os.path.join(storePath,chunkName+'.npy'))
+    with open(os.path.join(storePath,chunkName+'.json'),'w') as jsonFile:
+        json.dump({'labels': chunkLabels}, jsonFile)
+
+    return chunkName, [int(rowStart) for rowStart in rowStarts]
+
+# %% writeResultsIndex
+
+def writeResultsIndex(storePath = None, resultsIndex = None):
+
+    # Writes the index of a results store, removing any chunks that are no
+    # longer used by a solution. A chunk is released from the loaded chunks
+    # before it is removed, as a memory mapped file can't be removed on
+    # Windows. Chunks that still can't be removed (e.g. mapped by another
+    # process) are left and removed by a later write of the index.
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           resultsIndex - pandas dataframe of the results index
+
+    #Check for appropriate inputs
+    if storePath is None or resultsIndex is None:
+        raise ValueError('A store path and results index are needed in writeResultsIndex')
+
+    #Order the columns and write the index
+    resultsIndex = resultsIndex[indexColumns + [column for column in resultsIndex.columns
+                                                if column not in indexColumns]]
+    tempFile = os.path.join(storePath,resultsIndexName+'.tmp')
+    resultsIndex.to_csv(tempFile, index = False)
+    os.replace(tempFile,os.path.join(storePath,resultsIndexName))
+
+    #Remove the unused chunks, including any left by earlier writes
+    usedChunks = set(resultsIndex['chunk'])
+    keptFiles = []
+    for fileName in os.listdir(storePath):
+        chunkMatch = re.match(r'^(chunk_\d+)\.(npy|json)$', fileName)
+        if chunkMatch is not None and chunkMatch.group(1) not in usedChunks:
+            storeChunks.pop(os.path.abspath(os.path.join(storePath,chunkMatch.group(1))), None)
+            try:
+                os.remove(os.path.join(storePath,fileName))
+            except OSError:
+                keptFiles.append(fileName)
+    if len(keptFiles) > 0:
+        print('Unused chunks kept until the next write of results store '+storePath+': '+
+              ', '.join(keptFiles))
+
+# %% getSolutionRow
+
+def getSolutionRow(solutionFile = None, taskName = None):
+
+    # Gets the index row of a solution file, without its place in the store
+    #
+    # Input:    solutionFile - string of path to the solution file
+    #           taskName - optional string of task name to remove from the
+    #                      variant name (see getSolutionInfo)
+    #
+    # Output:   solutionRow - dictionary of the solution details, file details
+    #                         and the header values of the solution file
+
+    #Check for appropriate inputs
+    if solutionFile is None:
+        raise ValueError('A solution file is needed in getSolutionRow')
+
+    #Get the solution and file details
+    solutionFile = os.path.abspath(solutionFile)
+    stoStat = os.stat(solutionFile)
+    solutionRow = getSolutionInfo(solutionFile,taskName)
+    solutionRow.update({'solutionFile': solutionFile, 'stoSize': stoStat.st_size,
+                        'stoModified': stoStat.st_mtime_ns})
+
+    #Add the header values
+    header, nHeaderLines = stoHelper.readStoHeader(solutionFile)
+    solutionRow.update({key: value for key, value in header.items()
+                        if value is not None and key not in indexColumns})
+
+    return solutionRow
+
+# %% getNewSolutions
+
+def getNewSolutions(storePath = None, solutionFiles = None):
+
+    # Lists the solution files that aren't in a results store yet, or have
+    # changed since they were added
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           solutionFiles - list of strings of paths to solution files
+    #
+    # Output:   newFiles - list of strings of paths to the new solution files
+
+    #Check for appropriate inputs
+    if storePath is None or solutionFiles is None:
+        raise ValueError('A store path and solution files are needed in getNewSolutions')
+
+    #Get the file details of the stored solutions
+    resultsIndex = loadResultsIndex(storePath)
+    storedFiles = {row['solutionFile']: (row['stoSize'],row['stoModified'])
+                   for ind, row in resultsIndex.iterrows()}
+
+    #Check each file against the store
+    newFiles = []
+    for solutionFile in solutionFiles:
+        stoStat = os.stat(solutionFile)
+        if storedFiles.get(os.path.abspath(solutionFile)) != (stoStat.st_size,stoStat.st_mtime_ns):
+            newFiles.append(solutionFile)
+
+    return newFiles
+
+# %% addStoreSolutions
+
+def addStoreSolutions(storePath = None, solutionRows = None, solutionList = None):
+
+    # Adds the data of a list of solutions to a results store as a new chunk,
+    # replacing the rows of any solutions already in the store
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           solutionRows - list of index row dictionaries of each solution
+    #                          (see getSolutionRow)
+    #           solutionList - list of (labels, data) tuples of each solution
+    #
+    # Output:   resultsIndex - pandas dataframe of the updated results index
+
+    #Check for appropriate inputs
+    if storePath is None or solutionRows is None or solutionList is None:
+        raise ValueError('A store path, solution rows and solution list are needed in addStoreSolutions')
+
+    #Create the store directory if needed
+    if not os.path.isdir(storePath):
+        os.makedirs(storePath)
+
+    #Import the file lock from the cache functions
+    import cacheHelper
+
+    with cacheHelper.lockFile(os.path.join(storePath,'store.lock')):
+
+        #Load the current index
+        resultsIndex = loadResultsIndex(storePath)
+        if len(solutionRows) == 0:
+            return resultsIndex
+
+        #Write the chunk and set the place of each solution in it
+        chunkName, rowStarts = writeStoreChunk(storePath,solutionList)
+        newRows = []
+        for solutionRow, rowStart, (labels, data) in zip(solutionRows, rowStarts, solutionList):
+            newRows.append(dict(solutionRow, chunk = chunkName, rowStart = rowStart,
+                                rowCount = data.shape[0]))
+
+        #Replace the rows of the solutions in the index
+        resultsIndex = resultsIndex[~resultsIndex['solutionFile'].isin(
+            [solutionRow['solutionFile'] for solutionRow in newRows])]
+        resultsIndex = pd.concat([resultsIndex, pd.DataFrame(newRows)], ignore_index = True, sort = False)
+        writeResultsIndex(storePath,resultsIndex)
+        print('Added '+str(len(newRows))+' solutions to results store '+storePath)
+
+    return resultsIndex
+
+# %% ingestSolutions
+
+def ingestSolutions(storePath = None, solutionFiles = None, taskName = None):
+
+    # Adds solution files to a results store. Solutions already in the store
+    # are skipped unless the file has changed since it was added, in which case
+    # its rows are replaced. The new solutions are added as a single chunk.
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           solutionFiles - list of strings of paths to solution files
+    #           taskName - optional string of task name to remove from the
+    #                      variant names (see getSolutionInfo)
+    #
+    # Output:   resultsIndex - pandas dataframe of the updated results index
+
+    #Check for appropriate inputs
+    if storePath is None or solutionFiles is None:
+        raise ValueError('A store path and solution files are needed in ingestSolutions')
+
+    #Read the new or changed solutions
+    solutionRows = []
+    solutionList = []
+    for solutionFile in getNewSolutions(storePath,solutionFiles):
+        solutionRows.append(getSolutionRow(solutionFile,taskName))
+        header, labels, data = stoHelper.readSto(solutionFile, useSidecar = False)
+        solutionList.append((labels,data))
+
+    return addStoreSolutions(storePath,solutionRows,solutionList)
+
+# %% compactStore
+
+def compactStore(storePath = None):
+
+    # Rewrites a results store into a single chunk, e.g. after many incremental
+    # additions, so that each column can be read in one block
+    #
+    # Input:    storePath - string of path to the results store directory
+    #
+    # Output:   resultsIndex - pandas dataframe of the updated results index
+
+    #Check for appropriate inputs
+    if storePath is None:
+        raise ValueError('A store path is needed in compactStore')
+
+    #Import the file lock from the cache functions
+    import cacheHelper
+
+    with cacheHelper.lockFile(os.path.join(storePath,'store.lock')):
+
+        #Load a copy of the data of every solution, so that no views of the
+        #old chunks are left when they are removed
+        resultsIndex = loadResultsIndex(storePath)
+        if len(resultsIndex) == 0 or resultsIndex['chunk'].nunique() == 1:
+            return resultsIndex
+        solutionList = []
+        for ind, row in resultsIndex.iterrows():
+            chunkLabels, chunkData = loadStoreChunk(storePath,row['chunk'])
+            solutionList.append((chunkLabels,np.array(chunkData[row['rowStart']:row['rowStart']+row['rowCount'],:])))
+        del chunkData
+
+        #Write the single chunk, dropping columns that are empty for a solution
+        solutionList = [([label for label, keep in zip(labels, ~np.all(np.isnan(data), axis = 0)) if keep],
+                         data[:,~np.all(np.isnan(data), axis = 0)])
+                        for labels, data in solutionList]
+        chunkName, rowStarts = writeStoreChunk(storePath,solutionList)
+        resultsIndex['chunk'] = chunkName
+        resultsIndex['rowStart'] = rowStarts
+        writeResultsIndex(storePath,resultsIndex)
+
+    return resultsIndex
+
+# %% loadStoreChunk
+
+def loadStoreChunk(storePath = None, chunkName = None):
+
+    # Loads a chunk of a results store as a memory map, keeping it for later
+    # calls in the current process
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           chunkName - string of the chunk name
+    #
+    # Output:   chunkLabels - list of the column labels of the chunk
+    #           chunkData - 2D memory mapped numpy array of the chunk data
+
+    #Check for appropriate inputs
+    if storePath is None or chunkName is None:
+        raise ValueError('A store path and chunk name are needed in loadStoreChunk')
+
+    #Load the chunk if it isn't already loaded
+    chunkFile = os.path.abspath(os.path.join(storePath,chunkName))
+    if chunkFile not in storeChunks:
+        with open(chunkFile+'.json','r') as jsonFile:
+            chunkLabels = json.load(jsonFile)['labels']
+        storeChunks[chunkFile] = (chunkLabels,np.load(chunkFile+'.npy', mmap_mode = 'r'))
+
+    return storeChunks[chunkFile]
+
+# %% filterResults
+
+def filterResults(resultsIndex = None, variant = None, muscleGroup = None,
+                  scaleFactor = None, nodes = None, successOnly = False):
+
+    # Selects solutions from the results index. Each filter can be a single
+    # value or a list of values.
+    #
+    # Input:    resultsIndex - pandas dataframe of the results index
+    #           variant - optional variant name(s) to select
+    #           muscleGroup - optional muscle group label(s) to select
+    #           scaleFactor - optional strength scale factor(s) to select
+    #           nodes - optional number(s) of nodes to select
+    #           successOnly - only select converged solutions
+    #
+    # Output:   resultsIndex - pandas dataframe of the selected solutions
+
+    #Check for appropriate inputs
+    if resultsIndex is None:
+        raise ValueError('A results index is needed in filterResults')
+
+    #Apply each filter
+    for column, values in [('variant',variant),('muscleGroup',muscleGroup),
+                           ('scaleFactor',scaleFactor),('nodes',nodes)]:
+        if values is not None:
+            if not isinstance(values, (list,tuple)):
+                values = [values]
+            resultsIndex = resultsIndex[resultsIndex[column].isin(values)]
+    if successOnly and 'success' in resultsIndex.columns:
+        resultsIndex = resultsIndex[resultsIndex['success'] == True]
+
+    return resultsIndex
+
+# %% matchColumns
+
+def matchColumns(storePath = None, pattern = None):
+
+    # Lists the data columns in a results store that match a pattern
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           pattern - regular expression to search the labels for (e.g.
+    #                     'DELT2.*activation')
+    #
+    # Output:   columnNames - list of the matching column labels
+
+    #Check for appropriate inputs
+    if storePath is None or pattern is None:
+        raise ValueError('A store path and pattern are needed in matchColumns')
+
+    #Search the labels of each chunk
+    columnNames = []
+    for chunkName in loadResultsIndex(storePath)['chunk'].unique():
+        chunkLabels, chunkData = loadStoreChunk(storePath,chunkName)
+        columnNames.extend([label for label in chunkLabels
+                            if re.search(pattern, label) and label not in columnNames])
+
+    return columnNames
+
+# %% getResultsColumns
+
+def getResultsColumns(storePath = None, columnNames = None, resultsIndex = None):
+
+    # Gets the data of selected columns for each solution in a results store
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           columnNames - list of column labels to get (e.g. 'time' or
+    #                         '/forceset/DELT2/activation')
+    #           resultsIndex - optional pandas dataframe of the solutions to get
+    #                          (e.g. from filterResults, default is all solutions)
+    #
+    # Output:   columnData - dictionary of solution ID to a 2D numpy array with
+    #                        a column for each label (NaN where a solution
+    #                        doesn't have the column)
+
+    #Check for appropriate inputs
+    if storePath is None or columnNames is None:
+        raise ValueError('A store path and column names are needed in getResultsColumns')
+
+    #Load the index if not provided
+    if resultsIndex is None:
+        resultsIndex = loadResultsIndex(storePath)
+
+    #Get the columns from each chunk
+    columnData = {}
+    for chunkName, chunkRows in resultsIndex.groupby('chunk'):
+        chunkLabels, chunkData = loadStoreChunk(storePath,chunkName)
+        labelIndex = {label: ind for ind, label in enumerate(chunkLabels)}
+        for ind, row in chunkRows.iterrows():
+            rowSlice = slice(row['rowStart'],row['rowStart']+row['rowCount'])
+            columnData[row['solutionId']] = np.column_stack(
+                [chunkData[rowSlice,labelIndex[columnName]] if columnName in labelIndex
+                 else np.full(row['rowCount'], np.nan) for columnName in columnNames])
+
+    return columnData
+
+# %% queryResults
+
+def queryResults(storePath = None, columnName = None, statistic = 'max', **filters):
+
+    # Calculates a statistic of a column for each solution in a results store,
+    # e.g. the peak DELT2 activation against strength with
+    #     queryResults(storePath,'/forceset/DELT2/activation','max',
+    #                  muscleGroup = ['Baseline','DELT2'])
+    #
+    # Input:    storePath - string of path to the results store directory
+    #           columnName - string of the column label
+    #           statistic - 'max', 'min', 'mean', 'absmax', 'initial', 'final'
+    #                       or a function of the column array
+    #           filters - optional keyword filters for the solutions (see
+    #                     filterResults)
+    #
+    # Output:   queryTable - pandas dataframe of the solution details and the
+    #                          statistic value of each solution
+
+    #Check for appropriate inputs
+    if storePath is None or columnName is None:
+        raise ValueError('A store path and column name are needed in queryResults')
+
+    #Set the statistic function
+    if not callable(statistic):
+        if statistic not in statisticFunctions:
+            raise ValueError('Statistic should be one of '+', '.join(statisticFunctions.keys())+' or a function')
+        statistic = statisticFunctions[statistic]
+
+    #Select the solutions and get the column
+    resultsIndex = filterResults(loadResultsIndex(storePath), **filters)
+    columnData = getResultsColumns(storePath,[columnName],resultsIndex)
+
+    #Calculate the statistic for each solution
+    queryTable = resultsIndex[['solutionId','variant','muscleGroup','scaleFactor','nodes']].copy()
+    queryTable['value'] = [statistic(columnData[solutionId][:,0]) for solutionId in queryTable['solutionId']]
+
+    return queryTable.sort_values(['muscleGroup','scaleFactor']).reset_index(drop = True)
+
+# %%
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for reading and writing .sto trajectory
+files (e.g. Moco solutions and guesses) with numpy, without needing to create
+opensim objects. Functions defined here include:
+
+    readStoHeader           reads the header key/value pairs of a .sto file
+
+    readSto                 reads the header, column labels and data of a .sto
+                            file, using a binary sidecar where available
+
+    writeSto                writes a header, column labels and data to a .sto file
+
+    writeStoSidecar         writes the binary sidecar files for a .sto file
+
+    getStoColumns           gets selected columns from a .sto file
+
+    getLastTime             gets the final time of a .sto file
+
+The binary sidecar for a file (e.g. solution.sto) is a numpy array of the data
+(solution.sto.npy), which can be memory mapped, and a .json file of the header,
+labels and details of the .sto file it was created from (solution.sto.json).
+The sidecar is only used if the .sto file hasn't changed since it was created,
+otherwise it is regenerated.
+
+"""
+
+# %% Import packages
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# %% readStoHeader
+
+def readStoHeader(stoFileName = None):
+
+    # Reads the header of a .sto file. Values are converted to integers, floats
+    # or booleans where possible. Any header lines that aren't key/value pairs
+    # are kept as keys with a value of None.
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #
+    # Output:   header - dictionary of the header key/value pairs in file order
+    #           nHeaderLines - number of lines up to and including 'endheader'
+
+    #Check for appropriate inputs
+    if stoFileName is None:
+        raise ValueError('A .sto file is needed in readStoHeader')
+
+    #Read the lines up until the end of the header
+    header = {}
+    nHeaderLines = 0
+    with open(stoFileName,'r') as stoFile:
+        for line in stoFile:
+            nHeaderLines += 1
+            line = line.strip()
+            if line == 'endheader':
+                break
+            if '=' in line:
+                key, value = line.split('=',1)
+                header[key] = convertHeaderValue(value)
+            elif len(line) > 0:
+                header[line] = None
+        else:
+            raise ValueError('No endheader line found in '+stoFileName)
+
+    return header, nHeaderLines
+
+# %% convertHeaderValue
+
+def convertHeaderValue(value = None):
+
+    # Converts a header value string to an integer, float or boolean where
+    # possible, otherwise it is kept as a string
+    #
+    # Input:    value - string of header value
+    #
+    # Output:   value - converted header value
+
+    #Convert booleans
+    if value in ['true','false']:
+        return value == 'true'
+
+    #Try integers then floats
+    for valueType in [int,float]:
+        try:
+            return valueType(value)
+        except ValueError:
+            pass
+
+    return value
+
+# %% readSto
+
+def readSto(stoFileName = None, useSidecar = True, mmapMode = 'r'):
+
+    # Reads a .sto file. The data block is read in a single pass by the pandas
+    # C parser. If the sidecar option is used, the data are loaded from the
+    # binary sidecar if it is up to date with the .sto file, or the sidecar is
+    # written after reading the .sto file for next time.
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #           useSidecar - use and create the binary sidecar files
+    #           mmapMode - memory map mode for loading the sidecar data (None
+    #                      loads the data fully into memory)
+    #
+    # Output:   header - dictionary of the header key/value pairs
+    #           labels - list of column labels (including time)
+    #           data - 2D numpy array of the data with a row per time point
+
+    #Check for appropriate inputs
+    if stoFileName is None:
+        raise ValueError('A .sto file is needed in readSto')
+
+    #Load from the sidecar if it matches the .sto file
+    if useSidecar:
+        sidecarDetails = loadSidecarDetails(stoFileName)
+        if sidecarDetails is not None:
+            data = np.load(stoFileName+'.npy', mmap_mode = mmapMode)
+            return sidecarDetails['header'], sidecarDetails['labels'], data
+
+    #Read the header
+    header, nHeaderLines = readStoHeader(stoFileName)
+
+    #Read the labels and data
+    dataFrame = pd.read_csv(stoFileName, sep = '\t', skiprows = nHeaderLines,
+                            engine = 'c', dtype = np.float64,
+                            float_precision = 'round_trip')
+    labels = list(dataFrame.columns)
+    data = dataFrame.to_numpy()
+
+    #Write the sidecar for next time
+    if useSidecar:
+        writeStoSidecar(stoFileName,header,labels,data)
+
+    return header, labels, data
+
+# %% loadSidecarDetails
+
+def loadSidecarDetails(stoFileName = None):
+
+    # Loads the sidecar details for a .sto file, checking that the size and
+    # modification time of the .sto file match those stored when the sidecar
+    # was created
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #
+    # Output:   sidecarDetails - dictionary of header, labels and file details
+    #                            (None if the sidecar is missing or out of date)
+
+    #Check for appropriate inputs
+    if stoFileName is None:
+        raise ValueError('A .sto file is needed in loadSidecarDetails')
+
+    #Check the sidecar files exist
+    if not os.path.isfile(stoFileName+'.json') or not os.path.isfile(stoFileName+'.npy'):
+        return None
+
+    #Load the details
+    try:
+        with open(stoFileName+'.json','r') as jsonFile:
+            sidecarDetails = json.load(jsonFile)
+    except ValueError:
+        return None
+
+    #Check against the .sto file
+    stoStat = os.stat(stoFileName)
+    if sidecarDetails.get('stoSize') != stoStat.st_size or \
+        sidecarDetails.get('stoModified') != stoStat.st_mtime_ns:
+        return None
+
+    return sidecarDetails
+
+# %% writeStoSidecar
+
+def writeStoSidecar(stoFileName = None, header = None, labels = None, data = None):
+
+    # Writes the binary sidecar files for a .sto file. The files are written
+    # to temporary names and renamed, so that other processes never load a
+    # partially written sidecar. The data file is written before the details
+    # file, as the details file marks the sidecar as complete.
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #           header - dictionary of the header key/value pairs
+    #           labels - list of column labels
+    #           data - 2D numpy array of the data
+
+    #Check for appropriate inputs
+    if stoFileName is None or header is None or labels is None or data is None:
+        raise ValueError('All four input arguments are needed in writeStoSidecar')
+
+    #Get the .sto file details
+    stoStat = os.stat(stoFileName)
+    sidecarDetails = {'header': header, 'labels': labels,
+                      'stoSize': stoStat.st_size, 'stoModified': stoStat.st_mtime_ns}
+
+    #Write the data
+    tempFile = stoFileName+'.'+str(os.getpid())+'.tmp.npy'
+    np.save(tempFile, np.ascontiguousarray(data, dtype = np.float64))
+    os.replace(tempFile,stoFileName+'.npy')
+
+    #Write the details
+    tempFile = stoFileName+'.'+str(os.getpid())+'.tmp.json'
+    with open(tempFile,'w') as jsonFile:
+        json.dump(sidecarDetails, jsonFile)
+    os.replace(tempFile,stoFileName+'.json')
+
+# %% writeSto
+
+def writeSto(stoFileName = None, header = None, labels = None, data = None,
+             writeSidecar = False):
+
+    # Writes a .sto file in the format used by the Moco trajectory files, with
+    # the header key/value pairs, an 'endheader' line, the tab separated column
+    # labels and the data with full precision
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #           header - dictionary of the header key/value pairs
+    #           labels - list of column labels (including time)
+    #           data - 2D numpy array of the data with a row per time point
+    #           writeSidecar - also write the binary sidecar for the file
+
+    #Check for appropriate inputs
+    if stoFileName is None or header is None or labels is None or data is None:
+        raise ValueError('All four input arguments are needed in writeSto')
+
+    #Check the data matches the labels
+    data = np.asarray(data, dtype = np.float64)
+    if data.ndim != 2 or data.shape[1] != len(labels):
+        raise ValueError('Data needs a column for each of the labels in writeSto')
+
+    #Create the header lines
+    headerLines = []
+    for key in header:
+        if header[key] is None:
+            headerLines.append(key)
+        elif isinstance(header[key], bool):
+            headerLines.append(key+'='+str(header[key]).lower())
+        else:
+            headerLines.append(key+'='+str(header[key]))
+    headerLines.append('endheader')
+    headerLines.append('\t'.join(labels))
+
+    #Write the file
+    with open(stoFileName,'w') as stoFile:
+        stoFile.write('\n'.join(headerLines)+'\n')
+        np.savetxt(stoFile, data, fmt = '%.17g', delimiter = '\t')
+
+    #Write the sidecar
+    if writeSidecar:
+        writeStoSidecar(stoFileName,header,labels,data)
+
+# %% getStoColumns
+
+def getStoColumns(stoFileName = None, columnNames = None, useSidecar = True):
+
+    # Gets selected columns from a .sto file
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #           columnNames - list of column labels to get (e.g. 'time' or
+    #                         '/forceset/DELT1/activation')
+    #           useSidecar - use and create the binary sidecar files
+    #
+    # Output:   columnData - 2D numpy array with a column for each label
+
+    #Check for appropriate inputs
+    if stoFileName is None or columnNames is None:
+        raise ValueError('A .sto file and column names are needed in getStoColumns')
+
+    #Read the file
+    header, labels, data = readSto(stoFileName, useSidecar)
+
+    #Get the column indices
+    missingColumns = [columnName for columnName in columnNames if columnName not in labels]
+    if len(missingColumns) > 0:
+        raise ValueError('Columns not found in '+stoFileName+': '+', '.join(missingColumns))
+
+    return np.asarray(data[:,[labels.index(columnName) for columnName in columnNames]])
+
+# %% getLastTime
+
+def getLastTime(stoFileName = None):
+
+    # Gets the final time of a .sto file. Only the end of the file is read.
+    #
+    # Input:    stoFileName - string of path to .sto file
+    #
+    # Output:   lastTime - float of the final time
+
+    #Check for appropriate inputs
+    if stoFileName is None:
+        raise ValueError('A .sto file is needed in getLastTime')
+
+    #Read the end of the file and get the first value of the last data row
+    with open(stoFileName,'rb') as stoFile:
+        stoFile.seek(0, os.SEEK_END)
+        stoFile.seek(max(0, stoFile.tell() - 65536))
+        lastLine = stoFile.read().decode().strip().splitlines()[-1]
+
+    return float(lastLine.split('\t')[0])
+
+# %%
@@ -0,0 +1,693 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for adaptively sampling the strength
+variants, rather than solving a dense sweep of every muscle group and scale
+factor. A Gaussian process surrogate of selected outcome metrics (e.g. the
+objective or peak muscle activations) is fitted against the scale factors of
+several muscle groups at once, and the next variants are chosen where the
+surrogate is most uncertain. Sampling stops once the surrogate reaches a target
+accuracy, so only the chosen variants are created and solved. Functions defined
+here include:
+
+    getDesignPoints         creates a Latin hypercube design over the unit cube
+
+    getSolutionMetrics      gets the outcome metrics of a solution file
+
+    getKernel               calculates the squared exponential kernel between
+                            two sets of points
+
+    getLogLikelihood        calculates the log marginal likelihood of a set of
+                            surrogate hyperparameters
+
+    fitGaussianProcess      fits a Gaussian process surrogate to a metric
+
+    predictGaussianProcess  predicts the mean and standard deviation of a metric
+
+    getLooErrors            gets the leave-one-out errors of a surrogate
+
+    chooseNextPoints        chooses the next points to solve where the
+                            surrogates are most uncertain
+
+    loadSamplingState       loads the state of an adaptive sampling run
+
+    writeSamplingState      writes the state of an adaptive sampling run
+
+    fitSurrogates           fits a surrogate to each metric of a sampling run
+
+    getUnitPoint            maps the scale factors of a point to the unit cube
+
+    getGroupFactors         maps a point on the unit cube to the scale factors
+
+    runAdaptiveSampling     solves variants chosen by the surrogates until the
+                            target accuracy or maximum number of solves is reached
+
+    getSurrogateEffects     predicts the effect of each muscle group on each
+                            metric from the surrogates
+
+Scale factors are mapped to the unit cube from their bounds, and each metric is
+standardised, before the surrogates are fitted. The accuracy of a surrogate is
+therefore relative to the spread of its metric, e.g. a target accuracy of 0.05
+means a predictive standard deviation and leave-one-out error of 5% of the
+standard deviation of the metric across the solved variants.
+
+The state of a sampling run (the points chosen, their solutions and metrics)
+is kept in a .json file that is rewritten after each batch of solves, so an
+interrupted run carries on from where it stopped.
+
+"""
+
+# %% Import packages
+
+import json
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+import pandas as pd
+import batchHelper
+import modelHelper
+import resultsHelper
+import stoHelper
+
+# %% Settings
+
+#Outcome metrics to fit surrogates to. Each metric is either a value from the
+#solution file header, or a statistic (see resultsHelper.statisticFunctions) of
+#a column of the solution.
+surrogateMetrics = {'objective': {'header': 'objective'}}
+
+#Default bounds of the scale factors of each muscle group
+factorBounds = (0.8, 1.2)
+
+#Length scales (on the unit cube) and noise variances (of the standardised
+#metric) searched when fitting the surrogates
+lengthScaleGrid = [0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0]
+noiseGrid = [1e-6, 1e-4, 1e-3, 1e-2, 1e-1]
+
+#Number of random candidate points to choose the next points from
+nCandidates = 2000
+
+#Minimum distance (on the unit cube) between a candidate and an existing point
+minPointDistance = 0.02
+
+# %% getDesignPoints
+
+def getDesignPoints(nPoints = None, nDims = None, seed = 0):
+
+    # Creates a Latin hypercube design over the unit cube, so that each
+    # dimension is evenly covered by a small number of points
+    #
+    # Input:    nPoints - number of points
+    #           nDims - number of dimensions
+    #           seed - random seed for the design
+    #
+    # Output:   designPoints - nPoints x nDims numpy array of points
+
+    #Check for appropriate inputs
+    if nPoints is None or nDims is None:
+        raise ValueError('A number of points and dimensions are needed in getDesignPoints')
+
+    #Place a point at random within each interval of each dimension, and
+    #shuffle the intervals between the dimensions
+    rng = np.random.RandomState(seed)
+    designPoints = (rng.uniform(size = (nPoints,nDims)) + np.arange(nPoints)[:,None]) / nPoints
+    for dimInd in range(nDims):
+        designPoints[:,dimInd] = designPoints[rng.permutation(nPoints),dimInd]
+
+    return designPoints
+
+# %% getSolutionMetrics
+
+def getSolutionMetrics(solutionFile = None, metricSpecs = None):
+
+    # Gets the outcome metrics of a solution file
+    #
+    # Input:    solutionFile - string of path to the solution file
+    #           metricSpecs - dictionary of metric name to metric specification
+    #                         (default uses surrogateMetrics)
+    #
+    # Output:   metrics - dictionary of metric name to value
+
+    #Check for appropriate inputs
+    if solutionFile is None:
+        raise ValueError('A solution file is needed in getSolutionMetrics')
+
+    #Set the defaults
+    if metricSpecs is None:
+        metricSpecs = surrogateMetrics
+
+    #Get each metric
+    header = stoHelper.readStoHeader(solutionFile)[0]
+    metrics = {}
+    for metricName in metricSpecs:
+        metricSpec = metricSpecs[metricName]
+        if 'header' in metricSpec:
+            metrics[metricName] = float(header[metricSpec['header']])
+        else:
+            columnData = stoHelper.getStoColumns(solutionFile,[metricSpec['column']])[:,0]
+            metrics[metricName] = float(resultsHelper.statisticFunctions[metricSpec['statistic']](columnData))
+
+    return metrics
+
+# %% getKernel
+
+def getKernel(pointsA = None, pointsB = None, lengthScales = None):
+
+    # Calculates the squared exponential kernel between two sets of points
+    #
+    # Input:    pointsA - nA x nDims numpy array of points
+    #           pointsB - nB x nDims numpy array of points
+    #           lengthScales - length scale of each dimension
+    #
+    # Output:   kernel - nA x nB numpy array of the kernel values
+
+    #Scale the points by the length scales
+    scaledA = pointsA / lengthScales
+    scaledB = pointsB / lengthScales
+
+    #Calculate the squared distances
+    sqDist = np.sum(scaledA**2, axis = 1)[:,None] + np.sum(scaledB**2, axis = 1)[None,:] \
+        - 2 * scaledA @ scaledB.T
+
+    return np.exp(-0.5 * np.maximum(sqDist, 0))
+
+# %% getLogLikelihood
+
+def getLogLikelihood(points = None, values = None, lengthScales = None, noise = None):
+
+    # Calculates the log marginal likelihood of a set of surrogate
+    # hyperparameters for standardised metric values
+    #
+    # Input:    points - nPoints x nDims numpy array of points on the unit cube
+    #           values - numpy array of the standardised metric values
+    #           lengthScales - length scale of each dimension
+    #           noise - noise variance of the standardised metric
+    #
+    # Output:   logLikelihood - log marginal likelihood (-inf if the kernel
+    #                           can't be factorised)
+    #           cholFactor - lower Cholesky factor of the kernel matrix
+    #           alpha - kernel matrix inverse multiplied by the values
+
+    #Factorise the kernel matrix
+    kernel = getKernel(points,points,lengthScales) + noise * np.eye(len(points))
+    try:
+        cholFactor = np.linalg.cholesky(kernel)
+    except np.linalg.LinAlgError:
+        return -np.inf, None, None
+
+    #Calculate the likelihood
+    alpha = np.linalg.solve(cholFactor.T, np.linalg.solve(cholFactor, values))
+    logLikelihood = -0.5 * values @ alpha - np.sum(np.log(np.diag(cholFactor))) \
+        - 0.5 * len(points) * np.log(2 * np.pi)
+
+    return logLikelihood, cholFactor, alpha
+
+# %% fitGaussianProcess
+
+def fitGaussianProcess(points = None, values = None, nPasses = 2):
+
+    # Fits a Gaussian process surrogate to a metric. The hyperparameters are
+    # chosen by maximising the log marginal likelihood, first with a single
+    # length scale for all dimensions and then with the length scale of each
+    # dimension searched in turn, so that groups with little effect on the
+    # metric get long length scales.
+    #
+    # Input:    points - nPoints x nDims numpy array of points on the unit cube
+    #           values - numpy array of the metric values
+    #           nPasses - number of passes of the per-dimension search
+    #
+    # Output:   surrogate - dictionary of the fitted surrogate
+
+    #Check for appropriate inputs
+    if points is None or values is None:
+        raise ValueError('Points and values are needed in fitGaussianProcess')
+    points = np.asarray(points, dtype = float)
+    values = np.asarray(values, dtype = float)
+    if len(points) < 3:
+        raise ValueError('At least three points are needed to fit a surrogate')
+
+    #Standardise the values
+    valueMean = np.mean(values)
+    valueStd = np.std(values)
+    if valueStd == 0:
+        valueStd = 1.0
+    stdValues = (values - valueMean) / valueStd
+
+    #Search a shared length scale and the noise
+    nDims = points.shape[1]
+    bestFit = (-np.inf, None, None)
+    for lengthScale in lengthScaleGrid:
+        for noise in noiseGrid:
+            logLikelihood = getLogLikelihood(points,stdValues,np.full(nDims, lengthScale),noise)[0]
+            if logLikelihood > bestFit[0]:
+                bestFit = (logLikelihood, np.full(nDims, lengthScale), noise)
+    if bestFit[1] is None:
+        raise ValueError('No surrogate hyperparameters could be fitted')
+
+    #Search the length scale of each dimension in turn
+    logLikelihood, lengthScales, noise = bestFit
+    for passNo in range(nPasses if nDims > 1 else 0):
+        for dimInd in range(nDims):
+            for lengthScale in lengthScaleGrid:
+                trialScales = lengthScales.copy()
+                trialScales[dimInd] = lengthScale
+                trialLikelihood = getLogLikelihood(points,stdValues,trialScales,noise)[0]
+                if trialLikelihood > logLikelihood:
+                    logLikelihood, lengthScales = trialLikelihood, trialScales
+
+    #Factorise the kernel with the chosen hyperparameters
+    logLikelihood, cholFactor, alpha = getLogLikelihood(points,stdValues,lengthScales,noise)
+
+    return {'points': points, 'values': values, 'valueMean': valueMean,
+            'valueStd': valueStd, 'lengthScales': lengthScales, 'noise': noise,
+            'logLikelihood': logLikelihood, 'cholFactor': cholFactor, 'alpha': alpha}
+
+# %% predictGaussianProcess
+
+def predictGaussianProcess(surrogate = None, newPoints = None, standardised = False):
+
+    # Predicts the mean and standard deviation of a metric from its surrogate.
+    # The standard deviation is that of the underlying metric, without the
+    # noise of the solutions.
+    #
+    # Input:    surrogate - dictionary of the fitted surrogate
+    #           newPoints - nNew x nDims numpy array of points on the unit cube
+    #           standardised - return the prediction of the standardised metric
+    #
+    # Output:   predMean - numpy array of the predicted metric values
+    #           predStd - numpy array of the predicted standard deviations
+
+    #Check for appropriate inputs
+    if surrogate is None or newPoints is None:
+        raise ValueError('A surrogate and points are needed in predictGaussianProcess')
+
+    #Predict the standardised metric
+    crossKernel = getKernel(np.atleast_2d(newPoints),surrogate['points'],surrogate['lengthScales'])
+    predMean = crossKernel @ surrogate['alpha']
+    solvedKernel = np.linalg.solve(surrogate['cholFactor'], crossKernel.T)
+    predStd = np.sqrt(np.maximum(1 - np.sum(solvedKernel**2, axis = 0), 0))
+
+    #Convert back to the metric units
+    if not standardised:
+        predMean = predMean * surrogate['valueStd'] + surrogate['valueMean']
+        predStd = predStd * surrogate['valueStd']
+
+    return predMean, predStd
+
+# %% getLooErrors
+
+def getLooErrors(surrogate = None):
+
+    # Gets the leave-one-out errors of a surrogate, i.e. the error in predicting
+    # each solved point from the others, which are found from the inverse of
+    # the kernel matrix without refitting
+    #
+    # Input:    surrogate - dictionary of the fitted surrogate
+    #
+    # Output:   looErrors - numpy array of the standardised error at each point
+
+    #Check for appropriate inputs
+    if surrogate is None:
+        raise ValueError('A surrogate is needed in getLooErrors')
+
+    #Invert the kernel matrix from its Cholesky factor
+    invFactor = np.linalg.inv(surrogate['cholFactor'])
+    invKernel = invFactor.T @ invFactor
+
+    return surrogate['alpha'] / np.diag(invKernel)
+
+# %% chooseNextPoints
+
+def chooseNextPoints(surrogates = None, candidatePoints = None, nPoints = 1, excludePoints = None):
+
+    # Chooses the next points to solve where the surrogates are most uncertain.
+    # The uncertainty of a candidate is the largest standardised standard
+    # deviation across the metrics. Points are chosen one at a time, with the
+    # uncertainty updated as if each chosen point had been solved (which
+    # doesn't depend on its value), so a batch of points is spread out rather
+    # than clustered at the same peak.
+    #
+    # Input:    surrogates - dictionary of metric name to fitted surrogate
+    #           candidatePoints - nCandidates x nDims numpy array of points on
+    #                             the unit cube to choose from
+    #           nPoints - number of points to choose
+    #           excludePoints - optional numpy array of points that have already
+    #                           been tried (e.g. failed solves), which candidates
+    #                           can't be close to
+    #
+    # Output:   nextPoints - nPoints x nDims numpy array of the chosen points
+    #           pointStd - numpy array of the uncertainty of each chosen point
+    #                      when it was chosen
+
+    #Check for appropriate inputs
+    if surrogates is None or candidatePoints is None:
+        raise ValueError('Surrogates and candidate points are needed in chooseNextPoints')
+
+    #Remove the candidates close to existing points
+    if excludePoints is not None and len(excludePoints) > 0:
+        pointDist = np.sqrt(np.maximum(np.sum(candidatePoints**2, axis = 1)[:,None] +
+                                       np.sum(excludePoints**2, axis = 1)[None,:] -
+                                       2 * candidatePoints @ excludePoints.T, 0))
+        candidatePoints = candidatePoints[np.min(pointDist, axis = 1) > minPointDistance]
+
+    #Choose the points one at a time
+    trainPoints = {metricName: surrogates[metricName]['points'] for metricName in surrogates}
+    nextPoints = []
+    pointStd = []
+    for pointNo in range(min(nPoints, len(candidatePoints))):
+
+        #Get the uncertainty of each candidate with the points chosen so far
+        candidateStd = np.zeros(len(candidatePoints))
+        for metricName in surrogates:
+            surrogate = surrogates[metricName]
+            kernel = getKernel(trainPoints[metricName],trainPoints[metricName],surrogate['lengthScales']) \
+                + surrogate['noise'] * np.eye(len(trainPoints[metricName]))
+            cholFactor = np.linalg.cholesky(kernel)
+            solvedKernel = np.linalg.solve(cholFactor,getKernel(trainPoints[metricName],candidatePoints,
+                                                                surrogate['lengthScales']))
+            candidateStd = np.maximum(candidateStd,
+                                      np.sqrt(np.maximum(1 - np.sum(solvedKernel**2, axis = 0), 0)))
+
+        #Choose the most uncertain candidate
+        bestInd = int(np.argmax(candidateStd))
+        nextPoints.append(candidatePoints[bestInd])
+        pointStd.append(candidateStd[bestInd])
+        for metricName in surrogates:
+            trainPoints[metricName] = np.vstack([trainPoints[metricName],candidatePoints[bestInd]])
+        candidatePoints = np.delete(candidatePoints, bestInd, axis = 0)
+
+    return np.array(nextPoints), np.array(pointStd)
+
+# %% loadSamplingState
+
+def loadSamplingState(samplingFile = None):
+
+    # Loads the state of an adaptive sampling run
+    #
+    # Input:    samplingFile - string of path to the sampling state .json file
+    #
+    # Output:   samplingState - dictionary of the sampling state, or None if the
+    #                           file doesn't exist
+
+    #Check for appropriate inputs
+    if samplingFile is None:
+        raise ValueError('A sampling file is needed in loadSamplingState')
+
+    #Load the file
+    if not os.path.isfile(samplingFile):
+        return None
+    with open(samplingFile,'r') as jsonFile:
+        samplingState = json.load(jsonFile)
+
+    return samplingState
+
+# %% writeSamplingState
+
+def writeSamplingState(samplingState = None, samplingFile = None):
+
+    # Writes the state of an adaptive sampling run, replacing the file in one
+    # step so that an interrupted write doesn't lose the previous state
+    #
+    # Input:    samplingState - dictionary of the sampling state
+    #           samplingFile - string of path to the sampling state .json file
+
+    #Check for appropriate inputs
+    if samplingState is None or samplingFile is None:
+        raise ValueError('A sampling state and file are needed in writeSamplingState')
+
+    #Write to a temporary file and replace
+    with open(samplingFile+'.tmp','w') as jsonFile:
+        json.dump(samplingState, jsonFile, indent = 1)
+    os.replace(samplingFile+'.tmp',samplingFile)
+
+# %% fitSurrogates
+
+def fitSurrogates(samplingState = None):
+
+    # Fits a surrogate to each metric of a sampling run from its solved points
+    #
+    # Input:    samplingState - dictionary of the sampling state
+    #
+    # Output:   surrogates - dictionary of metric name to fitted surrogate
+
+    #Check for appropriate inputs
+    if samplingState is None:
+        raise ValueError('A sampling state is needed in fitSurrogates')
+
+    #Get the solved points on the unit cube
+    solvedPoints = [point for point in samplingState['points'] if point['status'] == 'Solved']
+    unitPoints = np.array([getUnitPoint(samplingState,point['groupFactors']) for point in solvedPoints])
+
+    #Fit each metric
+    surrogates = {}
+    for metricName in samplingState['metrics']:
+        surrogates[metricName] = fitGaussianProcess(unitPoints,[point['metrics'][metricName]
+                                                                for point in solvedPoints])
+
+    return surrogates
+
+def getUnitPoint(samplingState, groupFactors):
+
+    # Maps the scale factors of a point to the unit cube
+
+    return [(groupFactors[groupLabel] - samplingState['factorBounds'][groupLabel][0]) /
+            (samplingState['factorBounds'][groupLabel][1] - samplingState['factorBounds'][groupLabel][0])
+            for groupLabel in samplingState['groupLabels']]
+
+def getGroupFactors(samplingState, unitPoint):
+
+    # Maps a point on the unit cube to the scale factors of each group
+
+    return {groupLabel: float(samplingState['factorBounds'][groupLabel][0] + unitPoint[dimInd] *
+                              (samplingState['factorBounds'][groupLabel][1] -
+                               samplingState['factorBounds'][groupLabel][0]))
+            for dimInd, groupLabel in enumerate(samplingState['groupLabels'])}
+
+# %% runAdaptiveSampling
+
+def runAdaptiveSampling(samplingFile = None, baseModelFile = None, muscToAlter = None,
+                        taskName = None, guessFile = None, meshInterval = 50,
+                        taskBounds = None, outputPath = None, boundsOfFactors = None,
+                        metricSpecs = None, nInitial = None, batchSize = None,
+                        maxSolves = 40, targetAccuracy = 0.05, seed = 0,
+                        batchSettings = None):
+
+    # Solves strength variants chosen by the surrogates of the outcome metrics.
+    # An initial Latin hypercube design (with the baseline strength as its
+    # first point) is solved, then batches of the most uncertain points are
+    # added until the largest standardised predictive standard deviation and
+    # the root mean square leave-one-out error of every metric are below the
+    # target accuracy, or the maximum number of solves is reached. Each batch
+    # is solved across a pool of worker processes (see
+    # batchHelper.runBatchSimulations), with the variant models created in
+    # memory. The run carries on from the sampling file if it exists.
+    #
+    # Input:    samplingFile - string of path to the sampling state .json file
+    #           baseModelFile - string of path to baseline model file
+    #           muscToAlter - list of lists of muscle names in each group
+    #           taskName - string of relevant task name options
+    #           guessFile - string of path to guess file
+    #           meshInterval - number of mesh intervals for the solver
+    #           taskBounds - list of the elevation, rotation and angle task
+    #                        bound dataframes (see osimHelper.loadTaskBounds)
+    #           outputPath - string of path to write solutions to
+    #           boundsOfFactors - (lower, upper) bounds of the scale factors of
+    #                             every group, or a dictionary of group label to
+    #                             bounds (default uses factorBounds)
+    #           metricSpecs - dictionary of metric name to metric specification
+    #                         (default uses surrogateMetrics)
+    #           nInitial - number of points in the initial design (default is
+    #                      twice the number of groups plus one)
+    #           batchSize - number of points to solve in each batch (default is
+    #                       the number of worker processes)
+    #           maxSolves - maximum number of points to solve
+    #           targetAccuracy - target standardised accuracy of the surrogates
+    #           seed - random seed for the design and candidate points
+    #           batchSettings - optional dictionary of further keyword arguments
+    #                           for batchHelper.runBatchSimulations
+    #
+    # Output:   samplingState - dictionary of the sampling state
+
+    #Check for appropriate inputs
+    if samplingFile is None or baseModelFile is None or muscToAlter is None or taskName is None \
+        or guessFile is None or taskBounds is None or outputPath is None:
+        raise ValueError('Sampling file, baseline model, muscle groups, task name, guess file, task bounds and output path are needed in runAdaptiveSampling')
+
+    #Set the defaults
+    if boundsOfFactors is None:
+        boundsOfFactors = factorBounds
+    if metricSpecs is None:
+        metricSpecs = surrogateMetrics
+    if batchSettings is None:
+        batchSettings = {}
+    groupLabels = ['_'.join(muscleGroup) for muscleGroup in muscToAlter]
+    if nInitial is None:
+        nInitial = 2 * len(groupLabels) + 1
+    if batchSize is None:
+        batchSize = batchSettings.get('nProcesses')
+    if batchSize is None:
+        batchSize = max(1, mp.cpu_count() // batchSettings.get('threadsPerWorker', 1))
+
+    #Create the output directory if needed
+    if not os.path.isdir(outputPath):
+        os.makedirs(outputPath)
+
+    #Load the state of a previous run, or start a new one
+    samplingState = loadSamplingState(samplingFile)
+    if samplingState is None:
+        if not isinstance(boundsOfFactors, dict):
+            boundsOfFactors = {groupLabel: list(boundsOfFactors) for groupLabel in groupLabels}
+        samplingState = {'taskName': taskName, 'groupLabels': groupLabels,
+                         'factorBounds': {groupLabel: [float(bound) for bound in boundsOfFactors[groupLabel]]
+                                          for groupLabel in groupLabels},
+                         'metrics': metricSpecs, 'seed': seed, 'points': [],
+                         'history': [], 'stopReason': None}
+    elif samplingState['groupLabels'] != groupLabels or samplingState['metrics'] != metricSpecs:
+        raise ValueError('The muscle groups and metrics need to match the existing run in '+samplingFile)
+    samplingState['stopReason'] = None
+
+    #Create the candidate points once, so that a resumed run chooses the same points
+    rng = np.random.RandomState(samplingState['seed'] + 1)
+    candidatePoints = rng.uniform(size = (nCandidates,len(groupLabels)))
+
+    while True:
+
+        #Solve any points from an interrupted batch first
+        newPoints = [point for point in samplingState['points'] if point['status'] == 'Pending']
+        if len(newPoints) == 0:
+
+            #Add the initial design, starting with the baseline strength
+            if len(samplingState['points']) < nInitial:
+                basePoint = np.clip(getUnitPoint(samplingState,{groupLabel: 1.0 for groupLabel in groupLabels}),0,1)
+                designPoints = np.vstack([basePoint,getDesignPoints(nInitial-1,len(groupLabels),
+                                                                    samplingState['seed'])])
+                nextPoints = designPoints[len(samplingState['points']):]
+
+            elif len([point for point in samplingState['points'] if point['status'] == 'Solved']) < 3:
+
+                #Add more design points while too few have solved to fit the
+                #surrogates, or stop if there are no solves left. The extra
+                #points are seeded by the number of points so far, so that a
+                #resumed run adds the same points.
+                if len(samplingState['points']) >= maxSolves:
+                    samplingState['stopReason'] = 'Too few solved points to fit the surrogates'
+                    writeSamplingState(samplingState,samplingFile)
+                    print(samplingState['stopReason'])
+                    break
+                nextPoints = getDesignPoints(min(batchSize, maxSolves - len(samplingState['points'])),
+                                             len(groupLabels),samplingState['seed'] + len(samplingState['points']))
+
+            else:
+
+                #Fit the surrogates to the solved points
+                surrogates = fitSurrogates(samplingState)
+
+                #Check the accuracy of each surrogate
+                roundInfo = {'nSolved': len([point for point in samplingState['points']
+                                             if point['status'] == 'Solved']),
+                             'nPoints': len(samplingState['points']), 'time': time.time()}
+                for metricName in surrogates:
+                    roundInfo[metricName+'_maxStd'] = float(np.max(predictGaussianProcess(
+                        surrogates[metricName],candidatePoints,standardised = True)[1]))
+                    roundInfo[metricName+'_looError'] = float(np.sqrt(np.mean(getLooErrors(surrogates[metricName])**2)))
+                samplingState['history'].append(roundInfo)
+                print('Surrogate accuracy after '+str(roundInfo['nSolved'])+' solves: '+
+                      ', '.join([metricName+' std '+str(round(roundInfo[metricName+'_maxStd'],3))+
+                                 ' loo '+str(round(roundInfo[metricName+'_looError'],3))
+                                 for metricName in surrogates]))
+
+                #Stop at the target accuracy or maximum number of solves
+                if all([roundInfo[metricName+'_maxStd'] < targetAccuracy and
+                        roundInfo[metricName+'_looError'] < targetAccuracy for metricName in surrogates]):
+                    samplingState['stopReason'] = 'Target accuracy reached'
+                elif len(samplingState['points']) >= maxSolves:
+                    samplingState['stopReason'] = 'Maximum number of solves reached'
+                if samplingState['stopReason'] is not None:
+                    writeSamplingState(samplingState,samplingFile)
+                    print(samplingState['stopReason'])
+                    break
+
+                #Choose the next points away from all of the points tried so far
+                triedPoints = np.array([getUnitPoint(samplingState,point['groupFactors'])
+                                        for point in samplingState['points']])
+                nextPoints = chooseNextPoints(surrogates,candidatePoints,
+                                              min(batchSize, maxSolves - len(samplingState['points'])),
+                                              triedPoints)[0]
+
+            #Add the new points to the state
+            for unitPoint in nextPoints:
+                newPoints.append({'name': None, 'groupFactors': getGroupFactors(samplingState,unitPoint),
+                                  'status': 'Pending', 'solutionFile': None, 'metrics': None})
+            samplingState['points'].extend(newPoints)
+
+        #Create the variant specifications of the new points
+        variantSpecs = modelHelper.getCombinedVariantSpecs(baseModelFile,muscToAlter,
+                                                           [point['groupFactors'] for point in newPoints])
+        for point, variantSpec in zip(newPoints, variantSpecs):
+            point['name'] = variantSpec['name']
+        writeSamplingState(samplingState,samplingFile)
+
+        #Solve the new points
+        print('Solving '+str(len(variantSpecs))+' sampled variants')
+        batchSummary = batchHelper.runBatchSimulations(variantSpecs,taskName,guessFile,meshInterval,
+                                                       taskBounds,outputPath,**batchSettings)
+        batchSummary = batchSummary.set_index('variant')
+
+        #Get the metrics of the solved points
+        for point in newPoints:
+            summary = batchSummary.loc[point['name']]
+            point['status'] = 'Failed'
+            if summary['success'] == True:
+                try:
+                    point['metrics'] = getSolutionMetrics(summary['solutionFile'],samplingState['metrics'])
+                    point['solutionFile'] = summary['solutionFile']
+                    point['status'] = 'Solved'
+                except Exception as err:
+                    print('Could not get the metrics of '+point['name']+': '+repr(err))
+        writeSamplingState(samplingState,samplingFile)
+
+    return samplingState
+
+# %% getSurrogateEffects
+
+def getSurrogateEffects(samplingState = None, nPoints = 21):
+
+    # Predicts the effect of each muscle group on each metric from the
+    # surrogates, by varying the scale factor of one group across its bounds
+    # with the other groups at the baseline strength
+    #
+    # Input:    samplingState - dictionary of the sampling state
+    #           nPoints - number of scale factors across the bounds of each group
+    #
+    # Output:   surrogateEffects - pandas dataframe of the predicted mean and
+    #                              standard deviation of each metric against the
+    #                              scale factor of each group
+
+    #Check for appropriate inputs
+    if samplingState is None:
+        raise ValueError('A sampling state is needed in getSurrogateEffects')
+
+    #Fit the surrogates
+    surrogates = fitSurrogates(samplingState)
+
+    #Vary each group from the baseline strength
+    basePoint = np.clip(getUnitPoint(samplingState,{groupLabel: 1.0 for groupLabel in samplingState['groupLabels']}),0,1)
+    effectList = []
+    for dimInd, groupLabel in enumerate(samplingState['groupLabels']):
+        unitPoints = np.tile(basePoint, (nPoints,1))
+        unitPoints[:,dimInd] = np.linspace(0, 1, nPoints)
+        scaleFactors = [getGroupFactors(samplingState,unitPoint)[groupLabel] for unitPoint in unitPoints]
+        for metricName in surrogates:
+            predMean, predStd = predictGaussianProcess(surrogates[metricName],unitPoints)
+            effectList.append(pd.DataFrame({'metric': metricName, 'muscleGroup': groupLabel,
+                                            'scaleFactor': scaleFactors, 'mean': predMean,
+                                            'std': predStd}))
+
+    return pd.concat(effectList, ignore_index = True)
+
+# %%
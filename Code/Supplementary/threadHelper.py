@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a function for capping the number of threads the numerical
+libraries (BLAS/LAPACK and OpenMP) can start. Functions defined here include:
+
+    setThreadLimits         sets the thread limits of the numerical libraries
+                            in the current process
+
+The libraries read their thread limits from environment variables when they are
+first loaded, and worker processes started by forking inherit the thread pools
+of their parent. The limits therefore need to be set before numpy or pandas are
+imported, which is why this file only imports os and the entry scripts import
+it before the other helper functions, e.g.:
+
+    import threadHelper
+    threadHelper.setThreadLimits(threadsPerWorker)
+    import batchHelper
+
+If threadpoolctl is installed, the limits are also applied to any of the
+libraries that are already loaded (e.g. when numpy has been imported by the
+console before a script is run).
+
+"""
+
+# %% Import packages
+
+import os
+
+# %% Settings
+
+#Environment variables that control the thread pools of the numerical libraries
+#(BLAS/LAPACK and OpenMP). The CasADi parallel evaluations in Moco are set
+#separately through OPENSIM_MOCO_PARALLEL (see batchHelper.limitWorkerThreads).
+threadEnvVars = ['OMP_NUM_THREADS',
+                 'OPENBLAS_NUM_THREADS',
+                 'MKL_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS',
+                 'NUMEXPR_NUM_THREADS']
+
+# %% setThreadLimits
+
+def setThreadLimits(nThreads = 1):
+
+    # Sets the thread limits of the numerical libraries in the current process.
+    # The environment variables are set for the libraries that haven't been
+    # loaded yet (including those of processes started from this one), and the
+    # thread pools of the libraries that are already loaded are resized if
+    # threadpoolctl is available.
+    #
+    # Input:    nThreads - number of threads the libraries can use
+
+    #Check for appropriate inputs
+    if nThreads is None or nThreads < 1:
+        raise ValueError('At least one thread is needed in setThreadLimits')
+
+    #Set each of the thread environment variables
+    for envVar in threadEnvVars:
+        os.environ[envVar] = str(nThreads)
+
+    #Resize the thread pools of the libraries that are already loaded
+    try:
+        import threadpoolctl
+    except ImportError:
+        return
+    threadpoolctl.threadpool_limits(limits = int(nThreads))
+
+# %%
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for tuning the solver configuration to the
+machine it runs on. Short probes of the task problem, stopped after a set number
+of iterations, are solved with different CasADi parallel evaluation settings,
+finite difference schemes and IPOPT linear solvers, and then with different
+splits of the CPUs between worker processes and threads per worker. The
+configuration with the highest throughput (IPOPT iterations per second across
+all of the workers) is saved against a fingerprint of the host hardware, and
+applied automatically by the batch runners on later runs (see batchHelper).
+Functions defined here include:
+
+    getHostFingerprint      gets a fingerprint of the host hardware
+
+    getThreadSplits         lists the splits of the CPUs between worker
+                            processes and threads per worker
+
+    runTuneProbe            solves a single truncated probe of the task problem
+                            (used by the worker processes)
+
+    runProbeConfig          solves a probe in each worker process of a
+                            configuration and calculates its throughput
+
+    autotuneSolver          finds and saves the fastest configuration for the
+                            current host
+
+    loadTunedConfig         loads the saved configuration for the current host
+
+    getTunedRunSettings     merges the saved configuration for the current host
+                            into the settings of a batch run
+
+The tuned configurations are saved in a .json file keyed by the host
+fingerprint, so a single file can be shared between the nodes of a cluster.
+
+Note that opensim is only imported within the worker function, so that the
+thread limits are in the worker environment before it is loaded (see
+threadHelper for the limits of numpy and pandas).
+
+"""
+
+# %% Import packages
+
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import tempfile
+import time
+import traceback
+
+# %% Settings
+
+#Default file to save the tuned configurations to
+defaultTuneFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..',
+                               'Benchmarks','solverTuning.json')
+
+#Options to probe. Parallel evaluations are either off, or use the threads of
+#each worker. Linear solvers that aren't available in the IPOPT build fail
+#their probe and are skipped.
+tuneOptions = {'parallel': [True, False],
+               'optim_finite_difference_scheme': ['central','forward'],
+               'linear_solver': ['mumps','ma27','ma57','ma86','ma97']}
+
+#Number of IPOPT iterations to run in each probe
+probeIterations = 30
+
+# %% getHostFingerprint
+
+def getHostFingerprint():
+
+    # Gets a fingerprint of the host hardware and software, so that nodes with
+    # the same setup share a tuned configuration. The host name isn't included.
+    #
+    # Output:   fingerprint - string of the fingerprint hash
+    #           hostInfo - dictionary of the details the fingerprint is made from
+
+    #Get the processor model, which platform doesn't report on Linux
+    processor = platform.processor()
+    if os.path.isfile('/proc/cpuinfo'):
+        with open('/proc/cpuinfo','r') as cpuFile:
+            for line in cpuFile:
+                if line.startswith('model name'):
+                    processor = line.split(':',1)[1].strip()
+                    break
+
+    #Get the total memory where available
+    try:
+        totalMemoryGB = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024**3)
+    except (AttributeError, ValueError, OSError):
+        totalMemoryGB = None
+
+    #Create the fingerprint
+    hostInfo = {'system': platform.system(),
+                'machine': platform.machine(),
+                'processor': processor,
+                'cpuCount': mp.cpu_count(),
+                'totalMemoryGB': totalMemoryGB,
+                'python': platform.python_version()}
+    fingerprint = hashlib.sha1(json.dumps(hostInfo, sort_keys = True).encode()).hexdigest()[:16]
+
+    return fingerprint, hostInfo
+
+# %% getThreadSplits
+
+def getThreadSplits(nCpus = None):
+
+    # Lists the splits of the CPUs between worker processes and threads per
+    # worker, with the threads per worker in powers of two
+    #
+    # Input:    nCpus - number of CPUs to split (default is the CPU count)
+    #
+    # Output:   threadSplits - list of (nProcesses, threadsPerWorker) tuples
+
+    #Set the number of CPUs if not specified
+    if nCpus is None:
+        nCpus = mp.cpu_count()
+
+    #Create the splits
+    threadCounts = [2**ind for ind in range(nCpus.bit_length()) if 2**ind <= nCpus]
+    if nCpus not in threadCounts:
+        threadCounts.append(nCpus)
+
+    return [(nCpus // nThreads, nThreads) for nThreads in threadCounts]
+
+# %% runTuneProbe
+
+def runTuneProbe(probeSettings = None):
+
+    # Worker function for solving a truncated probe of the task problem. The
+    # solve is stopped after the probe iterations, so it isn't expected to
+    # converge.
+    #
+    # Input:    probeSettings - dictionary of the benchmark case to probe (see
+    #                           benchmarkHelper.createBenchmarkStudy) with:
+    #               ipoptOptions - dictionary of IPOPT options to solve with
+    #
+    # Output:   probeResult - dictionary of the iterations and solve time
+
+    #Check for appropriate inputs
+    if probeSettings is None:
+        raise ValueError('Probe settings are needed in runTuneProbe')
+
+    probeResult = {'workerPid': os.getpid()}
+    try:
+
+        #Import opensim and the helper functions within the worker, after the
+        #thread limits have been set in the environment
+        import benchmarkHelper
+        import cacheHelper
+
+        #Create and solve the probe
+        study, guessFile = benchmarkHelper.createBenchmarkStudy(probeSettings)
+        solutionPath = tempfile.mkdtemp()
+        solution, solveInfo = cacheHelper.solveStudy(study,os.path.join(solutionPath,'probe_solution.sto'),
+                                                     ipoptOptions = probeSettings['ipoptOptions'])
+        os.remove(os.path.join(solutionPath,'probe_solution.sto'))
+        os.rmdir(solutionPath)
+        probeResult.update({'numIterations': solveInfo['numIterations'],
+                            'solverDuration': solveInfo['solverDuration'],
+                            'status': solveInfo['status']})
+
+    except Exception as err:
+
+        #Record the error for the probe
+        probeResult.update({'numIterations': 0, 'solverDuration': None, 'status': 'Error',
+                            'errorMessage': repr(err)+'\n'+traceback.format_exc()})
+
+    return probeResult
+
+# %% runProbeConfig
+
+def runProbeConfig(probeConfig = None, caseSettings = None):
+
+    # Solves a probe in each worker process of a configuration at the same time,
+    # so that the throughput includes any contention between the workers
+    #
+    # Input:    probeConfig - dictionary of the configuration, containing
+    #                         nProcesses, threadsPerWorker, parallel,
+    #                         optim_finite_difference_scheme and linear_solver
+    #           caseSettings - dictionary of the benchmark case to probe (see
+    #                          benchmarkHelper.createBenchmarkStudy)
+    #
+    # Output:   configResult - dictionary of the configuration and its
+    #                          throughput in iterations per second (0 if any
+    #                          of the probes failed)
+
+    #Check for appropriate inputs
+    if probeConfig is None or caseSettings is None:
+        raise ValueError('A probe configuration and case settings are needed in runProbeConfig')
+
+    #Import the thread limits from the batch functions
+    import batchHelper
+    import osimHelper
+
+    #Set the probe settings
+    probeSettings = dict(caseSettings)
+    probeSettings['solverSettings'] = dict(caseSettings.get('solverSettings') or {})
+    probeSettings['solverSettings'].update({'optim_max_iterations': probeIterations,
+                                            'optim_finite_difference_scheme': probeConfig['optim_finite_difference_scheme'],
+                                            'parallel': osimHelper.getMocoParallel(probeConfig['threadsPerWorker'])
+                                            if probeConfig['parallel'] else 0})
+    probeSettings['ipoptOptions'] = {'linear_solver': probeConfig['linear_solver']}
+
+    #Solve the probes across the pool
+    batchHelper.limitWorkerThreads(probeConfig['threadsPerWorker'])
+    with mp.Pool(processes = probeConfig['nProcesses'], initializer = batchHelper.limitWorkerThreads,
+                 initargs = (probeConfig['threadsPerWorker'],), maxtasksperchild = 1) as pool:
+        probeResults = pool.map(runTuneProbe, [probeSettings]*probeConfig['nProcesses'], chunksize = 1)
+
+    #Calculate the throughput across the workers
+    configResult = dict(probeConfig)
+    if all([probeResult['numIterations'] > 0 and probeResult['solverDuration'] for probeResult in probeResults]):
+        configResult['throughput'] = sum([probeResult['numIterations'] / probeResult['solverDuration']
+                                          for probeResult in probeResults])
+    else:
+        configResult['throughput'] = 0.0
+        configResult['errorMessage'] = [probeResult.get('errorMessage') for probeResult in probeResults
+                                        if probeResult.get('errorMessage') is not None][:1]
+
+    print('Probed '+', '.join([key+' = '+str(probeConfig[key]) for key in probeConfig])+
+          ': '+str(round(configResult['throughput'],2))+' iterations/s')
+
+    return configResult
+
+# %% autotuneSolver
+
+def autotuneSolver(taskName = None, modelFile = None, guessFile = None, dataPath = None,
+                   meshInterval = 50, tuneFile = None, options = None, threadSplits = None):
+
+    # Finds the fastest solver configuration for the current host and saves it
+    # to the tune file. The solver options are probed with a single worker
+    # using all of the CPUs, and the process and thread splits are then probed
+    # with the fastest options. Each probe runs in fresh worker processes so
+    # the thread limits are applied before opensim is loaded.
+    #
+    # Input:    taskName - string of relevant task name options
+    #           modelFile - string of path to the model file to probe with
+    #           guessFile - string of path to the guess file to probe from
+    #           dataPath - string of path to supporting data directory
+    #           meshInterval - number of mesh intervals for the probes
+    #           tuneFile - string of path to the tune .json file (default uses
+    #                      defaultTuneFile)
+    #           options - dictionary of the options to probe (default uses
+    #                     tuneOptions)
+    #           threadSplits - list of (nProcesses, threadsPerWorker) tuples to
+    #                          probe (default uses getThreadSplits)
+    #
+    # Output:   tunedConfig - dictionary of the fastest configuration and the
+    #                         results of each probe
+
+    #Check for appropriate inputs
+    if taskName is None or modelFile is None or guessFile is None or dataPath is None:
+        raise ValueError('Task name, model file, guess file and data path are needed in autotuneSolver')
+
+    #Set the defaults
+    if tuneFile is None:
+        tuneFile = defaultTuneFile
+    if options is None:
+        options = tuneOptions
+    if threadSplits is None:
+        threadSplits = getThreadSplits()
+
+    #Set the case to probe
+    caseSettings = {'name': taskName+'_probe', 'problem': taskName, 'meshInterval': meshInterval,
+                    'modelFile': modelFile, 'guessFile': guessFile, 'dataPath': dataPath}
+
+    #Probe the solver options with a single worker
+    nCpus = max([nProcesses * nThreads for nProcesses, nThreads in threadSplits])
+    optionNames = list(options.keys())
+    probeList = []
+    for optionValues in itertools.product(*[options[optionName] for optionName in optionNames]):
+        probeConfig = {'nProcesses': 1, 'threadsPerWorker': nCpus}
+        probeConfig.update(dict(zip(optionNames,optionValues)))
+        probeList.append(runProbeConfig(probeConfig,caseSettings))
+    bestOptions = max(probeList, key = lambda probeResult: probeResult['throughput'])
+    if bestOptions['throughput'] == 0:
+        raise ValueError('All of the solver option probes failed in autotuneSolver: '+str(bestOptions['errorMessage']))
+
+    #Probe the process and thread splits with the fastest options
+    for nProcesses, nThreads in threadSplits:
+        if (nProcesses, nThreads) == (1, nCpus):
+            continue
+        probeConfig = {'nProcesses': nProcesses, 'threadsPerWorker': nThreads}
+        probeConfig.update({optionName: bestOptions[optionName] for optionName in optionNames})
+        probeList.append(runProbeConfig(probeConfig,caseSettings))
+    bestConfig = max(probeList, key = lambda probeResult: probeResult['throughput'])
+
+    #Create the tuned configuration
+    fingerprint, hostInfo = getHostFingerprint()
+    #Save the Moco parallel setting of the fastest configuration as an
+    #explicit thread count (see osimHelper.getMocoParallel)
+    import osimHelper
+    solverSettings = {'optim_finite_difference_scheme': bestConfig['optim_finite_difference_scheme'],
+                      'parallel': osimHelper.getMocoParallel(bestConfig['threadsPerWorker'])
+                      if bestConfig['parallel'] else 0}
+    tunedConfig = {'hostInfo': hostInfo,
+                   'nProcesses': bestConfig['nProcesses'],
+                   'threadsPerWorker': bestConfig['threadsPerWorker'],
+                   'solverSettings': solverSettings,
+                   'ipoptOptions': {'linear_solver': bestConfig['linear_solver']},
+                   'throughput': bestConfig['throughput'],
+                   'probes': probeList,
+                   'created': time.time()}
+
+    #Add the configuration to the tune file, keeping the other hosts
+    import cacheHelper
+    if not os.path.isdir(os.path.dirname(os.path.abspath(tuneFile))):
+        os.makedirs(os.path.dirname(os.path.abspath(tuneFile)))
+    with cacheHelper.lockFile(tuneFile+'.lock'):
+        tunedConfigs = {}
+        if os.path.isfile(tuneFile):
+            with open(tuneFile,'r') as jsonFile:
+                tunedConfigs = json.load(jsonFile)
+        tunedConfigs[fingerprint] = tunedConfig
+        tempFile = tuneFile+'.tmp'
+        with open(tempFile,'w') as jsonFile:
+            json.dump(tunedConfigs, jsonFile, indent = 1)
+        os.replace(tempFile,tuneFile)
+
+    return tunedConfig
+
+# %% loadTunedConfig
+
+def loadTunedConfig(tuneFile = None):
+
+    # Loads the saved configuration for the current host
+    #
+    # Input:    tuneFile - string of path to the tune .json file (default uses
+    #                      defaultTuneFile)
+    #
+    # Output:   tunedConfig - dictionary of the tuned configuration (None if
+    #                         the host hasn't been tuned)
+
+    #Set the default tune file
+    if tuneFile is None:
+        tuneFile = defaultTuneFile
+
+    #Return nothing if there is no tune file
+    if not os.path.isfile(tuneFile):
+        return None
+
+    #Get the configuration for the host
+    with open(tuneFile,'r') as jsonFile:
+        tunedConfigs = json.load(jsonFile)
+    fingerprint, hostInfo = getHostFingerprint()
+
+    return tunedConfigs.get(fingerprint)
+
+# %% getTunedRunSettings
+
+def getTunedRunSettings(nProcesses = None, threadsPerWorker = 1, solverSettings = None,
+                        ipoptOptions = None, tuneFile = None):
+
+    # Merges the saved configuration for the current host into the settings of
+    # a batch run. Settings given explicitly take priority, and the process and
+    # thread split is only applied if the number of processes isn't given.
+    #
+    # Input:    nProcesses - number of worker processes (None uses the tuned split)
+    #           threadsPerWorker - number of threads each worker can use
+    #           solverSettings - optional dictionary of solver settings
+    #           ipoptOptions - optional dictionary of IPOPT options
+    #           tuneFile - string of path to the tune .json file (default uses
+    #                      defaultTuneFile)
+    #
+    # Output:   nProcesses, threadsPerWorker, solverSettings, ipoptOptions -
+    #           the settings with the tuned configuration applied
+
+    #Get the configuration for the host
+    tunedConfig = loadTunedConfig(tuneFile)
+    if tunedConfig is None:
+        return nProcesses, threadsPerWorker, solverSettings, ipoptOptions
+    print('Using tuned solver configuration for this host ('+str(round(tunedConfig['throughput'],2))+
+          ' iterations/s when tuned)')
+
+    #Apply the process and thread split
+    if nProcesses is None:
+        nProcesses = tunedConfig['nProcesses']
+        threadsPerWorker = tunedConfig['threadsPerWorker']
+
+    #Merge the solver settings and IPOPT options
+    mergedSettings = dict(tunedConfig['solverSettings'])
+    mergedSettings.update(solverSettings or {})
+    mergedOptions = dict(tunedConfig['ipoptOptions'])
+    mergedOptions.update(ipoptOptions or {})
+
+    return nProcesses, threadsPerWorker, mergedSettings, mergedOptions
+
+# %%
@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for checking that the simulation solutions
+of a sweep are dynamically consistent, by replaying the solved controls in a
+forward simulation of the processed model of each variant from the solved
+initial state (see opensim.simulateIterateWithTimeStepping). The integrated
+states are compared against the solved states, and the final marker positions
+against the marker end point targets of the task (see
+osimHelper.getMarkerEndPointGoals). Functions defined here include:
+
+    getValidationHash       creates the hash identifying the validation of a
+                            solution with its model and settings
+
+    getCachedValidation     loads a cached validation result for a hash
+
+    addCachedValidation     adds a validation result to the cache
+
+    calcTrackingErrors      calculates the errors between integrated and solved
+                            states for each type of state
+
+    runSolutionValidation   forward simulates a single solution and measures its
+                            errors (used by the worker processes)
+
+    runBatchValidation      spreads the validation of a list of solutions across
+                            a pool of worker processes and collects a table of
+                            the errors and integration cost
+
+The state errors are grouped by the type of state, i.e. the coordinate values
+(rad), coordinate speeds (rad/s) and muscle activations, with the RMS error
+across all time nodes and states of a type, and the largest error of any state.
+A solution is taken as consistent when its largest coordinate error and marker
+end point error (m) are within the validation tolerances. The integration cost
+is the wall time and number of steps of the forward simulation.
+
+Validation results are cached as .json files named by their hash, which covers
+the solution file, the model source, the model changes for the task and the
+validation settings. The files are written to a temporary name and renamed into
+place, so any number of processes can share the cache without needing a lock,
+and solutions that have already been validated are only integrated again if
+they have changed.
+
+Note that opensim is only imported within the worker function, so that the
+thread limits are in the worker environment before it is loaded (see
+threadHelper for the limits of numpy and pandas).
+
+"""
+
+# %% Import packages
+
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+import numpy as np
+import pandas as pd
+import batchHelper
+import osimHelper
+import profileHelper
+import resultsHelper
+import stoHelper
+
+# %% Settings
+
+#Accuracy of the integrator used for the forward simulations
+integratorAccuracy = 1e-4
+
+#State name suffixes for each type of state
+stateTypes = {'value': '/value',
+              'speed': '/speed',
+              'activation': '/activation'}
+
+#Largest coordinate value error (rad) and marker end point error (m) for a
+#solution to be taken as consistent
+validationTolerances = {'value': 0.05,
+                        'markerEndPoint': 0.02}
+
+#Prefix of the validation result files in the cache directory
+validationCachePrefix = 'validation_'
+
+# %% getValidationHash
+
+def getValidationHash(solutionFile = None, modelFile = None, taskName = None,
+                      validationSettings = None):
+
+    # Creates the hash identifying the validation of a solution, from the
+    # solution file, the model source and the model changes for the task, and
+    # the validation settings
+    #
+    # Input:    solutionFile - string of path to the solution file
+    #           modelFile - string of path to the variant model file, or a
+    #                       variant specification dictionary
+    #           taskName - string of relevant task name options
+    #           validationSettings - optional dictionary of the settings that
+    #                                change the validation (e.g. the integrator
+    #                                accuracy)
+    #
+    # Output:   validationHash - string of SHA-256 hex digest
+
+    #Check for appropriate inputs
+    if solutionFile is None or modelFile is None or taskName is None:
+        raise ValueError('A solution file, model file and task name are needed in getValidationHash')
+
+    #Add the solution file
+    validationHash = hashlib.sha256()
+    with open(solutionFile,'rb') as stoFile:
+        validationHash.update(stoFile.read())
+
+    #Add the model source, reading model files as the variant models can be
+    #regenerated under the same name
+    if isinstance(modelFile, dict):
+        validationHash.update(json.dumps(modelFile, sort_keys = True).encode())
+    else:
+        with open(modelFile,'rb') as osimFile:
+            validationHash.update(osimFile.read())
+
+    #Add the model changes and validation settings
+    validationHash.update(json.dumps({'taskName': taskName,
+                                      'modelSpec': osimHelper.getTaskModelSpec(taskName),
+                                      'validationSettings': validationSettings},
+                                     sort_keys = True).encode())
+
+    return validationHash.hexdigest()
+
+# %% getCachedValidation
+
+def getCachedValidation(cachePath = None, validationHash = None):
+
+    # Loads the cached validation result for a validation hash
+    #
+    # Input:    cachePath - string of path to the validation cache directory
+    #           validationHash - string of validation hash (see getValidationHash)
+    #
+    # Output:   validationResult - dictionary of the validation result (None
+    #                              if not in the cache)
+
+    #Check for appropriate inputs
+    if cachePath is None or validationHash is None:
+        raise ValueError('A cache path and validation hash are needed in getCachedValidation')
+
+    #Return nothing if the result isn't cached
+    cacheFile = os.path.join(cachePath,validationCachePrefix+validationHash+'.json')
+    if not os.path.isfile(cacheFile):
+        return None
+
+    #Load the result
+    with open(cacheFile,'r') as jsonFile:
+        validationResult = json.load(jsonFile)
+
+    return validationResult
+
+# %% addCachedValidation
+
+def addCachedValidation(cachePath = None, validationHash = None, validationResult = None):
+
+    # Adds a validation result to the cache
+    #
+    # Input:    cachePath - string of path to the validation cache directory
+    #           validationHash - string of validation hash (see getValidationHash)
+    #           validationResult - dictionary of the validation result
+
+    #Check for appropriate inputs
+    if cachePath is None or validationHash is None or validationResult is None:
+        raise ValueError('A cache path, validation hash and result are needed in addCachedValidation')
+
+    #Create the cache directory if needed
+    os.makedirs(cachePath, exist_ok = True)
+
+    #Write the result to a temporary file and rename it into place
+    cacheFile = os.path.join(cachePath,validationCachePrefix+validationHash+'.json')
+    tempFile = cacheFile+'.'+str(os.getpid())+'.tmp'
+    with open(tempFile,'w') as jsonFile:
+        json.dump(validationResult, jsonFile, indent = 2)
+    os.replace(tempFile,cacheFile)
+
+# %% calcTrackingErrors
+
+def calcTrackingErrors(solvedTime = None, solvedStates = None, forwardTime = None,
+                       forwardStates = None, stateNames = None):
+
+    # Calculates the errors between the integrated and solved states. The
+    # integrated states are interpolated to the solved time nodes, and the
+    # errors are grouped by the type of state (see stateTypes).
+    #
+    # Input:    solvedTime - numpy array of the solved time nodes
+    #           solvedStates - 2D numpy array of the solved states, with a row
+    #                          per time node and a column per state
+    #           forwardTime - numpy array of the integrated time steps
+    #           forwardStates - 2D numpy array of the integrated states, with
+    #                           the same columns as the solved states
+    #           stateNames - list of the state names of the columns
+    #
+    # Output:   trackingErrors - dictionary of the RMS and largest error of each
+    #                            type of state (e.g. valueRmsError and
+    #                            valueMaxError), and the state with the largest
+    #                            coordinate value error
+
+    #Check for appropriate inputs
+    if solvedTime is None or solvedStates is None or forwardTime is None or \
+        forwardStates is None or stateNames is None:
+        raise ValueError('Solved and integrated times and states and the state names are needed in calcTrackingErrors')
+
+    #Interpolate the integrated states to the solved time nodes
+    stateErrors = np.column_stack([np.interp(solvedTime, forwardTime, forwardStates[:,ii])
+                                   for ii in range(len(stateNames))]) - solvedStates
+
+    #Get the errors of each type of state
+    trackingErrors = {}
+    for stateType, stateSuffix in stateTypes.items():
+        typeColumns = [ii for ii, stateName in enumerate(stateNames) if stateName.endswith(stateSuffix)]
+        if len(typeColumns) == 0:
+            trackingErrors[stateType+'RmsError'] = np.nan
+            trackingErrors[stateType+'MaxError'] = np.nan
+            continue
+        typeErrors = np.abs(stateErrors[:,typeColumns])
+        trackingErrors[stateType+'RmsError'] = float(np.sqrt(np.nanmean(typeErrors**2)))
+        trackingErrors[stateType+'MaxError'] = float(np.nanmax(typeErrors))
+        if stateType == 'value':
+            trackingErrors['worstState'] = stateNames[typeColumns[int(np.nanargmax(np.nanmax(typeErrors, axis = 0)))]]
+
+    return trackingErrors
+
+# %% runSolutionValidation
+
+def runSolutionValidation(validationSettings = None):
+
+    # Worker function for validating a single solution with the processed model
+    # of its variant. The solved controls are replayed from the solved initial
+    # state, and the integrated states and final marker positions are compared
+    # against the solution and the marker end point targets. Any errors are
+    # caught and returned so that a failed solution doesn't bring down the
+    # rest of the batch.
+    #
+    # Input:    validationSettings - dictionary containing:
+    #               solutionFile - string of path to the solution file
+    #               modelFile - string of path to the variant model file, or a
+    #                           variant specification dictionary
+    #               taskName - string of relevant task name options
+    #               modelCachePath - optional string of path to the processed
+    #                                model cache (see osimHelper.createSimModel)
+    #               landmarkCachePath - optional string of path to the model
+    #                                   landmark cache (see osimHelper.getModelLandmarks)
+    #               integratorAccuracy - accuracy of the integrator
+    #
+    # Output:   validationResult - dictionary of the solution file, the state
+    #                              tracking errors (see calcTrackingErrors), the
+    #                              end point error of each marker for the
+    #                              integrated and solved final states, the
+    #                              integration cost and any error message
+
+    #Check for appropriate inputs
+    if validationSettings is None:
+        raise ValueError('Validation settings are needed in runSolutionValidation')
+
+    #Start the timer for the validation
+    startTime = time.time()
+    validationResult = {'solutionFile': validationSettings['solutionFile'], 'errorMessage': None}
+
+    try:
+
+        #Import opensim and the helper functions within the worker, after the
+        #thread limits have been set in the environment
+        import opensim as osim
+        import modelHelper
+
+        #Create the processed model of the variant, as it was solved
+        if isinstance(validationSettings['modelFile'], dict):
+            osimModel = modelHelper.createVariantModel(validationSettings['modelFile'])
+        else:
+            osimModel = validationSettings['modelFile']
+        simModel = osimHelper.createSimModel(osimModel,validationSettings['taskName'],
+                                             modelCachePath = validationSettings.get('modelCachePath'))
+
+        #Get the marker end point targets, before the model is used for the
+        #forward simulation
+        goalSpecs = osimHelper.getMarkerEndPointGoals(validationSettings['taskName'],simModel,
+                                                      validationSettings.get('landmarkCachePath'))
+
+        #Replay the solved controls from the solved initial state. The model is
+        #copied by the simulation, which prescribes the controls to the actuators.
+        #The simulation function was renamed in later opensim versions.
+        simulateTrajectory = getattr(osim,'simulateTrajectoryWithTimeStepping',None) or \
+            osim.simulateIterateWithTimeStepping
+        trajectory = osim.MocoTrajectory(validationSettings['solutionFile'])
+        with profileHelper.profileSpan('forwardSimulation','validation'):
+            integrationStart = time.time()
+            forwardTrajectory = simulateTrajectory(trajectory,simModel,
+                                                   validationSettings['integratorAccuracy'])
+            integrationTime = time.time() - integrationStart
+
+        #Get the integrated states and the matching solved states
+        stateNames = list(forwardTrajectory.getStateNames())
+        forwardTime = forwardTrajectory.getTime().to_numpy()
+        forwardStates = forwardTrajectory.getStatesTrajectory().to_numpy()
+        header, labels, data = stoHelper.readSto(validationSettings['solutionFile'], useSidecar = False)
+        solvedTime = data[:,labels.index('time')]
+        solvedStates = data[:,[labels.index(stateName) for stateName in stateNames]]
+
+        #Compare the integrated and solved states
+        validationResult.update(calcTrackingErrors(solvedTime,solvedStates,forwardTime,
+                                                   forwardStates,stateNames))
+
+        #Get the final marker positions of the integrated and solved states
+        modelState = simModel.initSystem()
+        for finalName, finalStates in [('forward',forwardStates[-1,:]),('solved',solvedStates[-1,:])]:
+            for stateName, stateValue in zip(stateNames, finalStates):
+                simModel.setStateVariableValue(modelState, stateName, float(stateValue))
+            simModel.realizePosition(modelState)
+            markerErrors = []
+            for goalSpec in goalSpecs:
+                marker = osim.Marker.safeDownCast(simModel.getComponent(goalSpec['pointName']))
+                markerLocation = marker.getLocationInGround(modelState)
+                markerLocation = np.array([markerLocation.get(0),markerLocation.get(1),markerLocation.get(2)])
+                markerErrors.append(float(np.linalg.norm(markerLocation - np.array(goalSpec['referenceLocation']))))
+                if finalName == 'forward':
+                    validationResult[goalSpec['name']+'Error'] = markerErrors[-1]
+            validationResult[finalName+'MarkerMaxError'] = max(markerErrors) if len(markerErrors) > 0 else np.nan
+
+        #Record the integration cost
+        validationResult.update({'integrationTime': integrationTime,
+                                 'integrationSteps': len(forwardTime),
+                                 'simulatedTime': float(forwardTime[-1] - forwardTime[0])})
+
+    except Exception as err:
+
+        #Record the error for the solution
+        validationResult['errorMessage'] = repr(err)+'\n'+traceback.format_exc()
+
+    #Set the overall time for the validation
+    validationResult['wallTime'] = time.time() - startTime
+
+    #Record the validation in the profile and write out the spans of the worker
+    profileHelper.addSpan('runSolutionValidation','job',startTime,validationResult['wallTime'],
+                          {'solutionFile': os.path.basename(validationSettings['solutionFile'])})
+    profileHelper.flushTrace()
+
+    return validationResult
+
+# %% runBatchValidation
+
+def runBatchValidation(solutionFiles = None, modelSources = None, taskName = None,
+                       cachePath = None, nProcesses = None, threadsPerWorker = 1,
+                       modelCachePath = None, accuracy = None, summaryFile = None):
+
+    # Spreads the validation of a list of solutions across a pool of worker
+    # processes. Solutions with a cached validation result are not integrated
+    # again, so re-running the validation as a sweep progresses only integrates
+    # the new or changed solutions.
+    #
+    # Input:    solutionFiles - list of strings of paths to solution files
+    #           modelSources - dictionary of variant name to model source (see
+    #                          analysisHelper.getVariantModelSources)
+    #           taskName - string of relevant task name options
+    #           cachePath - optional string of path to the validation cache
+    #                       directory, which also holds the model landmarks
+    #           nProcesses - number of worker processes (default is the number
+    #                        of CPUs divided by the threads per worker)
+    #           threadsPerWorker - number of threads each worker can use
+    #           modelCachePath - optional string of path to the processed model
+    #                            cache (see osimHelper.createSimModel)
+    #           accuracy - accuracy of the integrator (default uses
+    #                      integratorAccuracy)
+    #           summaryFile - optional string of path for a .csv file of the
+    #                         validation table
+    #
+    # Output:   validationTable - pandas dataframe with a row per solution of
+    #                             its details, errors, integration cost and
+    #                             whether it is consistent
+    #           errorList - list of (solution file, error message) tuples of
+    #                       the solutions that couldn't be validated
+
+    #Check for appropriate inputs
+    if solutionFiles is None or modelSources is None or taskName is None:
+        raise ValueError('Solution files, model sources and task name are needed in runBatchValidation')
+
+    #Set the defaults
+    if accuracy is None:
+        accuracy = integratorAccuracy
+
+    #Create the settings for each solution, matching it to its model and
+    #taking the results already in the cache
+    jobList = []
+    errorList = []
+    validationResults = []
+    validationHashes = {}
+    for solutionFile in solutionFiles:
+        solutionFile = os.path.abspath(solutionFile)
+        solutionInfo = resultsHelper.getSolutionInfo(solutionFile,taskName)
+        if solutionInfo['muscleGroup'] == 'Baseline':
+            modelFile = modelSources.get('Baseline')
+        else:
+            modelFile = modelSources.get(solutionInfo['variant'])
+        if modelFile is None:
+            errorList.append((solutionFile,'No model found for variant '+solutionInfo['variant']))
+            continue
+        if cachePath is not None:
+            validationHash = getValidationHash(solutionFile,modelFile,taskName,
+                                               {'integratorAccuracy': accuracy})
+            validationResult = getCachedValidation(cachePath,validationHash)
+            if validationResult is not None:
+                validationResult.update({'solutionFile': solutionFile, 'cached': True})
+                validationResults.append(validationResult)
+                continue
+            validationHashes[solutionFile] = validationHash
+        jobList.append({'solutionFile': solutionFile, 'modelFile': modelFile,
+                        'taskName': taskName, 'modelCachePath': modelCachePath,
+                        'landmarkCachePath': cachePath, 'integratorAccuracy': accuracy})
+    print(str(len(jobList))+' solutions to validate ('+str(len(validationResults))+' cached)')
+
+    #Run the validations across the pool
+    if len(jobList) > 0:
+
+        #Set the number of processes if not specified
+        if nProcesses is None:
+            nProcesses = max(1, mp.cpu_count() // threadsPerWorker)
+        nProcesses = max(1, min(nProcesses, len(jobList)))
+
+        #Set the thread limits in the current environment
+        batchHelper.limitWorkerThreads(threadsPerWorker)
+
+        #Validate the solutions, caching the results as they finish
+        batchStart = time.time()
+        with mp.Pool(processes = nProcesses, initializer = batchHelper.limitWorkerThreads,
+                     initargs = (threadsPerWorker,)) as pool:
+            for nFinished, validationResult in enumerate(pool.imap_unordered(runSolutionValidation, jobList,
+                                                                             chunksize = 1), 1):
+                if validationResult['errorMessage'] is not None:
+                    errorList.append((validationResult['solutionFile'],validationResult['errorMessage']))
+                else:
+                    if cachePath is not None:
+                        addCachedValidation(cachePath,validationHashes[validationResult['solutionFile']],
+                                            validationResult)
+                    validationResult['cached'] = False
+                    validationResults.append(validationResult)
+                print('Validated '+os.path.basename(validationResult['solutionFile'])+' in '+
+                      str(round(validationResult['wallTime'],1))+' s ['+str(nFinished)+'/'+
+                      str(len(jobList))+' after '+str(round(time.time()-batchStart,1))+' s]')
+
+    #Print any errors
+    for solutionFile, errorMessage in errorList:
+        print('Could not validate '+solutionFile+': '+errorMessage.splitlines()[0])
+
+    #Collect the results with the solution details, and check them against the
+    #tolerances
+    validationTable = pd.DataFrame([dict(resultsHelper.getSolutionInfo(validationResult['solutionFile'],taskName),
+                                         **validationResult) for validationResult in validationResults])
+    if len(validationTable) > 0:
+        validationTable = validationTable.drop(columns = ['errorMessage'])
+        validationTable['isConsistent'] = (validationTable['valueMaxError'] <= validationTolerances['value']) & \
+            (validationTable['forwardMarkerMaxError'] <= validationTolerances['markerEndPoint'])
+        validationTable = validationTable.sort_values(['muscleGroup','scaleFactor','nodes']).reset_index(drop = True)
+
+    #Write the table
+    if summaryFile is not None:
+        validationTable.to_csv(summaryFile, index = False)
+
+    return validationTable, errorList
+
+# %%
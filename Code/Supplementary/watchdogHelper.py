@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Code includes a series of functions for watching the progress of a Moco solve
+and stopping it early when it is unlikely to converge. The study is solved in a
+separate python process with its output written to a log file, and the IPOPT
+iteration lines in the log are read as the solve runs. The solve is stopped if
+any of the watchdog rules are broken. Functions defined here include:
+
+    parseIpoptLog           reads the IPOPT iteration lines from a solve log
+
+    checkIpoptProgress      checks the iterations against the watchdog rules
+
+    runWatchedSolve         solves a printed study with a guess file and writes
+                            the solution (run in the solve process)
+
+    solveWatched            solves a Moco study in a separate process, stopping
+                            it if the watchdog rules are broken
+
+The watchdog rules are set in a settings dictionary (see watchdogDefaults):
+    - maxWallTime: seconds before the solve is stopped
+    - maxIterations: iterations before the solve is stopped
+    - nonFiniteIterations: consecutive iterations with a NaN or infinite
+      objective or infeasibility before the solve is stopped (e.g. from a guess
+      containing NaN's)
+    - maxInfeasibility: primal infeasibility above which the solve is treated
+      as diverging
+    - stallIterations / stallTolerance / stallFloor: the solve is treated as
+      stalled if the best primal infeasibility hasn't improved by the relative
+      tolerance over this many iterations, unless it is already below the floor
+    - smallStepIterations / minStepSize: consecutive iterations with a primal
+      step size below the minimum before the solve is stopped
+    - restorationIterations: consecutive restoration phase iterations before
+      the solve is stopped
+Any rule can be turned off by setting it to None.
+
+This file can also be run as a script, which is how the solve process is
+started (python watchdogHelper.py study.omoco guess.sto solution.sto result.json).
+
+"""
+
+# %% Import packages
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# %% Settings
+
+#Default watchdog rules
+watchdogDefaults = {'maxWallTime': 3600,
+                    'maxIterations': 3000,
+                    'nonFiniteIterations': 5,
+                    'maxInfeasibility': 1e10,
+                    'stallIterations': 250,
+                    'stallTolerance': 1e-2,
+                    'stallFloor': 1e-4,
+                    'smallStepIterations': 50,
+                    'minStepSize': 1e-8,
+                    'restorationIterations': 100,
+                    'pollInterval': 5}
+
+#Columns of the IPOPT iteration lines
+ipoptColumns = ['iteration','restoration','objective','infPr','infDu','lgMu',
+                'dNorm','lgRg','alphaDu','alphaPr','lineSearch']
+
+#Pattern matching the IPOPT iteration lines, e.g.:
+#iter    objective    inf_pr   inf_du lg(mu)  ||d||  lg(rg) alpha_du alpha_pr  ls
+#  12r 1.2345678e+00 1.23e-01 4.56e+02  -1.0 7.89e-01    -  1.00e+00 5.00e-01f  2
+ipoptPattern = re.compile(r'^\s*(\d+)(r?)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)'
+                          r'\s+(\S+)\s+(\S+)\s+([-+.\deEnaif]+?)[a-zA-Z]?\s+(\d+)\s*$')
+
+# %% parseIpoptLog
+
+def parseIpoptLog(logText = None):
+
+    # Reads the IPOPT iteration lines from the text of a solve log. Values that
+    # can't be read (e.g. '-' for lg(rg)) are set to NaN.
+    #
+    # Input:    logText - string of the solve log
+    #
+    # Output:   iterations - 2D numpy array with a row per iteration and a
+    #                        column for each of the ipoptColumns (restoration
+    #                        is 1 for restoration phase iterations)
+
+    #Check for appropriate inputs
+    if logText is None:
+        raise ValueError('Log text is needed in parseIpoptLog')
+
+    #Read the matching lines
+    rowList = []
+    for line in logText.splitlines():
+        lineMatch = ipoptPattern.match(line)
+        if lineMatch is None:
+            continue
+        row = []
+        for ind, value in enumerate(lineMatch.groups()):
+            if ind == 1:
+                row.append(1.0 if value == 'r' else 0.0)
+            else:
+                try:
+                    row.append(float(value))
+                except ValueError:
+                    row.append(np.nan)
+        rowList.append(row)
+
+    return np.array(rowList, dtype = np.float64).reshape(-1,len(ipoptColumns))
+
+# %% checkIpoptProgress
+
+def checkIpoptProgress(iterations = None, watchdogSettings = None):
+
+    # Checks the IPOPT iterations against the watchdog rules
+    #
+    # Input:    iterations - 2D numpy array of iterations (see parseIpoptLog)
+    #           watchdogSettings - dictionary of watchdog rules (default uses
+    #                              watchdogDefaults)
+    #
+    # Output:   abortReason - string describing the broken rule (None if the
+    #                         solve should continue)
+
+    #Check for appropriate inputs
+    if iterations is None:
+        raise ValueError('Iterations are needed in checkIpoptProgress')
+
+    #Set the rules
+    settings = dict(watchdogDefaults)
+    if watchdogSettings is not None:
+        settings.update(watchdogSettings)
+
+    #Nothing to check before the first iteration
+    nIterations = iterations.shape[0]
+    if nIterations == 0:
+        return None
+    col = {name: ind for ind, name in enumerate(ipoptColumns)}
+
+    #Iteration limit
+    if settings['maxIterations'] is not None and iterations[-1,col['iteration']] >= settings['maxIterations']:
+        return 'iteration limit of '+str(settings['maxIterations'])+' reached'
+
+    #Non-finite objective or infeasibility
+    nCheck = settings['nonFiniteIterations']
+    if nCheck is not None and nIterations >= nCheck:
+        recent = iterations[-nCheck:,[col['objective'],col['infPr'],col['infDu']]]
+        if (~np.isfinite(recent)).any(axis = 1).all():
+            return 'non-finite values for '+str(nCheck)+' iterations'
+
+    #Diverging primal infeasibility
+    if settings['maxInfeasibility'] is not None and iterations[-1,col['infPr']] > settings['maxInfeasibility']:
+        return 'primal infeasibility above '+str(settings['maxInfeasibility'])
+
+    #Stalled primal infeasibility
+    nCheck = settings['stallIterations']
+    if nCheck is not None and nIterations > nCheck:
+        infPr = iterations[:,col['infPr']]
+        bestBefore = np.nanmin(infPr[:-nCheck]) if np.isfinite(infPr[:-nCheck]).any() else np.inf
+        bestRecent = np.nanmin(infPr[-nCheck:]) if np.isfinite(infPr[-nCheck:]).any() else np.inf
+        if not bestRecent < max(bestBefore * (1 - settings['stallTolerance']), settings['stallFloor'] or 0.0):
+            return 'primal infeasibility stalled for '+str(nCheck)+' iterations'
+
+    #Small primal steps
+    nCheck = settings['smallStepIterations']
+    if nCheck is not None and nIterations >= nCheck:
+        if (iterations[-nCheck:,col['alphaPr']] < settings['minStepSize']).all():
+            return 'step sizes below '+str(settings['minStepSize'])+' for '+str(nCheck)+' iterations'
+
+    #Stuck in restoration
+    nCheck = settings['restorationIterations']
+    if nCheck is not None and nIterations >= nCheck:
+        if (iterations[-nCheck:,col['restoration']] == 1).all():
+            return 'restoration phase for '+str(nCheck)+' iterations'
+
+    return None
+
+# %% runWatchedSolve
+
+def runWatchedSolve(studyFile = None, guessFile = None, solutionFile = None,
+                    resultFile = None):
+
+    # Solves a printed Moco study with a guess trajectory file, and writes the
+    # solution and its details to file. This is run in the solve process
+    # started by solveWatched.
+    #
+    # Input:    studyFile - string of path to the .omoco study file
+    #           guessFile - string of path to the guess trajectory file on the
+    #                       solver mesh
+    #           solutionFile - string of path to write the solution to
+    #           resultFile - string of path to write the solution details to
+
+    #Check for appropriate inputs
+    if studyFile is None or guessFile is None or solutionFile is None or resultFile is None:
+        raise ValueError('All four input arguments are needed in runWatchedSolve')
+
+    #Import opensim
+    import opensim as osim
+
+    #Load the study and set the guess
+    study = osim.MocoStudy(studyFile)
+    solver = osim.MocoCasADiSolver.safeDownCast(study.updSolver())
+    solver.setGuessFile(guessFile)
+
+    #Run optimisation and write out the solution
+    solution = study.solve()
+    solution.unseal()
+    solution.write(solutionFile)
+
+    #Write the solution details
+    solveInfo = {'status': solution.getStatus(),
+                 'success': solution.success(),
+                 'numIterations': solution.getNumIterations(),
+                 'objective': solution.getObjective(),
+                 'solverDuration': solution.getSolverDuration()}
+    with open(resultFile,'w') as jsonFile:
+        json.dump(solveInfo, jsonFile)
+
+# %% solveWatched
+
+def solveWatched(study = None, solutionFile = None, watchdogSettings = None,
+                 logFile = None, workingPath = None):
+
+    # Solves a Moco study in a separate python process while watching its
+    # progress. The study and the guess set in its solver are printed to
+    # temporary files for the solve process, which writes its output to the
+    # log file. The IPOPT iterations in the log are checked against the
+    # watchdog rules as the solve runs, and the process is stopped if any rule
+    # is broken. Note that the log is written as the solve process flushes its
+    # output, so the checks can lag slightly behind the solve.
+    #
+    # Input:    study - MocoStudy object with a CasADi solver and guess set
+    #           solutionFile - string of path to write the solution to
+    #           watchdogSettings - dictionary of watchdog rules (default uses
+    #                              watchdogDefaults)
+    #           logFile - optional string of path to the solve log (default is
+    #                     the solution file with a .log extension)
+    #           workingPath - optional string of path to run the solve process
+    #                         in, where any intermediate trajectories are written
+    #
+    # Output:   solution - MocoTrajectory of the solution (None if the solve was
+    #                      stopped)
+    #           solveInfo - dictionary of the solution status, success, number
+    #                       of iterations, objective, solver duration and the
+    #                       reason the solve was stopped (None if it wasn't)
+
+    #Check for appropriate inputs
+    if study is None or solutionFile is None:
+        raise ValueError('A Moco study and solution file are needed in solveWatched')
+
+    #Import opensim
+    import opensim as osim
+
+    #Set the rules
+    settings = dict(watchdogDefaults)
+    if watchdogSettings is not None:
+        settings.update(watchdogSettings)
+
+    #Set the log file, with full paths as the solve process can run elsewhere
+    solutionFile = os.path.abspath(solutionFile)
+    if logFile is None:
+        logFile = os.path.splitext(solutionFile)[0]+'.log'
+
+    #Print the study and guess for the solve process
+    tempPath = tempfile.mkdtemp()
+    studyFile = os.path.join(tempPath,'study.omoco')
+    guessFile = os.path.join(tempPath,'guess.sto')
+    resultFile = os.path.join(tempPath,'result.json')
+    study.printToXML(studyFile)
+    osim.MocoCasADiSolver.safeDownCast(study.updSolver()).getGuess().write(guessFile)
+
+    try:
+
+        #Start the solve process
+        startTime = time.time()
+        with open(logFile,'w') as logOutput:
+            solveProcess = subprocess.Popen([sys.executable,os.path.abspath(__file__),
+                                             studyFile,guessFile,solutionFile,resultFile],
+                                            stdout = logOutput, stderr = subprocess.STDOUT,
+                                            cwd = workingPath)
+
+        #Watch the solve until it finishes or breaks a rule
+        abortReason = None
+        iterations = parseIpoptLog('')
+        while solveProcess.poll() is None:
+            time.sleep(settings['pollInterval'])
+            with open(logFile,'r') as logInput:
+                iterations = parseIpoptLog(logInput.read())
+            abortReason = checkIpoptProgress(iterations,settings)
+            if abortReason is None and settings['maxWallTime'] is not None \
+                and time.time() - startTime > settings['maxWallTime']:
+                abortReason = 'wall time limit of '+str(settings['maxWallTime'])+' s reached'
+            if abortReason is not None:
+                solveProcess.terminate()
+                try:
+                    solveProcess.wait(timeout = 30)
+                except subprocess.TimeoutExpired:
+                    solveProcess.kill()
+                    solveProcess.wait()
+                break
+
+        #Return the details of a stopped solve from the last iteration
+        if abortReason is not None:
+            with open(logFile,'a') as logOutput:
+                logOutput.write('\nSolve stopped by watchdog: '+abortReason+'\n')
+            lastIteration = iterations[-1,:] if iterations.shape[0] > 0 else np.full(len(ipoptColumns), np.nan)
+            solveInfo = {'status': 'Aborted',
+                         'success': False,
+                         'numIterations': int(lastIteration[0]) if np.isfinite(lastIteration[0]) else 0,
+                         'objective': float(lastIteration[2]),
+                         'solverDuration': time.time() - startTime,
+                         'abortReason': abortReason}
+            return None, solveInfo
+
+        #Check the solve process finished properly
+        if not os.path.isfile(resultFile):
+            raise RuntimeError('Solve process failed with exit code '+str(solveProcess.returncode)+
+                               ' (see '+logFile+')')
+
+        #Load the solution and details
+        with open(resultFile,'r') as jsonFile:
+            solveInfo = json.load(jsonFile)
+        solveInfo['abortReason'] = None
+
+    finally:
+
+        #Clean up the temporary files
+        for tempFile in [studyFile,guessFile,resultFile]:
+            if os.path.isfile(tempFile):
+                os.remove(tempFile)
+        os.rmdir(tempPath)
+
+    return osim.MocoTrajectory(solutionFile), solveInfo
+
+# %% Run solve process
+
+if __name__ == '__main__':
+
+    #Solve the study given on the command line
+    runWatchedSolve(*sys.argv[1:5])
+
+# %%
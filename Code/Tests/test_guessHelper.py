@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Tests of the guess assembly from existing solutions (see guessHelper), using
+small numpy arrays in place of solution files. Run with:
+
+    python -m pytest -q Code/Tests
+
+"""
+
+# %% Import packages
+
+import os
+import sys
+import numpy as np
+
+#Add the supplementary code directory to the path
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Supplementary'))
+import guessHelper
+
+# %% Tests
+
+def test_renameColumnsDropsSlacks():
+
+    #Check the slack variables are dropped and other labels are kept
+    newLabels = guessHelper.renameColumns(['time','gamma_0','gamma_1','/jointset/shoulder_elv/elv_angle/value'])
+    assert newLabels == ['time',None,None,'/jointset/shoulder_elv/elv_angle/value']
+
+def test_renameColumnsMovesActuatorsToForceset():
+
+    #Check the actuators outside the forceset are moved into it, and labels
+    #already in the forceset or jointset aren't changed
+    newLabels = guessHelper.renameColumns(['/elv_angle_reserve','/forceset/DELT2/activation',
+                                           '/jointset/hat_shoulder/elv_angle/speed','lambda_cid0_p0'])
+    assert newLabels == ['/forceset/elv_angle_reserve','/forceset/DELT2/activation',
+                         '/jointset/hat_shoulder/elv_angle/speed','lambda_cid0_p0']
+
+def test_scrubNonFiniteFillsLastRow():
+
+    #Check a NaN in the last row is filled from the earlier values, and a
+    #column without finite values is set to zero
+    time = np.array([0.0, 0.5, 1.0])
+    data = np.array([[1.0, 2.0, np.nan],
+                     [3.0, 4.0, np.nan],
+                     [5.0, np.nan, np.nan]])
+    scrubbedData, scrubbedColumns = guessHelper.scrubNonFinite(time,data)
+    assert scrubbedColumns == [1,2]
+    assert np.all(np.isfinite(scrubbedData))
+    assert scrubbedData[2,1] == 4.0
+    assert np.all(scrubbedData[:,2] == 0.0)
+    assert np.all(scrubbedData[:,0] == data[:,0])
+
+def test_assembleGuessReportsOnlyUnmappedTargets():
+
+    #Create a source solution with a slack, an actuator outside the forceset,
+    #a column the target doesn't have and a NaN in the last row
+    sourceLabels = ['time','/jointset/shoulder_elv/elv_angle/value','/elv_angle_reserve',
+                    'gamma_0','/forceset/OLD/activation']
+    sourceData = np.array([[0.0, 0.1, 1.0, 0.0, 0.5],
+                           [0.5, 0.2, 2.0, 0.0, 0.5],
+                           [1.0, 0.3, 3.0, np.nan, 0.5]])
+
+    #Create the target layout on a finer mesh, with a slack, a multiplier and
+    #a muscle the source doesn't have
+    targetLabels = ['time','/jointset/shoulder_elv/elv_angle/value','/forceset/elv_angle_reserve',
+                    'gamma_0','lambda_cid0_p0','/forceset/DELT2/activation']
+    targetData = np.zeros((5,len(targetLabels)))
+    targetData[:,0] = np.linspace(0.0, 2.0, 5)
+    targetData[:,5] = 0.1
+
+    guessData, report = guessHelper.assembleGuess(sourceLabels,sourceData,targetLabels,targetData)
+
+    #Check the mapping, with the renamed actuator found in the forceset
+    assert report['mapped'] == ['/jointset/shoulder_elv/elv_angle/value','/forceset/elv_angle_reserve']
+    assert report['unused'] == ['gamma_0','/forceset/OLD/activation']
+    assert report['scrubbed'] == []
+
+    #Check only the targets without a source column are defaulted, and that
+    #only the muscle is a real gap once the expected defaults are excluded
+    assert report['defaulted'] == ['gamma_0','lambda_cid0_p0','/forceset/DELT2/activation']
+    assert guessHelper.getMissingLabels(report['defaulted']) == ['/forceset/DELT2/activation']
+
+    #Check the data are resampled onto the source period, and the defaulted
+    #columns keep the target values
+    assert np.allclose(guessData[:,0], np.linspace(0.0, 1.0, 5))
+    assert np.allclose(guessData[:,1], np.linspace(0.1, 0.3, 5))
+    assert np.allclose(guessData[:,2], np.linspace(1.0, 3.0, 5))
+    assert np.all(guessData[:,3:5] == 0.0)
+    assert np.all(guessData[:,5] == 0.1)
+
+def test_assembleGuessFillsNaNInLastRow():
+
+    #Check a mapped column with a NaN in the last row is filled and reported
+    sourceLabels = ['time','/forceset/DELT2/activation']
+    sourceData = np.array([[0.0, 0.2],
+                           [0.5, 0.4],
+                           [1.0, np.nan]])
+    targetLabels = ['time','/forceset/DELT2/activation']
+    targetData = np.zeros((3,2))
+    targetData[:,0] = [0.0, 0.5, 1.0]
+
+    guessData, report = guessHelper.assembleGuess(sourceLabels,sourceData,targetLabels,targetData)
+    assert report['scrubbed'] == ['/forceset/DELT2/activation']
+    assert report['defaulted'] == []
+    assert np.allclose(guessData[:,1], [0.2, 0.4, 0.4])
+
+# %%
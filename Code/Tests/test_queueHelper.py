@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Author:
+    Aaron Fox
+    Centre for Sport Research
+    Deakin University
+
+Tests of a job queue shared by several runners (see queueHelper and
+batchHelper.runJobQueue). The runners are started as separate python processes
+on a temporary queue, with a stub job function in place of the simulations so
+that opensim isn't needed. Run with:
+
+    python -m pytest -q Code/Tests
+
+"""
+
+# %% Import packages
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+#Add the supplementary code directory to the path
+testsPath = os.path.dirname(os.path.abspath(__file__))
+supplementaryPath = os.path.join(testsPath,'..','Supplementary')
+sys.path.insert(0,supplementaryPath)
+import queueHelper
+
+# %% Settings
+
+#Code run by each runner process. The queue lock is treated as stale sooner
+#than usual, in case a runner is stopped while it holds the lock.
+runnerCode = '\n'.join(['import sys',
+                        'sys.path[:0] = [{supplementaryPath!r}, {testsPath!r}]',
+                        'import batchHelper',
+                        'import queueHelper',
+                        'import test_queueHelper',
+                        'queueHelper.queueLockStale = 5',
+                        'batchHelper.runJobQueue({queueFile!r}, nProcesses = 2, autoTune = False,',
+                        '                        pollInterval = 0.5, jobFunction = test_queueHelper.stubJob)'])
+
+#Seconds to wait for the runners to finish the queue
+runTimeout = 120
+
+# %% stubJob
+
+def stubJob(jobSettings = None):
+
+    # Stub job that logs the job and worker process and waits for the job
+    # duration, in place of solving a variant
+    #
+    # Input:    jobSettings - dictionary of the job ID, duration and log file
+    #
+    # Output:   summary - dictionary of the job status and timing
+
+    #Log the job in a single write, so that the lines of the workers don't mix
+    logHandle = os.open(jobSettings['logFile'], os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    os.write(logHandle, (jobSettings['jobId']+' '+str(os.getpid())+'\n').encode())
+    os.close(logHandle)
+
+    time.sleep(jobSettings['duration'])
+
+    return {'variant': jobSettings['jobId'], 'status': 'Solve_Succeeded', 'success': True,
+            'wallTime': jobSettings['duration']}
+
+# %% Helper functions
+
+def createQueue(queuePath, nJobs, duration):
+
+    # Creates a queue of stub jobs in a temporary directory
+
+    queueFile = os.path.join(str(queuePath),'jobQueue.json')
+    logFile = os.path.join(str(queuePath),'jobLog.txt')
+    queueHelper.initQueue(queueFile,[{'jobId': 'job'+str(iJob).zfill(2),
+                                      'settings': {'jobId': 'job'+str(iJob).zfill(2),
+                                                   'duration': duration, 'logFile': logFile}}
+                                     for iJob in range(nJobs)])
+
+    return queueFile, logFile
+
+def startRunner(queueFile):
+
+    # Starts a runner process on the queue in its own process group, so that
+    # it can be stopped together with its workers
+
+    runnerArgs = [sys.executable, '-c', runnerCode.format(supplementaryPath = supplementaryPath,
+                                                          testsPath = testsPath,
+                                                          queueFile = queueFile)]
+    if os.name == 'nt':
+        return subprocess.Popen(runnerArgs, stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                creationflags = subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen(runnerArgs, stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                            start_new_session = True)
+
+def killRunner(runner):
+
+    # Stops a runner process and its workers without letting them clean up
+
+    if os.name == 'nt':
+        subprocess.run(['taskkill','/F','/T','/PID',str(runner.pid)], capture_output = True)
+    else:
+        os.killpg(runner.pid, signal.SIGKILL)
+    runner.wait()
+
+def waitForRunners(runnerList):
+
+    # Waits for the runners to finish, returning their output
+
+    runnerOutput = []
+    for runner in runnerList:
+        output, _ = runner.communicate(timeout = runTimeout)
+        assert runner.returncode == 0, output.decode()
+        runnerOutput.append(output.decode())
+
+    return runnerOutput
+
+def getLoggedJobs(logFile):
+
+    # Gets the job IDs from the log of the stub jobs
+
+    with open(logFile,'r') as logLines:
+        return [line.split()[0] for line in logLines if line.strip()]
+
+# %% Tests
+
+def test_runnersRunEachJobOnce(tmp_path):
+
+    #Run a queue with three runners
+    queueFile, logFile = createQueue(tmp_path, 12, 0.5)
+    runnerOutput = waitForRunners([startRunner(queueFile) for iRunner in range(3)])
+
+    #Check every job is done and was only run once
+    jobList = queueHelper.loadQueue(queueFile)['jobs']
+    assert all([job['state'] == 'done' for job in jobList]), '\n'.join(runnerOutput)
+    loggedJobs = getLoggedJobs(logFile)
+    assert sorted(loggedJobs) == sorted([job['jobId'] for job in jobList])
+    assert all([job['attempts'] == 1 for job in jobList])
+
+    #Check the heartbeats were removed as the runners finished
+    heartbeatPath = os.path.splitext(queueFile)[0]+'_heartbeats'
+    assert os.listdir(heartbeatPath) == []
+
+def test_killedRunnerJobIsReclaimed(tmp_path):
+
+    #Start a runner and wait for it to claim jobs
+    queueFile, logFile = createQueue(tmp_path, 6, 2.0)
+    killedRunner = startRunner(queueFile)
+    killedNodeId = socket.gethostname()+'_'+str(killedRunner.pid)
+    startTime = time.time()
+    while not any([job['state'] == 'running' and job['nodeId'] == killedNodeId
+                   for job in queueHelper.loadQueue(queueFile)['jobs']]):
+        assert time.time() - startTime < runTimeout, 'Runner did not claim a job'
+        time.sleep(0.1)
+
+    #Stop the runner with its workers part way through its jobs
+    killRunner(killedRunner)
+    killedJobs = [job['jobId'] for job in queueHelper.loadQueue(queueFile)['jobs']
+                  if job['state'] == 'running' and job['nodeId'] == killedNodeId]
+    assert len(killedJobs) > 0
+
+    #Finish the queue with two other runners
+    runnerOutput = waitForRunners([startRunner(queueFile) for iRunner in range(2)])
+
+    #Check the jobs of the stopped runner were reclaimed and run again by the
+    #other runners, and that every job is done
+    queueJobs = {job['jobId']: job for job in queueHelper.loadQueue(queueFile)['jobs']}
+    assert all([job['state'] == 'done' for job in queueJobs.values()]), '\n'.join(runnerOutput)
+    for jobId in killedJobs:
+        assert queueJobs[jobId]['reclaims'] >= 1
+        assert queueJobs[jobId]['attempts'] == 2
+        assert queueJobs[jobId]['nodeId'] != killedNodeId
+    assert 'Reclaimed jobs from stopped runners' in ''.join(runnerOutput)
+
+    #Check the other jobs were only run once
+    loggedJobs = getLoggedJobs(logFile)
+    for jobId in queueJobs:
+        if jobId not in killedJobs:
+            assert loggedJobs.count(jobId) == 1
+
+# %%